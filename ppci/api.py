@@ -25,6 +25,7 @@ from .opt import CommonSubexpressionEliminationPass
 from .opt import ConstantFolder
 from .opt import LoadAfterStorePass
 from .opt import CleanPass
+from .opt import DivisionByPowerOfTwoPass
 from .opt.mem2reg import Mem2RegPromotor
 from .opt.cjmp import CJumpPass
 from .opt.tailcall import TailCallOptimization
@@ -219,6 +220,7 @@ def optimize(ir_module, level=0, reporter=None):
         Mem2RegPromotor(),
         RemoveAddZeroPass(),
         ConstantFolder(),
+        DivisionByPowerOfTwoPass(),
         CommonSubexpressionEliminationPass(),
         TailCallOptimization(),
         LoadAfterStorePass(),
@@ -246,7 +248,13 @@ def optimize(ir_module, level=0, reporter=None):
 
 
 def ir_to_stream(
-    ir_module, march, output_stream, reporter=None, debug=False, opt="speed"
+    ir_module,
+    march,
+    output_stream,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    allocator="coloring",
 ):
     """Translate IR module to output stream."""
     march = get_arch(march)
@@ -254,7 +262,9 @@ def ir_to_stream(
     if not reporter:  # pragma: no cover
         reporter = DummyReportGenerator()
 
-    code_generator = CodeGenerator(march, reporter, optimize_for=opt)
+    code_generator = CodeGenerator(
+        march, reporter, optimize_for=opt, allocator=allocator
+    )
     verify_module(ir_module)
 
     # Code generation:
@@ -271,7 +281,13 @@ def ir_to_assembly(ir_modules, march, add_binary=False):
 
 
 def ir_to_object(
-    ir_modules, march, reporter=None, debug=False, opt="speed", outstream=None
+    ir_modules,
+    march,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    outstream=None,
+    allocator="coloring",
 ):
     """Translate IR-modules into code for the given architecture.
 
@@ -283,6 +299,8 @@ def ir_to_object(
         debug (bool): include debugging information
         opt (str): optimization goal. Can be 'speed', 'size' or 'co2'.
         outstream: instruction stream to write instructions to
+        allocator (str): the register allocator. Can be 'coloring' or
+            'linearscan', the latter is faster but gives larger code.
 
     Returns:
         ObjectFile: An object file
@@ -317,6 +335,7 @@ def ir_to_object(
             reporter=reporter,
             debug=debug,
             opt=opt,
+            allocator=allocator,
         )
 
     reporter.message("All modules generated!")
@@ -331,6 +350,7 @@ def cc(
     opt_level=0,
     debug=False,
     reporter=None,
+    allocator="coloring",
 ):
     """C compiler. compiles a single source file into an object file.
 
@@ -339,6 +359,7 @@ def cc(
         march: The architecture for which to compile
         coptions: options for the C frontend
         debug: Create debug info when set to True
+        allocator: The register allocator, 'coloring' or 'linearscan'
 
     Returns:
         an object file
@@ -363,7 +384,9 @@ def cc(
     reporter.message("{} {}".format(ir_module, ir_module.stats()))
     reporter.dump_ir(ir_module)
     optimize(ir_module, level=opt_level, reporter=reporter)
-    return ir_to_object([ir_module], march, debug=debug, reporter=reporter)
+    return ir_to_object(
+        [ir_module], march, debug=debug, reporter=reporter, allocator=allocator
+    )
 
 
 def wasmcompile(source: io.TextIOBase, march, opt_level=2, reporter=None):
@@ -107,13 +107,15 @@ class Architecture(MachineArchitecture):
         raise NotImplementedError("Implement this!")
 
     @abc.abstractmethod
-    def gen_function_enter(self, args):  # pragma: no cover
+    def gen_function_enter(self, frame, args):  # pragma: no cover
         """Generate code to extract arguments from the proper locations
 
         The default implementation tries to use registers and move
         instructions.
 
         Arguments:
+            frame: the frame of the function, in which extra values can
+                   be allocated.
             args: an iterable of virtual registers in which the arguments
                   must be placed.
         """
@@ -123,6 +125,16 @@ class Architecture(MachineArchitecture):
     def gen_function_exit(self, rv):  # pragma: no cover
         raise NotImplementedError("Implement me!")
 
+    def get_register_preferences(self, instruction):
+        """Get register preferences of an instruction.
+
+        Yield pairs of a register used by the instruction and the registers
+        which are preferred for it, for example because the instruction
+        has a shorter encoding with these registers. The register allocator
+        takes these hints into account when choosing registers.
+        """
+        return ()
+
     def between_blocks(self, frame):
         """ Generate any instructions here if needed between two blocks """
         return []
@@ -158,6 +170,16 @@ class Architecture(MachineArchitecture):
 
     runtime = property(get_compiler_rt_lib)
 
+    def get_decoder(self):
+        """Get a decoder for machine code of this architecture.
+
+        The decoder has a decode(data, address) method which returns an
+        instruction and its size, or raises a ValueError, and an
+        alignment attribute with the minimal instruction size. Returns
+        None when decoding is not supported.
+        """
+        return None
+
     def get_reloc_type(self, reloc_type, symbol):
         """Re-implement this function to support ELF format
         relocations.
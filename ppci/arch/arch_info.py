@@ -6,6 +6,9 @@ The information present:
 - endianness
 - type sizes and alignment
 - int size for the machine
+- support for jump tables
+- support for selects
+- latencies of the instructions, for instruction scheduling
 
 """
 import enum
@@ -29,6 +32,39 @@ class TypeInfo:
         self.alignment = alignment
 
 
+class LatencyModel:
+    """Latencies of the instructions on a specific processor core.
+
+    The instruction classes are grouped into kinds, such as 'alu', 'load',
+    'store' and 'mul', and the latency is given per kind. The latency is
+    the number of cycles after the issue of an instruction at which its
+    result can be used without stalling the pipeline. Instructions
+    without a kind are not moved by the instruction scheduler.
+    """
+
+    memory_kinds = ("load", "store")
+
+    def __init__(self, name, kinds, latencies):
+        self.name = name
+        self.kinds = kinds
+        self.latencies = latencies
+
+    def __repr__(self):
+        return "LatencyModel({})".format(self.name)
+
+    def get_kind(self, instruction):
+        """ Get the kind of an instruction, or None if it is unknown """
+        return self.kinds.get(type(instruction))
+
+    def get_latency(self, instruction):
+        """ Get the latency of the result of an instruction """
+        return self.latencies.get(self.get_kind(instruction), 1)
+
+    def accesses_memory(self, instruction):
+        """ Test if an instruction loads from or stores to memory """
+        return self.get_kind(instruction) in self.memory_kinds
+
+
 class ArchInfo:
     """ A collection of information for language frontends """
 
@@ -37,11 +73,23 @@ class ArchInfo:
         type_infos=None,
         endianness=Endianness.LITTLE,
         register_classes=(),
+        jump_tables=False,
+        selects=False,
+        latency_model=None,
+        reschedule=False,
     ):
         self.type_infos = type_infos
         assert isinstance(endianness, Endianness)
         self.endianness = endianness
         self.register_classes = register_classes
+        # Whether the backend can lower the ir.JumpTable instruction:
+        self.jump_tables = jump_tables
+        # Whether the backend can lower the ir.Select instruction:
+        self.selects = selects
+        # The latencies of the instructions, used to schedule them:
+        self.latency_model = latency_model
+        # Whether to schedule the instructions again after allocation:
+        self.reschedule = reschedule
         self._registers_by_name = {}
 
         mapping = {}
@@ -2,6 +2,8 @@
 
 
 import abc
+import operator
+from .arch_info import Endianness
 from .registers import Register
 from .token import TokenSequence
 
@@ -423,11 +425,25 @@ class Instruction(Constructor, metaclass=InsMeta):
 
         returns bytes for this instruction.
         """
+        packer = self.get_packer()
+        if packer:
+            return packer(self)
 
         tokens = self.get_tokens()
         self.set_all_patterns(tokens)
         return tokens.encode()
 
+    @classmethod
+    def get_packer(cls):
+        """Get the compiled encode function of this class.
+
+        The function is created on first use. Returns None if the
+        patterns of this class cannot be compiled.
+        """
+        if "_packer" not in cls.__dict__:
+            cls._packer = compile_packer(cls)
+        return cls._packer
+
     @classmethod
     def decode(cls, data):
         """ Decode data into an instruction of this class """
@@ -489,6 +505,7 @@ class Syntax:
         "-",
         "*",
         "%",
+        "!",
     ]
 
     def __init__(self, syntax, priority=0):
@@ -513,12 +530,21 @@ class Syntax:
         self.syntax = syntax
         self.priority = priority
 
-        # Pre-calculate format arguments:
+        # Pre-calculate format arguments and a template to render with:
         formal_args = []
+        template = []
         for element in self.syntax:
             if isinstance(element, Operand):
                 formal_args.append(element)
+                template.append("{}")
+            else:
+                template.append(element.replace("{", "{{").replace("}", "}}"))
         self.formal_arguments = formal_args
+        self._template = "".join(template)
+        # The operand values are fetched from their backing fields at once:
+        fields = ["_{}".format(a._name) for a in formal_args]
+        self._get_values = operator.attrgetter(*fields) if fields else None
+        self._single_value = len(fields) == 1
 
     def __add__(self, other):
         assert isinstance(other, Syntax)
@@ -539,18 +565,12 @@ class Syntax:
 
     def render(self, obj):
         """ Return this syntax formatted for the given object. """
-        return "".join(self._get_repr(e, obj) for e in self.syntax)
-
-    @staticmethod
-    def _get_repr(syntax_element, obj):
-        """Get the repr of a syntax part. Can be str or prop class,
-        in refering to an element in the args list"""
-        if isinstance(syntax_element, str):
-            return syntax_element
-        elif isinstance(syntax_element, Operand):
-            return str(syntax_element.__get__(obj))
-        else:  # pragma: no cover
-            raise NotImplementedError(str(syntax_element))
+        if self._get_values is None:
+            return self._template.format()
+        values = self._get_values(obj)
+        if self._single_value:
+            return self._template.format(str(values))
+        return self._template.format(*map(str, values))
 
 
 class BitPattern:
@@ -588,6 +608,112 @@ class VariablePattern(BitPattern):
         return self.prop.get_value(objref)
 
 
+def compile_packer(cls):
+    """Compile the patterns of an instruction class into a pack function.
+
+    The pack function puts all fields of the instruction into a single
+    integer, which is converted into bytes at once. This is bit-exact with
+    filling the tokens one field at a time. Returns None for classes which
+    do not fit this scheme, for example when fields overlap, or when the
+    instruction is composed of constructors.
+    """
+    if (
+        cls.set_user_patterns is not Constructor.set_user_patterns
+        or cls.set_all_patterns is not Instruction.set_all_patterns
+        or cls.get_tokens is not Instruction.get_tokens
+        or not cls.syntax
+        or not hasattr(cls, "tokens")
+        or any(a.is_constructor for a in cls.syntax.formal_arguments)
+    ):
+        return
+
+    # Determine the bit offset of each token, precodes go first:
+    token_classes = [t for t in cls.tokens if t.Info.precode]
+    token_classes += [t for t in cls.tokens if not t.Info.precode]
+    endianness = {t.Info.endianness for t in token_classes}
+    if len(token_classes) > 1 and endianness != {Endianness.LITTLE}:
+        return
+    offsets = []
+    size = 0
+    for token_class in token_classes:
+        offsets.append(size)
+        size += token_class.Info.size
+    byteorder = "little" if Endianness.LITTLE in endianness else "big"
+
+    namespace = {"raise_range_error": _raise_range_error}
+    lines = []
+    fixed_value = 0
+    used_bits = 0
+    for index, pattern in enumerate(cls.dict_to_patterns(cls.patterns)):
+        # Find the bit positions of the field in the whole instruction:
+        for token_class, offset in zip(token_classes, offsets):
+            if hasattr(token_class, pattern.field):
+                field = getattr(token_class, pattern.field)
+                break
+        else:
+            return
+        ranges = getattr(field, "_ranges", None)
+        if not ranges:
+            return
+        ranges = [(begin + offset, end + offset) for begin, end in ranges]
+        for begin, end in ranges:
+            bits = ((1 << (end - begin)) - 1) << begin
+            if used_bits & bits:
+                return
+            used_bits |= bits
+
+        if isinstance(pattern, FixedPattern):
+            value = pattern.value
+            if len(ranges) == 1:
+                limit = 1 << field._bitsize
+                if not -limit <= value < limit:
+                    return
+            for begin, end in reversed(ranges):
+                fixed_value |= (value & ((1 << (end - begin)) - 1)) << begin
+                value >>= end - begin
+        elif isinstance(pattern, VariablePattern):
+            prop = pattern.prop
+            if isinstance(prop, Operand) and not prop._value_map:
+                if issubclass(prop._cls, Register):
+                    expression = "ins._{}.num".format(prop._name)
+                else:
+                    expression = "ins._{}".format(prop._name)
+            else:
+                namespace["prop{}".format(index)] = prop
+                expression = "prop{}.get_value(ins)".format(index)
+            lines.append("    v = {}".format(expression))
+            if len(ranges) == 1:
+                limit = 1 << field._bitsize
+                lines.append("    if not -{0} <= v < {0}:".format(limit))
+                lines.append("        raise_range_error(v, {})".format(limit))
+            shift = 0
+            for begin, end in reversed(ranges):
+                lines.append(
+                    "    value |= ((v >> {}) & {}) << {}".format(
+                        shift, (1 << (end - begin)) - 1, begin
+                    )
+                )
+                shift += end - begin
+        else:  # pragma: no cover
+            return
+
+    source = "\n".join(
+        ["def pack(ins):", "    value = {}".format(fixed_value)]
+        + lines
+        + ['    return value.to_bytes({}, "{}")'.format(size // 8, byteorder)]
+    )
+    exec(source, namespace)
+    return namespace["pack"]
+
+
+def _raise_range_error(value, limit):
+    raise ValueError(
+        "value {} cannot be fit into {} bits".format(
+            value, limit.bit_length() - 1
+        )
+    )
+
+
 class Relocation:
     """Baseclass for all relocation types.
 
@@ -597,12 +723,19 @@ class Relocation:
     - number: the number that can be used to uniquely identify the relocation.
     - apply: a function that can be used to apply the relocation.
     - calc: a function that calculates the value for the relocation.
+
+    A relocation can be relative to another symbol than its own, such as
+    a global pointer. In that case, base_symbol is set to the name of
+    this symbol, and the linker provides its value as base_value, or
+    None when it is not defined.
     """
 
     name = None
     number = None
     token = None
     field = None
+    base_symbol = None
+    base_value = None
 
     def __init__(self, symbol_name, offset=0, addend=0):
         self.symbol_name = symbol_name
@@ -54,7 +54,7 @@ class ExampleArch(Architecture):
     def gen_call(self, label, args, rv):
         return []
 
-    def gen_function_enter(self, args):
+    def gen_function_enter(self, frame, args):
         return []
 
     def gen_function_exit(self, rv):
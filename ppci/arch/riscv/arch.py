@@ -3,32 +3,73 @@
 import io
 from ..arch import Architecture
 from ..arch_info import ArchInfo, TypeInfo
-from ..generic_instructions import Label, RegisterUseDef
+from ..isa import Isa
+from ..generic_instructions import Label, RegisterUseDef, Global
 from ..data_instructions import DByte, DZero
 from .asm_printer import RiscvAsmPrinter
 from .instructions import isa, Align, Section
 from .rvc_instructions import rvcisa
-from .rvf_instructions import rvfisa, movf
+from .rvf_instructions import rvfisa, movf, FLw, FSw, Movxs, Movsx
+from .rvd_instructions import rvdisa, movd, rvd_intrinsics
+from .rvd_instructions import single_precision_isa
+from .softd_instructions import softdisa, softd_rvf_isa
+from .softd_instructions import LoadPair, StorePair, MovePair, SplitPair
+from .softd_instructions import JoinPair, split_pair_instructions
 from .rvfx_instructions import rvfxisa
+from .rvb_instructions import zbaisa, zbbisa, zbb_intrinsics
+from .zicond_instructions import zicondisa
+from .rv64_instructions import rv64isa, rv32_instructions, Ld, Sd
+from .nom_instructions import nomisa, without_mext
+from .sdata_instructions import sdataisa
+from .xpulp_instructions import xpulpisa, fold_post_increments
+from .xpulp_instructions import insert_hardware_loops, pad_hardware_loops
+from .rvv_instructions import rvvisa, rvv_kernels, rvv_intrinsics
+from .latencies import latency_models
+from .runtime import RT_MUL_ASM_SRC, RT_DIV_ASM_SRC, RT_FLOAT_ASM_SRC
+from .runtime import RT_BLOCK_ASM_SRC, RT_BLOCK_RVV_ASM_SRC
+from .runtime import RT_FLOAT_MULTIPLY_ASM_SRC
+from .runtime import RT_FLOAT_MULTIPLY_NOM_ASM_SRC
+from .runtime import RT_DOUBLE_ASM_SRC, RT_DOUBLE_MULTIPLY_ASM_SRC
+from .runtime import RT_DOUBLE_MULTIPLY_NOM_ASM_SRC
 from .registers import RiscvRegister, RiscvFRegister, gdb_registers, Register
-from .registers import R0, LR, SP, FP
+from .registers import RiscvPairRegister, P10
+from .registers import R0, LR, SP, FP, R5
 from .registers import R10, R11, R12
 from .registers import R13, R14, R15, R16, R17
 from .registers import PC
 from .registers import R9, R18, R19
 from .registers import R20, R21, R22, R23, R24, R25, R26, R27
-from .registers import F10, F12, F13, F14, F15, F16, F17
+from .registers import F10, F11, F12, F13, F14, F15, F16, F17
+from .registers import fregisters
 from ... import ir
 from .registers import register_classes_hwfp, register_classes_swfp
+from .registers import register_classes_hwfp_d
+from .registers import register_classes_rv64, register_class_rvv
+from ..registers import RegisterClass
 from ..stack import StackLocation
 from ..stack import FramePointerLocation
 from ..data_instructions import data_isa
 from ...binutils.assembler import BaseAssembler
+from ...binutils.archive import archive
+from ...utils.bitfun import sign_extend
 from .instructions import dcd, Addi, Movr, Bl, Sw, Lw, Blr, Lb, Sb
-from .rvc_instructions import CSwsp, CLwsp, CBl, CJr, CBlr, CMovr
-from .rvc_instructions import CAddi16sp, CAddi4spn
+from .instructions import Lh, Sh
+from .instructions import Addr, Lui, Li, B, Call
+from .rvc_instructions import CSwsp, CLwsp, CBl, CJr, CBlr, CMovr, CB, CCall
+from .rvc_instructions import compress, compressible_registers
+from .rvc_instructions import get_compressible_operands, get_tied_operands
+from .rvc_instructions import expand_instruction, instruction_size
 from . import instructions
 
+# Larger blocks are copied or cleared by a loop in the runtime:
+MAX_UNROLLED_MOVES = 16
+
+# Variables up to this size are placed in the small data sections:
+MAX_SMALL_DATA_SIZE = 8
+
+block_loads = {1: Lb, 2: Lh, 4: Lw, 8: Ld}
+block_stores = {1: Sb, 2: Sh, 4: Sw, 8: Sd}
+
 
 def isinsrange(bits, val):
     msb = 1 << (bits - 1)
@@ -65,30 +106,164 @@ class RiscvAssembler(BaseAssembler):
 
 class RiscvArch(Architecture):
     name = "riscv"
-    option_names = ("rvc", "rvf", "rvfx")
+    option_names = (
+        "rvc",
+        "rvf",
+        "rvfx",
+        "rvd",
+        "zba",
+        "zbb",
+        "zicond",
+        "rv64",
+        "nom",
+        "omitfp",
+        "ilp32",
+        "ilp32f",
+        "sdata",
+        "farcall",
+        "xpulp",
+        "rvv",
+        "picorv32",
+        "vexriscv",
+        "rocket",
+        "postsched",
+    )
 
     def __init__(self, options=None):
         super().__init__(options=options)
+        if self.has_option("nom"):
+            # Multiply and divide by calling the runtime functions:
+            base_isa = without_mext(isa) + nomisa
+        else:
+            base_isa = isa
+        if self.has_option("ilp32") and self.has_option("ilp32f"):
+            raise ValueError("Only one of the ilp32 options can be used")
+        if self.has_option("ilp32f") and not self.has_option("rvf"):
+            raise ValueError("The ilp32f option requires the rvf option")
+        if self.has_option("xpulp") and self.has_option("nom"):
+            raise ValueError("The xpulp option requires the M extension")
+        cores = [core for core in latency_models if self.has_option(core)]
+        if len(cores) > 1:
+            raise ValueError("Only one of the core options can be used")
+        if self.has_option("postsched") and not cores:
+            raise ValueError("The postsched option requires a core option")
+        if self.psabi:
+            for option in ("rv64", "rvd"):
+                if self.has_option(option):
+                    raise ValueError(
+                        "The {} option is not supported by the ilp32 "
+                        "calling conventions".format(option)
+                    )
         if self.has_option("rvc"):
-            self.isa = isa + rvcisa + data_isa
+            # The compressed moves and stack accesses are integer only:
+            for option in ("rvf", "rvd"):
+                if self.has_option(option):
+                    raise ValueError(
+                        "The {} option is not supported with rvc".format(
+                            option
+                        )
+                    )
+        if self.has_option("rv64"):
+            for option in (
+                "rvc",
+                "rvf",
+                "rvfx",
+                "rvd",
+                "zba",
+                "zbb",
+                "nom",
+                "sdata",
+                "xpulp",
+                "rvv",
+            ):
+                if self.has_option(option):
+                    raise ValueError(
+                        "The {} option is not supported on rv64".format(option)
+                    )
+            base_isa = Isa()
+            base_isa.instructions = [
+                i for i in isa.instructions if i not in rv32_instructions
+            ]
+            base_isa.patterns = isa.patterns
+            base_isa.relocation_map = isa.relocation_map
+            self.isa = base_isa + rv64isa + data_isa
+            self.store = Sd
+            self.load = Ld
+            self.regclass = register_classes_rv64
+        elif self.has_option("rvc"):
+            self.isa = (
+                single_precision_isa(base_isa) + softdisa + rvcisa + data_isa
+            )
             self.store = CSwsp
             self.load = CLwsp
             self.regclass = register_classes_swfp
         elif self.has_option("rvfx"):
-            self.isa = isa + rvfxisa + data_isa
+            self.isa = (
+                single_precision_isa(base_isa)
+                + softdisa
+                + single_precision_isa(rvfxisa)
+                + data_isa
+            )
             self.store = Sw
             self.load = Lw
             self.regclass = register_classes_swfp
+        elif self.has_option("rvd"):
+            # Doubles are 64 bits values in the floating point registers:
+            rvf_isa = single_precision_isa(rvfisa)
+            self.isa = base_isa + rvf_isa + rvdisa + data_isa
+            self.store = Sw
+            self.load = Lw
+            self.regclass = register_classes_hwfp_d
         elif self.has_option("rvf"):
-            self.isa = isa + rvfisa + data_isa
+            # Doubles are kept in pairs of integer registers:
+            self.isa = (
+                single_precision_isa(base_isa)
+                + softdisa
+                + single_precision_isa(rvfisa)
+                + softd_rvf_isa
+                + data_isa
+            )
             self.store = Sw
             self.load = Lw
             self.regclass = register_classes_hwfp
         else:
-            self.isa = isa + data_isa
+            self.isa = single_precision_isa(base_isa) + softdisa + data_isa
             self.store = Sw
             self.load = Lw
             self.regclass = register_classes_swfp
+        if self.has_option("omitfp"):
+            # Locals are addressed relative to the stack pointer, so the
+            # frame pointer is allocated as a callee saved register:
+            self.regclass = [
+                (
+                    RegisterClass(
+                        rc.name, rc.ir_types, rc.typ, rc.registers + [FP]
+                    )
+                    if R9 in rc.registers
+                    else rc
+                )
+                for rc in self.regclass
+            ]
+        self.intrinsics = {}
+        self.kernels = {}
+        if self.has_option("zba"):
+            self.isa = self.isa + zbaisa
+        if self.has_option("zbb"):
+            self.isa = self.isa + zbbisa
+            self.intrinsics.update(zbb_intrinsics)
+        if self.has_option("zicond"):
+            self.isa = self.isa + zicondisa
+        if self.has_option("rvd"):
+            self.intrinsics.update(rvd_intrinsics)
+        if self.has_option("sdata"):
+            self.isa = self.isa + sdataisa
+        if self.has_option("xpulp"):
+            self.isa = self.isa + xpulpisa
+        if self.has_option("rvv"):
+            self.isa = self.isa + rvvisa
+            self.intrinsics.update(rvv_intrinsics)
+            self.kernels.update(rvv_kernels)
+            self.regclass = self.regclass + [register_class_rvv]
         self.fp_location = FramePointerLocation.TOP
         self.isa.sectinst = Section
         self.isa.dbinst = DByte
@@ -99,25 +274,52 @@ class RiscvArch(Architecture):
         self.assembler = RiscvAssembler()
         self.assembler.gen_asm_parser(self.isa)
 
+        type_infos = {
+            ir.i8: TypeInfo(1, 1),
+            ir.u8: TypeInfo(1, 1),
+            ir.i16: TypeInfo(2, 2),
+            ir.u16: TypeInfo(2, 2),
+            ir.i32: TypeInfo(4, 4),
+            ir.u32: TypeInfo(4, 4),
+            ir.f32: TypeInfo(4, 4),
+            ir.f64: TypeInfo(4, 4),
+            "int": ir.i32,
+            "long": ir.i32,
+            "ptr": ir.u32,
+            ir.ptr: ir.u32,
+        }
+        if self.has_option("rv64"):
+            # The lp64 data model: long and pointers are 64 bits wide.
+            self.xlen = 64
+            type_infos.update(
+                {
+                    ir.i64: TypeInfo(8, 8),
+                    ir.u64: TypeInfo(8, 8),
+                    "long": ir.i64,
+                    "ptr": ir.u64,
+                    ir.ptr: ir.u64,
+                }
+            )
+        else:
+            self.xlen = 32
+            type_infos[ir.f64] = TypeInfo(8, 8)
+        # The return address and the frame pointer are saved in a header
+        # in between the frame and the caller frame.
+        self.word_size = self.xlen // 8
+        self.header_size = 2 * self.word_size
+
         self.info = ArchInfo(
-            type_infos={
-                ir.i8: TypeInfo(1, 1),
-                ir.u8: TypeInfo(1, 1),
-                ir.i16: TypeInfo(2, 2),
-                ir.u16: TypeInfo(2, 2),
-                ir.i32: TypeInfo(4, 4),
-                ir.u32: TypeInfo(4, 4),
-                ir.f32: TypeInfo(4, 4),
-                ir.f64: TypeInfo(4, 4),
-                "int": ir.i32,
-                "long": ir.i32,
-                "ptr": ir.u32,
-                ir.ptr: ir.u32,
-            },
+            type_infos=type_infos,
             register_classes=self.regclass,
+            jump_tables=True,
+            selects=True,
+            latency_model=latency_models[cores[0]] if cores else None,
+            reschedule=self.has_option("postsched"),
         )
 
-        self.fp = FP
+        # Locals are addressed relative to the frame pointer, or relative
+        # to the stack pointer if the frame pointer is omitted:
+        self.fp = SP if self.has_option("omitfp") else FP
         self.callee_save = (
             R9,
             R18,
@@ -132,128 +334,361 @@ class RiscvArch(Architecture):
             R27,
         )
         self.caller_save = (R10, R11, R12, R13, R14, R15, R16, R17)
+        if self.has_option("omitfp"):
+            self.callee_save = (FP,) + self.callee_save
+        if self.psabi and self.hard_float:
+            # The standard calling convention also divides the floating
+            # point registers in callee and caller saved registers:
+            self.callee_save += tuple(fregisters[8:10] + fregisters[18:28])
+            self.caller_save += tuple(
+                fregisters[0:8] + fregisters[10:18] + fregisters[28:]
+            )
+        elif self.hard_float:
+            # No floating point registers are saved by the callee:
+            self.caller_save += tuple(fregisters)
         # (LR, FP, R9, R18, R19, R20, R21 ,R22, R23 ,R24, R25, R26, R27)
 
-    def branch(self, reg, lab):
+    def branch(self, reg, lab, clobbers=None):
+        """Call a label or the address in a register.
+
+        With the farcall option, labels are called with an auipc and jalr
+        pair, which the linker relaxes when the label is near.
+        """
+        if clobbers is None:
+            clobbers = self.caller_save
         if self.has_option("rvc"):
             if isinstance(lab, RiscvRegister):
-                return CBlr(reg, lab, 0, clobbers=self.caller_save)
+                return CBlr(reg, lab, 0, clobbers=clobbers)
+            elif self.has_option("farcall"):
+                return CCall(reg, lab, clobbers=clobbers)
             else:
-                return CBl(reg, lab, clobbers=self.caller_save)
+                return CBl(reg, lab, clobbers=clobbers)
         else:
             if isinstance(lab, RiscvRegister):
-                return Blr(reg, lab, 0, clobbers=self.caller_save)
+                return Blr(reg, lab, 0, clobbers=clobbers)
+            elif self.has_option("farcall"):
+                return Call(reg, lab, clobbers=clobbers)
             else:
-                return Bl(reg, lab, clobbers=self.caller_save)
+                return Bl(reg, lab, clobbers=clobbers)
 
     def get_runtime(self):
-        """ Implement compiler runtime functions """
+        """Implement compiler runtime functions.
+
+        The multiply and divide functions are used by the nom option and
+        the floating point functions when there is no floating point unit.
+        Large blocks of memory are copied and cleared by the block
+        functions. They are bundled as an archive, so only the functions
+        which are called are linked in.
+        """
         from ...api import asm
 
-        asm_src = """
-        __sdiv:
-        ; Divide x12 by x13
-        ; x14 is a work register.
-        ; x10 is the quotient
-
-        mv x10, x0     ; Initialize the result
-        li x14, 1      ; mov divisor into temporary register.
-
-        ; Blow up part: blow up divisor until it is larger than the divident.
-        __shiftl:
-        bge x13, x12, __cont1
-        slli x13, x13, 1
-        slli x14, x14, 1
-        j __shiftl
-
-        ; Repeatedly substract shifted versions of divisor
-        __cont1:
-        beq x14, x0, __exit
-        blt x12, x13, __skip
-        sub x12, x12, x13
-        or x10, x10, x14
-        __skip:
-        srli x13, x13, 1
-        srli x14, x14, 1
-        j __cont1
-
-        __exit:
-        jalr x0,ra,0
+        if self.has_option("rvv"):
+            block = asm(io.StringIO(RT_BLOCK_RVV_ASM_SRC), self)
+        else:
+            block = asm(io.StringIO(RT_BLOCK_ASM_SRC), self)
+        if self.has_option("rv64"):
+            # The rv64 target always has the multiply and divide instructions
+            return archive([block])
+        if self.has_option("nom"):
+            float_src = RT_FLOAT_ASM_SRC + RT_FLOAT_MULTIPLY_NOM_ASM_SRC
+            double_src = RT_DOUBLE_ASM_SRC + RT_DOUBLE_MULTIPLY_NOM_ASM_SRC
+        else:
+            float_src = RT_FLOAT_ASM_SRC + RT_FLOAT_MULTIPLY_ASM_SRC
+            double_src = RT_DOUBLE_ASM_SRC + RT_DOUBLE_MULTIPLY_ASM_SRC
+        return archive(
+            [
+                asm(io.StringIO(RT_MUL_ASM_SRC), self),
+                asm(io.StringIO(RT_DIV_ASM_SRC), self),
+                block,
+                asm(io.StringIO(float_src), self),
+                asm(io.StringIO(double_src), self),
+            ]
+        )
+
+    def get_global_section(self, var):
+        """Get the section in which a global variable is placed.
+
+        With the sdata option, small variables are placed in the sdata
+        and sbss sections, so they can be addressed relative to the
+        global pointer.
         """
-        return asm(io.StringIO(asm_src), self)
+        if self.has_option("sdata") and var.amount <= MAX_SMALL_DATA_SIZE:
+            return "sdata" if var.value else "sbss"
+        return "data"
+
+    def get_decoder(self):
+        """ Create a decoder for riscv machine code """
+        from .decoder import RiscvDecoder
+
+        return RiscvDecoder(self)
 
     def move(self, dst, src):
         """ Generate a move from src to dst """
+        if isinstance(dst, RiscvPairRegister):
+            return MovePair(dst, src, ismove=True)
+        if isinstance(dst, RiscvFRegister) != isinstance(src, RiscvFRegister):
+            # Floating point values can be passed in integer registers:
+            if isinstance(dst, RiscvFRegister):
+                return Movsx(dst, src)
+            else:
+                return Movxs(dst, src)
         if self.has_option("rvc"):
             return CMovr(dst, src, ismove=True)
         else:
             if (
                 isinstance(dst, RiscvFRegister)
                 and isinstance(src, RiscvFRegister)
-                and self.has_option("rvf")
+                and self.hard_float
             ):
+                if self.has_option("rvd"):
+                    return movd(dst, src)
                 return movf(dst, src)
             else:
                 return Movr(dst, src, ismove=True)
 
-    def gen_riscv_memcpy(self, dst, src, tmp, size):
-        # Called before register allocation
-        # Major crappy memcpy, can be improved!
-        for idx in range(size):
-            yield Lb(tmp, idx, src)
-            yield Sb(tmp, idx, dst)
+    def gen_riscv_memcpy(self, frame, dst, src, size, alignment):
+        """Copy size bytes from src to dst.
+
+        Called before register allocation. Small copies are unrolled into
+        loads and stores of the widest access which the alignment allows.
+        Larger copies call the copy loop in the runtime.
+        """
+        moves = self.split_block(size, alignment)
+        if len(moves) > MAX_UNROLLED_MOVES:
+            yield from self.gen_block_call("__memcpy", (dst, src), size)
+            return
+
+        # Load a group of values before storing them, so that a store
+        # does not wait for the load right before it:
+        for index in range(0, len(moves), 4):
+            group = moves[index : index + 4]
+            temps = [frame.new_reg(RiscvRegister) for _ in group]
+            for tmp, (offset, width) in zip(temps, group):
+                yield block_loads[width](tmp, offset, src)
+            for tmp, (offset, width) in zip(temps, group):
+                yield block_stores[width](tmp, offset, dst)
+
+    def gen_riscv_memclr(self, dst, size, alignment):
+        """ Fill size bytes at dst with zeros, like gen_riscv_memcpy """
+        moves = self.split_block(size, alignment)
+        if len(moves) > MAX_UNROLLED_MOVES:
+            yield from self.gen_block_call("__memclr", (dst,), size)
+            return
+
+        for offset, width in moves:
+            yield block_stores[width](R0, offset, dst)
+
+    def split_block(self, size, alignment):
+        """Split a block of memory into accesses of at most a word.
+
+        Returns a list of offset and width pairs.
+        """
+        width = min(alignment, self.word_size)
+        moves = []
+        offset = 0
+        while offset < size:
+            while offset + width > size:
+                width //= 2
+            moves.append((offset, width))
+            offset += width
+        return moves
+
+    def gen_block_call(self, name, pointers, size):
+        """Call a block function in the runtime.
+
+        The pointers are passed in x12 and x13, followed by the size.
+        """
+        registers = (R12, R13, R14)[: len(pointers) + 1]
+        for register, pointer in zip(registers, pointers):
+            yield self.move(register, pointer)
+        yield Li(registers[-1], size)
+        yield RegisterUseDef(uses=registers)
+        yield Global(name)
+        yield self.branch(LR, name, clobbers=registers)
+
+    def optimize_selection(self, frame):
+        """Optimize the selected instructions, before register allocation.
+
+        With the xpulp option, pointer increments are folded into post
+        increment loads and stores, and counted loops become hardware
+        loops.
+        """
+        instructions = frame.instructions
+        if self.has_option("xpulp"):
+            instructions = fold_post_increments(instructions, self.move)
+            instructions = insert_hardware_loops(frame, instructions)
+        return instructions
 
     def peephole(self, frame):
+        frame.is_leaf = self.is_leaf(frame)
+        frame_offset = self.frame_offset(frame)
+        base = FP if self.uses_frame_pointer(frame) else SP
         newinstructions = []
-        for ins in frame.instructions:
-            if hasattr(ins, "fprel") and ins.fprel:
-                ins.offset += round_up(frame.stacksize + 8) - 8
+        # The words of the pairs are accessed separately, so that their
+        # offsets are checked one by one:
+        for ins in split_pair_instructions(frame.instructions):
+            if getattr(ins, "fprel", False) and ins.rs1 is self.fp:
+                ins.offset += frame_offset
+                ins.rs1 = base
+                if not isinsrange(12, ins.offset):
+                    # Add the upper bits of the offset to the base first:
+                    lower = sign_extend(ins.offset, 12)
+                    upper = (ins.offset - lower) >> 12
+                    newinstructions.append(Lui(R5, upper & 0xFFFFF))
+                    newinstructions.append(Addr(R5, R5, base))
+                    ins.offset = lower
+                    ins.rs1 = R5
             newinstructions.append(ins)
+        newinstructions = self.remove_jumps_to_next(newinstructions)
+        if self.has_option("xpulp"):
+            newinstructions = pad_hardware_loops(newinstructions)
+        if self.has_option("rvc"):
+            newinstructions = self.compress_instructions(
+                frame, newinstructions
+            )
+        return newinstructions
+
+    def remove_jumps_to_next(self, instructions):
+        """ Remove jumps to the label directly after them """
+        newinstructions = []
+        for ins, next_ins in zip(instructions, instructions[1:] + [None]):
+            if (
+                isinstance(ins, (B, CB))
+                and isinstance(next_ins, Label)
+                and next_ins.name == ins.target
+            ):
+                continue
+            newinstructions.append(ins)
+        return newinstructions
+
+    def get_register_preferences(self, instruction):
+        """ Prefer registers for which the instruction can be compressed """
+        if self.has_option("rvc"):
+            for register in get_compressible_operands(instruction):
+                yield register, compressible_registers
+            rd, sources = get_tied_operands(instruction)
+            if sources:
+                yield rd, sources
+                for register in sources:
+                    yield register, (rd,)
+
+    def compress_instructions(self, frame, instructions):
+        """Replace instructions by their compressed forms.
+
+        This is done after register allocation, when the registers are
+        known. The code size before and after is logged per function.
+        """
+        debug_db = frame.debug_db
+        newinstructions = []
+        old_size = new_size = 0
+        for ins in instructions:
+            # Compress the instructions which pseudo instructions stand for:
+            for part in expand_instruction(ins):
+                old_size += instruction_size(part)
+                cpart = compress(part)
+                if cpart is not None:
+                    part = cpart
+                if debug_db:
+                    debug_db.map(ins, part)
+                new_size += instruction_size(part)
+                newinstructions.append(part)
+        self.logger.info(
+            "Compressed %s from %s to %s bytes", frame.name, old_size, new_size
+        )
         return newinstructions
 
     def gen_call(self, frame, label, args, rv):
         """ Implement actual call and save / restore live registers """
 
+        if rv and label in self.intrinsics:
+            # The function is a single instruction, no call is needed:
+            yield self.intrinsics[label](rv[1], *(a[1] for a in args))
+            return
+
+        if label in self.kernels:
+            # The function is expanded into a loop:
+            kernel = self.kernels[label]
+            yield from kernel(self, frame, rv, [a[1] for a in args])
+            return
+
         arg_types = [a[0] for a in args]
         arg_locs = self.determine_arg_locations(arg_types)
-        stack_size = 0
-        # Setup parameters:
-        for arg_loc, arg2 in zip(arg_locs, args):
-            arg = arg2[1]
-            if isinstance(arg_loc, (RiscvRegister, RiscvFRegister)):
-                yield self.move(arg_loc, arg)
-            elif isinstance(arg_loc, StackLocation):
-                stack_size += arg_loc.size
-                if isinstance(arg, RiscvRegister):
-                    yield Sw(arg, arg_loc.offset, SP)
-                elif isinstance(arg, StackLocation):
+        values = []
+        # Setup parameters on the stack first, since copying a large blob
+        # calls the runtime, which uses the argument registers:
+        for arg_loc, (arg_type, arg) in zip(arg_locs, args):
+            if isinstance(arg_loc, BlobReference):
+                # Pass a pointer to a copy of the blob:
+                alignment = max(arg_type.alignment, self.word_size)
+                copy = frame.alloc(arg.size, alignment)
+                pointer = frame.new_reg(RiscvRegister)
+                yield from self.gen_blob_copy(frame, pointer, copy, arg)
+                arg_loc, arg = arg_loc.location, pointer
+            elif isinstance(arg_loc, tuple) and isinstance(arg, Register):
+                # Pass the words of a double:
+                words = tuple(frame.new_reg(RiscvRegister) for _ in arg_loc)
+                yield SplitPair(*words, arg)
+                for part, word in zip(arg_loc, words):
+                    if isinstance(part, StackLocation):
+                        yield self.store_word(word, part.offset, SP)
+                arg = words
+            elif isinstance(arg_loc, tuple):
+                # Load the words of a small blob, from an aligned copy if
+                # the blob itself is not aligned:
+                if self.get_alignment(arg) < self.word_size:
+                    size = round_up(arg.size, self.word_size)
+                    copy = frame.alloc(size, self.word_size)
+                    pointer = frame.new_reg(RiscvRegister)
+                    yield from self.gen_blob_copy(frame, pointer, copy, arg)
+                    arg = copy
+                for index, part in enumerate(arg_loc):
+                    if isinstance(part, StackLocation):
+                        value = frame.new_reg(RiscvRegister)
+                        offset = arg.offset + index * self.word_size
+                        code = self.load_word(value, offset, self.fp)
+                        code.fprel = True
+                        yield code
+                        yield self.store_word(value, part.offset, SP)
+            if isinstance(arg_loc, StackLocation):
+                if isinstance(arg, Register):
+                    yield self.store_word(arg, arg_loc.offset, SP)
+                else:
                     p1 = frame.new_reg(RiscvRegister)
                     p2 = frame.new_reg(RiscvRegister)
-                    v3 = frame.new_reg(RiscvRegister)
 
                     # Destination location:
-                    # Remember that the LR and FP are pushed in between
-                    # So hence -8:
                     yield instructions.Addi(p1, SP, arg_loc.offset)
                     # Source location:
-                    yield instructions.Addi(
-                        p2,
-                        self.fp,
-                        arg.offset + round_up(frame.stacksize + 8) - 8,
+                    code = instructions.Addi(p2, self.fp, arg.offset)
+                    code.fprel = True
+                    yield code
+                    alignment = min(
+                        self.get_alignment(arg_loc), self.get_alignment(arg)
                     )
-                    for instruction in self.gen_riscv_memcpy(
-                        p1, p2, v3, arg.size
-                    ):
-                        yield instruction
-            else:  # pragma: no cover
-                raise NotImplementedError("Parameters in memory not impl")
+                    yield from self.gen_riscv_memcpy(
+                        frame, p1, p2, arg.size, alignment
+                    )
+            values.append((arg_loc, arg))
+
+        for arg_loc, arg in values:
+            if isinstance(arg_loc, Register):
+                yield self.move(arg_loc, arg)
+            elif isinstance(arg_loc, tuple) and isinstance(arg, tuple):
+                for part, word in zip(arg_loc, arg):
+                    if isinstance(part, Register):
+                        yield self.move(part, word)
+            elif isinstance(arg_loc, tuple):
+                for index, part in enumerate(arg_loc):
+                    if isinstance(part, Register):
+                        offset = arg.offset + index * self.word_size
+                        code = self.load_word(part, offset, self.fp)
+                        code.fprel = True
+                        yield code
 
         # Record that certain amount of stack is required:
-        frame.add_out_call(stack_size)
+        frame.add_out_call(self.get_stack_arguments_size(arg_locs))
 
-        arg_regs = set(
-            arg_loc for arg_loc in arg_locs if isinstance(arg_loc, Register)
-        )
+        arg_regs = list(self.get_argument_registers(arg_locs))
         yield RegisterUseDef(uses=arg_regs)
 
         yield self.branch(LR, label)
@@ -263,28 +698,99 @@ class RiscvArch(Architecture):
             yield RegisterUseDef(defs=(retval_loc,))
             yield self.move(rv[1], retval_loc)
 
-    def gen_function_enter(self, args):
+    def gen_function_enter(self, frame, args):
         arg_types = [a[0] for a in args]
         arg_locs = self.determine_arg_locations(arg_types)
 
-        arg_regs = set(
-            arg_loc for arg_loc in arg_locs if isinstance(arg_loc, Register)
-        )
+        arg_regs = list(self.get_argument_registers(arg_locs))
         yield RegisterUseDef(defs=arg_regs)
 
-        for arg_loc, arg2 in zip(arg_locs, args):
-            arg = arg2[1]
+        copies = []
+        for arg_loc, (arg_type, arg) in zip(arg_locs, args):
+            if isinstance(arg_loc, BlobReference):
+                # Copy the blob into the frame, after all arguments have
+                # been taken from the argument registers:
+                pointer = frame.new_reg(RiscvRegister)
+                copies.append((pointer, arg, arg_type))
+                arg_loc, arg = arg_loc.location, pointer
+            elif isinstance(arg_loc, tuple) and isinstance(arg, Register):
+                # Join the words of a double:
+                words = []
+                for part in arg_loc:
+                    if isinstance(part, StackLocation):
+                        value = frame.new_reg(RiscvRegister)
+                        code = self.load_word(value, part.offset, self.fp)
+                        code.fprel = True
+                        yield code
+                    else:
+                        value = part
+                    words.append(value)
+                yield JoinPair(arg, *words)
+            elif isinstance(arg_loc, tuple):
+                # Store the words of a small blob into the frame:
+                for index, part in enumerate(arg_loc):
+                    if isinstance(part, StackLocation):
+                        value = frame.new_reg(RiscvRegister)
+                        code = self.load_word(value, part.offset, self.fp)
+                        code.fprel = True
+                        yield code
+                    else:
+                        value = part
+                    yield from self.gen_store_blob_word(
+                        frame, value, arg, index
+                    )
+
             if isinstance(arg_loc, Register):
                 yield self.move(arg, arg_loc)
             elif isinstance(arg_loc, StackLocation):
-                if isinstance(arg, RiscvRegister):
-                    Code = Lw(arg, arg_loc.offset, FP)
+                if isinstance(arg, Register):
+                    Code = self.load_word(arg, arg_loc.offset, self.fp)
                     Code.fprel = True
                     yield Code
-                else:
-                    pass
-            else:  # pragma: no cover
-                raise NotImplementedError("Parameters in memory not impl")
+
+        for pointer, arg, arg_type in copies:
+            copy = frame.new_reg(RiscvRegister)
+            code = instructions.Addi(copy, self.fp, arg.offset)
+            code.fprel = True
+            yield code
+            alignment = min(self.get_alignment(arg), arg_type.alignment)
+            yield from self.gen_riscv_memcpy(
+                frame, copy, pointer, arg.size, alignment
+            )
+
+    def gen_blob_copy(self, frame, pointer, copy, blob):
+        """ Copy a blob on the stack to copy, and point pointer to it """
+        source = frame.new_reg(RiscvRegister)
+        for register, location in ((pointer, copy), (source, blob)):
+            code = instructions.Addi(register, self.fp, location.offset)
+            code.fprel = True
+            yield code
+        alignment = min(self.get_alignment(copy), self.get_alignment(blob))
+        yield from self.gen_riscv_memcpy(
+            frame, pointer, source, blob.size, alignment
+        )
+
+    def gen_store_blob_word(self, frame, value, location, index):
+        """Store the word with the given index of a blob.
+
+        The last word of the blob can be partial, and the blob can be
+        less aligned than a word, so the word is stored in pieces which
+        fit in the blob.
+        """
+        alignment = self.get_alignment(location)
+        start = index * self.word_size
+        size = min(location.size - start, self.word_size)
+        for offset, width in self.split_block(size, alignment):
+            if offset:
+                piece = frame.new_reg(RiscvRegister)
+                yield instructions.Srli(piece, value, 8 * offset)
+            else:
+                piece = value
+            code = block_stores[width](
+                piece, location.offset + start + offset, self.fp
+            )
+            code.fprel = True
+            yield code
 
     def gen_function_exit(self, rv):
         live_out = set()
@@ -300,7 +806,13 @@ class RiscvArch(Architecture):
         ABI:
         pass args in R12-R17
         return values in R10
+
+        With the ilp32 and ilp32f options, the standard calling convention
+        is used instead.
         """
+        if self.psabi:
+            return self.determine_psabi_arg_locations(arg_types)
+
         locations = []
         regs = [R12, R13, R14, R15, R16, R17]
         fregs = [F12, F13, F14, F15, F16, F17]
@@ -310,8 +822,10 @@ class RiscvArch(Architecture):
             if a.is_blob:
                 r = StackLocation(offset, a.size)
                 offset += a.size
+            elif a is ir.f64 and self.soft_double:
+                r, offset = self.get_double_location(regs, offset)
             else:
-                if a in [ir.f32, ir.f64] and self.has_option("rvf"):
+                if self.in_float_register(a):
                     if fregs:
                         r = fregs.pop(0)
                     else:
@@ -322,67 +836,143 @@ class RiscvArch(Architecture):
                     if regs:
                         r = regs.pop(0)
                     else:
-                        arg_size = self.info.get_size(a)
+                        # Arguments are passed in a full register slot:
+                        arg_size = self.word_size
                         r = StackLocation(offset, arg_size)
                         offset += arg_size
             locations.append(r)
         return locations
 
+    def determine_psabi_arg_locations(self, arg_types):
+        """Determine argument locations of the standard calling convention.
+
+        Integer arguments are passed in a0-a7 and floating point arguments
+        in fa0-fa7 with the ilp32f option. When these run out, arguments
+        are passed in the remaining integer registers, and then on the
+        stack. Blobs of up to two words are split into words, which are
+        passed like integers. Larger blobs are passed by reference to a
+        copy made by the caller.
+        """
+        locations = []
+        regs = [R10, R11, R12, R13, R14, R15, R16, R17]
+        if self.has_option("ilp32f"):
+            fregs = [F10, F11, F12, F13, F14, F15, F16, F17]
+        else:
+            fregs = []
+
+        offset = 0
+        for a in arg_types:
+            if a.is_blob and a.size > 2 * self.word_size:
+                if regs:
+                    r = BlobReference(regs.pop(0))
+                else:
+                    r = BlobReference(StackLocation(offset, self.word_size))
+                    offset += self.word_size
+            elif a.is_blob and regs:
+                words = []
+                for _ in range(0, a.size, self.word_size):
+                    if regs:
+                        words.append(regs.pop(0))
+                    else:
+                        words.append(StackLocation(offset, self.word_size))
+                        offset += self.word_size
+                r = tuple(words)
+            elif a.is_blob:
+                r = StackLocation(offset, round_up(a.size, self.word_size))
+                offset += r.size
+            elif self.in_float_register(a) and fregs:
+                r = fregs.pop(0)
+            elif a is ir.f64 and self.soft_double:
+                r, offset = self.get_double_location(regs, offset)
+            elif regs:
+                r = regs.pop(0)
+            else:
+                # Arguments are passed in a full register slot:
+                r = StackLocation(offset, self.word_size)
+                offset += self.word_size
+            locations.append(r)
+        return locations
+
+    def get_double_location(self, regs, offset):
+        """Get the location of a double which is kept in a pair.
+
+        The words of the double are passed in the next registers, and on
+        the stack when these run out. Returns the location and the offset
+        on the stack after it.
+        """
+        if not regs:
+            offset = round_up(offset, 8)
+            return StackLocation(offset, 8), offset + 8
+        words = []
+        for _ in range(2):
+            if regs:
+                words.append(regs.pop(0))
+            else:
+                words.append(StackLocation(offset, self.word_size))
+                offset += self.word_size
+        return tuple(words), offset
+
+    def get_argument_registers(self, arg_locs):
+        """ Get the registers which are used by the argument locations """
+        for arg_loc in arg_locs:
+            if isinstance(arg_loc, BlobReference):
+                arg_loc = arg_loc.location
+            for part in arg_loc if isinstance(arg_loc, tuple) else (arg_loc,):
+                if isinstance(part, Register):
+                    yield part
+
+    def get_stack_arguments_size(self, arg_locs):
+        """ Get the size of the arguments which are passed on the stack """
+        size = 0
+        for arg_loc in arg_locs:
+            if isinstance(arg_loc, BlobReference):
+                arg_loc = arg_loc.location
+            for part in arg_loc if isinstance(arg_loc, tuple) else (arg_loc,):
+                if isinstance(part, StackLocation):
+                    size = max(size, part.offset + part.size)
+        return size
+
+    def get_alignment(self, location):
+        """Get the alignment of a location on the stack.
+
+        The stack pointer and frame pointer are aligned at 16 bytes, so
+        the offset determines the alignment.
+        """
+        offset = location.offset | 16
+        return offset & -offset
+
     def determine_rv_location(self, ret_type):
-        if ret_type in [ir.f32, ir.f64] and self.has_option("rvf"):
+        if self.in_float_register(ret_type) and not self.has_option("ilp32"):
             rv = F10
+        elif ret_type is ir.f64 and self.soft_double:
+            rv = P10
         else:
             rv = R10
         return rv
 
     def gen_prologue(self, frame):
-        """ Returns prologue instruction sequence """
+        """Returns prologue instruction sequence.
+
+        The stack pointer is adjusted once for the whole frame. From the
+        stack pointer upwards, the frame holds the arguments of outgoing
+        calls, the saved registers and the locals. The frame pointer, if
+        any, points to the stack pointer of the caller.
+        """
         # Label indication function:
         yield Label(frame.name)
-        ssize = round_up(frame.stacksize + 8)
-        if self.has_option("rvc") and isinsrange(10, -ssize):
-            yield CAddi16sp(-ssize)  # Reserve stack space
-        else:
-            yield Addi(SP, SP, -ssize)  # Reserve stack space
-
-        if self.has_option("rvc"):
-            yield CSwsp(LR, 4)
-            yield CSwsp(FP, 0)
-        else:
-            yield Sw(LR, 4, SP)
-            yield Sw(FP, 0, SP)
-
-        if self.has_option("rvc"):
-            yield CAddi4spn(FP, 8)  # Setup frame pointer
-        else:
-            yield Addi(FP, SP, 8)  # Setup frame pointer
-        # yield Addi(FP, SP, 8)  # Setup frame pointer
-
-        saved_registers = self.get_callee_saved(frame)
-        rsize = 4 * len(saved_registers)
-        rsize = round_up(rsize)
-
-        if self.has_option("rvc") and isinsrange(10, rsize):
-            yield CAddi16sp(-rsize)  # Reserve stack space
-        else:
-            yield Addi(SP, SP, -rsize)  # Reserve stack space
-
-        i = 0
-        for register in saved_registers:
-            i -= 4
-            if self.has_option("rvc"):
-                yield CSwsp(register, i + rsize)
-            else:
-                yield Sw(register, i + rsize, SP)
-
-        # Allocate space for outgoing calls:
-        extras = max(frame.out_calls) if frame.out_calls else 0
-        if extras:
-            ssize = round_up(extras)
-            if self.has_option("rvc") and isinsrange(10, ssize):
-                yield CAddi16sp(-ssize)  # Reserve stack space
+        size = self.get_frame_size(frame)
+        code = list(self.adjust_stack(-size))
+        offset = self.get_out_calls_size(frame)
+        for register in self.get_saved_registers(frame):
+            code.append(self.store_word(register, offset, SP))
+            offset += self.word_size
+        if self.uses_frame_pointer(frame):
+            if isinsrange(12, size):
+                code.append(Addi(FP, SP, size))
             else:
-                yield Addi(SP, SP, -ssize)  # Reserve stack space
+                code.append(Li(R5, size))
+                code.append(Addr(FP, SP, R5))
+        yield from self.compress_sequence(code)
 
     def litpool(self, frame):
         """ Generate instruction for the current literals """
@@ -394,6 +984,8 @@ class RiscvArch(Architecture):
         # Add constant literals:
         while frame.constants:
             label, value = frame.constants.pop(0)
+            if isinstance(value, bytes) and len(value) == 8:
+                yield Align(8)  # Align doubles at 8 bytes
             yield Label(label)
             if isinstance(value, (int, str)):
                 yield dcd(value)
@@ -401,6 +993,10 @@ class RiscvArch(Architecture):
                 for byte in value:
                     yield DByte(byte)
                 yield Align(4)  # Align at 4 bytes
+            elif isinstance(value, tuple):
+                # A table of labels:
+                for label in value:
+                    yield dcd(label)
             else:  # pragma: no cover
                 raise NotImplementedError("Constant of type {}".format(value))
 
@@ -414,45 +1010,13 @@ class RiscvArch(Architecture):
         """Return epilogue sequence for a frame. Adjust frame pointer
         and add constant pool
         """
-        # Free space for outgoing calls:
-        extras = max(frame.out_calls) if frame.out_calls else 0
-        if extras:
-            ssize = round_up(extras)
-            if self.has_option("rvc") and isinsrange(10, ssize):
-                yield CAddi16sp(ssize)  # Reserve stack space
-            else:
-                yield Addi(SP, SP, ssize)  # Reserve stack space
-
-        # Callee saved registers:
-        saved_registers = self.get_callee_saved(frame)
-        rsize = 4 * len(saved_registers)
-        rsize = round_up(rsize)
-
-        i = 0
-        for register in saved_registers:
-            i -= 4
-            if self.has_option("rvc"):
-                yield CLwsp(register, i + rsize)
-            else:
-                yield Lw(register, i + rsize, SP)
-
-        if self.has_option("rvc") and isinsrange(10, rsize):
-            yield CAddi16sp(rsize)  # Reserve stack space
-        else:
-            yield Addi(SP, SP, rsize)  # Reserve stack space
-
-        if self.has_option("rvc"):
-            yield CLwsp(LR, 4)
-            yield CLwsp(FP, 0)
-        else:
-            yield Lw(LR, 4, SP)
-            yield Lw(FP, 0, SP)
-
-        ssize = round_up(frame.stacksize + 8)
-        if self.has_option("rvc") and isinsrange(10, ssize):
-            yield CAddi16sp(ssize)  # Free stack space
-        else:
-            yield Addi(SP, SP, ssize)  # Free stack space
+        code = []
+        offset = self.get_out_calls_size(frame)
+        for register in self.get_saved_registers(frame):
+            code.append(self.load_word(register, offset, SP))
+            offset += self.word_size
+        code.extend(self.adjust_stack(self.get_frame_size(frame)))
+        yield from self.compress_sequence(code)
 
         # Return
         if self.has_option("rvc"):
@@ -465,6 +1029,120 @@ class RiscvArch(Architecture):
             yield instruction
         yield Align(4)  # Align at 4 bytes
 
+    def is_leaf(self, frame):
+        """Test if a frame makes no calls.
+
+        Next to calls to other functions, calls to the runtime functions
+        overwrite the return address.
+        """
+        if frame.out_calls:
+            return False
+        return not any(
+            LR in ins.defined_registers for ins in frame.instructions
+        )
+
+    def uses_frame_pointer(self, frame):
+        """ Test if the frame pointer is setup for a frame """
+        if self.has_option("omitfp"):
+            return False
+        # Leaf functions without locals do not need a frame:
+        return not (frame.is_leaf and frame.stacksize == 0)
+
+    def get_saved_registers(self, frame):
+        """ Get the registers which are saved on the stack by a frame """
+        saved_registers = []
+        if not frame.is_leaf:
+            saved_registers.append(LR)
+        if self.uses_frame_pointer(frame):
+            saved_registers.append(FP)
+        saved_registers.extend(self.get_callee_saved(frame))
+        return saved_registers
+
+    def get_out_calls_size(self, frame):
+        """ Get the space for stack arguments of outgoing calls """
+        return max(frame.out_calls) if frame.out_calls else 0
+
+    def get_frame_size(self, frame):
+        """ Get the total amount of stack space used by a frame """
+        saved_size = self.word_size * len(self.get_saved_registers(frame))
+        locals_size = round_up(frame.stacksize, self.word_size)
+        size = self.get_out_calls_size(frame) + saved_size + locals_size
+        return round_up(size, 16)
+
+    def adjust_stack(self, amount):
+        """ Add an amount to the stack pointer """
+        if not amount:
+            return
+        if isinsrange(12, amount):
+            yield Addi(SP, SP, amount)
+        else:
+            yield Li(R5, amount)
+            yield Addr(SP, SP, R5)
+
+    def compress_sequence(self, instructions):
+        """ Compress prologue and epilogue instructions if possible """
+        if self.has_option("rvc"):
+            for ins in instructions:
+                for part in expand_instruction(ins):
+                    yield compress(part) or part
+        else:
+            yield from instructions
+
+    def frame_offset(self, frame):
+        """Get the offset of the stack pointer of the caller.
+
+        Locals and stack arguments are addressed relative to this
+        location, which is the frame pointer or the stack pointer plus
+        the frame size.
+        """
+        if self.uses_frame_pointer(frame):
+            return 0
+        else:
+            return self.get_frame_size(frame)
+
+    def store_word(self, register, offset, base):
+        """ Store a full register """
+        if isinstance(register, RiscvPairRegister):
+            return StorePair(register, offset, base)
+        elif isinstance(register, RiscvFRegister):
+            return FSw(register, offset, base)
+        elif self.has_option("rv64"):
+            return Sd(register, offset, base)
+        else:
+            return Sw(register, offset, base)
+
+    def load_word(self, register, offset, base):
+        """ Load a full register """
+        if isinstance(register, RiscvPairRegister):
+            return LoadPair(register, offset, base)
+        elif isinstance(register, RiscvFRegister):
+            return FLw(register, offset, base)
+        elif self.has_option("rv64"):
+            return Ld(register, offset, base)
+        else:
+            return Lw(register, offset, base)
+
+    @property
+    def hard_float(self):
+        """ Test if floating point values are passed in the F registers """
+        return self.has_option("rvf") or self.has_option("rvd")
+
+    @property
+    def soft_double(self):
+        """ Test if doubles are kept in pairs of integer registers """
+        return not (self.has_option("rv64") or self.has_option("rvd"))
+
+    def in_float_register(self, typ):
+        """ Test if values of a type are passed in the F registers """
+        if typ is ir.f64:
+            return self.has_option("rvd")
+        return typ is ir.f32 and self.hard_float
+
+    @property
+    def psabi(self):
+        """ Test if the standard calling convention is used """
+        return self.has_option("ilp32") or self.has_option("ilp32f")
+
     def get_callee_saved(self, frame):
         saved_registers = []
         for register in self.callee_save:
@@ -473,5 +1151,12 @@ class RiscvArch(Architecture):
         return saved_registers
 
 
-def round_up(s):
-    return s + (16 - s % 16)
+class BlobReference:
+    """ A blob which is passed as a pointer to a copy of the blob """
+
+    def __init__(self, location):
+        self.location = location
+
+
+def round_up(value, multiple):
+    return value + (-value % multiple)
@@ -0,0 +1,591 @@
+"""Table driven decoding of RISC-V machine code.
+
+The decoder turns raw instruction words back into instances of the
+instruction classes of the isa, rvcisa, rvfisa, rvdisa, rv64isa, bit
+manipulation, conditional zero, xpulp and vector modules. It is used by
+the disassembler and by the instruction set simulator.
+
+The lookup table is built once per instruction set. The fixed bits of
+every instruction class are determined by encoding the class with a range
+of operand values: bits which never change are part of the opcode. The
+resulting mask and match values are grouped by the primary opcode bits,
+so decoding a word takes only a few dictionary lookups.
+
+Operand values are extracted with the field functions listed per
+instruction format below. Jump and branch targets are absolute addresses,
+rendered as hexadecimal strings, since the decoded instructions have no
+labels to refer to.
+"""
+
+from ..registers import Register
+from . import instructions as rv
+from . import rvc_instructions as rvc
+from . import rvf_instructions as rvf
+from . import rvd_instructions as rvd
+from . import rvb_instructions as rvb
+from . import rv64_instructions as rv64
+from . import zicond_instructions as zc
+from . import xpulp_instructions as xp
+from . import rvv_instructions as rvv
+from .registers import RiscvRegister, RiscvFRegister
+
+
+class DecodeError(ValueError):
+    """ Raised when a word does not match a known instruction """
+
+    pass
+
+
+def format_target(address):
+    """ Render an absolute jump target """
+    return "0x{:08x}".format(address & 0xFFFFFFFF)
+
+
+def signed(field, bits):
+    """Sign extend a field, which is an expression of the given number of
+    bits, without calling a function for it.
+    """
+    sign_bit = 1 << (bits - 1)
+    return "(({}) ^ {:#x}) - {:#x}".format(field, sign_bit, sign_bit)
+
+
+def relative(field, bits):
+    """ Render a signed, pc relative, field as a jump target """
+    return "format_target(address + {})".format(signed(field, bits))
+
+
+# Fields of the instruction formats, as python expressions of the
+# instruction word and its address:
+rd = "(word >> 7) & 0x1F"
+rs1 = "(word >> 15) & 0x1F"
+rs2 = "(word >> 20) & 0x1F"
+shamt = "(word >> 20) & 0x3F"
+rs3 = "word >> 27"
+imm_i = signed("word >> 20", 12)
+imm_s = signed("((word >> 25) << 5) | ((word >> 7) & 0x1F)", 12)
+imm_u = "word >> 12"
+csr = "word >> 20"
+target_b = relative(
+    "((word >> 31) << 12) | (((word >> 7) & 1) << 11)"
+    " | (((word >> 25) & 0x3F) << 5) | (((word >> 8) & 0xF) << 1)",
+    13,
+)
+target_j = relative(
+    "((word >> 31) << 20) | (word & 0xFF000)"
+    " | (((word >> 20) & 1) << 11) | (((word >> 21) & 0x3FF) << 1)",
+    21,
+)
+
+# Fields of the hardware loop instructions, of which the end of the loop
+# is an unsigned offset in half words:
+uimm = "word >> 20"
+lp_target = "format_target(address + ((word >> 20) << 1))"
+lp_target5 = "format_target(address + (((word >> 15) & 0x1F) << 1))"
+
+# The signed immediate of the vector instructions, in the rs1 field:
+simm5 = signed("(word >> 15) & 0x1F", 5)
+
+# Fields of the compressed instruction formats:
+c_rd = "(word >> 7) & 0x1F"
+c_rs2 = "(word >> 2) & 0x1F"
+c_rdp = "((word >> 7) & 0x7) + 8"
+c_rs2p = "((word >> 2) & 0x7) + 8"
+c_imm = signed("(((word >> 12) & 1) << 5) | ((word >> 2) & 0x1F)", 6)
+c_shamt = "(((word >> 12) & 1) << 5) | ((word >> 2) & 0x1F)"
+c_lw_offset = (
+    "(((word >> 10) & 0x7) << 3) | (((word >> 6) & 1) << 2)"
+    " | (((word >> 5) & 1) << 6)"
+)
+c_lwsp_offset = (
+    "(((word >> 12) & 1) << 5) | (((word >> 4) & 0x7) << 2)"
+    " | (((word >> 2) & 0x3) << 6)"
+)
+c_swsp_offset = "(((word >> 9) & 0xF) << 2) | (((word >> 7) & 0x3) << 6)"
+c_addi4spn_imm = (
+    "(((word >> 11) & 0x3) << 4) | (((word >> 7) & 0xF) << 6)"
+    " | (((word >> 6) & 1) << 2) | (((word >> 5) & 1) << 3)"
+)
+c_addi16sp_imm = signed(
+    "(((word >> 12) & 1) << 9) | (((word >> 6) & 1) << 4)"
+    " | (((word >> 5) & 1) << 6) | (((word >> 3) & 0x3) << 7)"
+    " | (((word >> 2) & 1) << 5)",
+    10,
+)
+c_target_j = relative(
+    "(((word >> 12) & 1) << 11) | (((word >> 11) & 1) << 4)"
+    " | (((word >> 9) & 0x3) << 8) | (((word >> 8) & 1) << 10)"
+    " | (((word >> 7) & 1) << 6) | (((word >> 6) & 1) << 7)"
+    " | (((word >> 3) & 0x7) << 1) | (((word >> 2) & 1) << 5)",
+    12,
+)
+c_target_b = relative(
+    "(((word >> 12) & 1) << 8) | (((word >> 10) & 0x3) << 3)"
+    " | (((word >> 5) & 0x3) << 6) | (((word >> 3) & 0x3) << 1)"
+    " | (((word >> 2) & 1) << 5)",
+    9,
+)
+
+
+# The fields of each decodable instruction class, in the order of the
+# syntax arguments of the class:
+formats = {}
+
+
+def register_format(fields, *classes):
+    for cls in classes:
+        formats[cls] = fields
+
+
+register_format((), rv.Nop, rv.Ebreak, rv.Mret, rvc.CNop, rvc.CEbreak)
+register_format(
+    (rd, rs1, rs2),
+    rv.Addr,
+    rv.Subr,
+    rv.Sll,
+    rv.Slt,
+    rv.Sltu,
+    rv.Xorr,
+    rv.Srl,
+    rv.Sra,
+    rv.Orr,
+    rv.Andr,
+    rv.Mul,
+    rv.Mulh,
+    rv.Mulhsu,
+    rv.Mulhu,
+    rv.Div,
+    rv.Divu,
+    rv.Rem,
+    rv.Remu,
+    rvf.FAdd,
+    rvf.FSub,
+    rvf.FMul,
+    rvf.FDiv,
+    rvf.FSgnj,
+    rvf.FSgnjn,
+    rvf.FSgnjx,
+    rvf.Feq,
+    rvf.Fle,
+    rvf.Flt,
+)
+register_format(
+    (rd, rs1),
+    rv.Movr,
+    rvf.Movxs,
+    rvf.Movsx,
+    rvf.Fcvtsw,
+    rvf.Fcvtswu,
+    rvf.Fcvtws,
+    rvf.Fcvtwus,
+)
+register_format(
+    (rd, rs1, imm_i),
+    rv.Addi,
+    rv.Slti,
+    rv.Sltiu,
+    rv.Xori,
+    rv.Ori,
+    rv.Andi,
+    rv.Blr,
+)
+register_format((rd, rs1, rs2), rv.Slli, rv.Srli, rv.Srai)
+register_format((rd, imm_i, rs1), rv.Lb, rv.Lh, rv.Lw, rv.Lbu, rv.Lhu, rvf.FLw)
+register_format((rs2, imm_s, rs1), rv.Sb, rv.Sh, rv.Sw, rvf.FSw)
+register_format(
+    (rd, rs1, rs2),
+    rv64.Addw,
+    rv64.Subw,
+    rv64.Sllw,
+    rv64.Srlw,
+    rv64.Sraw,
+    rv64.Mulw,
+    rv64.Divw,
+    rv64.Divuw,
+    rv64.Remw,
+    rv64.Remuw,
+    rv64.Slliw,
+    rv64.Srliw,
+    rv64.Sraiw,
+)
+register_format((rd, rs1, imm_i), rv64.Addiw)
+register_format(
+    (rd, rs1, rs2),
+    rvd.FAddD,
+    rvd.FSubD,
+    rvd.FMulD,
+    rvd.FDivD,
+    rvd.FSgnjD,
+    rvd.FSgnjnD,
+    rvd.FSgnjxD,
+    rvd.FMinD,
+    rvd.FMaxD,
+    rvd.FeqD,
+    rvd.FleD,
+    rvd.FltD,
+)
+register_format(
+    (rd, rs1, rs2, rs3), rvd.FMaddD, rvd.FMsubD, rvd.FNmsubD, rvd.FNmaddD
+)
+register_format(
+    (rd, rs1),
+    rvd.FSqrtD,
+    rvd.Fcvtsd,
+    rvd.Fcvtds,
+    rvd.Fcvtwd,
+    rvd.Fcvtwud,
+    rvd.Fcvtdw,
+    rvd.Fcvtdwu,
+)
+register_format((rd, imm_i, rs1), rvd.FLd)
+register_format((rs2, imm_s, rs1), rvd.FSd)
+register_format((rd, rs1, shamt), rv64.Slli64, rv64.Srli64, rv64.Srai64)
+register_format((rd, imm_i, rs1), rv64.Ld, rv64.Lwu)
+register_format((rs2, imm_s, rs1), rv64.Sd)
+register_format(
+    (rs1, rs2, target_b), rv.Beq, rv.Bne, rv.Blt, rv.Bge, rv.Bltu, rv.Bgeu
+)
+register_format((rd, imm_u), rv.Lui, rv.Auipc)
+register_format((rd, target_j), rv.Bl)
+register_format((target_j,), rv.B)
+register_format((rd, csr), rv.Csrr)
+register_format((csr, rs1), rv.Csrw, rv.Csrs, rv.Csrwi, rv.Csrsi, rv.Csrci)
+register_format(
+    (rd,),
+    rv.Rdcyclei,
+    rv.Rdcyclehi,
+    rv.Rdtimei,
+    rv.Rdtimehi,
+    rv.Rdinstreti,
+    rv.Rdinstrethi,
+)
+register_format(
+    (rd, rs1, rs2),
+    rvb.Sh1add,
+    rvb.Sh2add,
+    rvb.Sh3add,
+    rvb.Andn,
+    rvb.Orn,
+    rvb.Xnor,
+    rvb.Min,
+    rvb.Minu,
+    rvb.Max,
+    rvb.Maxu,
+    rvb.Rol,
+    rvb.Ror,
+    rvb.Rori,
+)
+register_format(
+    (rd, rs1),
+    rvb.Clz,
+    rvb.Ctz,
+    rvb.Cpop,
+    rvb.SextB,
+    rvb.SextH,
+    rvb.ZextH,
+    rvb.OrcB,
+    rvb.Rev8,
+)
+register_format((rd, rs1, rs2), zc.CzeroEqz, zc.CzeroNez)
+register_format(
+    (rd, rs1, rs2),
+    xp.PMin,
+    xp.PMinu,
+    xp.PMax,
+    xp.PMaxu,
+    xp.PRor,
+    xp.PMac,
+    xp.PMsu,
+    xp.PClip,
+    xp.PClipu,
+)
+register_format(
+    (rd, rs1),
+    xp.PAbs,
+    xp.PExths,
+    xp.PExthz,
+    xp.PExtbs,
+    xp.PExtbz,
+    xp.PCnt,
+)
+register_format((rd, imm_i, rs1), xp.PLb, xp.PLh, xp.PLw, xp.PLbu, xp.PLhu)
+register_format((rs2, imm_s, rs1), xp.PSb, xp.PSh, xp.PSw)
+register_format((rd, lp_target), xp.LpStarti, xp.LpEndi)
+register_format((rd, rs1), xp.LpCount)
+register_format((rd, uimm), xp.LpCounti)
+register_format((rd, rs1, lp_target), xp.LpSetup)
+register_format((rd, uimm, lp_target5), xp.LpSetupi)
+register_format((rd, rs1), *rvv.vsetvli.values())
+register_format((rd, rs1), *rvv.vsetivli.values())
+register_format((rd, rs1, rs2), rvv.Vsetvl)
+register_format((rd, rs1), rvv.Vle8, rvv.Vle16, rvv.Vle32, rvv.Vle64)
+register_format((rd, rs1), rvv.Vse8, rvv.Vse16, rvv.Vse32, rvv.Vse64)
+register_format(
+    (rd, rs2, rs1),
+    rvv.VaddVv,
+    rvv.VaddVx,
+    rvv.VsubVv,
+    rvv.VsubVx,
+    rvv.VrsubVx,
+    rvv.VminuVv,
+    rvv.VminuVx,
+    rvv.VminVv,
+    rvv.VminVx,
+    rvv.VmaxuVv,
+    rvv.VmaxuVx,
+    rvv.VmaxVv,
+    rvv.VmaxVx,
+    rvv.VandVv,
+    rvv.VandVx,
+    rvv.VorVv,
+    rvv.VorVx,
+    rvv.VxorVv,
+    rvv.VxorVx,
+    rvv.VsllVv,
+    rvv.VsllVx,
+    rvv.VsrlVv,
+    rvv.VsrlVx,
+    rvv.VsraVv,
+    rvv.VsraVx,
+    rvv.VmulVv,
+    rvv.VmulVx,
+    rvv.VredsumVs,
+    rvv.VredandVs,
+    rvv.VredorVs,
+    rvv.VredxorVs,
+    rvv.VredminuVs,
+    rvv.VredminVs,
+    rvv.VredmaxuVs,
+    rvv.VredmaxVs,
+)
+register_format(
+    (rd, rs2, simm5),
+    rvv.VaddVi,
+    rvv.VrsubVi,
+    rvv.VandVi,
+    rvv.VorVi,
+    rvv.VxorVi,
+)
+register_format((rd, rs2, rs1), rvv.VsllVi, rvv.VsrlVi, rvv.VsraVi)
+register_format((rd, rs1, rs2), rvv.VmaccVv, rvv.VmaccVx)
+register_format((rd, rs1), rvv.VmvVv, rvv.VmvVx, rvv.VmvSx)
+register_format((rd, simm5), rvv.VmvVi)
+register_format((rd, rs2), rvv.VmvXs)
+register_format((c_rdp, c_rs2p), rvc.CSub, rvc.CXor, rvc.COr, rvc.CAnd)
+register_format((c_rd, c_rd, c_shamt), rvc.CSlli)
+register_format((c_rdp, c_rdp, c_shamt), rvc.CSrli, rvc.CSrai)
+register_format((c_rdp, c_rdp, c_imm), rvc.CAndi)
+register_format((c_rd, c_rd, c_imm), rvc.CAddi)
+register_format((c_rd, c_imm), rvc.CLi, rvc.CLui)
+register_format((c_rs2p, c_addi4spn_imm), rvc.CAddi4spn)
+register_format((c_addi16sp_imm,), rvc.CAddi16sp)
+register_format((c_rs2p, c_lw_offset, c_rdp), rvc.CLw, rvc.CSw)
+register_format((c_rd, c_lwsp_offset), rvc.CLwsp)
+register_format((c_rs2, c_swsp_offset), rvc.CSwsp)
+register_format((c_rd, c_rs2), rvc.CMovr, rvc.CAdd)
+register_format((c_rd,), rvc.CJr, rvc.CJalr)
+register_format((c_target_j,), rvc.CJ, rvc.CJal)
+register_format((c_rdp, c_target_b), rvc.CBeqz, rvc.CBnez)
+
+
+# Operand values used to find out which bits an operand occupies:
+_probe_ints = [0, -1] + [1 << n for n in range(32)]
+_probe_nums = [0] + [1 << n for n in range(12)]
+_probe_symbols = [1 << n for n in range(1, 21)] + [-2, -4096]
+
+
+def _probe_values(operand_cls):
+    if issubclass(operand_cls, Register):
+        return [operand_cls("probe", num=num) for num in _probe_nums]
+    elif issubclass(operand_cls, str):
+        return ["probe"]
+    else:
+        return _probe_ints
+
+
+def probe_encoding(cls):
+    """Find the fixed bits of an instruction class.
+
+    Returns a tuple with the encoded size in bytes, the mask of fixed bits
+    and the value of these fixed bits.
+    """
+    operands = cls.syntax.formal_arguments
+    choices = [_probe_values(operand._cls) for operand in operands]
+    base_args = [values[0] for values in choices]
+    base_ins = cls(*base_args)
+    base = base_ins.encode()
+    value = int.from_bytes(base, "little")
+    varying = 0
+    for index, values in enumerate(choices):
+        for probe in values[1:]:
+            args = list(base_args)
+            args[index] = probe
+            try:
+                data = cls(*args).encode()
+            except (ValueError, AssertionError):
+                continue
+            varying |= value ^ int.from_bytes(data, "little")
+
+    # Bits filled in by the linker are variable as well:
+    for relocation in base_ins.relocations():
+        begin = relocation.offset
+        end = begin + relocation.size()
+        for symbol_value in _probe_symbols:
+            try:
+                data = relocation.apply(
+                    symbol_value, bytearray(base[begin:end]), 0
+                )
+            except (ValueError, AssertionError):
+                continue
+            data = base[:begin] + bytes(data) + base[end:]
+            varying |= value ^ int.from_bytes(data, "little")
+
+    mask = ((1 << (8 * len(base))) - 1) & ~varying
+    return len(base), mask, value & mask
+
+
+def make_builder(cls):
+    """Create a function which constructs an instance of cls from a word.
+
+    The operand values are known to be valid, so the instance is filled
+    in directly instead of via the generic constructor. Decoded
+    instructions do not take part in code generation, so they share
+    empty tuples for the jumps, clobbers and extra uses and definitions.
+    The objects used by the function are passed as default arguments,
+    which are faster to access than globals.
+    """
+    namespace = {
+        "cls": cls,
+        "new": object.__new__,
+        "format_target": format_target,
+    }
+    values = []
+    for field, operand in zip(formats[cls], cls.syntax.formal_arguments):
+        if issubclass(operand._cls, (RiscvRegister, RiscvFRegister)):
+            registers = "registers_" + operand._name
+            namespace[registers] = tuple(
+                operand._cls.from_num(num) for num in range(32)
+            )
+            field = "{}[{}]".format(registers, field)
+        elif issubclass(operand._cls, Register):
+            from_num = "from_num_" + operand._name
+            namespace[from_num] = operand._cls.from_num
+            field = "{}({})".format(from_num, field)
+        values.append('        "_{}": {},'.format(operand._name, field))
+    defaults = "".join(", {0}={0}".format(name) for name in namespace)
+    lines = [
+        "def build(word, address{}):".format(defaults),
+        "    ins = new(cls)",
+        "    ins.__dict__ = {",
+    ]
+    lines.extend(values)
+    lines.extend(
+        [
+            '        "jumps": (),',
+            '        "ismove": False,',
+            '        "clobbers": (),',
+            '        "extra_uses": (),',
+            '        "extra_defs": (),',
+            "    }",
+            "    return ins",
+        ]
+    )
+    source = "\n".join(lines)
+    exec(source, namespace)
+    return namespace["build"]
+
+
+class DecoderTable:
+    """Lookup table from instruction words to instruction builders.
+
+    Per instruction size, the table holds the mask of the bits which are
+    fixed in all instructions, and a dictionary which maps these bits to
+    a list of (mask, {match: builder}) pairs, with the most specific mask
+    first.
+    """
+
+    def __init__(self, classes):
+        entries = {}
+        for cls in classes:
+            size, mask, match = probe_encoding(cls)
+            if mask:
+                entries.setdefault(size, []).append((mask, match, cls))
+
+        self.tables = {}
+        for size, size_entries in entries.items():
+            primary_mask = (1 << (8 * size)) - 1
+            for mask, _, _ in size_entries:
+                primary_mask &= mask
+            # Most specific first, keep the isa order otherwise:
+            size_entries.sort(key=lambda e: -bin(e[0]).count("1"))
+            buckets = {}
+            for mask, match, cls in size_entries:
+                bucket = buckets.setdefault(match & primary_mask, [])
+                if not bucket or bucket[-1][0] != mask:
+                    bucket.append((mask, {}))
+                if match not in bucket[-1][1]:
+                    bucket[-1][1][match] = make_builder(cls)
+            self.tables[size] = (primary_mask, buckets)
+
+    def lookup(self, size, word):
+        """ Find the instruction builder for a word of the given size """
+        if size not in self.tables:
+            return
+        primary_mask, buckets = self.tables[size]
+        for mask, builders in buckets.get(word & primary_mask, ()):
+            builder = builders.get(word & mask)
+            if builder:
+                return builder
+
+
+_tables = {}
+
+
+def get_decoder_table(isa):
+    """ Get the, cached, decoder table for the given instruction set """
+    classes = tuple(cls for cls in isa.instructions if cls in formats)
+    if classes not in _tables:
+        _tables[classes] = DecoderTable(classes)
+    return _tables[classes]
+
+
+class RiscvDecoder:
+    """Decoder of RISC-V instructions.
+
+    Compressed instructions are recognized by their two lowest bits, and
+    are only accepted when the architecture has the rvc option.
+    """
+
+    def __init__(self, arch):
+        self.arch = arch
+        self.table = get_decoder_table(arch.isa)
+        self.alignment = 2 if arch.has_option("rvc") else 4
+        tables = self.table.tables
+        self._table32 = tables.get(4, (0, {}))
+        self._table16 = tables.get(2, (0, {}))
+
+    def decode(self, data, address):
+        """Decode a single instruction at the start of data.
+
+        Returns a tuple with the instruction and its size in bytes.
+        """
+        # This is the inner loop of the disassembler, so the table lookup
+        # is done here instead of via DecoderTable.lookup:
+        word = int.from_bytes(data[:4], "little")
+        if word & 0x3 == 0x3:
+            size = 4
+            primary_mask, buckets = self._table32
+        else:
+            size = 2
+            word &= 0xFFFF
+            primary_mask, buckets = self._table16
+        if len(data) < size:
+            raise DecodeError("Not enough data at {:#x}".format(address))
+        # The all zero half word is defined to be an illegal instruction:
+        if word:
+            for mask, builders in buckets.get(word & primary_mask, ()):
+                builder = builders.get(word & mask)
+                if builder:
+                    return builder(word, address), size
+        raise DecodeError(
+            "Cannot decode {:0{}x} at {:#x}".format(word, size * 2, address)
+        )
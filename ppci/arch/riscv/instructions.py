@@ -4,7 +4,8 @@
 from ..isa import Isa
 from ..encoding import Instruction, Syntax, Operand
 from ..data_instructions import Dd
-from ...utils.bitfun import inrange
+from ...utils.bitfun import inrange, is_power_of_two, sign_extend
+from ...utils.bitfun import signed_division_magic, unsigned_division_magic
 from ..generic_instructions import ArtificialInstruction, Alignment
 from ..generic_instructions import SectionInstruction
 from ..generic_instructions import RegisterUseDef, Global
@@ -12,10 +13,10 @@ from .registers import (
     RiscvRegister,
     RiscvFRegister,
     RiscvCsrRegister,
-    FP,
     LR,
     R0,
     R10,
+    R11,
     R12,
     R13,
 )
@@ -23,9 +24,11 @@ from .relocations import AbsAddr32Relocation
 from .relocations import BImm12Relocation, BImm20Relocation
 from .relocations import Abs32Imm20Relocation
 from .relocations import Abs32Imm12Relocation, RelImm20Relocation
-from .relocations import RelImm12Relocation
-from .tokens import RiscvToken, RiscvIToken
+from .relocations import RelImm12Relocation, CallRelocation
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken, RiscvSBToken
+from .tokens import RiscvUToken
 import struct
+from collections import namedtuple
 
 isa = Isa()
 
@@ -36,6 +39,7 @@ isa.register_relocation(Abs32Imm20Relocation)
 isa.register_relocation(Abs32Imm12Relocation)
 isa.register_relocation(RelImm20Relocation)
 isa.register_relocation(RelImm12Relocation)
+isa.register_relocation(CallRelocation)
 
 
 class RiscvInstruction(Instruction):
@@ -225,15 +229,7 @@ Srai = make_si("srai", 0b0100000, 0b101)
 
 
 class IBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        self.offset = self.offset & 0xFFF
-        tokens[0][20:32] = self.offset
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
 
 
 def make_i(mnemonic, func):
@@ -243,8 +239,16 @@ def make_i(mnemonic, func):
     offset = Operand("offset", int)
     fprel = False
     syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", offset])
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "imm": offset,
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "fprel": fprel,
         "rd": rd,
@@ -278,20 +282,25 @@ class Nop(RiscvInstruction):
 
 
 class SmBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1110011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0b010
-        tokens[0][15:20] = 0
-        tokens[0][20:32] = self.code
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
 
 
 def make_sm(mnemonic, code):
     rd = Operand("rd", RiscvRegister, write=True)
     syntax = Syntax([mnemonic, " ", rd])
-    members = {"syntax": syntax, "rd": rd, "code": code}
+    patterns = {
+        "opcode": 0b1110011,
+        "rd": rd,
+        "funct3": 0b010,
+        "rs1": 0,
+        "imm": code,
+    }
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "rd": rd,
+        "code": code,
+    }
     return type(mnemonic + "_ins", (SmBase,), members)
 
 
@@ -319,26 +328,44 @@ class Bl(RiscvInstruction):
     target = Operand("target", str)
     rd = Operand("rd", RiscvRegister, write=True)
     syntax = Syntax(["jal", " ", rd, ",", " ", target])
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b1101111, "rd": rd}
+
+    def relocations(self):
+        return [BImm20Relocation(self.target)]
+
+
+class Call(RiscvInstruction):
+    """Call a function anywhere in the address space.
+
+    This is an auipc and a jalr instruction, which the linker relaxes into
+    a single jal when the target is near.
+    """
+
+    target = Operand("target", str)
+    rd = Operand("rd", RiscvRegister, write=True)
+    syntax = Syntax(["call", " ", rd, ",", " ", target])
+    tokens = [RiscvUToken, RiscvIToken]
 
     def encode(self):
         tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1101111
-        tokens[0][7:12] = self.rd.num
-        return tokens[0].encode()
+        tokens[0].opcode = 0b0010111  # auipc
+        tokens[0].rd = self.rd.num
+        tokens[1].opcode = 0b1100111  # jalr
+        tokens[1].rd = self.rd.num
+        tokens[1].funct3 = 0
+        tokens[1].rs1 = self.rd.num
+        return tokens[0].encode() + tokens[1].encode()
 
     def relocations(self):
-        return [BImm20Relocation(self.target)]
+        return [CallRelocation(self.target)]
 
 
 class B(RiscvInstruction):
     target = Operand("target", str)
     syntax = Syntax(["j", " ", target])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1101111
-        tokens[0][7:12] = 0
-        return tokens[0].encode()
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b1101111, "rd": 0}
 
     def relocations(self):
         return [BImm20Relocation(self.target)]
@@ -349,15 +376,14 @@ class Blr(RiscvInstruction):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     offset = Operand("offset", int)
     syntax = Syntax(["jalr", " ", rd, ",", rs1, ",", " ", offset])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1100111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:32] = self.offset
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b1100111,
+        "rd": rd,
+        "funct3": 0,
+        "rs1": rs1,
+        "imm": offset,
+    }
 
 
 class Lui(RiscvInstruction):
@@ -378,13 +404,8 @@ class Adru(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True)
     label = Operand("label", str)
     syntax = Syntax(["lui", " ", rd, ",", " ", label])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0110111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:32] = 0
-        return tokens[0].encode()
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b0110111, "rd": rd, "imm": 0}
 
     def relocations(self):
         return [Abs32Imm20Relocation(self.label)]
@@ -396,13 +417,8 @@ class Adrurel(RiscvInstruction):
     syntax = Syntax(
         ["auipc", " ", rd, ",", " ", "%", "pcrel_hi", "(", label, ")"]
     )
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:32] = 0
-        return tokens[0].encode()
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b0010111, "rd": rd, "imm": 0}
 
     def relocations(self):
         return [RelImm20Relocation(self.label)]
@@ -413,15 +429,14 @@ class Adrl(RiscvInstruction):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     label = Operand("label", str)
     syntax = Syntax(["addi", " ", rd, ",", " ", rs1, ",", " ", label])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:32] = 0
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": 0,
+        "rs1": rs1,
+        "imm": 0,
+    }
 
     def relocations(self):
         return [Abs32Imm12Relocation(self.label)]
@@ -433,15 +448,14 @@ class Loadlrel(RiscvInstruction):
     syntax = Syntax(
         ["lw", " ", rd, "%", "pcrel_lo", "(", label, ")", "(", rd, ")"]
     )
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0000011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0b010
-        tokens[0][15:20] = self.rd.num
-        tokens[0][20:32] = 0
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0000011,
+        "rd": rd,
+        "funct3": 0b010,
+        "rs1": rd,
+        "imm": 0,
+    }
 
     def relocations(self):
         return [RelImm12Relocation(self.label)]
@@ -451,15 +465,14 @@ class Adrlrel(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True, read=True)
     label = Operand("label", str)
     syntax = Syntax(["addi", " ", rd, ",", " ", label])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = 0b000
-        tokens[0][15:20] = self.rd.num
-        tokens[0][20:32] = 0
-        return tokens[0].encode()
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": 0b000,
+        "rs1": rd,
+        "imm": 0,
+    }
 
     def relocations(self):
         return [RelImm12Relocation(self.label)]
@@ -469,13 +482,8 @@ class Auipc(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True)
     imm = Operand("imm", int)
     syntax = Syntax(["auipc", " ", rd, ",", " ", imm])
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0010111
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:32] = self.imm
-        return tokens[0].encode()
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b0010111, "rd": rd, "imm": imm}
 
 
 class Labelrel(PseudoRiscvInstruction):
@@ -505,30 +513,21 @@ class Li(PseudoRiscvInstruction):
 
     def render(self):
         # If the immediate value fits into 12 bits, do so!
-        if inrange(self.imm, 12):
-            yield Addi(self.rd, R0, self.imm)
+        imm = self.imm
+        if inrange(imm, 12):
+            yield Addi(self.rd, R0, imm)
         else:
-            if (self.imm & 0x800) != 0:
-                self.imm += 0x1000
-            yield Lui(self.rd, self.imm >> 12)
-            lower_bits = self.imm & 0xFFF
+            # The lower bits are sign extended by addi:
+            if (imm & 0x800) != 0:
+                imm += 0x1000
+            yield Lui(self.rd, imm >> 12)
+            lower_bits = imm & 0xFFF
             yield Addi(self.rd, self.rd, lower_bits)
 
 
 class BranchBase(RiscvInstruction):
     target = Operand("target", str)
-
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b1100011
-        tokens[0][12:15] = self.cond
-        if self.invert:
-            tokens[0][15:20] = self.rm.num
-            tokens[0][20:25] = self.rn.num
-        else:
-            tokens[0][15:20] = self.rn.num
-            tokens[0][20:25] = self.rm.num
-        return tokens[0].encode()
+    tokens = [RiscvSBToken]
 
     def relocations(self):
         return [BImm12Relocation(self.target)]
@@ -539,9 +538,16 @@ def make_branch(mnemonic, cond, invert):
     rn = Operand("rn", RiscvRegister, read=True)
     rm = Operand("rm", RiscvRegister, read=True)
     syntax = Syntax([mnemonic, " ", rn, ",", " ", rm, ",", " ", target])
-
+    patterns = {
+        "opcode": 0b1100011,
+        "funct3": cond,
+        "rs1": rm if invert else rn,
+        "rs2": rn if invert else rm,
+        "imm": 0,
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "target": target,
         "rn": rn,
         "rm": rm,
@@ -571,17 +577,7 @@ def reg_list_to_mask(reg_list):
 
 
 class StrBase(RiscvInstruction):
-    def encode(self):
-        imml5 = self.offset & 0x1F
-        immh7 = (self.offset >> 5) & 0x7F
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0100011
-        tokens[0][7:12] = imml5
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:25] = self.rs2.num
-        tokens[0][25:32] = immh7
-        return tokens[0].encode()
+    tokens = [RiscvSToken]
 
 
 def make_str(mnemonic, func):
@@ -590,8 +586,16 @@ def make_str(mnemonic, func):
     rs1 = Operand("rs1", RiscvRegister, read=True)
     fprel = False
     syntax = Syntax([mnemonic, " ", rs2, ",", " ", offset, "(", rs1, ")"])
+    patterns = {
+        "opcode": 0b0100011,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": rs2,
+        "imm": offset,
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "fprel": fprel,
         "offset": offset,
@@ -640,15 +644,7 @@ Lhu = make_ldr("lhu", 0b101)
 
 
 class MextBase(RiscvInstruction):
-    def encode(self):
-        tokens = self.get_tokens()
-        tokens[0][0:7] = 0b0110011
-        tokens[0][7:12] = self.rd.num
-        tokens[0][12:15] = self.func
-        tokens[0][15:20] = self.rs1.num
-        tokens[0][20:25] = self.rs2.num
-        tokens[0][25:32] = 0b0000001
-        return tokens[0].encode()
+    pass
 
 
 def make_mext(mnemonic, func):
@@ -656,8 +652,17 @@ def make_mext(mnemonic, func):
     rs2 = Operand("rs2", RiscvRegister, read=True)
     rd = Operand("rd", RiscvRegister, write=True)
     syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", rs2])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": rs2,
+        "funct7": 0b0000001,
+    }
     members = {
         "syntax": syntax,
+        "patterns": patterns,
         "func": func,
         "rd": rd,
         "rs1": rs1,
@@ -667,11 +672,17 @@ def make_mext(mnemonic, func):
 
 
 Mul = make_mext("mul", 0b000)
+Mulh = make_mext("mulh", 0b001)
+Mulhsu = make_mext("mulhsu", 0b010)
+Mulhu = make_mext("mulhu", 0b011)
 Div = make_mext("div", 0b100)
 Divu = make_mext("divu", 0b101)
 Rem = make_mext("rem", 0b110)
 Remu = make_mext("remu", 0b111)
 
+# The instructions of the M extension, which are left out by the nom option:
+mext_instructions = (Mul, Mulh, Mulhsu, Mulhu, Div, Divu, Rem, Remu)
+
 # Instruction selection patterns:
 
 
@@ -704,9 +715,17 @@ def pattern_movb(context, tree, c0, c1):
     # Emit memcpy
     dst = c0
     src = c1
-    tmp = context.new_reg(RiscvRegister)
-    size = tree.value
-    for instruction in context.arch.gen_riscv_memcpy(dst, src, tmp, size):
+    size, alignment = tree.value
+    for instruction in context.arch.gen_riscv_memcpy(
+        context.frame, dst, src, size, alignment
+    ):
+        context.emit(instruction)
+
+
+@isa.pattern("stm", "CLRB(reg)", size=20)
+def pattern_clrb(context, tree, c0):
+    size, alignment = tree.value
+    for instruction in context.arch.gen_riscv_memclr(c0, size, alignment):
         context.emit(instruction)
 
 
@@ -739,43 +758,48 @@ def pattern_i32_to_i32(context, tree, c0):
 @isa.pattern("reg", "I8TOI16(reg)", size=4)
 @isa.pattern("reg", "I8TOI32(reg)", size=4)
 def pattern_i8_to_i32(context, tree, c0):
-    context.emit(Slli(c0, c0, 24))
-    context.emit(Srai(c0, c0, 24))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Slli(d, c0, 24))
+    context.emit(Srai(d, d, 24))
+    return d
 
 
 @isa.pattern("reg", "I16TOI32(reg)", size=4)
 def pattern_i16_to_i32(context, tree, c0):
-    context.emit(Slli(c0, c0, 16))
-    context.emit(Srai(c0, c0, 16))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Slli(d, c0, 16))
+    context.emit(Srai(d, d, 16))
+    return d
 
 
 @isa.pattern("reg", "I8TOU16(reg)", size=4)
 @isa.pattern("reg", "U8TOU16(reg)", size=4)
 @isa.pattern("reg", "U8TOI16(reg)", size=4)
 def pattern_8_to_16(context, tree, c0):
-    context.emit(Slli(c0, c0, 24))
-    context.emit(Srli(c0, c0, 24))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Slli(d, c0, 24))
+    context.emit(Srli(d, d, 24))
+    return d
 
 
 @isa.pattern("reg", "I8TOU32(reg)", size=4)
 @isa.pattern("reg", "U8TOU32(reg)", size=4)
 @isa.pattern("reg", "U8TOI32(reg)", size=4)
 def pattern_8_to_32(context, tree, c0):
-    context.emit(Slli(c0, c0, 24))
-    context.emit(Srli(c0, c0, 24))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Slli(d, c0, 24))
+    context.emit(Srli(d, d, 24))
+    return d
 
 
 @isa.pattern("reg", "I16TOU32(reg)", size=4)
 @isa.pattern("reg", "U16TOU32(reg)", size=4)
 @isa.pattern("reg", "U16TOI32(reg)", size=4)
 def pattern_16_to_32(context, tree, c0):
-    context.emit(Slli(c0, c0, 16))
-    context.emit(Srli(c0, c0, 16))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Slli(d, c0, 16))
+    context.emit(Srli(d, d, 16))
+    return d
 
 
 @isa.pattern("reg", "I32TOI8(reg)", size=0)
@@ -859,6 +883,199 @@ def pattern_cjmpu(context, tree, c0, c1):
     context.emit(jmp_ins)
 
 
+def emit_condition(context, op, signed, a, b, reg_class=RiscvRegister):
+    """Compare a to b without jumping, b can also be a small constant.
+
+    Returns a register, whether the condition holds when this register is
+    non zero (or else when it is zero) and whether the register is known
+    to be either zero or one.
+    """
+    if op in ("==", "!="):
+        if isinstance(b, int) and b == 0:
+            return a, op == "!=", False
+        t = context.new_reg(reg_class)
+        if isinstance(b, int):
+            context.emit(Xori(t, a, b))
+        else:
+            context.emit(Xorr(t, a, b))
+        return t, op == "!=", False
+
+    # Only a less than comparison is available:
+    t = context.new_reg(reg_class)
+    if isinstance(b, int):
+        if op in (">", "<="):
+            op = {">": ">=", "<=": "<"}[op]
+            b += 1
+        context.emit((Slti if signed else Sltiu)(t, a, b))
+    else:
+        if op in (">", "<="):
+            op = {">": "<", "<=": ">="}[op]
+            a, b = b, a
+        context.emit((Slt if signed else Sltu)(t, a, b))
+    return t, op == "<", True
+
+
+def emit_select(context, op, signed, a, b, yes, no, reg_class=RiscvRegister):
+    """Select a value without branches.
+
+    The comparison is turned into a mask with all bits set if the
+    comparison holds, after which the value is selected with and and
+    xor operations. Constant zero and one values are handled shorter.
+    """
+    t, holds_if_set, is_bool = emit_condition(
+        context, op, signed, a, b, reg_class=reg_class
+    )
+    d = context.new_reg(reg_class)
+    if isinstance(yes, int) and isinstance(no, int):
+        if yes == no:
+            context.emit(Li(d, yes))
+        elif holds_if_set == (yes == 1):
+            if is_bool:
+                return t
+            context.emit(Sltu(d, R0, t))
+        else:
+            context.emit(Xori(d, t, 1) if is_bool else Sltiu(d, t, 1))
+        return d
+
+    if not is_bool:
+        f = context.new_reg(reg_class)
+        context.emit(Sltu(f, R0, t))
+        t = f
+
+    # Create a mask which keeps the value which is not zero:
+    keep_yes = not isinstance(yes, int)
+    mask = context.new_reg(reg_class)
+    if holds_if_set == keep_yes:
+        context.emit(Subr(mask, R0, t))
+    else:
+        context.emit(Addi(mask, t, -1))
+
+    if isinstance(no, int):
+        context.emit(Andr(d, yes, mask))
+    elif isinstance(yes, int):
+        context.emit(Andr(d, no, mask))
+    else:
+        x = context.new_reg(reg_class)
+        context.emit(Xorr(x, yes, no))
+        context.emit(Andr(x, x, mask))
+        context.emit(Xorr(d, no, x))
+    return d
+
+
+def select_condition(b_const, yes_const, no_const):
+    """Create the condition of a select pattern with constant operands.
+
+    A constant b is compared with an immediate, constant yes and no
+    values can be zero, or one if both of them are constant.
+    """
+
+    def condition(tree):
+        if b_const and tree[1].value not in range(-2048, 2047):
+            return False
+        if yes_const and no_const:
+            return tree[2].value in (0, 1) and tree[3].value in (0, 1)
+        elif yes_const:
+            return tree[2].value == 0
+        elif no_const:
+            return tree[3].value == 0
+        return True
+
+    return condition
+
+
+def select_trees(ty, compare_types=("I32", "U32")):
+    """Create the select trees of type ty with constant operands.
+
+    Yields the tree, which of the operands a, b, yes and no are constant
+    and the condition of the pattern.
+    """
+    for b_ty in compare_types + (None,):
+        for yes_const, no_const in (
+            (False, False),
+            (True, True),
+            (True, False),
+            (False, True),
+        ):
+            if not (b_ty or yes_const or no_const):
+                continue
+            tree = "SELECT{}(reg, {}, {}, {})".format(
+                ty,
+                "CONST" + b_ty if b_ty else "reg",
+                "CONST" + ty if yes_const else "reg",
+                "CONST" + ty if no_const else "reg",
+            )
+            constants = (False, bool(b_ty), yes_const, no_const)
+            condition = select_condition(b_ty, yes_const, no_const)
+            yield tree, constants, condition
+
+
+def make_select_pattern(emit, constants, reg_class=RiscvRegister):
+    """Create a select pattern function for a tree with constants.
+
+    The constant operands are taken from the tree, the others are the
+    registers of the matched child trees.
+    """
+
+    def pattern(context, tree, *kids):
+        kids = iter(kids)
+        a, b, yes, no = [
+            child.value if constant else next(kids)
+            for child, constant in zip(tree.children, constants)
+        ]
+        op, signed = tree.value
+        return emit(context, op, signed, a, b, yes, no, reg_class=reg_class)
+
+    return pattern
+
+
+no_constants = (False, False, False, False)
+for _ty in ("I32", "U32", "I16", "U16", "I8", "U8"):
+    isa.pattern("reg", "SELECT{}(reg, reg, reg, reg)".format(_ty), size=20)(
+        make_select_pattern(emit_select, no_constants)
+    )
+
+for _ty in ("I32", "U32"):
+    for _tree, _constants, _condition in select_trees(_ty):
+        _yes_const, _no_const = _constants[2:]
+        if _yes_const and _no_const:
+            _size = 8
+        elif _yes_const or _no_const:
+            _size = 12
+        else:
+            _size = 20
+        isa.pattern("reg", _tree, size=_size, condition=_condition)(
+            make_select_pattern(emit_select, _constants)
+        )
+
+
+@isa.pattern("stm", "JMPTABLEI32(reg)", size=24)
+@isa.pattern("stm", "JMPTABLEU32(reg)", size=24)
+def pattern_jmptable(context, tree, c0):
+    """Jump via a table with the addresses of the labels.
+
+    The table is placed in the literal pool of the function.
+    """
+    labels, default_label = tree.value
+    size = context.new_reg(RiscvRegister)
+    address = context.new_reg(RiscvRegister)
+    offset = context.new_reg(RiscvRegister)
+    table = context.frame.add_constant(tuple(label.name for label in labels))
+    context.emit(Li(size, len(labels)))
+    load_ins = La(address, table)
+    context.emit(
+        Bgeu(c0, size, default_label.name, jumps=[default_label, load_ins])
+    )
+    context.emit(load_ins)
+    context.emit(Slli(offset, c0, 2))
+    context.emit(Addr(address, address, offset))
+    context.emit(Lw(address, 0, address))
+    targets = []
+    for label in labels:
+        if label not in targets:
+            targets.append(label)
+    context.emit(Blr(R0, address, 0, jumps=targets))
+
+
 @isa.pattern("reg", "ADDU32(reg, reg)", size=2)
 @isa.pattern("reg", "ADDI32(reg, reg)", size=2)
 def pattern_add_i32(context, tree, c0, c1):
@@ -960,7 +1177,7 @@ def pattern_label2(context, tree):
 def pattern_fpreli32(context, tree):
     d = context.new_reg(RiscvRegister)
     offset = tree.value.offset
-    Code = Addi(d, FP, offset)
+    Code = Addi(d, context.arch.fp, offset)
     Code.fprel = True
     context.emit(Code)
     return d
@@ -975,7 +1192,7 @@ def pattern_fpreli32(context, tree):
 )
 def pattern_mem_fpreli32(context, tree):
     offset = tree.value.offset
-    return FP, offset
+    return context.arch.fp, offset
 
 
 @isa.pattern("mem", "reg", size=10)
@@ -1106,8 +1323,9 @@ def pattern_ldr32_fprel(context, tree, c0):
 @isa.pattern("reg", "NEGI32(reg)", size=2)
 @isa.pattern("reg", "NEGU32(reg)", size=2)
 def pattern_negi32(context, tree, c0):
-    context.emit(Subr(c0, R0, c0))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Subr(d, R0, c0))
+    return d
 
 
 @isa.pattern("reg", "INVI8(reg)", size=2)
@@ -1115,8 +1333,9 @@ def pattern_negi32(context, tree, c0):
 @isa.pattern("reg", "INVU32(reg)", size=2)
 @isa.pattern("reg", "INVI32(reg)", size=2)
 def pattern_inv(context, tree, c0):
-    context.emit(Xori(c0, c0, -1))
-    return c0
+    d = context.new_reg(RiscvRegister)
+    context.emit(Xori(d, c0, -1))
+    return d
 
 
 @isa.pattern("reg", "LDRU16(reg)", size=2)
@@ -1235,18 +1454,18 @@ def pattern_shr_u32(context, tree, c0, c1):
 @isa.pattern("reg", "SHRI8(reg, reg)", size=2)
 def pattern_shr_i32(context, tree, c0, c1):
     d = context.new_reg(RiscvRegister)
-    context.emit(Slli(c0, c0, 24))
-    context.emit(Srai(c0, c0, 24))
-    context.emit(Sra(d, c0, c1))
+    context.emit(Slli(d, c0, 24))
+    context.emit(Srai(d, d, 24))
+    context.emit(Sra(d, d, c1))
     return d
 
 
 @isa.pattern("reg", "SHRI16(reg, reg)", size=2)
 def pattern_shr_i32(context, tree, c0, c1):
     d = context.new_reg(RiscvRegister)
-    context.emit(Slli(c0, c0, 16))
-    context.emit(Srai(c0, c0, 16))
-    context.emit(Sra(d, c0, c1))
+    context.emit(Slli(d, c0, 16))
+    context.emit(Srai(d, d, 16))
+    context.emit(Sra(d, d, c1))
     return d
 
 
@@ -1257,6 +1476,19 @@ def pattern_shr_i32(context, tree, c0, c1):
     return d
 
 
+@isa.pattern(
+    "reg",
+    "SHRU32(reg, CONSTU32)",
+    size=2,
+    condition=lambda t: t.children[1].value < 32,
+)
+def pattern_shr_u32_reg_const(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    c1 = tree.children[1].value
+    context.emit(Srli(d, c0, c1))
+    return d
+
+
 @isa.pattern(
     "reg",
     "SHRI32(reg, CONSTI32)",
@@ -1288,6 +1520,12 @@ def pattern_shl_i32(context, tree, c0, c1):
     size=2,
     condition=lambda t: t.children[1].value < 32,
 )
+@isa.pattern(
+    "reg",
+    "SHLU32(reg, CONSTU32)",
+    size=2,
+    condition=lambda t: t.children[1].value < 32,
+)
 def pattern_shl_i32_reg_const(context, tree, c0):
     d = context.new_reg(RiscvRegister)
     c1 = tree.children[1].value
@@ -1345,6 +1583,207 @@ def pattern_rem_u32(context, tree, c0, c1):
     return d
 
 
+# The instructions used to divide by a constant, so that the same
+# sequences can be emitted for the 32 and 64 bit registers of rv64:
+IntegerOps = namedtuple(
+    "IntegerOps",
+    "bits reg_class load_constant sll srl sra add sub mul mulh mulhu",
+)
+
+
+def load_constant(context, d, value):
+    context.emit(Li(d, sign_extend(value, 32)))
+
+
+rv32_ops = IntegerOps(
+    32,
+    RiscvRegister,
+    load_constant,
+    Slli,
+    Srli,
+    Srai,
+    Addr,
+    Subr,
+    Mul,
+    Mulh,
+    Mulhu,
+)
+
+
+def emit_binop(context, ops, ins, a, b):
+    d = context.new_reg(ops.reg_class)
+    context.emit(ins(d, a, b))
+    return d
+
+
+def emit_rounding_bias(context, n, shift, ops):
+    """Get 2**shift - 1 for negative n and zero otherwise. Added to n
+    before an arithmetic shift right, this rounds towards zero.
+    """
+    if shift == 1:
+        return emit_binop(context, ops, ops.srl, n, ops.bits - 1)
+    sign = emit_binop(context, ops, ops.sra, n, ops.bits - 1)
+    return emit_binop(context, ops, ops.srl, sign, ops.bits - shift)
+
+
+def emit_low_bits(context, n, count, ops):
+    """ Clear all but the lower count bits of n """
+    if count < 11:
+        d = context.new_reg(ops.reg_class)
+        context.emit(Andi(d, n, (1 << count) - 1))
+        return d
+    t = emit_binop(context, ops, ops.sll, n, ops.bits - count)
+    return emit_binop(context, ops, ops.srl, t, ops.bits - count)
+
+
+def emit_division_by_constant(context, n, divisor, signed, ops):
+    """Divide n by a constant without a div instruction.
+
+    Division takes 32 or more cycles on most small cores. Powers of two
+    become shifts, other divisors a multiplication by a magic number of
+    which only the upper half of the product is used.
+    """
+    magnitude = abs(divisor)
+    if magnitude == 1:
+        q = context.new_reg(ops.reg_class)
+        context.move(q, n)
+    elif is_power_of_two(magnitude):
+        shift = magnitude.bit_length() - 1
+        if signed:
+            bias = emit_rounding_bias(context, n, shift, ops)
+            t = emit_binop(context, ops, ops.add, n, bias)
+            q = emit_binop(context, ops, ops.sra, t, shift)
+        else:
+            q = emit_binop(context, ops, ops.srl, n, shift)
+    elif signed:
+        multiplier, shift = signed_division_magic(magnitude, ops.bits)
+        m = context.new_reg(ops.reg_class)
+        ops.load_constant(context, m, multiplier)
+        q = emit_binop(context, ops, ops.mulh, n, m)
+        if multiplier >> (ops.bits - 1):
+            # The multiplier was taken as negative value, correct this:
+            q = emit_binop(context, ops, ops.add, q, n)
+        if shift:
+            q = emit_binop(context, ops, ops.sra, q, shift)
+        sign = emit_binop(context, ops, ops.srl, n, ops.bits - 1)
+        q = emit_binop(context, ops, ops.add, q, sign)
+    else:
+        multiplier, shift = unsigned_division_magic(magnitude, ops.bits)
+        m = context.new_reg(ops.reg_class)
+        ops.load_constant(context, m, multiplier)
+        q = emit_binop(context, ops, ops.mulhu, n, m)
+        if multiplier >> ops.bits:
+            # Add the dividend for the missing top bit of the multiplier,
+            # halving first to prevent overflow:
+            t = emit_binop(context, ops, ops.sub, n, q)
+            t = emit_binop(context, ops, ops.srl, t, 1)
+            q = emit_binop(context, ops, ops.add, t, q)
+            shift -= 1
+        if shift:
+            q = emit_binop(context, ops, ops.srl, q, shift)
+
+    if divisor < 0:
+        q = emit_binop(context, ops, ops.sub, R0, q)
+    return q
+
+
+def emit_remainder_by_constant(context, n, divisor, signed, ops):
+    """ Calculate n modulo a constant without a rem instruction """
+    magnitude = abs(divisor)
+    if magnitude == 1:
+        r = context.new_reg(ops.reg_class)
+        context.emit(Addi(r, R0, 0))
+    elif is_power_of_two(magnitude):
+        count = magnitude.bit_length() - 1
+        if signed:
+            bias = emit_rounding_bias(context, n, count, ops)
+            t = emit_binop(context, ops, ops.add, n, bias)
+            t = emit_low_bits(context, t, count, ops)
+            r = emit_binop(context, ops, ops.sub, t, bias)
+        else:
+            r = emit_low_bits(context, n, count, ops)
+    else:
+        q = emit_division_by_constant(context, n, magnitude, signed, ops)
+        m = context.new_reg(ops.reg_class)
+        ops.load_constant(context, m, magnitude)
+        t = emit_binop(context, ops, ops.mul, q, m)
+        r = emit_binop(context, ops, ops.sub, n, t)
+    return r
+
+
+@isa.pattern(
+    "reg",
+    "DIVI32(reg, CONSTI32)",
+    size=6,
+    condition=lambda t: sign_extend(t[1].value, 32) != 0,
+)
+def pattern_div_i32_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_division_by_constant(context, c0, divisor, True, rv32_ops)
+
+
+@isa.pattern(
+    "reg",
+    "DIVU16(reg, CONSTU16)",
+    size=6,
+    condition=lambda t: t[1].value & 0xFFFF != 0,
+)
+@isa.pattern(
+    "reg",
+    "DIVU32(reg, CONSTU32)",
+    size=6,
+    condition=lambda t: t[1].value & 0xFFFFFFFF != 0,
+)
+def pattern_div_u32_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_division_by_constant(context, c0, divisor, False, rv32_ops)
+
+
+@isa.pattern(
+    "reg",
+    "REMI32(reg, CONSTI32)",
+    size=8,
+    condition=lambda t: sign_extend(t[1].value, 32) != 0,
+)
+def pattern_rem_i32_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_remainder_by_constant(context, c0, divisor, True, rv32_ops)
+
+
+@isa.pattern(
+    "reg",
+    "REMU16(reg, CONSTU16)",
+    size=8,
+    condition=lambda t: t[1].value & 0xFFFF != 0,
+)
+@isa.pattern(
+    "reg",
+    "REMU32(reg, CONSTU32)",
+    size=8,
+    condition=lambda t: t[1].value & 0xFFFFFFFF != 0,
+)
+def pattern_rem_u32_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_remainder_by_constant(context, c0, divisor, False, rv32_ops)
+
+
+@isa.pattern(
+    "reg",
+    "ANDI32(reg, CONSTI32)",
+    size=4,
+    condition=lambda t: t[1].value > 2047 and is_power_of_two(t[1].value + 1),
+)
+@isa.pattern(
+    "reg",
+    "ANDU32(reg, CONSTU32)",
+    size=4,
+    condition=lambda t: t[1].value > 2047 and is_power_of_two(t[1].value + 1),
+)
+def pattern_and_low_mask(context, tree, c0):
+    count = tree[1].value.bit_length()
+    return emit_low_bits(context, c0, count, rv32_ops)
+
+
 @isa.pattern("reg", "XORU8(reg, reg)", size=2)
 @isa.pattern("reg", "XORI8(reg, reg)", size=2)
 @isa.pattern("reg", "XORU16(reg, reg)", size=2)
@@ -1389,7 +1828,7 @@ def call_internal2(context, name, a, b, clobbers=()):
     context.move(R13, b)
     context.emit(RegisterUseDef(uses=(R12, R13)))
     context.emit(Global(name))
-    context.emit(Bl(LR, name, clobbers=clobbers))
+    context.emit(context.arch.branch(LR, name, clobbers=clobbers))
     context.emit(RegisterUseDef(uses=(R10,)))
     context.move(d, R10)
     return d
@@ -1400,17 +1839,22 @@ def call_internal1(context, name, a, clobbers=()):
     context.move(R12, a)
     context.emit(RegisterUseDef(uses=(R12,)))
     context.emit(Global(name))
-    context.emit(Bl(LR, name, clobbers=clobbers))
+    context.emit(context.arch.branch(LR, name, clobbers=clobbers))
     context.emit(RegisterUseDef(uses=(R10,)))
     context.move(d, R10)
     return d
 
 
+# The runtime functions only write these registers, next to temporaries
+# which are not available to the register allocator:
+runtime_clobbers = (R10, R11, R12, R13)
+
+
 @isa.pattern("reg", "ADDF64(reg, reg)", size=20)
 @isa.pattern("reg", "ADDF32(reg, reg)", size=20)
 def pattern_add_f32(context, tree, c0, c1):
     return call_internal2(
-        context, "float32_add", c0, c1, clobbers=context.arch.caller_save
+        context, "__addsf3", c0, c1, clobbers=runtime_clobbers
     )
 
 
@@ -1418,7 +1862,7 @@ def pattern_add_f32(context, tree, c0, c1):
 @isa.pattern("reg", "SUBF32(reg, reg)", size=20)
 def pattern_sub_f32(context, tree, c0, c1):
     return call_internal2(
-        context, "float32_sub", c0, c1, clobbers=context.arch.caller_save
+        context, "__subsf3", c0, c1, clobbers=runtime_clobbers
     )
 
 
@@ -1426,7 +1870,7 @@ def pattern_sub_f32(context, tree, c0, c1):
 @isa.pattern("reg", "MULF32(reg, reg)", size=20)
 def pattern_mul_f32(context, tree, c0, c1):
     return call_internal2(
-        context, "float32_mul", c0, c1, clobbers=context.arch.caller_save
+        context, "__mulsf3", c0, c1, clobbers=runtime_clobbers
     )
 
 
@@ -1434,23 +1878,26 @@ def pattern_mul_f32(context, tree, c0, c1):
 @isa.pattern("reg", "DIVF32(reg, reg)", size=20)
 def pattern_div_f32(context, tree, c0, c1):
     return call_internal2(
-        context, "float32_div", c0, c1, clobbers=context.arch.caller_save
+        context, "__divsf3", c0, c1, clobbers=runtime_clobbers
     )
 
 
-@isa.pattern("reg", "NEGF64(reg)", size=20)
-@isa.pattern("reg", "NEGF32(reg)", size=20)
+@isa.pattern("reg", "NEGF64(reg)", size=4)
+@isa.pattern("reg", "NEGF32(reg)", size=4)
 def pattern_neg_f32(context, tree, c0):
-    return call_internal1(
-        context, "float32_neg", c0, clobbers=context.arch.caller_save
-    )
+    # Flip the sign bit:
+    t = context.new_reg(RiscvRegister)
+    d = context.new_reg(RiscvRegister)
+    context.emit(Lui(t, 0x80000))
+    context.emit(Xorr(d, c0, t))
+    return d
 
 
 @isa.pattern("reg", "F32TOI32(reg)", size=20)
 @isa.pattern("reg", "F64TOI32(reg)", size=20)
 def pattern_ftoi_f32(context, tree, c0):
     return call_internal1(
-        context, "float32_to_int32", c0, clobbers=context.arch.caller_save
+        context, "__fixsfsi", c0, clobbers=runtime_clobbers
     )
 
 
@@ -1458,26 +1905,28 @@ def pattern_ftoi_f32(context, tree, c0):
 @isa.pattern("reg", "I32TOF64(reg)", size=20)
 def pattern_itof_f32(context, tree, c0):
     return call_internal1(
-        context, "int32_to_float32", c0, clobbers=context.arch.caller_save
+        context, "__floatsisf", c0, clobbers=runtime_clobbers
     )
 
 
 @isa.pattern("stm", "CJMPF32(reg, reg)", size=20)
 @isa.pattern("stm", "CJMPF64(reg, reg)", size=20)
 def pattern_cjmpf(context, tree, c0, c1):
+    # The comparison functions return a value which compares to zero
+    # like the operands compare to each other:
     op, yes_label, no_label = tree.value
     opnames = {
-        "<": "float32_lt",
-        ">": "float32_gt",
-        "==": "float32_eq",
-        "!=": "float32_ne",
-        ">=": "float32_ge",
-        "<=": "float32_le",
+        "<": ("__ltsf2", Blt),
+        ">": ("__gtsf2", Bgt),
+        "==": ("__eqsf2", Beq),
+        "!=": ("__nesf2", Bne),
+        ">=": ("__gesf2", Bge),
+        "<=": ("__lesf2", Ble),
     }
-    Bop = opnames[op]
+    name, Bop = opnames[op]
     jmp_ins = B(no_label.name, jumps=[no_label])
-    call_internal2(context, Bop, c0, c1, clobbers=context.arch.caller_save)
-    context.emit(Bne(R10, R0, yes_label.name, jumps=[yes_label, jmp_ins]))
+    d = call_internal2(context, name, c0, c1, clobbers=runtime_clobbers)
+    context.emit(Bop(d, R0, yes_label.name, jumps=[yes_label, jmp_ins]))
     context.emit(jmp_ins)
 
 
@@ -0,0 +1,99 @@
+"""Latencies of the riscv instructions on a number of cores.
+
+A core is selected with an option of the riscv architecture, for example
+``riscv:vexriscv``. The instructions are then scheduled such that results
+are not used directly after long latency instructions, like loads and
+multiplications. The latencies are the number of cycles after which a
+result can be used without stalling. They are approximations for common
+configurations of the cores:
+
+picorv32
+    Executes one instruction at a time, so results can always be used by
+    the next instruction. The code is not reordered for this core, and the
+    stall estimate is zero.
+
+vexriscv
+    The five stage pipeline with bypassing. The result of a load is
+    available one cycle late and the result of a multiplication two
+    cycles late. The iterative divider holds the pipeline until it is
+    done, which cannot be hidden by scheduling.
+
+rocket
+    The five stage in order pipeline of the rocket chip generator. The
+    multiplier and divider are iterative, but independent instructions
+    can continue while they work. The floating point unit is pipelined.
+
+"""
+
+from ..arch_info import LatencyModel
+from .instructions import Addr, Subr, Sll, Slt, Sltu, Xorr, Srl, Sra
+from .instructions import Orr, Andr, Slli, Srli, Srai, Addi, Slti, Sltiu
+from .instructions import Xori, Ori, Andi, Lui, Movr, Li, La, Adru, Adrl
+from .instructions import Lb, Lh, Lw, Lbu, Lhu, Sb, Sh, Sw, Labelrel
+from .instructions import Mul, Mulh, Mulhsu, Mulhu, Div, Divu, Rem, Remu
+from .rvc_instructions import CMovr, CLwsp, CSwsp
+from .rvf_instructions import FAdd, FSub, FMul, FDiv, FSgnj, FSgnjn, FSgnjx
+from .rvf_instructions import Movxs, Movsx, Fcvtsw, Fcvtswu, Fcvtws, Fcvtwus
+from .rvf_instructions import FLw, FSw, Feq, Fle, Flt, Fne, Fgt, Fge
+from .rvd_instructions import FAddD, FSubD, FMulD, FDivD, FSqrtD
+from .rvd_instructions import FSgnjD, FSgnjnD, FSgnjxD, FMinD, FMaxD
+from .rvd_instructions import FMaddD, FMsubD, FNmsubD, FNmaddD
+from .rvd_instructions import Fcvtsd, Fcvtds, Fcvtwd, Fcvtwud, Fcvtdw
+from .rvd_instructions import Fcvtdwu, FLd, FSd, FeqD, FleD, FltD, FgtD, FgeD
+from .rv64_instructions import Addw, Subw, Sllw, Srlw, Sraw, Addiw
+from .rv64_instructions import Slliw, Srliw, Sraiw, Slli64, Srli64, Srai64
+from .rv64_instructions import Mulw, Divw, Divuw, Remw, Remuw, Ld, Lwu, Sd
+from .sdata_instructions import LbLo, LhLo, LwLo, LbuLo, LhuLo
+from .sdata_instructions import SbLo, ShLo, SwLo
+from .xpulp_instructions import PMin, PMinu, PMax, PMaxu, PRor, PAbs
+from .xpulp_instructions import PExths, PExthz, PExtbs, PExtbz, PCnt
+from .xpulp_instructions import PClip, PClipu, PMac, PMsu
+from .xpulp_instructions import PLb, PLh, PLw, PLbu, PLhu, PSb, PSh, PSw
+
+alu_instructions = (Addr, Subr, Sll, Slt, Sltu, Xorr, Srl, Sra, Orr, Andr)
+alu_instructions += (Slli, Srli, Srai, Addi, Slti, Sltiu, Xori, Ori, Andi)
+alu_instructions += (Lui, Movr, CMovr, Li, La, Adru, Adrl)
+alu_instructions += (Addw, Subw, Sllw, Srlw, Sraw, Addiw, Slliw, Srliw)
+alu_instructions += (Sraiw, Slli64, Srli64, Srai64)
+alu_instructions += (PMin, PMinu, PMax, PMaxu, PRor, PAbs, PExths, PExthz)
+alu_instructions += (PExtbs, PExtbz, PCnt, PClip, PClipu)
+load_instructions = (Lb, Lh, Lw, Lbu, Lhu, Ld, Lwu, Labelrel, CLwsp)
+load_instructions += (FLw, FLd, LbLo, LhLo, LwLo, LbuLo, LhuLo)
+load_instructions += (PLb, PLh, PLw, PLbu, PLhu)
+store_instructions = (Sb, Sh, Sw, Sd, CSwsp, FSw, FSd, SbLo, ShLo, SwLo)
+store_instructions += (PSb, PSh, PSw)
+mul_instructions = (Mul, Mulh, Mulhsu, Mulhu, Mulw, PMac, PMsu)
+div_instructions = (Div, Divu, Rem, Remu, Divw, Divuw, Remw, Remuw)
+fpu_instructions = (FAdd, FSub, FMul, FSgnj, FSgnjn, FSgnjx, Movxs, Movsx)
+fpu_instructions += (Fcvtsw, Fcvtswu, Fcvtws, Fcvtwus)
+fpu_instructions += (Feq, Fle, Flt, Fne, Fgt, Fge)
+fpu_instructions += (FAddD, FSubD, FMulD, FSgnjD, FSgnjnD, FSgnjxD)
+fpu_instructions += (FMinD, FMaxD, FMaddD, FMsubD, FNmsubD, FNmaddD)
+fpu_instructions += (Fcvtsd, Fcvtds, Fcvtwd, Fcvtwud, Fcvtdw, Fcvtdwu)
+fpu_instructions += (FeqD, FleD, FltD, FgtD, FgeD)
+fdiv_instructions = (FDiv, FDivD, FSqrtD)
+
+instruction_kinds = {}
+for kind, instructions in [
+    ("alu", alu_instructions),
+    ("load", load_instructions),
+    ("store", store_instructions),
+    ("mul", mul_instructions),
+    ("div", div_instructions),
+    ("fpu", fpu_instructions),
+    ("fdiv", fdiv_instructions),
+]:
+    for instruction in instructions:
+        instruction_kinds[instruction] = kind
+
+latency_models = {
+    "picorv32": LatencyModel("picorv32", instruction_kinds, {}),
+    "vexriscv": LatencyModel(
+        "vexriscv", instruction_kinds, {"load": 2, "mul": 3}
+    ),
+    "rocket": LatencyModel(
+        "rocket",
+        instruction_kinds,
+        {"load": 3, "mul": 4, "div": 33, "fpu": 4, "fdiv": 20},
+    ),
+}
@@ -0,0 +1,177 @@
+"""Instruction selection for riscv cores without the M extension.
+
+Small cores, such as the picorv32, are often built without a multiplier.
+With the nom option, multiplications and divisions are done by calls to
+the runtime functions, unless a constant operand allows shifts and adds.
+"""
+
+from ..isa import Isa
+from ...utils.bitfun import is_power_of_two, popcnt, sign_extend
+from .registers import RiscvRegister
+from .instructions import Slli, Addr, mext_instructions, rv32_ops
+from .instructions import call_internal2, runtime_clobbers
+from .instructions import emit_division_by_constant
+from .instructions import emit_remainder_by_constant
+
+nomisa = Isa()
+
+
+def is_mext_pattern(pattern):
+    """ Test for integer multiply and divide patterns """
+    name = pattern.tree.name
+    return name.startswith(("MUL", "DIV", "REM")) and name[3] in "IU"
+
+
+def without_mext(isa):
+    """ Get a copy of isa without the multiply and divide instructions """
+    isa2 = Isa()
+    isa2.instructions = [
+        i for i in isa.instructions if i not in mext_instructions
+    ]
+    isa2.relocation_map = isa.relocation_map
+    isa2.patterns = [p for p in isa.patterns if not is_mext_pattern(p)]
+    return isa2
+
+
+def call_runtime(context, name, c0, c1):
+    """Call a runtime function on c0 and c1.
+
+    Unlike a normal call, only the registers written by the runtime
+    function are clobbered.
+    """
+    return call_internal2(context, name, c0, c1, clobbers=runtime_clobbers)
+
+
+@nomisa.pattern("reg", "MULI8(reg, reg)", size=10)
+@nomisa.pattern("reg", "MULU8(reg, reg)", size=10)
+@nomisa.pattern("reg", "MULU16(reg, reg)", size=10)
+@nomisa.pattern("reg", "MULI32(reg, reg)", size=10)
+@nomisa.pattern("reg", "MULU32(reg, reg)", size=10)
+def pattern_mul(context, tree, c0, c1):
+    return call_runtime(context, "__mulsi3", c0, c1)
+
+
+@nomisa.pattern("reg", "DIVI32(reg, reg)", size=10)
+def pattern_div(context, tree, c0, c1):
+    return call_runtime(context, "__divsi3", c0, c1)
+
+
+@nomisa.pattern("reg", "DIVU16(reg, reg)", size=10)
+@nomisa.pattern("reg", "DIVU32(reg, reg)", size=10)
+def pattern_divu(context, tree, c0, c1):
+    return call_runtime(context, "__udivsi3", c0, c1)
+
+
+@nomisa.pattern("reg", "REMI32(reg, reg)", size=10)
+def pattern_rem(context, tree, c0, c1):
+    return call_runtime(context, "__modsi3", c0, c1)
+
+
+@nomisa.pattern("reg", "REMU16(reg, reg)", size=10)
+@nomisa.pattern("reg", "REMU32(reg, reg)", size=10)
+def pattern_remu(context, tree, c0, c1):
+    return call_runtime(context, "__umodsi3", c0, c1)
+
+
+def is_shift_add_constant(tree):
+    """ Test if a multiplication by the constant takes a few shift adds """
+    value = sign_extend(tree[1].value, 32)
+    return value > 0 and popcnt(value, 32) <= 4
+
+
+@nomisa.pattern(
+    "reg", "MULI8(reg, CONSTI8)", size=6, condition=is_shift_add_constant
+)
+@nomisa.pattern(
+    "reg", "MULU8(reg, CONSTU8)", size=6, condition=is_shift_add_constant
+)
+@nomisa.pattern(
+    "reg", "MULU16(reg, CONSTU16)", size=6, condition=is_shift_add_constant
+)
+@nomisa.pattern(
+    "reg", "MULI32(reg, CONSTI32)", size=6, condition=is_shift_add_constant
+)
+@nomisa.pattern(
+    "reg", "MULU32(reg, CONSTU32)", size=6, condition=is_shift_add_constant
+)
+def pattern_mul_const(context, tree, c0):
+    """ Multiply by adding shifted copies of c0 for each bit set """
+    value = sign_extend(tree[1].value, 32)
+    d = None
+    for shift in range(32):
+        if value & (1 << shift):
+            if shift:
+                t = context.new_reg(RiscvRegister)
+                context.emit(Slli(t, c0, shift))
+            else:
+                t = c0
+            if d is None:
+                d = t
+            else:
+                s = context.new_reg(RiscvRegister)
+                context.emit(Addr(s, d, t))
+                d = s
+    if d is c0:
+        d = context.new_reg(RiscvRegister)
+        context.move(d, c0)
+    return d
+
+
+def is_power_of_two_divisor(tree):
+    return is_power_of_two(abs(sign_extend(tree[1].value, 32)))
+
+
+@nomisa.pattern(
+    "reg",
+    "DIVI32(reg, CONSTI32)",
+    size=6,
+    condition=is_power_of_two_divisor,
+)
+def pattern_div_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_division_by_constant(context, c0, divisor, True, rv32_ops)
+
+
+@nomisa.pattern(
+    "reg",
+    "DIVU16(reg, CONSTU16)",
+    size=6,
+    condition=lambda t: is_power_of_two(t[1].value & 0xFFFF),
+)
+@nomisa.pattern(
+    "reg",
+    "DIVU32(reg, CONSTU32)",
+    size=6,
+    condition=lambda t: is_power_of_two(t[1].value & 0xFFFFFFFF),
+)
+def pattern_divu_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_division_by_constant(context, c0, divisor, False, rv32_ops)
+
+
+@nomisa.pattern(
+    "reg",
+    "REMI32(reg, CONSTI32)",
+    size=6,
+    condition=is_power_of_two_divisor,
+)
+def pattern_rem_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_remainder_by_constant(context, c0, divisor, True, rv32_ops)
+
+
+@nomisa.pattern(
+    "reg",
+    "REMU16(reg, CONSTU16)",
+    size=6,
+    condition=lambda t: is_power_of_two(t[1].value & 0xFFFF),
+)
+@nomisa.pattern(
+    "reg",
+    "REMU32(reg, CONSTU32)",
+    size=6,
+    condition=lambda t: is_power_of_two(t[1].value & 0xFFFFFFFF),
+)
+def pattern_remu_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_remainder_by_constant(context, c0, divisor, False, rv32_ops)
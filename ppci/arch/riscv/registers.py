@@ -7,6 +7,10 @@ from ... import ir
 class RiscvRegister(Register):
     bitsize = 32
 
+    @classmethod
+    def from_num(cls, num):
+        return num2regmap[num]
+
     def __repr__(self):
         if self.is_colored:
             return get_register(self.color).name
@@ -15,17 +19,80 @@ class RiscvRegister(Register):
             return self.name
 
 
+class Riscv64Register(RiscvRegister):
+    """ A register holding a 64 bits value on the rv64 variant """
+
+    bitsize = 64
+
+
 class RiscvProgramCounterRegister(Register):
     bitsize = 32
 
 
 class RiscvFRegister(Register):
     bitsize = 32
+    ty = "F"
+
+    @classmethod
+    def from_num(cls, num):
+        return num2fregmap[num]
+
+
+class RiscvDRegister(RiscvFRegister):
+    """ A floating point register holding a double precision value """
+
+    bitsize = 64
+
+
+class RiscvPairRegister(Register):
+    """A pair of integer registers holding a double precision value.
+
+    Without the D extension, the low word of a double is kept in the
+    first register of the pair and the high word in the second one.
+    """
+
+    bitsize = 64
+    ty = "F"
+
+    @classmethod
+    def from_num(cls, num):
+        return num2pairmap[num]
+
+    @property
+    def lo(self):
+        """ The register with the low word """
+        return self.get_real().aliases[0]
+
+    @property
+    def hi(self):
+        """ The register with the high word """
+        return self.get_real().aliases[1]
+
+
+class RiscvVRegister(Register):
+    """A vector register of the V extension.
+
+    Vector registers hold no ir values, code which uses them refers to
+    fixed registers.
+    """
+
+    bitsize = 128
+
+    @classmethod
+    def from_num(cls, num):
+        return num2vregmap[num]
 
 
 class RiscvCsrRegister(Register):
     bitsize = 32
 
+    @classmethod
+    def from_num(cls, num):
+        for register in cls.registers:
+            if register.num == num:
+                return register
+        return cls("csr{:#x}".format(num), num=num)
+
 
 def get_register(n):
     """ Based on a number, get the corresponding register """
@@ -106,6 +173,9 @@ F29 = RiscvFRegister("f29", num=29)
 F30 = RiscvFRegister("f30", num=30)
 F31 = RiscvFRegister("f31", num=31)
 
+vregisters = [RiscvVRegister("v{}".format(num), num=num) for num in range(32)]
+V8, V12, V16 = vregisters[8], vregisters[12], vregisters[16]
+
 MSTATUS = RiscvCsrRegister("mstatus", num=0x300)
 MIE = RiscvCsrRegister("mie", num=0x304)
 MTVEC = RiscvCsrRegister("mtvec", num=0x305)
@@ -186,11 +256,32 @@ fregisters = [
 ]
 
 RiscvFRegister.registers = fregisters
+RiscvVRegister.registers = vregisters
 num2regmap = {r.num: r for r in registers}
+num2fregmap = {r.num: r for r in fregisters}
+num2vregmap = {r.num: r for r in vregisters}
+
+# The pairs are aligned, so that two pairs never partly overlap:
+pairs = [
+    RiscvPairRegister(
+        "x{}:x{}".format(num, num + 1),
+        num=num,
+        aliases=(num2regmap[num], num2regmap[num + 1]),
+    )
+    for num in range(10, 28, 2)
+]
+P10, P12, P14 = pairs[0:3]
+RiscvPairRegister.registers = pairs
+num2pairmap = {r.num: r for r in pairs}
 
 gdb_registers = registers + [PC]
 RiscvCsrRegister.registers = [MSTATUS, MIE, MTVEC, MEPC, MCAUSE, MHARTID, FRM]
 
+# Without the D extension, doubles are kept in pairs of registers:
+register_class_pairs = RegisterClass(
+    "pair", [ir.f64], RiscvPairRegister, pairs
+)
+
 register_classes_hwfp = [
     RegisterClass(
         "reg",
@@ -218,13 +309,20 @@ register_classes_hwfp = [
             R27,
         ],
     ),
-    RegisterClass("freg", [ir.f32, ir.f64], RiscvFRegister, fregisters),
+    RegisterClass("freg", [ir.f32], RiscvFRegister, fregisters),
+    register_class_pairs,
+]
+
+register_classes_hwfp_d = [
+    register_classes_hwfp[0],
+    RegisterClass("freg", [ir.f32], RiscvFRegister, fregisters),
+    RegisterClass("dreg", [ir.f64], RiscvDRegister, fregisters),
 ]
 
 register_classes_swfp = [
     RegisterClass(
         "reg",
-        [ir.i8, ir.i16, ir.i32, ir.ptr, ir.u8, ir.u16, ir.u32, ir.f32, ir.f64],
+        [ir.i8, ir.i16, ir.i32, ir.ptr, ir.u8, ir.u16, ir.u32, ir.f32],
         RiscvRegister,
         [
             R9,
@@ -247,5 +345,25 @@ register_classes_swfp = [
             R26,
             R27,
         ],
-    )
+    ),
+    register_class_pairs,
 ]
+
+register_classes_rv64 = [
+    RegisterClass(
+        "reg",
+        [ir.i8, ir.i16, ir.i32, ir.u8, ir.u16, ir.u32, ir.f32, ir.f64],
+        RiscvRegister,
+        register_classes_swfp[0].registers,
+    ),
+    RegisterClass(
+        "reg64",
+        [ir.i64, ir.u64, ir.ptr],
+        Riscv64Register,
+        register_classes_swfp[0].registers,
+    ),
+]
+
+# The vector registers hold no ir values, the class only makes the fixed
+# vector registers known to the register allocator:
+register_class_rvv = RegisterClass("vreg", [], RiscvVRegister, vregisters)
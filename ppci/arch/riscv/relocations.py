@@ -1,6 +1,12 @@
-from ...utils.bitfun import wrap_negative, BitView
+from ...utils.bitfun import wrap_negative, inrange, BitView
 from ..encoding import Relocation
-from .tokens import RiscvToken, RiscvIToken, RiscvSBToken
+from .registers import R3
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken, RiscvSBToken
+from .tokens import RiscvUToken
+
+# Small data is addressed relative to this symbol, which must be loaded
+# into the gp register by the startup code:
+GLOBAL_POINTER = "__global_pointer"
 
 
 class BImm12Relocation(Relocation):
@@ -44,6 +50,44 @@ class BImm20Relocation(Relocation):
         return data
 
 
+class CallRelocation(Relocation):
+    """Relocation for a call with an auipc and a jalr instruction.
+
+    When the target is within reach of a jal instruction, the pair is
+    relaxed into this single jal.
+    """
+
+    name = "call"
+    token = RiscvUToken
+
+    @classmethod
+    def size(cls):
+        return 8
+
+    def apply(self, sym_value, data, reloc_value):
+        assert sym_value % 2 == 0
+        assert reloc_value % 2 == 0
+        offset = sym_value - reloc_value
+        bv = BitView(data, 0, 8)
+        # The lower 12 bits of the jalr are sign extended:
+        bv[12:32] = ((offset + 0x800) >> 12) & 0xFFFFF
+        bv[52:64] = offset & 0xFFF
+        return data
+
+    def can_shrink(self, sym_value, reloc_value):
+        return inrange(sym_value - reloc_value, 21)
+
+    def do_shrink(self, sym_value, data, reloc_value):
+        token = RiscvUToken.from_data(data[:4])
+        token.opcode = 0b1101111
+        token.imm = 0
+        return token.encode(), [self.jal_relocation(token.rd)]
+
+    def jal_relocation(self, rd):
+        """ Get the relocation for the jal which replaces the call """
+        return BImm20Relocation(self.symbol_name)
+
+
 class Abs32Imm20Relocation(Relocation):
     name = "abs32_imm20"
     token = RiscvToken
@@ -64,7 +108,7 @@ class RelImm20Relocation(Relocation):
     token = RiscvToken
 
     def apply(self, sym_value, data, reloc_value):
-        assert sym_value % 2 == 0
+        # Data labels can be at odd addresses, only the pc is aligned:
         assert reloc_value % 2 == 0
         offset = sym_value - reloc_value
         bv = BitView(data, 0, 4)
@@ -105,7 +149,6 @@ class RelImm12Relocation(Relocation):
     field = "imm"
 
     def calc(self, sym_value, reloc_value):
-        assert sym_value % 2 == 0
         assert reloc_value % 2 == 0
         offset = sym_value - reloc_value + 4
         return offset & 0xFFF
@@ -132,3 +175,111 @@ class AbsAddr32Relocation(Relocation):
         bv = BitView(data, 0, 4)
         bv[0:32] = offset
         return data
+
+
+class GpRelaxable(Relocation):
+    """ A relocation which can be relaxed to a global pointer offset """
+
+    base_symbol = GLOBAL_POINTER
+
+    def can_shrink(self, sym_value, reloc_value):
+        return self.base_value is not None and inrange(
+            sym_value - self.base_value, 12
+        )
+
+
+class Hi20Relocation(GpRelaxable):
+    """The upper 20 bits of an address, as used by lui with %hi.
+
+    When the address is near the global pointer, the lui is removed.
+    """
+
+    name = "hi20"
+    token = RiscvUToken
+    field = "imm"
+
+    def calc(self, sym_value, reloc_value):
+        # The lower 12 bits are sign extended:
+        return ((sym_value + 0x800) >> 12) & 0xFFFFF
+
+    def do_shrink(self, sym_value, data, reloc_value):
+        return data[:0], []
+
+
+class Lo12IRelocation(GpRelaxable):
+    """The lower 12 bits of an address, as used by addi or loads.
+
+    When the address is near the global pointer, the instruction is
+    patched to use the global pointer as base register.
+    """
+
+    name = "lo12_i"
+    token = RiscvIToken
+    field = "imm"
+
+    def calc(self, sym_value, reloc_value):
+        return sym_value & 0xFFF
+
+    def do_shrink(self, sym_value, data, reloc_value):
+        token = self.token.from_data(data)
+        token.rs1 = R3.num
+        return token.encode(), [GpRel12IRelocation(self.symbol_name)]
+
+
+class Lo12SRelocation(Lo12IRelocation):
+    """ The lower 12 bits of an address, as used by stores """
+
+    name = "lo12_s"
+    token = RiscvSToken
+
+    def do_shrink(self, sym_value, data, reloc_value):
+        token = self.token.from_data(data)
+        token.rs1 = R3.num
+        return token.encode(), [GpRel12SRelocation(self.symbol_name)]
+
+
+class GpRel12IRelocation(Relocation):
+    """ The offset of an address relative to the global pointer """
+
+    name = "gprel12_i"
+    token = RiscvIToken
+    field = "imm"
+    base_symbol = GLOBAL_POINTER
+
+    def calc(self, sym_value, reloc_value):
+        return wrap_negative(sym_value - self.base_value, 12)
+
+
+class GpRel12SRelocation(GpRel12IRelocation):
+    name = "gprel12_s"
+    token = RiscvSToken
+
+
+class LoopUImm12Relocation(Relocation):
+    """The offset to a hardware loop label, in half words.
+
+    Hardware loop labels come after the instruction which sets them up.
+    """
+
+    name = "loop_uimm12"
+    token = RiscvIToken
+    field = "imm"
+
+    def calc(self, sym_value, reloc_value):
+        offset = sym_value - reloc_value
+        assert offset % 2 == 0
+        assert offset in range(0, 1 << 13), "Hardware loop is too large"
+        return offset >> 1
+
+
+class LoopUImm5Relocation(LoopUImm12Relocation):
+    """ The short loop end offset of lp.setupi, in the rs1 field """
+
+    name = "loop_uimm5"
+    field = "rs1"
+
+    def calc(self, sym_value, reloc_value):
+        offset = sym_value - reloc_value
+        assert offset % 2 == 0
+        assert offset in range(0, 1 << 6), "Hardware loop is too large"
+        return offset >> 1
@@ -0,0 +1,1488 @@
+"""Runtime functions for riscv cores without the M or F extensions.
+
+The functions follow the gcc naming conventions, such as __mulsi3,
+__divsi3 and __addsf3. They take their operands in x12 and x13 and return
+the result in x10. Next to the argument registers, only the temporaries
+x5 to x7 and x28 to x31 are used, which are never allocated by the
+compiler, so a call to these functions clobbers fewer registers than a
+normal call.
+
+The block functions __memcpy and __memclr copy and clear large blocks of
+memory, such as structs. They take a destination pointer in x12, followed
+by a source pointer and the size in bytes, and also clobber x12 to x14.
+
+With the rvv option, the block functions use vector loads and stores,
+and the vector registers v8 to v15 are clobbered as well.
+
+The multiply, divide, block and floating point functions are placed in
+separate objects, so that the linker only adds the functions that are used.
+"""
+
+RT_MUL_ASM_SRC = """
+section code
+global __mulsi3
+
+__mulsi3:
+; Multiply x12 by x13, giving the product in x10.
+mv x10, x0
+; The product of two negative numbers is the product of their magnitudes:
+and x5, x12, x13
+bge x5, x0, __mulsi3_positive
+sub x12, x0, x12
+sub x13, x0, x13
+__mulsi3_positive:
+; Loop over the bits of the smallest operand:
+bgeu x13, x12, __mulsi3_ordered
+mv x5, x12
+mv x12, x13
+mv x13, x5
+__mulsi3_ordered:
+beq x12, x0, __mulsi3_done
+
+; Handle four bits per iteration:
+__mulsi3_loop:
+andi x5, x12, 1
+beq x5, x0, __mulsi3_bit1
+add x10, x10, x13
+__mulsi3_bit1:
+andi x5, x12, 2
+beq x5, x0, __mulsi3_bit2
+slli x6, x13, 1
+add x10, x10, x6
+__mulsi3_bit2:
+andi x5, x12, 4
+beq x5, x0, __mulsi3_bit3
+slli x6, x13, 2
+add x10, x10, x6
+__mulsi3_bit3:
+andi x5, x12, 8
+beq x5, x0, __mulsi3_next
+slli x6, x13, 3
+add x10, x10, x6
+__mulsi3_next:
+srli x12, x12, 4
+slli x13, x13, 4
+bne x12, x0, __mulsi3_loop
+
+__mulsi3_done:
+jalr x0, x1, 0
+"""
+
+RT_DIV_ASM_SRC = """
+section code
+global __udivsi3
+global __umodsi3
+global __divsi3
+global __modsi3
+
+__udivsi3:
+; Unsigned division of x12 by x13, giving the quotient in x10.
+jal x7, __udivmodsi4
+jalr x0, x1, 0
+
+__umodsi3:
+; Unsigned remainder of x12 divided by x13 in x10.
+jal x7, __udivmodsi4
+mv x10, x11
+jalr x0, x1, 0
+
+__divsi3:
+; Signed division, the quotient is negative when the signs differ.
+beq x13, x0, __udivsi3
+xor x28, x12, x13
+srai x5, x12, 31
+xor x12, x12, x5
+sub x12, x12, x5
+srai x5, x13, 31
+xor x13, x13, x5
+sub x13, x13, x5
+jal x7, __udivmodsi4
+srai x28, x28, 31
+xor x10, x10, x28
+sub x10, x10, x28
+jalr x0, x1, 0
+
+__modsi3:
+; Signed remainder, which has the sign of the dividend.
+mv x28, x12
+srai x5, x12, 31
+xor x12, x12, x5
+sub x12, x12, x5
+srai x5, x13, 31
+xor x13, x13, x5
+sub x13, x13, x5
+jal x7, __udivmodsi4
+srai x28, x28, 31
+xor x10, x11, x28
+sub x10, x10, x28
+jalr x0, x1, 0
+
+__udivmodsi4:
+; Divide x12 by x13, giving the quotient in x10 and the remainder in x11.
+; This function returns to the address in x7.
+mv x10, x0
+mv x11, x12
+; The quotient is zero when the divisor is larger than the dividend:
+bltu x12, x13, __udivmodsi4_done
+beq x13, x0, __udivmodsi4_zero
+
+; Shift the divisor up to the dividend, four bits at a time first. This
+; way only the significant bits of the quotient are calculated.
+li x5, 1
+srli x6, x12, 4
+bltu x6, x13, __udivmodsi4_align
+__udivmodsi4_align4:
+slli x13, x13, 4
+slli x5, x5, 4
+bgeu x6, x13, __udivmodsi4_align4
+__udivmodsi4_align:
+srli x6, x12, 1
+bltu x6, x13, __udivmodsi4_loop
+__udivmodsi4_align1:
+slli x13, x13, 1
+slli x5, x5, 1
+bgeu x6, x13, __udivmodsi4_align1
+
+; Subtract the shifted divisor for each bit of the quotient, and stop
+; as soon as nothing remains:
+__udivmodsi4_loop:
+bltu x11, x13, __udivmodsi4_next
+sub x11, x11, x13
+or x10, x10, x5
+beq x11, x0, __udivmodsi4_done
+__udivmodsi4_next:
+srli x13, x13, 1
+srli x5, x5, 1
+bne x5, x0, __udivmodsi4_loop
+__udivmodsi4_done:
+jalr x0, x7, 0
+
+__udivmodsi4_zero:
+; Division by zero gives all ones, like the divu instruction:
+li x10, -1
+jalr x0, x7, 0
+"""
+
+RT_BLOCK_ASM_SRC = """
+section code
+global __memcpy
+global __memclr
+
+__memcpy:
+; Copy x14 bytes from x13 to x12.
+or x5, x12, x13
+andi x5, x5, 3
+bne x5, x0, __memcpy_bytes
+; Both pointers are word aligned, copy four words per iteration:
+li x6, 16
+bltu x14, x6, __memcpy_words
+__memcpy_loop:
+lw x5, 0(x13)
+lw x7, 4(x13)
+lw x28, 8(x13)
+lw x29, 12(x13)
+sw x5, 0(x12)
+sw x7, 4(x12)
+sw x28, 8(x12)
+sw x29, 12(x12)
+addi x13, x13, 16
+addi x12, x12, 16
+addi x14, x14, -16
+bgeu x14, x6, __memcpy_loop
+__memcpy_words:
+li x6, 4
+bltu x14, x6, __memcpy_bytes
+lw x5, 0(x13)
+sw x5, 0(x12)
+addi x13, x13, 4
+addi x12, x12, 4
+addi x14, x14, -4
+j __memcpy_words
+__memcpy_bytes:
+beq x14, x0, __memcpy_done
+lb x5, 0(x13)
+sb x5, 0(x12)
+addi x13, x13, 1
+addi x12, x12, 1
+addi x14, x14, -1
+j __memcpy_bytes
+__memcpy_done:
+jalr x0, x1, 0
+
+__memclr:
+; Fill x13 bytes at x12 with zeros.
+andi x5, x12, 3
+bne x5, x0, __memclr_bytes
+li x6, 16
+bltu x13, x6, __memclr_words
+__memclr_loop:
+sw x0, 0(x12)
+sw x0, 4(x12)
+sw x0, 8(x12)
+sw x0, 12(x12)
+addi x12, x12, 16
+addi x13, x13, -16
+bgeu x13, x6, __memclr_loop
+__memclr_words:
+li x6, 4
+bltu x13, x6, __memclr_bytes
+sw x0, 0(x12)
+addi x12, x12, 4
+addi x13, x13, -4
+j __memclr_words
+__memclr_bytes:
+beq x13, x0, __memclr_done
+sb x0, 0(x12)
+addi x12, x12, 1
+addi x13, x13, -1
+j __memclr_bytes
+__memclr_done:
+jalr x0, x1, 0
+"""
+
+RT_FLOAT_ASM_SRC = """
+section code
+global __addsf3
+global __subsf3
+global __mulsf3
+global __divsf3
+global __negsf2
+global __fixsfsi
+global __floatsisf
+global __eqsf2
+global __nesf2
+global __ltsf2
+global __lesf2
+global __gtsf2
+global __gesf2
+global __extendsfdf2
+global __truncdfsf2
+
+; Single precision floating point values are kept in the integer registers.
+; The results are rounded to the nearest value, ties to even. Like the F
+; extension, the functions return the canonical NaN 0x7FC00000.
+
+__subsf3:
+; Subtract x13 from x12 by adding the negated value.
+lui x5, 0x80000
+xor x13, x13, x5
+
+__addsf3:
+; Add x12 and x13. Make x12 the operand with the largest magnitude, so that
+; the result has its sign.
+slli x6, x12, 1
+slli x7, x13, 1
+bgeu x6, x7, __addsf3_ordered
+mv x5, x12
+mv x12, x13
+mv x13, x5
+mv x5, x6
+mv x6, x7
+mv x7, x5
+__addsf3_ordered:
+srli x28, x6, 24
+li x5, 255
+beq x28, x5, __addsf3_special
+beq x7, x0, __addsf3_zero
+beq x28, x0, __addsf3_subnormal
+
+; The mantissas get the implicit bit at bit 30 and seven rounding bits.
+lui x5, 0x40000
+slli x10, x6, 8
+srli x10, x10, 2
+or x10, x10, x5
+srli x29, x7, 24
+slli x11, x7, 8
+srli x11, x11, 2
+beq x29, x0, __addsf3_b_subnormal
+or x11, x11, x5
+__addsf3_align:
+; Align the mantissa of x13, keeping the shifted out bits as sticky bit:
+sub x29, x28, x29
+li x30, 31
+bltu x29, x30, __addsf3_shift
+li x29, 31
+__addsf3_shift:
+srl x30, x11, x29
+sll x31, x30, x29
+sltu x31, x31, x11
+or x11, x30, x31
+lui x5, 0x80000
+and x29, x12, x5
+xor x30, x12, x13
+blt x30, x0, __addsf3_subtract
+add x10, x10, x11
+bge x10, x0, __sf_pack
+andi x30, x10, 1
+srli x10, x10, 1
+or x10, x10, x30
+addi x28, x28, 1
+j __sf_pack
+
+__addsf3_subtract:
+sub x10, x10, x11
+beq x10, x0, __addsf3_done
+; Normalize the difference, eight bits at a time first:
+lui x5, 0x40000
+__addsf3_normalize8:
+lui x30, 0x400
+bgeu x10, x30, __addsf3_normalize
+li x30, 9
+blt x28, x30, __addsf3_normalize
+slli x10, x10, 8
+addi x28, x28, -8
+j __addsf3_normalize8
+__addsf3_normalize:
+bgeu x10, x5, __sf_pack
+li x30, 1
+beq x28, x30, __sf_pack
+slli x10, x10, 1
+addi x28, x28, -1
+j __addsf3_normalize
+
+__addsf3_b_subnormal:
+li x29, 1
+j __addsf3_align
+
+__addsf3_subnormal:
+; Both values are subnormal, so their bits can be added as integers.
+srli x6, x6, 1
+srli x7, x7, 1
+xor x5, x12, x13
+blt x5, x0, __addsf3_subnormal_subtract
+add x10, x6, x7
+j __addsf3_subnormal_sign
+__addsf3_subnormal_subtract:
+sub x10, x6, x7
+beq x10, x0, __addsf3_done
+__addsf3_subnormal_sign:
+lui x5, 0x80000
+and x5, x12, x5
+or x10, x10, x5
+__addsf3_done:
+jalr x0, x1, 0
+
+__addsf3_zero:
+; Adding zero gives x12, unless both are zero:
+mv x10, x12
+bne x6, x0, __addsf3_done
+and x10, x12, x13
+jalr x0, x1, 0
+
+__addsf3_special:
+; Infinity or NaN, which are both larger than x13.
+lui x5, 0xFF000
+bltu x5, x6, __sf_nan
+mv x10, x12
+bne x6, x7, __addsf3_done
+xor x5, x12, x13
+blt x5, x0, __sf_nan
+jalr x0, x1, 0
+
+__mulsf3:
+; Multiply x12 by x13.
+xor x29, x12, x13
+lui x5, 0x80000
+and x29, x29, x5
+slli x6, x12, 1
+slli x7, x13, 1
+lui x5, 0xFF000
+bltu x5, x6, __sf_nan
+bltu x5, x7, __sf_nan
+beq x6, x5, __mulsf3_inf
+beq x7, x5, __mulsf3_inf_b
+beq x6, x0, __sf_zero
+beq x7, x0, __sf_zero
+jal x30, __sf_unpack
+mv x10, x11
+mv x28, x31
+mv x6, x7
+jal x30, __sf_unpack
+add x28, x28, x31
+addi x28, x28, -127
+jal x7, __sf_multiply
+; The product of the mantissas is between 1 and 4:
+lui x5, 0x40000
+bltu x10, x5, __mulsf3_low
+addi x28, x28, 1
+j __sf_pack
+__mulsf3_low:
+slli x10, x10, 1
+j __sf_pack
+
+__mulsf3_inf:
+beq x7, x0, __sf_nan
+j __sf_inf
+__mulsf3_inf_b:
+beq x6, x0, __sf_nan
+j __sf_inf
+
+__divsf3:
+; Divide x12 by x13.
+xor x29, x12, x13
+lui x5, 0x80000
+and x29, x29, x5
+slli x6, x12, 1
+slli x7, x13, 1
+lui x5, 0xFF000
+bltu x5, x6, __sf_nan
+bltu x5, x7, __sf_nan
+beq x6, x5, __divsf3_inf
+beq x7, x5, __sf_zero
+beq x7, x0, __divsf3_by_zero
+beq x6, x0, __sf_zero
+jal x30, __sf_unpack
+mv x12, x11
+mv x28, x31
+mv x6, x7
+jal x30, __sf_unpack
+sub x28, x28, x31
+addi x28, x28, 127
+; Make the first quotient bit a one:
+bgeu x12, x11, __divsf3_start
+slli x12, x12, 1
+addi x28, x28, -1
+__divsf3_start:
+; Calculate 26 quotient bits, and stop when nothing remains:
+mv x10, x0
+li x30, 26
+__divsf3_loop:
+slli x10, x10, 1
+bltu x12, x11, __divsf3_next
+sub x12, x12, x11
+ori x10, x10, 1
+beq x12, x0, __divsf3_exact
+__divsf3_next:
+slli x12, x12, 1
+addi x30, x30, -1
+bne x30, x0, __divsf3_loop
+sltu x12, x0, x12
+slli x10, x10, 5
+or x10, x10, x12
+j __sf_pack
+__divsf3_exact:
+addi x30, x30, 4
+sll x10, x10, x30
+j __sf_pack
+
+__divsf3_inf:
+beq x7, x5, __sf_nan
+j __sf_inf
+__divsf3_by_zero:
+beq x6, x0, __sf_nan
+j __sf_inf
+
+__negsf2:
+lui x5, 0x80000
+xor x10, x12, x5
+jalr x0, x1, 0
+
+__fixsfsi:
+; Convert x12 to an integer, rounding towards zero. Like the F extension,
+; values out of range saturate and NaN gives the largest integer.
+slli x6, x12, 1
+srli x28, x6, 24
+mv x10, x0
+li x5, 127
+blt x28, x5, __fixsfsi_done
+li x5, 158
+bge x28, x5, __fixsfsi_overflow
+slli x10, x12, 8
+lui x7, 0x80000
+or x10, x10, x7
+sub x5, x5, x28
+srl x10, x10, x5
+bge x12, x0, __fixsfsi_done
+sub x10, x0, x10
+__fixsfsi_done:
+jalr x0, x1, 0
+__fixsfsi_overflow:
+lui x10, 0x80000
+lui x5, 0xFF000
+bltu x5, x6, __fixsfsi_max
+blt x12, x0, __fixsfsi_done
+__fixsfsi_max:
+addi x10, x10, -1
+jalr x0, x1, 0
+
+__floatsisf:
+; Convert the integer x12 to a floating point value.
+mv x10, x0
+beq x12, x0, __fixsfsi_done
+lui x5, 0x80000
+and x29, x12, x5
+bge x12, x0, __floatsisf_positive
+sub x12, x0, x12
+__floatsisf_positive:
+; Shift the most significant bit to bit 31:
+li x28, 158
+srli x5, x12, 16
+bne x5, x0, __floatsisf_8
+slli x12, x12, 16
+addi x28, x28, -16
+__floatsisf_8:
+srli x5, x12, 24
+bne x5, x0, __floatsisf_4
+slli x12, x12, 8
+addi x28, x28, -8
+__floatsisf_4:
+srli x5, x12, 28
+bne x5, x0, __floatsisf_2
+slli x12, x12, 4
+addi x28, x28, -4
+__floatsisf_2:
+srli x5, x12, 30
+bne x5, x0, __floatsisf_1
+slli x12, x12, 2
+addi x28, x28, -2
+__floatsisf_1:
+blt x12, x0, __floatsisf_round
+slli x12, x12, 1
+addi x28, x28, -1
+__floatsisf_round:
+andi x5, x12, 1
+srli x10, x12, 1
+or x10, x10, x5
+j __sf_pack
+
+__eqsf2:
+__nesf2:
+__ltsf2:
+__lesf2:
+; Compare x12 and x13, giving -1, 0 or 1. The result is 1 when one of
+; the values is NaN, which makes these comparisons false.
+li x11, 1
+j __sf_compare
+__gtsf2:
+__gesf2:
+; Like the other comparisons, but the result is -1 for NaN.
+li x11, -1
+__sf_compare:
+slli x6, x12, 1
+slli x7, x13, 1
+lui x5, 0xFF000
+bltu x5, x6, __sf_compare_unordered
+bltu x5, x7, __sf_compare_unordered
+; Positive and negative zero are equal:
+mv x10, x0
+or x28, x6, x7
+beq x28, x0, __sf_compare_done
+; Flip the magnitude bits of negative values, which makes the values
+; ordered as signed integers:
+srai x28, x12, 31
+srli x28, x28, 1
+xor x12, x12, x28
+srai x28, x13, 31
+srli x28, x28, 1
+xor x13, x13, x28
+slt x10, x13, x12
+slt x11, x12, x13
+sub x10, x10, x11
+__sf_compare_done:
+jalr x0, x1, 0
+__sf_compare_unordered:
+mv x10, x11
+jalr x0, x1, 0
+
+__extendsfdf2:
+; Convert x12 to a double precision value in x10:x11, which is exact.
+lui x5, 0x80000
+and x29, x12, x5
+slli x6, x12, 1
+mv x10, x0
+mv x11, x29
+beq x6, x0, __extendsfdf2_done
+lui x5, 0xFF000
+bltu x5, x6, __extendsfdf2_nan
+beq x6, x5, __extendsfdf2_inf
+jal x30, __sf_unpack
+; Move the implicit bit to bit 20 of the high word:
+addi x31, x31, 895
+slli x31, x31, 20
+slli x10, x11, 29
+srli x11, x11, 3
+add x11, x11, x31
+or x11, x11, x29
+__extendsfdf2_done:
+jalr x0, x1, 0
+__extendsfdf2_nan:
+lui x11, 0x7FF80
+jalr x0, x1, 0
+__extendsfdf2_inf:
+lui x11, 0x7FF00
+or x11, x11, x29
+jalr x0, x1, 0
+
+__truncdfsf2:
+; Convert the double precision value x12:x13 to a single precision value.
+lui x5, 0x80000
+and x29, x13, x5
+slli x6, x13, 1
+sltu x5, x0, x12
+or x6, x6, x5
+lui x5, 0xFFE00
+bltu x5, x6, __sf_nan
+beq x6, x5, __sf_inf
+; Subnormal doubles are too small for a single precision value:
+srli x28, x6, 21
+beq x28, x0, __sf_zero
+; Take the upper 30 bits of the mantissa and a sticky bit for the others:
+slli x10, x13, 12
+srli x10, x10, 2
+srli x7, x12, 22
+or x10, x10, x7
+slli x7, x12, 10
+sltu x7, x0, x7
+or x10, x10, x7
+lui x5, 0x40000
+or x10, x10, x5
+addi x28, x28, -896
+j __sf_pack
+
+__sf_unpack:
+; Split the nonzero magnitude in x6, which is shifted left by one, into the
+; mantissa x11 with the implicit bit at bit 23 and the exponent x31.
+; Subnormal values are normalized. This function returns to x30.
+lui x5, 0x800
+srli x31, x6, 24
+slli x11, x6, 8
+srli x11, x11, 9
+beq x31, x0, __sf_unpack_subnormal
+or x11, x11, x5
+jalr x0, x30, 0
+__sf_unpack_subnormal:
+li x31, 1
+__sf_unpack_normalize:
+slli x11, x11, 1
+addi x31, x31, -1
+bltu x11, x5, __sf_unpack_normalize
+jalr x0, x30, 0
+
+__sf_pack:
+; Round and pack the mantissa x10 with the implicit bit at bit 30 and the
+; exponent x28 into a value with the sign x29.
+li x30, 255
+bge x28, x30, __sf_inf
+blt x0, x28, __sf_round
+; Shift the mantissa of a subnormal result, keeping a sticky bit:
+li x30, 1
+sub x30, x30, x28
+li x31, 31
+bltu x30, x31, __sf_pack_shift
+li x30, 31
+__sf_pack_shift:
+srl x31, x10, x30
+sll x5, x31, x30
+sltu x5, x5, x10
+or x10, x31, x5
+li x28, 1
+__sf_round:
+; The implicit bit increments the exponent, and so does a carry of the
+; rounding, up to infinity.
+andi x30, x10, 0x7F
+srli x10, x10, 7
+addi x28, x28, -1
+slli x28, x28, 23
+add x10, x10, x28
+li x31, 0x40
+bltu x30, x31, __sf_sign
+bne x30, x31, __sf_round_up
+andi x31, x10, 1
+beq x31, x0, __sf_sign
+__sf_round_up:
+addi x10, x10, 1
+__sf_sign:
+or x10, x10, x29
+jalr x0, x1, 0
+
+__sf_inf:
+lui x10, 0x7F800
+or x10, x10, x29
+jalr x0, x1, 0
+
+__sf_zero:
+mv x10, x29
+jalr x0, x1, 0
+
+__sf_nan:
+lui x10, 0x7FC00
+jalr x0, x1, 0
+"""
+
+# The multiplication of the mantissas. Both variants return the product of
+# x10 and x11 shifted right by 17 bits, with a sticky bit for the bits that
+# are shifted out.
+RT_FLOAT_MULTIPLY_ASM_SRC = """
+__sf_multiply:
+slli x10, x10, 8
+slli x11, x11, 7
+mul x5, x10, x11
+mulhu x10, x10, x11
+sltu x5, x0, x5
+or x10, x10, x5
+jalr x0, x7, 0
+"""
+
+RT_FLOAT_MULTIPLY_NOM_ASM_SRC = """
+__sf_multiply:
+; Loop over the bits of the mantissa with the most trailing zeros.
+sub x5, x0, x10
+and x5, x5, x10
+sub x6, x0, x11
+and x6, x6, x11
+bgeu x6, x5, __sf_multiply_ordered
+mv x5, x10
+mv x10, x11
+mv x11, x5
+__sf_multiply_ordered:
+slli x6, x10, 7
+mv x10, x0
+mv x31, x0
+__sf_multiply_skip:
+andi x5, x11, 1
+bne x5, x0, __sf_multiply_loop
+srli x11, x11, 1
+j __sf_multiply_skip
+__sf_multiply_loop:
+andi x5, x11, 1
+beq x5, x0, __sf_multiply_shift
+add x10, x10, x6
+__sf_multiply_shift:
+andi x5, x10, 1
+or x31, x31, x5
+srli x10, x10, 1
+srli x11, x11, 1
+bne x11, x0, __sf_multiply_loop
+or x10, x10, x31
+jalr x0, x7, 0
+"""
+
+RT_DOUBLE_ASM_SRC = """
+section code
+global __adddf3
+global __subdf3
+global __muldf3
+global __divdf3
+global __negdf2
+global __fixdfsi
+global __fixunsdfsi
+global __floatsidf
+global __floatunsidf
+global __eqdf2
+global __nedf2
+global __ltdf2
+global __ledf2
+global __gtdf2
+global __gedf2
+
+; Double precision floating point values are kept in pairs of integer
+; registers, with the low word in the first register. The operands are
+; passed in x12:x13 and x14:x15, and the result is returned in x10:x11.
+; The results are rounded to the nearest value, ties to even. Like the D
+; extension, the functions return the canonical NaN 0x7FF8000000000000.
+
+__subdf3:
+; Subtract x14:x15 from x12:x13 by adding the negated value.
+lui x5, 0x80000
+xor x15, x15, x5
+
+__adddf3:
+; Add x12:x13 and x14:x15. Make x12:x13 the operand with the largest
+; magnitude, so that the result has its sign.
+slli x6, x13, 1
+slli x7, x15, 1
+bltu x7, x6, __adddf3_ordered
+bltu x6, x7, __adddf3_swap
+bgeu x12, x14, __adddf3_ordered
+__adddf3_swap:
+mv x5, x12
+mv x12, x14
+mv x14, x5
+mv x5, x13
+mv x13, x15
+mv x15, x5
+mv x5, x6
+mv x6, x7
+mv x7, x5
+__adddf3_ordered:
+srli x28, x6, 21
+li x5, 2047
+beq x28, x5, __adddf3_special
+or x5, x7, x14
+beq x5, x0, __adddf3_zero
+beq x28, x0, __adddf3_subnormal
+
+; The mantissas get the implicit bit at bit 62 and ten rounding bits.
+lui x5, 0x40000
+slli x11, x6, 11
+srli x11, x11, 2
+srli x10, x12, 22
+or x11, x11, x10
+or x11, x11, x5
+slli x10, x12, 10
+lui x29, 0x80000
+and x29, x13, x29
+xor x13, x13, x15
+srli x31, x7, 21
+slli x15, x7, 11
+srli x15, x15, 2
+srli x6, x14, 22
+or x15, x15, x6
+slli x14, x14, 10
+beq x31, x0, __adddf3_b_subnormal
+or x15, x15, x5
+__adddf3_align:
+; Align the mantissa of x14:x15:
+sub x30, x28, x31
+li x31, 63
+bltu x30, x31, __adddf3_shift
+li x30, 63
+__adddf3_shift:
+jal x7, __df_shift
+blt x13, x0, __adddf3_subtract
+add x10, x10, x14
+sltu x5, x10, x14
+add x11, x11, x15
+add x11, x11, x5
+bge x11, x0, __df_pack
+andi x5, x10, 1
+srli x10, x10, 1
+slli x6, x11, 31
+or x10, x10, x6
+or x10, x10, x5
+srli x11, x11, 1
+addi x28, x28, 1
+j __df_pack
+
+__adddf3_subtract:
+sltu x5, x10, x14
+sub x10, x10, x14
+sub x11, x11, x15
+sub x11, x11, x5
+or x5, x10, x11
+beq x5, x0, __adddf3_done
+; Normalize the difference, 32 and eight bits at a time first:
+lui x5, 0x40000
+bne x11, x0, __adddf3_normalize8
+bgeu x10, x5, __adddf3_normalize8
+li x30, 33
+blt x28, x30, __adddf3_normalize8
+mv x11, x10
+mv x10, x0
+addi x28, x28, -32
+__adddf3_normalize8:
+lui x30, 0x400
+bgeu x11, x30, __adddf3_normalize
+li x30, 9
+blt x28, x30, __adddf3_normalize
+srli x6, x10, 24
+slli x11, x11, 8
+or x11, x11, x6
+slli x10, x10, 8
+addi x28, x28, -8
+j __adddf3_normalize8
+__adddf3_normalize:
+bgeu x11, x5, __df_pack
+li x30, 1
+beq x28, x30, __df_pack
+srli x6, x10, 31
+slli x11, x11, 1
+or x11, x11, x6
+slli x10, x10, 1
+addi x28, x28, -1
+j __adddf3_normalize
+
+__adddf3_b_subnormal:
+li x31, 1
+j __adddf3_align
+
+__adddf3_subnormal:
+; Both values are subnormal, so their bits can be added as integers.
+srli x11, x6, 1
+srli x7, x7, 1
+lui x29, 0x80000
+and x29, x13, x29
+xor x5, x13, x15
+blt x5, x0, __adddf3_subnormal_subtract
+add x10, x12, x14
+sltu x5, x10, x14
+add x11, x11, x7
+add x11, x11, x5
+j __adddf3_subnormal_sign
+__adddf3_subnormal_subtract:
+sltu x5, x12, x14
+sub x10, x12, x14
+sub x11, x11, x7
+sub x11, x11, x5
+or x5, x10, x11
+beq x5, x0, __adddf3_done
+__adddf3_subnormal_sign:
+or x11, x11, x29
+__adddf3_done:
+jalr x0, x1, 0
+
+__adddf3_zero:
+; Adding zero gives x12:x13, unless both are zero:
+mv x10, x12
+mv x11, x13
+or x5, x6, x12
+bne x5, x0, __adddf3_done
+and x11, x13, x15
+jalr x0, x1, 0
+
+__adddf3_special:
+; Infinity or NaN, which are both larger than x14:x15.
+sltu x5, x0, x12
+or x5, x6, x5
+lui x31, 0xFFE00
+bltu x31, x5, __df_nan
+mv x10, x12
+mv x11, x13
+bne x6, x7, __adddf3_done
+xor x5, x13, x15
+blt x5, x0, __df_nan
+jalr x0, x1, 0
+
+__muldf3:
+; Multiply x12:x13 by x14:x15.
+xor x29, x13, x15
+lui x5, 0x80000
+and x29, x29, x5
+jal x31, __df_classify
+lui x5, 0xFFE00
+bltu x5, x6, __df_nan
+bltu x5, x7, __df_nan
+beq x6, x5, __muldf3_inf
+beq x7, x5, __muldf3_inf_b
+beq x6, x0, __df_zero
+beq x7, x0, __df_zero
+jal x30, __df_unpack
+mv x10, x14
+mv x11, x15
+mv x28, x31
+mv x14, x12
+mv x15, x13
+jal x30, __df_unpack
+add x28, x28, x31
+addi x28, x28, -1023
+jal x7, __df_multiply
+; The product of the mantissas is between 1 and 4:
+lui x5, 0x40000
+bltu x11, x5, __muldf3_low
+addi x28, x28, 1
+j __df_pack
+__muldf3_low:
+srli x6, x10, 31
+slli x11, x11, 1
+or x11, x11, x6
+slli x10, x10, 1
+j __df_pack
+
+__muldf3_inf:
+beq x7, x0, __df_nan
+j __df_inf
+__muldf3_inf_b:
+beq x6, x0, __df_nan
+j __df_inf
+
+__divdf3:
+; Divide x12:x13 by x14:x15.
+xor x29, x13, x15
+lui x5, 0x80000
+and x29, x29, x5
+jal x31, __df_classify
+lui x5, 0xFFE00
+bltu x5, x6, __df_nan
+bltu x5, x7, __df_nan
+beq x6, x5, __divdf3_inf
+beq x7, x5, __df_zero
+beq x7, x0, __divdf3_by_zero
+beq x6, x0, __df_zero
+jal x30, __df_unpack
+mv x10, x14
+mv x11, x15
+mv x28, x31
+mv x14, x12
+mv x15, x13
+jal x30, __df_unpack
+mv x12, x10
+mv x13, x11
+sub x28, x31, x28
+addi x28, x28, 1023
+; Make the first quotient bit a one:
+bltu x15, x13, __divdf3_first
+bne x15, x13, __divdf3_start
+bgeu x14, x12, __divdf3_start
+__divdf3_first:
+srli x5, x14, 31
+slli x15, x15, 1
+or x15, x15, x5
+slli x14, x14, 1
+addi x28, x28, -1
+__divdf3_start:
+; Calculate 55 quotient bits, and stop when nothing remains:
+mv x10, x0
+mv x11, x0
+li x30, 55
+__divdf3_loop:
+srli x5, x10, 31
+slli x11, x11, 1
+or x11, x11, x5
+slli x10, x10, 1
+bltu x15, x13, __divdf3_next
+bne x15, x13, __divdf3_subtract
+bltu x14, x12, __divdf3_next
+__divdf3_subtract:
+sltu x5, x14, x12
+sub x14, x14, x12
+sub x15, x15, x13
+sub x15, x15, x5
+ori x10, x10, 1
+or x5, x14, x15
+beq x5, x0, __divdf3_exact
+__divdf3_next:
+srli x5, x14, 31
+slli x15, x15, 1
+or x15, x15, x5
+slli x14, x14, 1
+addi x30, x30, -1
+bne x30, x0, __divdf3_loop
+or x5, x14, x15
+sltu x5, x0, x5
+srli x6, x10, 24
+slli x11, x11, 8
+or x11, x11, x6
+slli x10, x10, 8
+or x10, x10, x5
+j __df_pack
+__divdf3_exact:
+; Shift the quotient as if the remaining bits were calculated:
+addi x30, x30, 7
+li x5, 32
+bltu x30, x5, __divdf3_exact_shift
+addi x30, x30, -32
+sll x11, x10, x30
+mv x10, x0
+j __df_pack
+__divdf3_exact_shift:
+sub x5, x0, x30
+srl x5, x10, x5
+sll x11, x11, x30
+or x11, x11, x5
+sll x10, x10, x30
+j __df_pack
+
+__divdf3_inf:
+beq x7, x5, __df_nan
+j __df_inf
+__divdf3_by_zero:
+beq x6, x0, __df_nan
+j __df_inf
+
+__negdf2:
+lui x5, 0x80000
+xor x11, x13, x5
+mv x10, x12
+jalr x0, x1, 0
+
+__fixdfsi:
+; Convert x12:x13 to an integer, rounding towards zero. Like the D
+; extension, values out of range saturate and NaN gives the largest integer.
+slli x6, x13, 1
+srli x28, x6, 21
+mv x10, x0
+li x5, 1023
+blt x28, x5, __fixdfsi_done
+li x5, 1054
+bge x28, x5, __fixdfsi_overflow
+jal x31, __df_upper_word
+sub x5, x5, x28
+srl x10, x10, x5
+bge x13, x0, __fixdfsi_done
+sub x10, x0, x10
+__fixdfsi_done:
+jalr x0, x1, 0
+__fixdfsi_overflow:
+lui x10, 0x80000
+sltu x5, x0, x12
+or x6, x6, x5
+lui x5, 0xFFE00
+bltu x5, x6, __fixdfsi_max
+blt x13, x0, __fixdfsi_done
+__fixdfsi_max:
+addi x10, x10, -1
+jalr x0, x1, 0
+
+__fixunsdfsi:
+; Convert x12:x13 to an unsigned integer, rounding towards zero. Negative
+; values give zero, and values out of range and NaN the largest integer.
+slli x6, x13, 1
+srli x28, x6, 21
+mv x10, x0
+li x5, 1023
+blt x28, x5, __fixdfsi_done
+li x5, 1055
+bge x28, x5, __fixunsdfsi_overflow
+blt x13, x0, __fixdfsi_done
+jal x31, __df_upper_word
+li x5, 1054
+sub x5, x5, x28
+srl x10, x10, x5
+jalr x0, x1, 0
+__fixunsdfsi_overflow:
+sltu x5, x0, x12
+or x6, x6, x5
+lui x5, 0xFFE00
+bltu x5, x6, __fixunsdfsi_max
+blt x13, x0, __fixdfsi_done
+__fixunsdfsi_max:
+li x10, -1
+jalr x0, x1, 0
+
+__df_upper_word:
+; Get the upper 32 bits of the mantissa of x12:x13 in x10, with the
+; implicit bit at bit 31. This function returns to x31.
+slli x10, x13, 11
+srli x7, x12, 21
+or x10, x10, x7
+lui x7, 0x80000
+or x10, x10, x7
+jalr x0, x31, 0
+
+__floatsidf:
+; Convert the integer x12 to a double precision value, which is exact.
+mv x10, x0
+mv x11, x0
+beq x12, x0, __floatsidf_done
+lui x5, 0x80000
+and x29, x12, x5
+bge x12, x0, __floatsidf_convert
+sub x12, x0, x12
+j __floatsidf_convert
+__floatunsidf:
+; Convert the unsigned integer x12 to a double precision value.
+mv x10, x0
+mv x11, x0
+beq x12, x0, __floatsidf_done
+mv x29, x0
+__floatsidf_convert:
+; Shift the most significant bit to bit 31:
+li x28, 1054
+srli x5, x12, 16
+bne x5, x0, __floatsidf_8
+slli x12, x12, 16
+addi x28, x28, -16
+__floatsidf_8:
+srli x5, x12, 24
+bne x5, x0, __floatsidf_4
+slli x12, x12, 8
+addi x28, x28, -8
+__floatsidf_4:
+srli x5, x12, 28
+bne x5, x0, __floatsidf_2
+slli x12, x12, 4
+addi x28, x28, -4
+__floatsidf_2:
+srli x5, x12, 30
+bne x5, x0, __floatsidf_1
+slli x12, x12, 2
+addi x28, x28, -2
+__floatsidf_1:
+blt x12, x0, __floatsidf_pack
+slli x12, x12, 1
+addi x28, x28, -1
+__floatsidf_pack:
+; The implicit bit increments the exponent:
+addi x28, x28, -1
+slli x28, x28, 20
+slli x10, x12, 21
+srli x11, x12, 11
+add x11, x11, x28
+or x11, x11, x29
+__floatsidf_done:
+jalr x0, x1, 0
+
+__eqdf2:
+__nedf2:
+__ltdf2:
+__ledf2:
+; Compare x12:x13 and x14:x15, giving -1, 0 or 1. The result is 1 when
+; one of the values is NaN, which makes these comparisons false.
+li x11, 1
+j __df_compare
+__gtdf2:
+__gedf2:
+; Like the other comparisons, but the result is -1 for NaN.
+li x11, -1
+__df_compare:
+jal x31, __df_classify
+lui x5, 0xFFE00
+bltu x5, x6, __df_compare_unordered
+bltu x5, x7, __df_compare_unordered
+; Positive and negative zero are equal:
+mv x10, x0
+or x28, x6, x7
+beq x28, x0, __df_compare_done
+; Flip the magnitude bits of negative values, which makes the values
+; ordered as signed integers:
+srai x28, x13, 31
+srli x29, x28, 1
+xor x13, x13, x29
+xor x12, x12, x28
+srai x28, x15, 31
+srli x29, x28, 1
+xor x15, x15, x29
+xor x14, x14, x28
+bne x13, x15, __df_compare_high
+sltu x10, x14, x12
+sltu x11, x12, x14
+sub x10, x10, x11
+jalr x0, x1, 0
+__df_compare_high:
+slt x10, x15, x13
+slt x11, x13, x15
+sub x10, x10, x11
+__df_compare_done:
+jalr x0, x1, 0
+__df_compare_unordered:
+mv x10, x11
+jalr x0, x1, 0
+
+__df_classify:
+; Get the magnitudes of x12:x13 and x14:x15 in x6 and x7, shifted left by
+; one, with bit 0 set when the low word is nonzero. The values are NaN
+; when they are above 0xFFE00000, infinity when they are equal to it and
+; zero when they are zero. This function returns to x31.
+slli x6, x13, 1
+sltu x5, x0, x12
+or x6, x6, x5
+slli x7, x15, 1
+sltu x5, x0, x14
+or x7, x7, x5
+jalr x0, x31, 0
+
+__df_unpack:
+; Split the nonzero magnitude of x14:x15 into the mantissa x14:x15 with the
+; implicit bit at bit 52 and the exponent x31. Subnormal values are
+; normalized. This function returns to x30.
+lui x5, 0x100
+slli x15, x15, 1
+srli x31, x15, 21
+slli x15, x15, 11
+srli x15, x15, 12
+beq x31, x0, __df_unpack_subnormal
+or x15, x15, x5
+jalr x0, x30, 0
+__df_unpack_subnormal:
+li x31, 1
+__df_unpack_normalize:
+srli x6, x14, 31
+slli x15, x15, 1
+or x15, x15, x6
+slli x14, x14, 1
+addi x31, x31, -1
+bltu x15, x5, __df_unpack_normalize
+jalr x0, x30, 0
+
+__df_shift:
+; Shift x14:x15 right by x30 bits, less than 64, keeping the shifted out
+; bits as sticky bit. This function returns to x7.
+beq x30, x0, __df_shift_done
+li x31, 32
+bltu x30, x31, __df_shift_word
+sltu x5, x0, x14
+addi x31, x30, -32
+srl x14, x15, x31
+sll x6, x14, x31
+sltu x6, x6, x15
+or x5, x5, x6
+or x14, x14, x5
+mv x15, x0
+jalr x0, x7, 0
+__df_shift_word:
+sub x31, x0, x30
+sll x5, x14, x31
+sltu x5, x0, x5
+sll x6, x15, x31
+srl x14, x14, x30
+or x14, x14, x6
+or x14, x14, x5
+srl x15, x15, x30
+__df_shift_done:
+jalr x0, x7, 0
+
+__df_pack:
+; Round and pack the mantissa x10:x11 with the implicit bit at bit 62 and
+; the exponent x28 into a value with the sign x29.
+li x30, 2047
+bge x28, x30, __df_inf
+blt x0, x28, __df_round
+; Shift the mantissa of a subnormal result, keeping a sticky bit:
+li x30, 1
+sub x30, x30, x28
+li x31, 63
+bltu x30, x31, __df_pack_shift
+li x30, 63
+__df_pack_shift:
+mv x14, x10
+mv x15, x11
+jal x7, __df_shift
+mv x10, x14
+mv x11, x15
+li x28, 1
+__df_round:
+; The implicit bit increments the exponent, and so does a carry of the
+; rounding, up to infinity.
+andi x30, x10, 0x3FF
+srli x10, x10, 10
+slli x31, x11, 22
+or x10, x10, x31
+srli x11, x11, 10
+addi x28, x28, -1
+slli x28, x28, 20
+add x11, x11, x28
+li x31, 0x200
+bltu x30, x31, __df_sign
+bne x30, x31, __df_round_up
+andi x31, x10, 1
+beq x31, x0, __df_sign
+__df_round_up:
+addi x10, x10, 1
+sltiu x31, x10, 1
+add x11, x11, x31
+__df_sign:
+or x11, x11, x29
+jalr x0, x1, 0
+
+__df_inf:
+mv x10, x0
+lui x11, 0x7FF00
+or x11, x11, x29
+jalr x0, x1, 0
+
+__df_zero:
+mv x10, x0
+mv x11, x29
+jalr x0, x1, 0
+
+__df_nan:
+mv x10, x0
+lui x11, 0x7FF80
+jalr x0, x1, 0
+"""
+
+# The multiplication of the mantissas. Both variants return the product of
+# x10:x11 and x14:x15 shifted right by 43 bits, with a sticky bit for the
+# bits that are shifted out.
+RT_DOUBLE_MULTIPLY_ASM_SRC = """
+__df_multiply:
+; Shift the operands up, so that the high words of the 128 bits product
+; are the result.
+srli x5, x10, 21
+slli x11, x11, 11
+or x11, x11, x5
+slli x10, x10, 11
+srli x5, x14, 22
+slli x15, x15, 10
+or x15, x15, x5
+slli x14, x14, 10
+mul x31, x10, x14
+mulhu x12, x10, x14
+mul x5, x10, x15
+add x12, x12, x5
+sltu x13, x12, x5
+mul x5, x11, x14
+add x12, x12, x5
+sltu x5, x12, x5
+add x13, x13, x5
+mulhu x5, x10, x15
+add x13, x13, x5
+sltu x30, x13, x5
+mulhu x5, x11, x14
+add x13, x13, x5
+sltu x5, x13, x5
+add x30, x30, x5
+mul x5, x11, x15
+add x13, x13, x5
+sltu x5, x13, x5
+add x30, x30, x5
+mulhu x5, x11, x15
+add x30, x30, x5
+or x31, x31, x12
+sltu x31, x0, x31
+or x10, x13, x31
+mv x11, x30
+jalr x0, x7, 0
+"""
+
+RT_DOUBLE_MULTIPLY_NOM_ASM_SRC = """
+__df_multiply:
+; Loop over the bits of x14:x15, after skipping its trailing zeros.
+srli x5, x10, 22
+slli x13, x11, 10
+or x13, x13, x5
+slli x12, x10, 10
+mv x10, x0
+mv x11, x0
+mv x31, x0
+bne x14, x0, __df_multiply_skip
+mv x14, x15
+mv x15, x0
+__df_multiply_skip:
+andi x5, x14, 1
+bne x5, x0, __df_multiply_loop
+srli x14, x14, 1
+slli x5, x15, 31
+or x14, x14, x5
+srli x15, x15, 1
+j __df_multiply_skip
+__df_multiply_loop:
+andi x5, x14, 1
+beq x5, x0, __df_multiply_shift
+add x10, x10, x12
+sltu x5, x10, x12
+add x11, x11, x13
+add x11, x11, x5
+__df_multiply_shift:
+andi x5, x10, 1
+or x31, x31, x5
+srli x10, x10, 1
+slli x5, x11, 31
+or x10, x10, x5
+srli x11, x11, 1
+srli x14, x14, 1
+slli x5, x15, 31
+or x14, x14, x5
+srli x15, x15, 1
+or x5, x14, x15
+bne x5, x0, __df_multiply_loop
+or x10, x10, x31
+jalr x0, x7, 0
+"""
+
+RT_BLOCK_RVV_ASM_SRC = """
+section code
+global __memcpy
+global __memclr
+
+__memcpy:
+; Copy x14 bytes from x13 to x12, as many as fit in v8 to v15 at once.
+vsetvli x5, x14, e8, m8, ta, ma
+vle8.v v8, (x13)
+vse8.v v8, (x12)
+add x13, x13, x5
+add x12, x12, x5
+sub x14, x14, x5
+bne x14, x0, __memcpy
+jalr x0, x1, 0
+
+__memclr:
+; Fill x13 bytes at x12 with zeros.
+vsetvli x5, x13, e8, m8, ta, ma
+vmv.v.i v8, 0
+vse8.v v8, (x12)
+add x12, x12, x5
+sub x13, x13, x5
+bne x13, x0, __memclr
+jalr x0, x1, 0
+"""
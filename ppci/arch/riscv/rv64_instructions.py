@@ -0,0 +1,810 @@
+"""Definitions of the Riscv rv64 instructions.
+
+On rv64 the integer registers are 64 bits wide. Values of 32 bit types
+are kept sign extended to 64 bits in the registers, which is also the
+result of the word instructions such as addw and lw. Therefore the 32 bit
+operations of which the upper bits are not fixed by the lower bits are
+selected from the word instructions on this variant. Values of 8 and 16
+bit types have undefined upper bits, just like on the 32 bits variant.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from ...utils.bitfun import is_power_of_two, sign_extend
+from ...utils.bitfun import signed_division_magic, unsigned_division_magic
+from .registers import RiscvRegister, Riscv64Register, R0
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken, RiscvShiftToken
+from .instructions import Addi, Addr, Subr, Andr, Orr, Xorr, Andi, Ori, Xori
+from .instructions import Sll, Srl, Sra, Slli, Srli, Srai, Lui, La
+from .instructions import Mul, Mulhu, Mulh, Div, Divu, Rem, Remu
+from .instructions import IntegerOps, emit_binop, emit_low_bits
+from .instructions import emit_division_by_constant
+from .instructions import emit_remainder_by_constant
+from .instructions import pattern_cjmpi, pattern_cjmpu, pattern_jmptable
+from .instructions import emit_select, make_select_pattern, no_constants
+
+rv64isa = Isa()
+
+
+class Rv64Instruction(Instruction):
+    tokens = [RiscvToken]
+    isa = rv64isa
+
+
+def make_regregreg(mnemonic, funct7, funct3):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rn = Operand("rn", RiscvRegister, read=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    syntax = Syntax([mnemonic, " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b0111011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": funct7,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    name = mnemonic.title() + "RegRegReg"
+    return type(name, (Rv64Instruction,), members)
+
+
+Addw = make_regregreg("addw", 0b0000000, 0b000)
+Subw = make_regregreg("subw", 0b0100000, 0b000)
+Sllw = make_regregreg("sllw", 0b0000000, 0b001)
+Srlw = make_regregreg("srlw", 0b0000000, 0b101)
+Sraw = make_regregreg("sraw", 0b0100000, 0b101)
+Mulw = make_regregreg("mulw", 0b0000001, 0b000)
+Divw = make_regregreg("divw", 0b0000001, 0b100)
+Divuw = make_regregreg("divuw", 0b0000001, 0b101)
+Remw = make_regregreg("remw", 0b0000001, 0b110)
+Remuw = make_regregreg("remuw", 0b0000001, 0b111)
+
+
+class Addiw(Rv64Instruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    offset = Operand("offset", int)
+    syntax = Syntax(["addiw", " ", rd, ",", " ", rs1, ",", " ", offset])
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0011011,
+        "rd": rd,
+        "funct3": 0b000,
+        "rs1": rs1,
+        "imm": offset,
+    }
+
+
+def make_siw(mnemonic, code, func):
+    """ Factory function for the 32 bit shift by immediate instructions """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    imm = Operand("imm", int)
+    syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", imm])
+    patterns = {
+        "opcode": 0b0011011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": imm,
+        "funct7": code,
+    }
+    members = {
+        "syntax": syntax,
+        "patterns": patterns,
+        "rd": rd,
+        "rs1": rs1,
+        "imm": imm,
+    }
+    name = mnemonic.title() + "ShiftImm"
+    return type(name, (Rv64Instruction,), members)
+
+
+Slliw = make_siw("slliw", 0b0000000, 0b001)
+Srliw = make_siw("srliw", 0b0000000, 0b101)
+Sraiw = make_siw("sraiw", 0b0100000, 0b101)
+
+
+def make_si(mnemonic, code, func):
+    """Factory function for the shift by immediate instructions.
+
+    On rv64 the shift amount has six bits. These instructions replace the
+    instructions with the same mnemonic of the 32 bits variant.
+    """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    imm = Operand("imm", int)
+    syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1, ",", " ", imm])
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "shamt": imm,
+        "funct6": code,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvShiftToken],
+        "patterns": patterns,
+        "rd": rd,
+        "rs1": rs1,
+        "imm": imm,
+    }
+    name = mnemonic.title() + "ShiftImm64"
+    return type(name, (Rv64Instruction,), members)
+
+
+Slli64 = make_si("slli", 0b000000, 0b001)
+Srli64 = make_si("srli", 0b000000, 0b101)
+Srai64 = make_si("srai", 0b010000, 0b101)
+
+# The instructions of the 32 bits variant that are replaced on rv64:
+rv32_instructions = (Slli, Srli, Srai)
+
+
+def make_ldr(mnemonic, func):
+    rd = Operand("rd", RiscvRegister, write=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    fprel = False
+    syntax = Syntax([mnemonic, " ", rd, ",", " ", offset, "(", rs1, ")"])
+    patterns = {
+        "opcode": 0b0000011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "imm": offset,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvIToken],
+        "patterns": patterns,
+        "fprel": fprel,
+        "offset": offset,
+        "rd": rd,
+        "rs1": rs1,
+    }
+    return type(mnemonic.title(), (Rv64Instruction,), members)
+
+
+Ld = make_ldr("ld", 0b011)
+Lwu = make_ldr("lwu", 0b110)
+
+
+class Sd(Rv64Instruction):
+    rs2 = Operand("rs2", RiscvRegister, read=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    fprel = False
+    syntax = Syntax(["sd", " ", rs2, ",", " ", offset, "(", rs1, ")"])
+    tokens = [RiscvSToken]
+    patterns = {
+        "opcode": 0b0100011,
+        "funct3": 0b011,
+        "rs1": rs1,
+        "rs2": rs2,
+        "imm": offset,
+    }
+
+
+def sext_w(dst, src):
+    """ Sign extend the lower 32 bits of src into dst """
+    return Addiw(dst, src, 0)
+
+
+def load_constant(context, d, value):
+    """Load a constant into register d.
+
+    Values which fit into 32 bits take at most a lui and an addiw. Larger
+    values are built by loading the upper part, and shifting in the
+    lower twelve bits at a time.
+    """
+    value = sign_extend(value & 0xFFFFFFFFFFFFFFFF, 64)
+    low = sign_extend(value & 0xFFF, 12)
+    if value in range(-2048, 2048):
+        context.emit(Addi(d, R0, value))
+    elif value in range(-(1 << 31), 1 << 31):
+        context.emit(Lui(d, ((value - low) >> 12) & 0xFFFFF))
+        if low:
+            context.emit(Addiw(d, d, low))
+    else:
+        high = (value - low) >> 12
+        shift = 12
+        while not high & 1:
+            high >>= 1
+            shift += 1
+        load_constant(context, d, high)
+        context.emit(Slli64(d, d, shift))
+        if low:
+            context.emit(Addi(d, d, low))
+
+
+def is_small(value):
+    return value in range(-2048, 2048)
+
+
+# Instruction selection patterns for the 64 bit types:
+@rv64isa.pattern("reg", "REGI64", size=0)
+@rv64isa.pattern("reg", "REGU64", size=0)
+def pattern_reg(context, tree):
+    return tree.value
+
+
+@rv64isa.pattern("stm", "MOVI64(reg)", size=2)
+@rv64isa.pattern("stm", "MOVU64(reg)", size=2)
+def pattern_mov64(context, tree, c0):
+    context.move(tree.value, c0)
+    return tree.value
+
+
+@rv64isa.pattern("reg", "CONSTI64", size=6)
+@rv64isa.pattern("reg", "CONSTU64", size=6)
+@rv64isa.pattern(
+    "reg", "CONSTI64", size=2, condition=lambda t: is_small(t.value)
+)
+@rv64isa.pattern(
+    "reg", "CONSTU64", size=2, condition=lambda t: is_small(t.value)
+)
+def pattern_const64(context, tree):
+    d = context.new_reg(Riscv64Register)
+    load_constant(context, d, tree.value)
+    return d
+
+
+@rv64isa.pattern(
+    "reg",
+    "FPRELU64",
+    size=4,
+    condition=lambda t: is_small(t.value.offset),
+)
+def pattern_fprel64(context, tree):
+    d = context.new_reg(Riscv64Register)
+    code = Addi(d, context.arch.fp, tree.value.offset)
+    code.fprel = True
+    context.emit(code)
+    return d
+
+
+@rv64isa.pattern(
+    "mem",
+    "FPRELU64",
+    size=0,
+    condition=lambda t: is_small(t.value.offset),
+)
+def pattern_mem_fprel64(context, tree):
+    return context.arch.fp, tree.value.offset
+
+
+@rv64isa.pattern("reg", "LDRI64(mem)", size=2)
+@rv64isa.pattern("reg", "LDRU64(mem)", size=2)
+def pattern_ldr64_fprel(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    base_reg, offset = c0
+    code = Ld(d, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+    return d
+
+
+@rv64isa.pattern("reg", "LDRI64(reg)", size=2)
+@rv64isa.pattern("reg", "LDRU64(reg)", size=2)
+def pattern_ldr64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    context.emit(Ld(d, 0, c0))
+    return d
+
+
+@rv64isa.pattern("stm", "STRI64(mem, reg)", size=2)
+@rv64isa.pattern("stm", "STRU64(mem, reg)", size=2)
+def pattern_str64_fprel(context, tree, c0, c1):
+    base_reg, offset = c0
+    code = Sd(c1, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+
+
+@rv64isa.pattern("stm", "STRI64(reg, reg)", size=2)
+@rv64isa.pattern("stm", "STRU64(reg, reg)", size=2)
+def pattern_str64(context, tree, c0, c1):
+    context.emit(Sd(c1, 0, c0))
+
+
+rv64isa.pattern("stm", "CJMPI64(reg, reg)", size=4)(pattern_cjmpi)
+rv64isa.pattern("stm", "CJMPU64(reg, reg)", size=4)(pattern_cjmpu)
+rv64isa.pattern("stm", "JMPTABLEI64(reg)", size=24)(pattern_jmptable)
+rv64isa.pattern("stm", "JMPTABLEU64(reg)", size=24)(pattern_jmptable)
+
+
+pattern_select64 = make_select_pattern(
+    emit_select, no_constants, reg_class=Riscv64Register
+)
+rv64isa.pattern("reg", "SELECTI64(reg, reg, reg, reg)", size=20)(
+    pattern_select64
+)
+rv64isa.pattern("reg", "SELECTU64(reg, reg, reg, reg)", size=20)(
+    pattern_select64
+)
+
+
+def make_binop(ins, *trees, size=2):
+    """ Create a pattern for each tree which emits a single instruction """
+
+    def pattern(context, tree, c0, c1):
+        d = context.new_reg(Riscv64Register)
+        context.emit(ins(d, c0, c1))
+        return d
+
+    for tree in trees:
+        rv64isa.pattern("reg", tree, size=size)(pattern)
+
+
+make_binop(Addr, "ADDI64(reg, reg)", "ADDU64(reg, reg)")
+make_binop(Subr, "SUBI64(reg, reg)", "SUBU64(reg, reg)")
+make_binop(Andr, "ANDI64(reg, reg)", "ANDU64(reg, reg)")
+make_binop(Orr, "ORI64(reg, reg)", "ORU64(reg, reg)")
+make_binop(Xorr, "XORI64(reg, reg)", "XORU64(reg, reg)")
+make_binop(Sll, "SHLI64(reg, reg)", "SHLU64(reg, reg)")
+make_binop(Srl, "SHRU64(reg, reg)")
+make_binop(Sra, "SHRI64(reg, reg)")
+make_binop(Mul, "MULI64(reg, reg)", "MULU64(reg, reg)", size=10)
+make_binop(Div, "DIVI64(reg, reg)", size=10)
+make_binop(Divu, "DIVU64(reg, reg)", size=10)
+make_binop(Rem, "REMI64(reg, reg)", size=10)
+make_binop(Remu, "REMU64(reg, reg)", size=10)
+
+
+def make_immop(ins, *trees, condition=lambda t: is_small(t[1].value)):
+    """ Create patterns for operations with a constant right operand """
+
+    def pattern(context, tree, c0):
+        d = context.new_reg(Riscv64Register)
+        context.emit(ins(d, c0, tree[1].value))
+        return d
+
+    for tree in trees:
+        rv64isa.pattern("reg", tree, size=2, condition=condition)(pattern)
+
+
+make_immop(Addi, "ADDI64(reg, CONSTI64)", "ADDU64(reg, CONSTU64)")
+make_immop(Andi, "ANDI64(reg, CONSTI64)", "ANDU64(reg, CONSTU64)")
+make_immop(Ori, "ORI64(reg, CONSTI64)", "ORU64(reg, CONSTU64)")
+make_immop(Xori, "XORI64(reg, CONSTI64)", "XORU64(reg, CONSTU64)")
+make_immop(
+    Slli64,
+    "SHLI64(reg, CONSTI64)",
+    "SHLU64(reg, CONSTU64)",
+    condition=lambda t: t[1].value in range(64),
+)
+make_immop(
+    Srli64,
+    "SHRU64(reg, CONSTU64)",
+    condition=lambda t: t[1].value in range(64),
+)
+make_immop(
+    Srai64,
+    "SHRI64(reg, CONSTI64)",
+    condition=lambda t: t[1].value in range(64),
+)
+
+
+rv64_ops = IntegerOps(
+    64,
+    Riscv64Register,
+    load_constant,
+    Slli64,
+    Srli64,
+    Srai64,
+    Addr,
+    Subr,
+    Mul,
+    Mulh,
+    Mulhu,
+)
+
+
+@rv64isa.pattern(
+    "reg",
+    "DIVI64(reg, CONSTI64)",
+    size=6,
+    condition=lambda t: sign_extend(t[1].value, 64) != 0,
+)
+def pattern_div64_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 64)
+    return emit_division_by_constant(context, c0, divisor, True, rv64_ops)
+
+
+@rv64isa.pattern(
+    "reg",
+    "DIVU64(reg, CONSTU64)",
+    size=6,
+    condition=lambda t: t[1].value & 0xFFFFFFFFFFFFFFFF != 0,
+)
+def pattern_divu64_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFFFFFFFFFF
+    return emit_division_by_constant(context, c0, divisor, False, rv64_ops)
+
+
+@rv64isa.pattern(
+    "reg",
+    "REMI64(reg, CONSTI64)",
+    size=8,
+    condition=lambda t: sign_extend(t[1].value, 64) != 0,
+)
+def pattern_rem64_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 64)
+    return emit_remainder_by_constant(context, c0, divisor, True, rv64_ops)
+
+
+@rv64isa.pattern(
+    "reg",
+    "REMU64(reg, CONSTU64)",
+    size=8,
+    condition=lambda t: t[1].value & 0xFFFFFFFFFFFFFFFF != 0,
+)
+def pattern_remu64_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFFFFFFFFFF
+    return emit_remainder_by_constant(context, c0, divisor, False, rv64_ops)
+
+
+@rv64isa.pattern("reg", "NEGI64(reg)", size=2)
+@rv64isa.pattern("reg", "NEGU64(reg)", size=2)
+def pattern_neg64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    context.emit(Subr(d, R0, c0))
+    return d
+
+
+@rv64isa.pattern("reg", "INVI64(reg)", size=2)
+@rv64isa.pattern("reg", "INVU64(reg)", size=2)
+def pattern_inv64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    context.emit(Xori(d, c0, -1))
+    return d
+
+
+# Conversions between the 64 bit types and the other types:
+@rv64isa.pattern("reg", "I64TOU64(reg)", size=0)
+@rv64isa.pattern("reg", "U64TOI64(reg)", size=0)
+@rv64isa.pattern("reg", "I64TOI8(reg)", size=0)
+@rv64isa.pattern("reg", "I64TOU8(reg)", size=0)
+@rv64isa.pattern("reg", "I64TOI16(reg)", size=0)
+@rv64isa.pattern("reg", "I64TOU16(reg)", size=0)
+@rv64isa.pattern("reg", "U64TOI8(reg)", size=0)
+@rv64isa.pattern("reg", "U64TOU8(reg)", size=0)
+@rv64isa.pattern("reg", "U64TOI16(reg)", size=0)
+@rv64isa.pattern("reg", "U64TOU16(reg)", size=0)
+@rv64isa.pattern("reg", "I32TOI64(reg)", size=0)
+@rv64isa.pattern("reg", "I32TOU64(reg)", size=0)
+def pattern_i64_nop(context, tree, c0):
+    return c0
+
+
+@rv64isa.pattern("reg", "I64TOI32(reg)", size=2)
+@rv64isa.pattern("reg", "I64TOU32(reg)", size=2)
+@rv64isa.pattern("reg", "U64TOI32(reg)", size=2)
+@rv64isa.pattern("reg", "U64TOU32(reg)", size=2)
+def pattern_64_to_32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(sext_w(d, c0))
+    return d
+
+
+def emit_extend(context, d, c0, bits, signed):
+    """ Sign or zero extend the lower bits of c0 into d """
+    if bits == 8 and not signed:
+        context.emit(Andi(d, c0, 0xFF))
+    else:
+        context.emit(Slli64(d, c0, 64 - bits))
+        shift = Srai64 if signed else Srli64
+        context.emit(shift(d, d, 64 - bits))
+    return d
+
+
+@rv64isa.pattern("reg", "U32TOI64(reg)", size=4)
+@rv64isa.pattern("reg", "U32TOU64(reg)", size=4)
+def pattern_u32_to_64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    return emit_extend(context, d, c0, 32, False)
+
+
+@rv64isa.pattern("reg", "I8TOI64(reg)", size=4)
+@rv64isa.pattern("reg", "I8TOU64(reg)", size=4)
+def pattern_i8_to_64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    return emit_extend(context, d, c0, 8, True)
+
+
+@rv64isa.pattern("reg", "I16TOI64(reg)", size=4)
+@rv64isa.pattern("reg", "I16TOU64(reg)", size=4)
+def pattern_i16_to_64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    return emit_extend(context, d, c0, 16, True)
+
+
+@rv64isa.pattern("reg", "U8TOI64(reg)", size=2)
+@rv64isa.pattern("reg", "U8TOU64(reg)", size=2)
+def pattern_u8_to_64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    return emit_extend(context, d, c0, 8, False)
+
+
+@rv64isa.pattern("reg", "U16TOI64(reg)", size=4)
+@rv64isa.pattern("reg", "U16TOU64(reg)", size=4)
+def pattern_u16_to_64(context, tree, c0):
+    d = context.new_reg(Riscv64Register)
+    return emit_extend(context, d, c0, 16, False)
+
+
+# Patterns replacing the patterns of the 32 bits variant which do not
+# sign extend their 32 bit result, or which rely on 32 bit registers:
+@rv64isa.pattern("reg", "I8TOI16(reg)", size=3)
+@rv64isa.pattern("reg", "I8TOI32(reg)", size=3)
+def pattern_i8_to_i32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    return emit_extend(context, d, c0, 8, True)
+
+
+@rv64isa.pattern("reg", "I16TOI32(reg)", size=3)
+def pattern_i16_to_i32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    return emit_extend(context, d, c0, 16, True)
+
+
+@rv64isa.pattern("reg", "I8TOU16(reg)", size=2)
+@rv64isa.pattern("reg", "U8TOU16(reg)", size=2)
+@rv64isa.pattern("reg", "U8TOI16(reg)", size=2)
+@rv64isa.pattern("reg", "I8TOU32(reg)", size=2)
+@rv64isa.pattern("reg", "U8TOU32(reg)", size=2)
+@rv64isa.pattern("reg", "U8TOI32(reg)", size=2)
+def pattern_8_to_32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    return emit_extend(context, d, c0, 8, False)
+
+
+@rv64isa.pattern("reg", "I16TOU32(reg)", size=3)
+@rv64isa.pattern("reg", "U16TOU32(reg)", size=3)
+@rv64isa.pattern("reg", "U16TOI32(reg)", size=3)
+def pattern_16_to_32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    return emit_extend(context, d, c0, 16, False)
+
+
+@rv64isa.pattern("reg", "CONSTI32", size=3)
+@rv64isa.pattern("reg", "CONSTU32", size=3)
+@rv64isa.pattern("reg", "CONSTI16", size=3)
+@rv64isa.pattern("reg", "CONSTU16", size=3)
+def pattern_const32(context, tree):
+    d = context.new_reg(RiscvRegister)
+    load_constant(context, d, sign_extend(tree.value & 0xFFFFFFFF, 32))
+    return d
+
+
+def make_binopw(ins, *trees, size=1):
+    """ Create a pattern for each tree which emits a word instruction """
+
+    def pattern(context, tree, c0, c1):
+        d = context.new_reg(RiscvRegister)
+        context.emit(ins(d, c0, c1))
+        return d
+
+    for tree in trees:
+        rv64isa.pattern("reg", tree, size=size)(pattern)
+
+
+make_binopw(Addw, "ADDI32(reg, reg)", "ADDU32(reg, reg)")
+make_binopw(Subw, "SUBI32(reg, reg)", "SUBU32(reg, reg)")
+make_binopw(Sllw, "SHLI32(reg, reg)", "SHLU32(reg, reg)")
+make_binopw(Srlw, "SHRU32(reg, reg)")
+make_binopw(Sraw, "SHRI32(reg, reg)")
+make_binopw(Mulw, "MULI32(reg, reg)", "MULU32(reg, reg)", size=9)
+make_binopw(Divw, "DIVI32(reg, reg)", size=9)
+make_binopw(Divuw, "DIVU32(reg, reg)", "DIVU16(reg, reg)", size=9)
+make_binopw(Remw, "REMI32(reg, reg)", size=9)
+make_binopw(Remuw, "REMU32(reg, reg)", "REMU16(reg, reg)", size=9)
+
+
+def make_immopw(ins, *trees, condition=lambda t: t[1].value in range(32)):
+    """ Create patterns for word operations with a constant operand """
+
+    def pattern(context, tree, c0):
+        d = context.new_reg(RiscvRegister)
+        context.emit(ins(d, c0, tree[1].value))
+        return d
+
+    for tree in trees:
+        rv64isa.pattern("reg", tree, size=1, condition=condition)(pattern)
+
+
+make_immopw(
+    Addiw,
+    "ADDI32(reg, CONSTI32)",
+    "ADDU32(reg, CONSTU32)",
+    condition=lambda t: is_small(t[1].value),
+)
+make_immopw(Slliw, "SHLI32(reg, CONSTI32)", "SHLU32(reg, CONSTU32)")
+make_immopw(Srliw, "SHRU32(reg, CONSTU32)")
+make_immopw(Sraiw, "SHRI32(reg, CONSTI32)")
+
+
+word_ops = IntegerOps(
+    32,
+    RiscvRegister,
+    load_constant,
+    Slliw,
+    Srliw,
+    Sraiw,
+    Addw,
+    Subw,
+    Mulw,
+    None,
+    None,
+)
+
+
+def emit_word_division_by_constant(context, n, divisor, signed):
+    """Divide a 32 bit value by a constant.
+
+    Instead of taking the upper half of a 32 bit product, the full
+    product of the 32 bit value and the magic number fits into the 64 bit
+    registers.
+    """
+    magnitude = abs(divisor)
+    if is_power_of_two(magnitude):
+        return emit_division_by_constant(context, n, divisor, signed, word_ops)
+
+    m = context.new_reg(Riscv64Register)
+    if signed:
+        multiplier, shift = signed_division_magic(magnitude, 32)
+        load_constant(context, m, multiplier)
+        p = emit_binop(context, rv64_ops, Mul, n, m)
+        p = emit_binop(context, word_ops, Srai64, p, 32 + shift)
+        sign = emit_binop(context, word_ops, Srli64, n, 63)
+        q = emit_binop(context, word_ops, Addw, p, sign)
+        if divisor < 0:
+            q = emit_binop(context, word_ops, Subw, R0, q)
+    else:
+        multiplier, shift = unsigned_division_magic(magnitude, 32)
+        load_constant(context, m, multiplier)
+        # Shifting into the upper half drops the sign extended bits:
+        high = emit_binop(context, rv64_ops, Slli64, n, 32)
+        q = emit_binop(context, rv64_ops, Mulhu, high, m)
+        if shift:
+            q = emit_binop(context, word_ops, Srli64, q, shift)
+    return q
+
+
+def emit_word_remainder_by_constant(context, n, divisor, signed):
+    magnitude = abs(divisor)
+    if is_power_of_two(magnitude):
+        return emit_remainder_by_constant(
+            context, n, divisor, signed, word_ops
+        )
+    q = emit_word_division_by_constant(context, n, magnitude, signed)
+    m = context.new_reg(RiscvRegister)
+    load_constant(context, m, magnitude)
+    t = emit_binop(context, word_ops, Mulw, q, m)
+    return emit_binop(context, word_ops, Subw, n, t)
+
+
+@rv64isa.pattern(
+    "reg",
+    "DIVI32(reg, CONSTI32)",
+    size=5,
+    condition=lambda t: sign_extend(t[1].value, 32) != 0,
+)
+def pattern_divw_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_word_division_by_constant(context, c0, divisor, True)
+
+
+@rv64isa.pattern(
+    "reg",
+    "DIVU16(reg, CONSTU16)",
+    size=5,
+    condition=lambda t: t[1].value & 0xFFFF != 0,
+)
+@rv64isa.pattern(
+    "reg",
+    "DIVU32(reg, CONSTU32)",
+    size=5,
+    condition=lambda t: t[1].value & 0xFFFFFFFF != 0,
+)
+def pattern_divuw_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_word_division_by_constant(context, c0, divisor, False)
+
+
+@rv64isa.pattern(
+    "reg",
+    "REMI32(reg, CONSTI32)",
+    size=7,
+    condition=lambda t: sign_extend(t[1].value, 32) != 0,
+)
+def pattern_remw_const(context, tree, c0):
+    divisor = sign_extend(tree[1].value, 32)
+    return emit_word_remainder_by_constant(context, c0, divisor, True)
+
+
+@rv64isa.pattern(
+    "reg",
+    "REMU16(reg, CONSTU16)",
+    size=7,
+    condition=lambda t: t[1].value & 0xFFFF != 0,
+)
+@rv64isa.pattern(
+    "reg",
+    "REMU32(reg, CONSTU32)",
+    size=7,
+    condition=lambda t: t[1].value & 0xFFFFFFFF != 0,
+)
+def pattern_remuw_const(context, tree, c0):
+    divisor = tree[1].value & 0xFFFFFFFF
+    return emit_word_remainder_by_constant(context, c0, divisor, False)
+
+
+@rv64isa.pattern(
+    "reg",
+    "ANDI32(reg, CONSTI32)",
+    size=3,
+    condition=lambda t: t[1].value > 2047 and is_power_of_two(t[1].value + 1),
+)
+@rv64isa.pattern(
+    "reg",
+    "ANDU32(reg, CONSTU32)",
+    size=3,
+    condition=lambda t: t[1].value > 2047 and is_power_of_two(t[1].value + 1),
+)
+def pattern_and_low_mask_w(context, tree, c0):
+    count = tree[1].value.bit_length()
+    return emit_low_bits(context, c0, count, word_ops)
+
+
+@rv64isa.pattern(
+    "reg",
+    "ADDI32(CONSTI32, reg)",
+    size=1,
+    condition=lambda t: is_small(t[0].value),
+)
+@rv64isa.pattern(
+    "reg",
+    "ADDU32(CONSTU32, reg)",
+    size=1,
+    condition=lambda t: is_small(t[0].value),
+)
+def pattern_addiw_const_reg(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Addiw(d, c0, tree[0].value))
+    return d
+
+
+@rv64isa.pattern("reg", "NEGI32(reg)", size=1)
+@rv64isa.pattern("reg", "NEGU32(reg)", size=1)
+def pattern_neg32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Subw(d, R0, c0))
+    return d
+
+
+@rv64isa.pattern("reg", "SHRI8(reg, reg)", size=1)
+@rv64isa.pattern("reg", "SHRI16(reg, reg)", size=1)
+def pattern_shr_i8(context, tree, c0, c1):
+    bits = 8 if tree.name == "SHRI8" else 16
+    d = context.new_reg(RiscvRegister)
+    emit_extend(context, d, c0, bits, True)
+    context.emit(Sra(d, d, c1))
+    return d
+
+
+@rv64isa.pattern("reg", "LABEL", size=3)
+def pattern_label(context, tree):
+    d = context.new_reg(Riscv64Register)
+    context.emit(La(d, tree.value))
+    return d
@@ -0,0 +1,321 @@
+"""Definitions of the Riscv bit manipulation extensions.
+
+The Zba extension contains the shift and add instructions, which are
+used for address calculations. The Zbb extension contains the basic bit
+manipulation instructions, such as count leading zeros, rotates and
+sign extensions.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from .registers import RiscvRegister
+from .tokens import RiscvToken, RiscvIToken
+
+zbaisa = Isa()
+zbbisa = Isa()
+
+
+class ZbaInstruction(Instruction):
+    tokens = [RiscvToken]
+    isa = zbaisa
+
+
+class ZbbInstruction(Instruction):
+    tokens = [RiscvToken]
+    isa = zbbisa
+
+
+def make_regregreg(mnemonic, base, funct7, funct3):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rn = Operand("rn", RiscvRegister, read=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    syntax = Syntax([mnemonic, " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": funct7,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    name = mnemonic.title() + "RegRegReg"
+    return type(name, (base,), members)
+
+
+Sh1add = make_regregreg("sh1add", ZbaInstruction, 0b0010000, 0b010)
+Sh2add = make_regregreg("sh2add", ZbaInstruction, 0b0010000, 0b100)
+Sh3add = make_regregreg("sh3add", ZbaInstruction, 0b0010000, 0b110)
+
+Andn = make_regregreg("andn", ZbbInstruction, 0b0100000, 0b111)
+Orn = make_regregreg("orn", ZbbInstruction, 0b0100000, 0b110)
+Xnor = make_regregreg("xnor", ZbbInstruction, 0b0100000, 0b100)
+Min = make_regregreg("min", ZbbInstruction, 0b0000101, 0b100)
+Minu = make_regregreg("minu", ZbbInstruction, 0b0000101, 0b101)
+Max = make_regregreg("max", ZbbInstruction, 0b0000101, 0b110)
+Maxu = make_regregreg("maxu", ZbbInstruction, 0b0000101, 0b111)
+Rol = make_regregreg("rol", ZbbInstruction, 0b0110000, 0b001)
+Ror = make_regregreg("ror", ZbbInstruction, 0b0110000, 0b101)
+
+
+def make_unary(mnemonic, funct3, code):
+    """Factory function for the single register operand instructions.
+
+    These instructions are encoded as an immediate instruction with
+    a fixed immediate value.
+    """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    parts = mnemonic.split(".")
+    if len(parts) == 2:
+        syntax = Syntax([parts[0], ".", parts[1], " ", rd, ",", " ", rs1])
+    else:
+        syntax = Syntax([mnemonic, " ", rd, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rs1,
+        "imm": code,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvIToken],
+        "rd": rd,
+        "rs1": rs1,
+        "patterns": patterns,
+    }
+    name = "".join(part.title() for part in parts)
+    return type(name, (ZbbInstruction,), members)
+
+
+Clz = make_unary("clz", 0b001, 0x600)
+Ctz = make_unary("ctz", 0b001, 0x601)
+Cpop = make_unary("cpop", 0b001, 0x602)
+SextB = make_unary("sext.b", 0b001, 0x604)
+SextH = make_unary("sext.h", 0b001, 0x605)
+OrcB = make_unary("orc.b", 0b101, 0x287)
+Rev8 = make_unary("rev8", 0b101, 0x698)
+
+
+class ZextH(ZbbInstruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["zext", ".", "h", " ", rd, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": 0b100,
+        "rs1": rs1,
+        "rs2": 0,
+        "funct7": 0b0000100,
+    }
+
+
+class Rori(ZbbInstruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    imm = Operand("imm", int)
+    syntax = Syntax(["rori", " ", rd, ",", " ", rs1, ",", " ", imm])
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": 0b101,
+        "rs1": rs1,
+        "rs2": imm,
+        "funct7": 0b0110000,
+    }
+
+
+# Instruction selection patterns:
+@zbbisa.pattern("reg", "I8TOI16(reg)", size=2)
+@zbbisa.pattern("reg", "I8TOI32(reg)", size=2)
+def pattern_sext_b(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(SextB(d, c0))
+    return d
+
+
+@zbbisa.pattern("reg", "I16TOI32(reg)", size=2)
+def pattern_sext_h(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(SextH(d, c0))
+    return d
+
+
+@zbbisa.pattern("reg", "I16TOU32(reg)", size=2)
+@zbbisa.pattern("reg", "U16TOU32(reg)", size=2)
+@zbbisa.pattern("reg", "U16TOI32(reg)", size=2)
+def pattern_zext_h(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(ZextH(d, c0))
+    return d
+
+
+@zbbisa.pattern("reg", "ANDI32(reg, INVI32(reg))", size=2)
+@zbbisa.pattern("reg", "ANDU32(reg, INVU32(reg))", size=2)
+def pattern_andn(context, tree, c0, c1):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Andn(d, c0, c1))
+    return d
+
+
+@zbbisa.pattern("reg", "ANDI32(INVI32(reg), reg)", size=2)
+@zbbisa.pattern("reg", "ANDU32(INVU32(reg), reg)", size=2)
+def pattern_andn_swapped(context, tree, c0, c1):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Andn(d, c1, c0))
+    return d
+
+
+@zbbisa.pattern("reg", "ORI32(reg, INVI32(reg))", size=2)
+@zbbisa.pattern("reg", "ORU32(reg, INVU32(reg))", size=2)
+def pattern_orn(context, tree, c0, c1):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Orn(d, c0, c1))
+    return d
+
+
+@zbbisa.pattern("reg", "ORI32(INVI32(reg), reg)", size=2)
+@zbbisa.pattern("reg", "ORU32(INVU32(reg), reg)", size=2)
+def pattern_orn_swapped(context, tree, c0, c1):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Orn(d, c1, c0))
+    return d
+
+
+@zbbisa.pattern("reg", "INVI32(XORI32(reg, reg))", size=2)
+@zbbisa.pattern("reg", "INVU32(XORU32(reg, reg))", size=2)
+def pattern_xnor(context, tree, c0, c1):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Xnor(d, c0, c1))
+    return d
+
+
+def is_rotate(tree):
+    """ Test if the tree rotates a register by a constant amount """
+    shl, shr = tree.children
+    if shl.name.startswith("SHR"):
+        shl, shr = shr, shl
+    value = shl[0].value
+    amount = shl[1].value
+    return (
+        value == shr[0].value
+        and 0 < amount < 32
+        and amount + shr[1].value == 32
+    )
+
+
+@zbbisa.pattern(
+    "reg",
+    "ORU32(SHLU32(REGU32, CONSTU32), SHRU32(REGU32, CONSTU32))",
+    size=2,
+    condition=is_rotate,
+)
+@zbbisa.pattern(
+    "reg",
+    "ORU32(SHRU32(REGU32, CONSTU32), SHLU32(REGU32, CONSTU32))",
+    size=2,
+    condition=is_rotate,
+)
+def pattern_rotate(context, tree):
+    shr = tree[0] if tree[0].name.startswith("SHR") else tree[1]
+    d = context.new_reg(RiscvRegister)
+    context.emit(Rori(d, shr[0].value, shr[1].value))
+    return d
+
+
+def shift_amount(tree):
+    """Get the amount by which a shift add instruction must shift.
+
+    Both a left shift by 1, 2 or 3 and a multiply by 2, 4 or 8 can be
+    done by a shift add instruction. Other amounts result in 0.
+    """
+    value = tree[1].value
+    if tree.name.startswith("MUL"):
+        value = {2: 1, 4: 2, 8: 3}.get(value, 0)
+    return value if value in (1, 2, 3) else 0
+
+
+def emit_shift_add(context, shift, c0, c1):
+    """ Emit a shift add of c0 shifted by the constant in shift and c1 """
+    d = context.new_reg(RiscvRegister)
+    ins = {1: Sh1add, 2: Sh2add, 3: Sh3add}[shift_amount(shift)]
+    context.emit(ins(d, c0, c1))
+    return d
+
+
+@zbaisa.pattern(
+    "reg",
+    "ADDI32(reg, SHLI32(reg, CONSTI32))",
+    size=2,
+    condition=lambda t: shift_amount(t[1]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDU32(reg, SHLU32(reg, CONSTU32))",
+    size=2,
+    condition=lambda t: shift_amount(t[1]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDI32(reg, MULI32(reg, CONSTI32))",
+    size=2,
+    condition=lambda t: shift_amount(t[1]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDU32(reg, MULU32(reg, CONSTU32))",
+    size=2,
+    condition=lambda t: shift_amount(t[1]),
+)
+def pattern_shift_add(context, tree, c0, c1):
+    return emit_shift_add(context, tree[1], c1, c0)
+
+
+@zbaisa.pattern(
+    "reg",
+    "ADDI32(SHLI32(reg, CONSTI32), reg)",
+    size=2,
+    condition=lambda t: shift_amount(t[0]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDU32(SHLU32(reg, CONSTU32), reg)",
+    size=2,
+    condition=lambda t: shift_amount(t[0]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDI32(MULI32(reg, CONSTI32), reg)",
+    size=2,
+    condition=lambda t: shift_amount(t[0]),
+)
+@zbaisa.pattern(
+    "reg",
+    "ADDU32(MULU32(reg, CONSTU32), reg)",
+    size=2,
+    condition=lambda t: shift_amount(t[0]),
+)
+def pattern_shift_add_swapped(context, tree, c0, c1):
+    return emit_shift_add(context, tree[0], c0, c1)
+
+
+# Runtime functions which are a single zbb instruction. The wasm
+# frontend calls these functions for the bit counting, rotate and
+# sign extension opcodes.
+zbb_intrinsics = {
+    "wasm_rt_i32_clz": Clz,
+    "wasm_rt_i32_ctz": Ctz,
+    "wasm_rt_i32_popcnt": Cpop,
+    "wasm_rt_i32_rotl": Rol,
+    "wasm_rt_i32_rotr": Ror,
+    "wasm_rt_i32_extend8_s": SextB,
+    "wasm_rt_i32_extend16_s": SextH,
+}
@@ -2,14 +2,18 @@
 
 from ..isa import Isa
 from ..encoding import Instruction, Syntax, Operand
-from .registers import RiscvRegister
+from .registers import RiscvRegister, SP
 from .tokens import RiscvToken, RiscvcToken
 from .rvc_relocations import BcImm11Relocation, BcImm8Relocation
 from .rvc_relocations import CBImm11Relocation, CBlImm11Relocation
+from .rvc_relocations import CCallRelocation
 from ..generic_instructions import ArtificialInstruction
+from ..generic_instructions import PseudoInstruction, VirtualInstruction
+from ...utils.bitfun import sign_extend
 from .instructions import Andr, Orr, Xorr, Subr, Addi, Slli, Srli
+from .instructions import Addr, Andi, Srai, Movr, Lui
 from .instructions import Lw, Sw, Blt, Bgt, Bge, Beq, Bne, Ble, Blr
-from .instructions import Bgtu, Bltu, Bgeu, Bleu
+from .instructions import Bgtu, Bltu, Bgeu, Bleu, Call
 import logging
 
 
@@ -25,6 +29,7 @@ rvcisa.register_relocation(BcImm11Relocation)
 rvcisa.register_relocation(BcImm8Relocation)
 rvcisa.register_relocation(CBImm11Relocation)
 rvcisa.register_relocation(CBlImm11Relocation)
+rvcisa.register_relocation(CCallRelocation)
 
 
 class RiscvcInstruction(Instruction):
@@ -79,7 +84,7 @@ class CSlli(RiscvcInstruction):
     def encode(self):
         tokens = self.get_tokens()
         tokens[0][0:2] = 0b10
-        tokens[0][2:7] = self.imm & 0xF
+        tokens[0][2:7] = self.imm & 0x1F
         tokens[0][7:12] = self.rd.num
         tokens[0][13:16] = 0b0000
         return tokens[0].encode()
@@ -89,10 +94,10 @@ class CiBase(RiscvcInstruction):
     def encode(self):
         tokens = self.get_tokens()
         tokens[0][0:2] = 0b01
-        tokens[0][2:7] = self.imm
         tokens[0][7:10] = self.rd.num - 8
         tokens[0][10:12] = self.func
-        tokens[0][12:16] = 0b1000
+        tokens[0][13:16] = 0b100
+        tokens[0].imm = self.imm
         return tokens[0].encode()
 
 
@@ -118,9 +123,9 @@ class CAddi(RiscvcInstruction):
     def encode(self):
         tokens = self.get_tokens()
         tokens[0][0:2] = 0b01
-        tokens[0][2:7] = self.imm
         tokens[0][7:12] = self.rd.num
-        tokens[0][12:16] = 0b0000
+        tokens[0][13:16] = 0b000
+        tokens[0].imm = self.imm
         return tokens[0].encode()
 
 
@@ -157,6 +162,20 @@ class CMovr(RiscvcInstruction):
         return tokens[0].encode()
 
 
+class CAdd(RiscvcInstruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    syntax = Syntax(["c", ".", "add", " ", rd, ",", " ", rm])
+
+    def encode(self):
+        tokens = self.get_tokens()
+        tokens[0][0:2] = 0b10
+        tokens[0][2:7] = self.rm.num
+        tokens[0][7:12] = self.rd.num
+        tokens[0][12:16] = 0b1001
+        return tokens[0].encode()
+
+
 class CBl(RiscvInstruction):
     """ jal instruction (32-bits) """
 
@@ -174,6 +193,15 @@ class CBl(RiscvInstruction):
         return [CBlImm11Relocation(self.target)]
 
 
+class CCall(Call):
+    """ Call which can be relaxed up to a c.jal instruction """
+
+    isa = rvcisa
+
+    def relocations(self):
+        return [CCallRelocation(self.target)]
+
+
 class CJal(RiscvcInstruction):
     """ c.jal instruction. """
 
@@ -552,16 +580,8 @@ class Lwv(PseudoRiscvInstruction):
     fprel = False
 
     def render(self):
-        if (
-            self.rd.num in range(8, 16)
-            and self.rs1.num in range(8, 16)
-            and self.offset in range(0, 128)
-        ):
-            yield CLw(self.rd, self.offset, self.rs1)
-        elif self.rs1.num == 2 and self.offset >= 0 and self.offset < 256:
-            yield CLwsp(self.rd, self.offset, self.rs1)
-        else:
-            yield Lw(self.rd, self.offset, self.rs1)
+        ins = Lw(self.rd, self.offset, self.rs1)
+        yield compress(ins) or ins
 
 
 class Swv(PseudoRiscvInstruction):
@@ -572,19 +592,8 @@ class Swv(PseudoRiscvInstruction):
     syntax = Syntax(["sw", " ", rs2, ",", " ", offset, "(", rs1, ")"])
 
     def render(self):
-        if (
-            (self.rs2.num <= 15)
-            and (self.rs2.num >= 8)
-            and (self.rs1.num <= 15)
-            and (self.rs1.num >= 8)
-            and (self.offset >= 0)
-            and (self.offset < 128)
-        ):
-            yield CSw(self.rs2, self.offset, self.rs1)
-        elif self.rs1.num == 2 and self.offset >= 0 and self.offset < 256:
-            yield CSwsp(self.rs2, self.offset, self.rs1)
-        else:
-            yield Sw(self.rs2, self.offset, self.rs1)
+        ins = Sw(self.rs2, self.offset, self.rs1)
+        yield compress(ins) or ins
 
 
 class Beqv(PseudoRiscvInstruction):
@@ -708,43 +717,17 @@ def pattern_shli32_1_(context, tree, c0):
 
 @rvcisa.pattern(
     "reg",
-    "SHLI32(CONSTI32, reg)",
-    size=1,
-    condition=lambda t: t.children[0].value < 16,
-)
-def pattern_shli32_2(context, tree, c0):
-    d = context.new_reg(RiscvRegister)
-    c1 = tree.children[0].value
-    context.emit(Slliv(d, c0, c1))
-    return d
-
-
-@rvcisa.pattern(
-    "reg",
-    "SHRI32(reg, CONSTI32)",
+    "SHRU32(reg, CONSTU32)",
     size=1,
     condition=lambda t: t.children[1].value < 16,
 )
-def pattern_shri32(context, tree, c0):
+def pattern_shru32(context, tree, c0):
     d = context.new_reg(RiscvRegister)
     c1 = tree.children[1].value
     context.emit(Srliv(d, c0, c1))
     return d
 
 
-@rvcisa.pattern(
-    "reg",
-    "SHRI32(CONSTI32, reg)",
-    size=1,
-    condition=lambda t: t.children[0].value < 16,
-)
-def pattern_stri32_const(context, tree, c0):
-    d = context.new_reg(RiscvRegister)
-    c1 = tree.children[0].value
-    context.emit(Srliv(d, c0, c1))
-    return d
-
-
 @rvcisa.pattern("reg", "LDRU32(mem)", size=1)
 @rvcisa.pattern("reg", "LDRI32(mem)", size=1)
 def pattern_ldri32(context, tree, c0):
@@ -822,3 +805,194 @@ def pattern_cjmpu(context, tree, c0, c1):
 def pattern_jmp(context, tree):
     tgt = tree.value
     context.emit(CB(tgt.name, jumps=[tgt]))
+
+
+# Compression of register allocated instructions:
+def is_compressible(register):
+    """ Test if a register fits in the register fields of three bits """
+    return register.num in range(8, 16)
+
+
+compressible_registers = tuple(RiscvRegister.from_num(n) for n in range(8, 16))
+
+# The operands which must be one of x8-x15 for the compressed form:
+compressible_operands = {
+    Andr: ("rd", "rn", "rm"),
+    Orr: ("rd", "rn", "rm"),
+    Xorr: ("rd", "rn", "rm"),
+    Subr: ("rd", "rn", "rm"),
+    Andv: ("rd", "rn", "rm"),
+    Orv: ("rd", "rn", "rm"),
+    Xorv: ("rd", "rn", "rm"),
+    Subv: ("rd", "rn", "rm"),
+    Andi: ("rd", "rs1"),
+    Srli: ("rd", "rs1"),
+    Srai: ("rd", "rs1"),
+    Srliv: ("rd", "rs1"),
+    Lw: ("rd", "rs1"),
+    Lwv: ("rd", "rs1"),
+    Sw: ("rs2", "rs1"),
+    Swv: ("rs2", "rs1"),
+}
+
+
+# The compressed forms overwrite their first source operand, so the
+# destination must be the same register as one of these operands:
+tied_operands = {
+    Addi: ("rs1",),
+    Addiv: ("rs1",),
+    Slli: ("rs1",),
+    Slliv: ("rs1",),
+    Srli: ("rs1",),
+    Srliv: ("rs1",),
+    Srai: ("rs1",),
+    Andi: ("rs1",),
+    Addr: ("rn", "rm"),
+    Andr: ("rn", "rm"),
+    Orr: ("rn", "rm"),
+    Xorr: ("rn", "rm"),
+    Subr: ("rn",),
+    Andv: ("rn", "rm"),
+    Orv: ("rn", "rm"),
+    Xorv: ("rn", "rm"),
+    Subv: ("rn",),
+}
+
+
+def get_tied_operands(instruction):
+    """Get the destination of an instruction and the sources which it
+    must equal to compress the instruction.
+    """
+    names = tied_operands.get(type(instruction), ())
+    if not names:
+        return None, ()
+    return instruction.rd, tuple(getattr(instruction, name) for name in names)
+
+
+def get_compressible_operands(instruction):
+    """Get the registers of an instruction which must be one of x8-x15
+    to compress the instruction.
+    """
+    names = compressible_operands.get(type(instruction), ())
+    registers = [getattr(instruction, name) for name in names]
+    if SP in registers:
+        # Stack pointer relative loads and stores take any register:
+        return []
+    return registers
+
+
+def compress(instruction):
+    """Get the compressed form of an instruction.
+
+    When the registers and the immediate fit, the 16 bit instruction is
+    returned, otherwise None.
+    """
+    cls = type(instruction)
+    if cls is Movr:
+        if instruction.rd.num and instruction.rm.num:
+            return CMovr(instruction.rd, instruction.rm)
+    elif cls is Addi:
+        return compress_addi(instruction)
+    elif cls is Addr:
+        rd, rn, rm = instruction.rd, instruction.rn, instruction.rm
+        if rd.num == 0:
+            return None
+        elif rn.num == 0 and rm.num:
+            return CMovr(rd, rm)
+        elif rm.num == 0 and rn.num:
+            return CMovr(rd, rn)
+        elif rd.num == rn.num and rm.num:
+            return CAdd(rd, rm)
+        elif rd.num == rm.num and rn.num:
+            return CAdd(rd, rn)
+    elif cls in (Andr, Orr, Xorr, Subr):
+        rd, rn, rm = instruction.rd, instruction.rn, instruction.rm
+        if not all(map(is_compressible, (rd, rn, rm))):
+            return None
+        cinstructions = {Andr: CAnd, Orr: COr, Xorr: CXor, Subr: CSub}
+        if rd.num == rn.num:
+            return cinstructions[cls](rd, rm)
+        elif rd.num == rm.num and cls is not Subr:
+            return cinstructions[cls](rd, rn)
+    elif cls is Slli:
+        rd, rs1, imm = instruction.rd, instruction.rs1, instruction.imm
+        if rd.num and rd.num == rs1.num and 0 < imm < 32:
+            return CSlli(rd, rd, imm)
+    elif cls in (Srli, Srai, Andi):
+        rd, rs1 = instruction.rd, instruction.rs1
+        if cls is Andi:
+            imm = instruction.offset
+            fits = imm in range(-32, 32)
+        else:
+            imm = instruction.imm
+            fits = 0 < imm < 32
+        if fits and rd.num == rs1.num and is_compressible(rd):
+            cinstructions = {Srli: CSrli, Srai: CSrai, Andi: CAndi}
+            return cinstructions[cls](rd, rd, imm)
+    elif cls is Lui:
+        imm = sign_extend(instruction.imm & 0xFFFFF, 20)
+        if instruction.rd.num not in (0, 2) and imm and imm in range(-32, 32):
+            return CLui(instruction.rd, imm)
+    elif cls in (Lw, Sw):
+        return compress_memory_access(instruction)
+    return None
+
+
+def compress_addi(instruction):
+    rd, rs1, imm = instruction.rd, instruction.rs1, instruction.offset
+    if rd.num == 0:
+        return None
+    elif rd.num == rs1.num == SP.num:
+        if imm and imm % 16 == 0 and imm in range(-512, 512):
+            return CAddi16sp(imm)
+    elif rs1.num == SP.num:
+        if is_compressible(rd) and imm % 4 == 0 and imm in range(4, 1024):
+            return CAddi4spn(rd, imm)
+    elif rs1.num == 0:
+        if imm in range(-32, 32):
+            return CLi(rd, imm)
+    if imm == 0 and rs1.num:
+        return CMovr(rd, rs1)
+    elif rd.num == rs1.num and imm and imm in range(-32, 32):
+        return CAddi(rd, rd, imm)
+    return None
+
+
+def compress_memory_access(instruction):
+    base, offset = instruction.rs1, instruction.offset
+    if isinstance(instruction, Lw):
+        value = instruction.rd
+    else:
+        value = instruction.rs2
+    if offset % 4 != 0:
+        return None
+    if base.num == SP.num and offset in range(0, 256):
+        if isinstance(instruction, Lw):
+            if value.num:
+                return CLwsp(value, offset)
+        else:
+            return CSwsp(value, offset)
+    elif is_compressible(base) and is_compressible(value):
+        if offset in range(0, 128):
+            if isinstance(instruction, Lw):
+                return CLw(value, offset, base)
+            else:
+                return CSw(value, offset, base)
+    return None
+
+
+def expand_instruction(instruction):
+    """ Get the real instructions which an instruction stands for """
+    if isinstance(instruction, ArtificialInstruction):
+        for part in instruction.render():
+            yield from expand_instruction(part)
+    else:
+        yield instruction
+
+
+def instruction_size(instruction):
+    """ Determine the number of bytes of a real instruction """
+    if isinstance(instruction, (VirtualInstruction, PseudoInstruction)):
+        return 0
+    else:
+        return sum(token.Info.size for token in instruction.tokens) // 8
@@ -1,5 +1,6 @@
 from ...utils.bitfun import wrap_negative, BitView
 from ..encoding import Relocation
+from .relocations import CallRelocation
 from .tokens import RiscvToken, RiscvcToken
 import logging
 
@@ -87,6 +88,20 @@ class CBlImm11Relocation(CRel):
         return data, [new_reloc]
 
 
+class CCallRelocation(CallRelocation):
+    """ Relocation for a call, which can be relaxed into a c.jal """
+
+    name = "c_call"
+
+    def jal_relocation(self, rd):
+        if rd == 1:
+            return CBlImm11Relocation(self.symbol_name)
+        elif rd == 0:
+            return CBImm11Relocation(self.symbol_name)
+        else:
+            return super().jal_relocation(rd)
+
+
 class BcImm11Relocation(CRel):
     name = "bc_imm11"
     token = RiscvcToken
@@ -0,0 +1,413 @@
+"""Definitions of the Riscv double precision floating point instructions.
+
+The D extension widens the floating point registers to 64 bits. Single
+precision values remain in the same registers, so the rvd option is used
+on top of the single precision instructions of the rvf option.
+"""
+
+import struct
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from .registers import RiscvDRegister, RiscvFRegister, RiscvRegister, R0
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken, RiscvR4Token
+from .instructions import B, Bne, La
+
+rvdisa = Isa()
+
+
+class RiscvdInstruction(Instruction):
+    tokens = [RiscvToken]
+    isa = rvdisa
+
+
+def make_dregdregdreg(mnemonic, rounding, func):
+    rd = Operand("rd", RiscvFRegister, write=True)
+    rn = Operand("rn", RiscvFRegister, read=True)
+    rm = Operand("rm", RiscvFRegister, read=True)
+    syntax = Syntax([mnemonic, ".", "d", " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b1010011,
+        "rd": rd,
+        "funct3": rounding,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": func,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "D", (RiscvdInstruction,), members)
+
+
+FAddD = make_dregdregdreg("fadd", 0b111, 0b0000001)
+FSubD = make_dregdregdreg("fsub", 0b111, 0b0000101)
+FMulD = make_dregdregdreg("fmul", 0b111, 0b0001001)
+FDivD = make_dregdregdreg("fdiv", 0b111, 0b0001101)
+FSgnjD = make_dregdregdreg("fsgnj", 0b000, 0b0010001)
+FSgnjnD = make_dregdregdreg("fsgnjn", 0b001, 0b0010001)
+FSgnjxD = make_dregdregdreg("fsgnjx", 0b010, 0b0010001)
+FMinD = make_dregdregdreg("fmin", 0b000, 0b0010101)
+FMaxD = make_dregdregdreg("fmax", 0b001, 0b0010101)
+
+
+def movd(dst, src):
+    """ Move the full 64 bits of src into dst register """
+    return FSgnjD(dst, src, src, ismove=True)
+
+
+def make_fused(mnemonic, opcode):
+    """ Factory function for the fused multiply add instructions """
+    rd = Operand("rd", RiscvFRegister, write=True)
+    rn = Operand("rn", RiscvFRegister, read=True)
+    rm = Operand("rm", RiscvFRegister, read=True)
+    ra = Operand("ra", RiscvFRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, ".", "d", " ", rd, ",", " ", rn, ",", " ", rm, ",", " ", ra]
+    )
+    patterns = {
+        "opcode": opcode,
+        "rd": rd,
+        "funct3": 0b111,
+        "rs1": rn,
+        "rs2": rm,
+        "fmt": 0b01,
+        "rs3": ra,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvR4Token],
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "ra": ra,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "D", (RiscvdInstruction,), members)
+
+
+FMaddD = make_fused("fmadd", 0b1000011)
+FMsubD = make_fused("fmsub", 0b1000111)
+FNmsubD = make_fused("fnmsub", 0b1001011)
+FNmaddD = make_fused("fnmadd", 0b1001111)
+
+
+# Rounding modes. Conversions to integers round towards zero, as C
+# requires, the other instructions use the mode in the frm register.
+RTZ = 0b001
+DYN = 0b111
+
+
+def make_unary(name, fmt, func, code, rounding, dst_cls, src_cls):
+    """Factory function for the instructions with a single source.
+
+    These are the square root and the conversion instructions. The
+    format is the part of the mnemonic after the operation, for example
+    "w.d" for a conversion from double to word.
+    """
+    rd = Operand("rd", dst_cls, write=True)
+    rm = Operand("rm", src_cls, read=True)
+    parts = [name]
+    for part in fmt.split("."):
+        parts.extend([".", part])
+    parts.extend([" ", rd, ",", " ", rm])
+    if rounding == RTZ:
+        parts.extend([",", " ", "rtz"])
+    syntax = Syntax(parts)
+    patterns = {
+        "opcode": 0b1010011,
+        "rd": rd,
+        "funct3": rounding,
+        "rs1": rm,
+        "rs2": code,
+        "funct7": func,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rm": rm,
+        "patterns": patterns,
+        "rounding": rounding,
+    }
+    cls_name = name.title() + "".join(p.title() for p in fmt.split("."))
+    return type(cls_name, (RiscvdInstruction,), members)
+
+
+FSqrtD = make_unary(
+    "fsqrt", "d", 0b0101101, 0, DYN, RiscvFRegister, RiscvFRegister
+)
+Fcvtsd = make_unary(
+    "fcvt", "s.d", 0b0100000, 1, DYN, RiscvFRegister, RiscvFRegister
+)
+Fcvtds = make_unary(
+    "fcvt", "d.s", 0b0100001, 0, DYN, RiscvFRegister, RiscvFRegister
+)
+Fcvtwd = make_unary(
+    "fcvt", "w.d", 0b1100001, 0, RTZ, RiscvRegister, RiscvFRegister
+)
+Fcvtwud = make_unary(
+    "fcvt", "wu.d", 0b1100001, 1, RTZ, RiscvRegister, RiscvFRegister
+)
+Fcvtdw = make_unary(
+    "fcvt", "d.w", 0b1101001, 0, DYN, RiscvFRegister, RiscvRegister
+)
+Fcvtdwu = make_unary(
+    "fcvt", "d.wu", 0b1101001, 1, DYN, RiscvFRegister, RiscvRegister
+)
+
+
+class FLd(RiscvdInstruction):
+    rd = Operand("rd", RiscvFRegister, write=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["fld", " ", rd, ",", " ", offset, "(", rs1, ")"])
+    fprel = False
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0000111,
+        "rd": rd,
+        "funct3": 0b011,
+        "rs1": rs1,
+        "imm": offset,
+    }
+
+
+class FSd(RiscvdInstruction):
+    rs2 = Operand("rs2", RiscvFRegister, read=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["fsd", " ", rs2, ",", " ", offset, "(", rs1, ")"])
+    tokens = [RiscvSToken]
+    fprel = False
+    patterns = {
+        "opcode": 0b0100111,
+        "funct3": 0b011,
+        "rs1": rs1,
+        "rs2": rs2,
+        "imm": offset,
+    }
+
+
+def make_fcmp(mnemonic, func3, invert):
+    """Factory function for the compare instructions.
+
+    The inverted variants are the same instruction with swapped operands.
+    """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rn = Operand("rn", RiscvFRegister, read=True)
+    rm = Operand("rm", RiscvFRegister, read=True)
+    syntax = Syntax([mnemonic, ".", "d", " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b1010011,
+        "rd": rd,
+        "funct3": func3,
+        "rs1": rm if invert else rn,
+        "rs2": rn if invert else rm,
+        "funct7": 0b1010001,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "D", (RiscvdInstruction,), members)
+
+
+FeqD = make_fcmp("feq", 0b010, False)
+FleD = make_fcmp("fle", 0b000, False)
+FltD = make_fcmp("flt", 0b001, False)
+FgtD = make_fcmp("fgt", 0b001, True)
+FgeD = make_fcmp("fge", 0b000, True)
+
+
+def is_double_pattern(pattern):
+    """ Test if an instruction selection pattern involves double values """
+    return "F64" in str(pattern.tree)
+
+
+def single_precision_isa(isa):
+    """Get a copy of isa without the double precision patterns.
+
+    The rvf patterns treat doubles as single precision values, which
+    the rvd patterns replace.
+    """
+    isa2 = Isa()
+    isa2.instructions = isa.instructions
+    isa2.relocation_map = isa.relocation_map
+    isa2.patterns = [p for p in isa.patterns if not is_double_pattern(p)]
+    return isa2
+
+
+# Instruction selection patterns:
+@rvdisa.pattern("freg", "REGF64", size=0)
+def pattern_reg(context, tree):
+    return tree.value
+
+
+@rvdisa.pattern("stm", "MOVF64(freg)", size=2)
+def pattern_mov64(context, tree, c0):
+    context.move(tree.value, c0)
+    return tree.value
+
+
+@rvdisa.pattern("freg", "CONSTF64", size=6)
+def pattern_const_f64(context, tree):
+    label = context.frame.add_constant(struct.pack("<d", tree.value))
+    address = context.new_reg(RiscvRegister)
+    context.emit(La(address, label))
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FLd(d, 0, address))
+    return d
+
+
+def make_binop(ins, tree):
+    def pattern(context, tree, c0, c1):
+        d = context.new_reg(RiscvDRegister)
+        context.emit(ins(d, c0, c1))
+        return d
+
+    rvdisa.pattern("freg", tree, size=2)(pattern)
+
+
+make_binop(FAddD, "ADDF64(freg, freg)")
+make_binop(FSubD, "SUBF64(freg, freg)")
+make_binop(FMulD, "MULF64(freg, freg)")
+make_binop(FDivD, "DIVF64(freg, freg)")
+
+
+@rvdisa.pattern("freg", "NEGF64(freg)", size=2)
+def pattern_neg_f64(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FSgnjnD(d, c0, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "ADDF64(MULF64(freg, freg), freg)", size=2)
+def pattern_fmadd(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FMaddD(d, c0, c1, c2))
+    return d
+
+
+@rvdisa.pattern("freg", "ADDF64(freg, MULF64(freg, freg))", size=2)
+def pattern_fmadd_swapped(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FMaddD(d, c1, c2, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "SUBF64(MULF64(freg, freg), freg)", size=2)
+def pattern_fmsub(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FMsubD(d, c0, c1, c2))
+    return d
+
+
+@rvdisa.pattern("freg", "SUBF64(freg, MULF64(freg, freg))", size=2)
+def pattern_fnmsub(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FNmsubD(d, c1, c2, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "F32TOF64(freg)", size=2)
+def pattern_f32_to_f64(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(Fcvtds(d, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "F64TOF32(freg)", size=2)
+def pattern_f64_to_f32(context, tree, c0):
+    d = context.new_reg(RiscvFRegister)
+    context.emit(Fcvtsd(d, c0))
+    return d
+
+
+@rvdisa.pattern("reg", "F64TOI32(freg)", size=2)
+@rvdisa.pattern("reg", "F64TOI16(freg)", size=2)
+@rvdisa.pattern("reg", "F64TOI8(freg)", size=2)
+def pattern_f64_to_i32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Fcvtwd(d, c0))
+    return d
+
+
+@rvdisa.pattern("reg", "F64TOU32(freg)", size=2)
+@rvdisa.pattern("reg", "F64TOU16(freg)", size=2)
+@rvdisa.pattern("reg", "F64TOU8(freg)", size=2)
+def pattern_f64_to_u32(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(Fcvtwud(d, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "I32TOF64(reg)", size=2)
+def pattern_i32_to_f64(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(Fcvtdw(d, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "U32TOF64(reg)", size=2)
+def pattern_u32_to_f64(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(Fcvtdwu(d, c0))
+    return d
+
+
+@rvdisa.pattern("freg", "LDRF64(mem)", size=2)
+def pattern_ldr64_fprel(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    base_reg, offset = c0
+    code = FLd(d, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+    return d
+
+
+@rvdisa.pattern("freg", "LDRF64(reg)", size=2)
+def pattern_ldr64(context, tree, c0):
+    d = context.new_reg(RiscvDRegister)
+    context.emit(FLd(d, 0, c0))
+    return d
+
+
+@rvdisa.pattern("stm", "STRF64(mem, freg)", size=2)
+def pattern_str64_fprel(context, tree, c0, c1):
+    base_reg, offset = c0
+    code = FSd(c1, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+
+
+@rvdisa.pattern("stm", "STRF64(reg, freg)", size=2)
+def pattern_str64(context, tree, c0, c1):
+    context.emit(FSd(c1, 0, c0))
+
+
+@rvdisa.pattern("stm", "CJMPF64(freg, freg)", size=4)
+def pattern_cjmp(context, tree, c0, c1):
+    op, yes_label, no_label = tree.value
+    opnames = {"<": FltD, ">": FgtD, "==": FeqD, ">=": FgeD, "<=": FleD}
+    if op == "!=":
+        # There is no not equal compare, branch on a false equal compare:
+        op = "=="
+        yes_label, no_label = no_label, yes_label
+    jmp_ins = B(no_label.name, jumps=[no_label])
+    d = context.new_reg(RiscvRegister)
+    context.emit(opnames[op](d, c0, c1))
+    context.emit(Bne(d, R0, yes_label.name, jumps=[yes_label, jmp_ins]))
+    context.emit(jmp_ins)
+
+
+# Runtime functions which are a single rvd instruction:
+rvd_intrinsics = {
+    "sqrt": FSqrtD,
+    "wasm_rt_f64_sqrt": FSqrtD,
+}
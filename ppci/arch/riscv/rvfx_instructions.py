@@ -92,11 +92,15 @@ class Fcvtswu(RiscvInstruction):
 class Fcvtws(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True)
     rm = Operand("rm", RiscvRegister, read=True)
-    syntax = Syntax(["fcvt", ".", "w", ".", "s", " ", rd, ",", " ", rm])
+    syntax = Syntax(
+        ["fcvt", ".", "w", ".", "s", " ", rd, ",", " ", rm, ",", " ", "rtz"]
+    )
+    # Round towards zero, as C requires:
+    rounding = 0b001
     patterns = {
         "opcode": 0b1010011,
         "rd": rd,
-        "funct3": 0b111,
+        "funct3": 0b001,
         "rs1": rm,
         "rs2": 0,
         "funct7": 0b1100000,
@@ -106,11 +110,14 @@ class Fcvtws(RiscvInstruction):
 class Fcvtwus(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True)
     rm = Operand("rm", RiscvRegister, read=True)
-    syntax = Syntax(["fcvt", ".", "wu", ".", "s", " ", rd, ",", " ", rm])
+    syntax = Syntax(
+        ["fcvt", ".", "wu", ".", "s", " ", rd, ",", " ", rm, ",", " ", "rtz"]
+    )
+    rounding = 0b001
     patterns = {
         "opcode": 0b1010011,
         "rd": rd,
-        "funct3": 0b111,
+        "funct3": 0b001,
         "rs1": rm,
         "rs2": 0b00001,
         "funct7": 0b1100000,
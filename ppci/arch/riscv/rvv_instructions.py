@@ -0,0 +1,606 @@
+"""Definitions of the Riscv vector extension, version 1.0.
+
+A subset of the vector extension is supported: the configuration
+instructions, unit stride loads and stores, integer arithmetic, moves
+and reductions. Masked execution is not supported, all instructions
+operate on the elements below the vector length.
+
+The element width and register grouping of vsetvli and vsetivli are part
+of the instruction syntax:
+
+    vsetvli x10, x11, e32, m4, ta, ma
+
+There is one instruction class per element width and grouping, and the
+tail and mask policies are always agnostic.
+
+The compiler does not allocate vector registers. Calls to the functions
+in rvv_kernels are expanded into strip mined loops over memory instead,
+which use fixed vector registers.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from .registers import RiscvRegister, RiscvVRegister, R0, V8, V12, V16
+from .tokens import RiscvToken, RiscvIToken, RiscvVToken
+from .instructions import Addr, Subr, Slli, B, Bne
+
+rvvisa = Isa()
+
+# The supported element widths, with their width field of the loads and
+# stores, and the register group sizes:
+element_widths = {8: 0b000, 16: 0b101, 32: 0b110, 64: 0b111}
+group_sizes = (1, 2, 4, 8)
+
+
+class RiscvVInstruction(Instruction):
+    tokens = [RiscvVToken]
+    isa = rvvisa
+
+
+def encode_vtype(sew, lmul):
+    """ Encode a vector type, with agnostic tail and mask policies """
+    vsew = {8: 0, 16: 1, 32: 2, 64: 3}[sew]
+    vlmul = {1: 0, 2: 1, 4: 2, 8: 3}[lmul]
+    return 0b11000000 | (vsew << 3) | vlmul
+
+
+def make_vsetvli(sew, lmul):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(
+        ["vsetvli", " ", rd, ",", " ", rs1, ",", " ", "e{}".format(sew)]
+        + [",", " ", "m{}".format(lmul), ",", " ", "ta", ",", " ", "ma"]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": rd,
+        "funct3": 0b111,
+        "rs1": rs1,
+        "imm": encode_vtype(sew, lmul),
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvIToken],
+        "rd": rd,
+        "rs1": rs1,
+        "patterns": patterns,
+        "sew": sew,
+        "lmul": lmul,
+    }
+    name = "VsetvliE{}M{}".format(sew, lmul)
+    return type(name, (RiscvVInstruction,), members)
+
+
+def make_vsetivli(sew, lmul):
+    """ Factory function for vsetivli, which has a 5 bit constant length """
+    rd = Operand("rd", RiscvRegister, write=True)
+    avl = Operand("avl", int)
+    syntax = Syntax(
+        ["vsetivli", " ", rd, ",", " ", avl, ",", " ", "e{}".format(sew)]
+        + [",", " ", "m{}".format(lmul), ",", " ", "ta", ",", " ", "ma"]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": rd,
+        "funct3": 0b111,
+        "rs1": avl,
+        "imm": 0b110000000000 | encode_vtype(sew, lmul),
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvIToken],
+        "rd": rd,
+        "avl": avl,
+        "patterns": patterns,
+        "sew": sew,
+        "lmul": lmul,
+    }
+    name = "VsetivliE{}M{}".format(sew, lmul)
+    return type(name, (RiscvVInstruction,), members)
+
+
+vsetvli = {}
+vsetivli = {}
+for _sew in element_widths:
+    for _lmul in group_sizes:
+        vsetvli[(_sew, _lmul)] = make_vsetvli(_sew, _lmul)
+        vsetivli[(_sew, _lmul)] = make_vsetivli(_sew, _lmul)
+
+
+class Vsetvl(RiscvVInstruction):
+    """ Set the vector length and type, with the type in a register """
+
+    tokens = [RiscvToken]
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    rs2 = Operand("rs2", RiscvRegister, read=True)
+    syntax = Syntax(["vsetvl", " ", rd, ",", " ", rs1, ",", " ", rs2])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": rd,
+        "funct3": 0b111,
+        "rs1": rs1,
+        "rs2": rs2,
+        "funct7": 0b1000000,
+    }
+
+
+def make_load(sew):
+    """ Factory function for the unit stride vector loads """
+    vd = Operand("vd", RiscvVRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    name = "vle{}".format(sew)
+    syntax = Syntax([name, ".", "v", " ", vd, ",", " ", "(", rs1, ")"])
+    patterns = {
+        "opcode": 0b0000111,
+        "rd": vd,
+        "funct3": element_widths[sew],
+        "rs1": rs1,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0,
+    }
+    members = {
+        "syntax": syntax,
+        "vd": vd,
+        "rs1": rs1,
+        "patterns": patterns,
+        "sew": sew,
+    }
+    return type(name.title(), (RiscvVInstruction,), members)
+
+
+Vle8 = make_load(8)
+Vle16 = make_load(16)
+Vle32 = make_load(32)
+Vle64 = make_load(64)
+
+
+def make_store(sew):
+    """ Factory function for the unit stride vector stores """
+    vs3 = Operand("vs3", RiscvVRegister, read=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    name = "vse{}".format(sew)
+    syntax = Syntax([name, ".", "v", " ", vs3, ",", " ", "(", rs1, ")"])
+    patterns = {
+        "opcode": 0b0100111,
+        "rd": vs3,
+        "funct3": element_widths[sew],
+        "rs1": rs1,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0,
+    }
+    members = {
+        "syntax": syntax,
+        "vs3": vs3,
+        "rs1": rs1,
+        "patterns": patterns,
+        "sew": sew,
+    }
+    return type(name.title(), (RiscvVInstruction,), members)
+
+
+Vse8 = make_store(8)
+Vse16 = make_store(16)
+Vse32 = make_store(32)
+Vse64 = make_store(64)
+
+# The funct3 values of the operand kinds:
+OPIVV = 0b000
+OPMVV = 0b010
+OPIVI = 0b011
+OPIVX = 0b100
+OPMVX = 0b110
+
+
+def make_vv(mnemonic, funct6, funct3=OPIVV):
+    """ Factory function for vector vector instructions """
+    vd = Operand("vd", RiscvVRegister, write=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    vs1 = Operand("vs1", RiscvVRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, ".", "vv", " ", vd, ",", " ", vs2, ",", " ", vs1]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": funct3,
+        "rs1": vs1,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": funct6,
+    }
+    members = {
+        "syntax": syntax,
+        "vd": vd,
+        "vs2": vs2,
+        "vs1": vs1,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "Vv", (RiscvVInstruction,), members)
+
+
+def make_vx(mnemonic, funct6, funct3=OPIVX):
+    """ Factory function for vector scalar instructions """
+    vd = Operand("vd", RiscvVRegister, write=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, ".", "vx", " ", vd, ",", " ", vs2, ",", " ", rs1]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": funct3,
+        "rs1": rs1,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": funct6,
+    }
+    members = {
+        "syntax": syntax,
+        "vd": vd,
+        "vs2": vs2,
+        "rs1": rs1,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "Vx", (RiscvVInstruction,), members)
+
+
+def make_vi(mnemonic, funct6):
+    """ Factory function for vector immediate instructions """
+    vd = Operand("vd", RiscvVRegister, write=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    imm = Operand("imm", int)
+    syntax = Syntax(
+        [mnemonic, ".", "vi", " ", vd, ",", " ", vs2, ",", " ", imm]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPIVI,
+        "rs1": imm,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": funct6,
+    }
+    members = {
+        "syntax": syntax,
+        "vd": vd,
+        "vs2": vs2,
+        "imm": imm,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "Vi", (RiscvVInstruction,), members)
+
+
+VaddVv = make_vv("vadd", 0b000000)
+VaddVx = make_vx("vadd", 0b000000)
+VaddVi = make_vi("vadd", 0b000000)
+VsubVv = make_vv("vsub", 0b000010)
+VsubVx = make_vx("vsub", 0b000010)
+VrsubVx = make_vx("vrsub", 0b000011)
+VrsubVi = make_vi("vrsub", 0b000011)
+VminuVv = make_vv("vminu", 0b000100)
+VminuVx = make_vx("vminu", 0b000100)
+VminVv = make_vv("vmin", 0b000101)
+VminVx = make_vx("vmin", 0b000101)
+VmaxuVv = make_vv("vmaxu", 0b000110)
+VmaxuVx = make_vx("vmaxu", 0b000110)
+VmaxVv = make_vv("vmax", 0b000111)
+VmaxVx = make_vx("vmax", 0b000111)
+VandVv = make_vv("vand", 0b001001)
+VandVx = make_vx("vand", 0b001001)
+VandVi = make_vi("vand", 0b001001)
+VorVv = make_vv("vor", 0b001010)
+VorVx = make_vx("vor", 0b001010)
+VorVi = make_vi("vor", 0b001010)
+VxorVv = make_vv("vxor", 0b001011)
+VxorVx = make_vx("vxor", 0b001011)
+VxorVi = make_vi("vxor", 0b001011)
+VsllVv = make_vv("vsll", 0b100101)
+VsllVx = make_vx("vsll", 0b100101)
+VsllVi = make_vi("vsll", 0b100101)
+VsrlVv = make_vv("vsrl", 0b101000)
+VsrlVx = make_vx("vsrl", 0b101000)
+VsrlVi = make_vi("vsrl", 0b101000)
+VsraVv = make_vv("vsra", 0b101001)
+VsraVx = make_vx("vsra", 0b101001)
+VsraVi = make_vi("vsra", 0b101001)
+VmulVv = make_vv("vmul", 0b100101, OPMVV)
+VmulVx = make_vx("vmul", 0b100101, OPMVX)
+
+
+class VmaccVv(RiscvVInstruction):
+    """ Multiply vs1 and vs2, and add the product to vd """
+
+    vd = Operand("vd", RiscvVRegister, read=True, write=True)
+    vs1 = Operand("vs1", RiscvVRegister, read=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    syntax = Syntax(
+        ["vmacc", ".", "vv", " ", vd, ",", " ", vs1, ",", " ", vs2]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPMVV,
+        "rs1": vs1,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": 0b101101,
+    }
+
+
+class VmaccVx(RiscvVInstruction):
+    vd = Operand("vd", RiscvVRegister, read=True, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    syntax = Syntax(
+        ["vmacc", ".", "vx", " ", vd, ",", " ", rs1, ",", " ", vs2]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPMVX,
+        "rs1": rs1,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": 0b101101,
+    }
+
+
+def make_reduction(mnemonic, funct6):
+    """Factory function for the reductions.
+
+    The first element of vd becomes the first element of vs1 combined
+    with all elements of vs2.
+    """
+    vd = Operand("vd", RiscvVRegister, write=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    vs1 = Operand("vs1", RiscvVRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, ".", "vs", " ", vd, ",", " ", vs2, ",", " ", vs1]
+    )
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPMVV,
+        "rs1": vs1,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": funct6,
+    }
+    members = {
+        "syntax": syntax,
+        "vd": vd,
+        "vs2": vs2,
+        "vs1": vs1,
+        "patterns": patterns,
+    }
+    return type(mnemonic.title() + "Vs", (RiscvVInstruction,), members)
+
+
+VredsumVs = make_reduction("vredsum", 0b000000)
+VredandVs = make_reduction("vredand", 0b000001)
+VredorVs = make_reduction("vredor", 0b000010)
+VredxorVs = make_reduction("vredxor", 0b000011)
+VredminuVs = make_reduction("vredminu", 0b000100)
+VredminVs = make_reduction("vredmin", 0b000101)
+VredmaxuVs = make_reduction("vredmaxu", 0b000110)
+VredmaxVs = make_reduction("vredmax", 0b000111)
+
+
+class VmvVv(RiscvVInstruction):
+    vd = Operand("vd", RiscvVRegister, write=True)
+    vs1 = Operand("vs1", RiscvVRegister, read=True)
+    syntax = Syntax(["vmv", ".", "v", ".", "v", " ", vd, ",", " ", vs1])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPIVV,
+        "rs1": vs1,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0b010111,
+    }
+
+
+class VmvVx(RiscvVInstruction):
+    """ Copy a scalar register into all elements of vd """
+
+    vd = Operand("vd", RiscvVRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["vmv", ".", "v", ".", "x", " ", vd, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPIVX,
+        "rs1": rs1,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0b010111,
+    }
+
+
+class VmvVi(RiscvVInstruction):
+    vd = Operand("vd", RiscvVRegister, write=True)
+    imm = Operand("imm", int)
+    syntax = Syntax(["vmv", ".", "v", ".", "i", " ", vd, ",", " ", imm])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPIVI,
+        "rs1": imm,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0b010111,
+    }
+
+
+class VmvXs(RiscvVInstruction):
+    """ Copy the first element of vs2 into a scalar register """
+
+    rd = Operand("rd", RiscvRegister, write=True)
+    vs2 = Operand("vs2", RiscvVRegister, read=True)
+    syntax = Syntax(["vmv", ".", "x", ".", "s", " ", rd, ",", " ", vs2])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": rd,
+        "funct3": OPMVV,
+        "rs1": 0,
+        "rs2": vs2,
+        "vm": 1,
+        "funct6": 0b010000,
+    }
+
+
+class VmvSx(RiscvVInstruction):
+    """ Copy a scalar register into the first element of vd """
+
+    vd = Operand("vd", RiscvVRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["vmv", ".", "s", ".", "x", " ", vd, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b1010111,
+        "rd": vd,
+        "funct3": OPMVX,
+        "rs1": rs1,
+        "rs2": 0,
+        "vm": 1,
+        "funct6": 0b010000,
+    }
+
+
+def gen_strip_mined_loop(arch, frame, sew, lmul, count, pointers, body):
+    """Generate a loop which processes count elements in chunks.
+
+    Every iteration sets the vector length to the number of elements
+    which are left, or to the number of elements which fit in the
+    register group, and then generates the body for the given pointers.
+    The pointers are advanced past the processed elements afterwards.
+    """
+    count_copy = frame.new_reg(RiscvRegister)
+    yield arch.move(count_copy, count)
+    pointer_copies = []
+    for pointer in pointers:
+        pointer_copy = frame.new_reg(RiscvRegister)
+        yield arch.move(pointer_copy, pointer)
+        pointer_copies.append(pointer_copy)
+
+    # A zero length sets the vector length to zero, so the body is
+    # entered at least once:
+    loop_label = frame.new_label()
+    done_label = frame.new_label()
+    yield B(loop_label.name, jumps=[loop_label])
+    yield loop_label
+    vl = frame.new_reg(RiscvRegister)
+    yield vsetvli[(sew, lmul)](vl, count_copy)
+    yield from body(*pointer_copies)
+    yield Subr(count_copy, count_copy, vl)
+    if pointer_copies:
+        if sew == 8:
+            step = vl
+        else:
+            step = frame.new_reg(RiscvRegister)
+            yield Slli(step, vl, {16: 1, 32: 2, 64: 3}[sew])
+        for pointer in pointer_copies:
+            yield Addr(pointer, pointer, step)
+    yield Bne(
+        count_copy, R0, loop_label.name, jumps=[loop_label, done_label]
+    )
+    yield done_label
+
+
+def gen_memcpy(arch, frame, rv, args):
+    dst, src, size = args
+
+    def body(dst, src):
+        yield Vle8(V8, src)
+        yield Vse8(V8, dst)
+
+    yield from gen_strip_mined_loop(
+        arch, frame, 8, 8, size, (dst, src), body
+    )
+
+
+def gen_memset(arch, frame, rv, args):
+    dst, value, size = args
+
+    def body(dst):
+        yield VmvVx(V8, value)
+        yield Vse8(V8, dst)
+
+    yield from gen_strip_mined_loop(arch, frame, 8, 8, size, (dst,), body)
+
+
+def make_elementwise(vector_cls):
+    """ Create a kernel which combines two arrays of words into a third """
+
+    def gen_elementwise(arch, frame, rv, args):
+        dst, a, b, count = args
+
+        def body(dst, a, b):
+            yield Vle32(V8, a)
+            yield Vle32(V12, b)
+            yield vector_cls(V8, V8, V12)
+            yield Vse32(V8, dst)
+
+        yield from gen_strip_mined_loop(
+            arch, frame, 32, 4, count, (dst, a, b), body
+        )
+
+    return gen_elementwise
+
+
+def gen_reduction(arch, frame, rv, body, count, pointers):
+    """ Sum the words produced by body into the first element of v16 """
+    yield vsetivli[(32, 1)](R0, 1)
+    yield VmvSx(V16, R0)
+    yield from gen_strip_mined_loop(arch, frame, 32, 4, count, pointers, body)
+    if rv:
+        yield VmvXs(rv[1], V16)
+
+
+def gen_sum(arch, frame, rv, args):
+    a, count = args
+
+    def body(a):
+        yield Vle32(V8, a)
+        yield VredsumVs(V16, V8, V16)
+
+    yield from gen_reduction(arch, frame, rv, body, count, (a,))
+
+
+def gen_dot(arch, frame, rv, args):
+    a, b, count = args
+
+    def body(a, b):
+        yield Vle32(V8, a)
+        yield Vle32(V12, b)
+        yield VmulVv(V8, V8, V12)
+        yield VredsumVs(V16, V8, V16)
+
+    yield from gen_reduction(arch, frame, rv, body, count, (a, b))
+
+
+# Runtime functions which are expanded into vector loops. The elementwise
+# and reduction functions operate on arrays of 32 bit integers, the
+# lengths are numbers of elements, or bytes for memcpy and memset.
+rvv_kernels = {
+    "rvv_memcpy": gen_memcpy,
+    "rvv_memset": gen_memset,
+    "rvv_add_i32": make_elementwise(VaddVv),
+    "rvv_sub_i32": make_elementwise(VsubVv),
+    "rvv_mul_i32": make_elementwise(VmulVv),
+    "rvv_sum_i32": gen_sum,
+    "rvv_dot_i32": gen_dot,
+}
+
+# Runtime functions which are a single instruction. These set the vector
+# length for the given number of elements, and return it.
+rvv_intrinsics = {
+    "rvv_setvl_e8": vsetvli[(8, 1)],
+    "rvv_setvl_e16": vsetvli[(16, 1)],
+    "rvv_setvl_e32": vsetvli[(32, 1)],
+}
@@ -0,0 +1,194 @@
+"""Addressing of global variables with %hi and %lo relocations.
+
+With the sdata option, the address of a global variable is loaded with a
+lui and an addi, and the lower part of the address is folded into loads
+and stores. Small variables are placed in the sdata and sbss sections.
+
+The startup code must load the address of the __global_pointer symbol
+into the gp register, for example with:
+
+    lui gp, __global_pointer
+    addi gp, gp, __global_pointer
+
+The layout must place the sdata and sbss sections, and can define this
+symbol in between them. During linker relaxation, the lui is removed and
+the lower part is rewritten into an offset to gp, when the variable is
+within 2 KiB of the global pointer.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from .registers import RiscvRegister
+from .tokens import RiscvIToken, RiscvSToken, RiscvUToken
+from .relocations import Hi20Relocation, Lo12IRelocation, Lo12SRelocation
+from .relocations import GpRel12IRelocation, GpRel12SRelocation
+
+sdataisa = Isa()
+sdataisa.register_relocation(Hi20Relocation)
+sdataisa.register_relocation(Lo12IRelocation)
+sdataisa.register_relocation(Lo12SRelocation)
+sdataisa.register_relocation(GpRel12IRelocation)
+sdataisa.register_relocation(GpRel12SRelocation)
+
+
+class SdataInstruction(Instruction):
+    isa = sdataisa
+
+
+class AdrHi(SdataInstruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    label = Operand("label", str)
+    syntax = Syntax(["lui", " ", rd, ",", " ", "%", "hi", "(", label, ")"])
+    tokens = [RiscvUToken]
+    patterns = {"opcode": 0b0110111, "rd": rd, "imm": 0}
+
+    def relocations(self):
+        return [Hi20Relocation(self.label)]
+
+
+class AdrLo(SdataInstruction):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    label = Operand("label", str)
+    syntax = Syntax(
+        ["addi", " ", rd, ",", " ", rs1, ",", " ", "%", "lo", "(", label, ")"]
+    )
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0010011,
+        "rd": rd,
+        "funct3": 0,
+        "rs1": rs1,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [Lo12IRelocation(self.label)]
+
+
+def make_ldr_lo(mnemonic, func):
+    rd = Operand("rd", RiscvRegister, write=True)
+    label = Operand("label", str)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, " ", rd, ",", " ", "%", "lo", "(", label, ")"]
+        + ["(", rs1, ")"]
+    )
+    tokens = [RiscvIToken]
+    patterns = {
+        "opcode": 0b0000011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [Lo12IRelocation(self.label)]
+
+    members = {
+        "syntax": syntax,
+        "tokens": tokens,
+        "patterns": patterns,
+        "rd": rd,
+        "label": label,
+        "rs1": rs1,
+        "relocations": relocations,
+    }
+    return type(mnemonic.title() + "Lo", (SdataInstruction,), members)
+
+
+def make_str_lo(mnemonic, func):
+    rs2 = Operand("rs2", RiscvRegister, read=True)
+    label = Operand("label", str)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(
+        [mnemonic, " ", rs2, ",", " ", "%", "lo", "(", label, ")"]
+        + ["(", rs1, ")"]
+    )
+    tokens = [RiscvSToken]
+    patterns = {
+        "opcode": 0b0100011,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": rs2,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [Lo12SRelocation(self.label)]
+
+    members = {
+        "syntax": syntax,
+        "tokens": tokens,
+        "patterns": patterns,
+        "rs2": rs2,
+        "label": label,
+        "rs1": rs1,
+        "relocations": relocations,
+    }
+    return type(mnemonic.title() + "Lo", (SdataInstruction,), members)
+
+
+LbLo = make_ldr_lo("lb", 0b000)
+LhLo = make_ldr_lo("lh", 0b001)
+LwLo = make_ldr_lo("lw", 0b010)
+LbuLo = make_ldr_lo("lbu", 0b100)
+LhuLo = make_ldr_lo("lhu", 0b101)
+SbLo = make_str_lo("sb", 0b000)
+ShLo = make_str_lo("sh", 0b001)
+SwLo = make_str_lo("sw", 0b010)
+
+
+@sdataisa.pattern("reg", "LABEL", size=3)
+def pattern_label(context, tree):
+    d = context.new_reg(RiscvRegister)
+    context.emit(AdrHi(d, tree.value))
+    context.emit(AdrLo(d, d, tree.value))
+    return d
+
+
+loads = {
+    "LDRI8": LbLo,
+    "LDRU8": LbuLo,
+    "LDRI16": LhLo,
+    "LDRU16": LhuLo,
+    "LDRI32": LwLo,
+    "LDRU32": LwLo,
+}
+stores = {
+    "STRI8": SbLo,
+    "STRU8": SbLo,
+    "STRI16": ShLo,
+    "STRU16": ShLo,
+    "STRI32": SwLo,
+    "STRU32": SwLo,
+}
+
+
+@sdataisa.pattern("reg", "LDRI8(LABEL)", size=4)
+@sdataisa.pattern("reg", "LDRU8(LABEL)", size=4)
+@sdataisa.pattern("reg", "LDRI16(LABEL)", size=4)
+@sdataisa.pattern("reg", "LDRU16(LABEL)", size=4)
+@sdataisa.pattern("reg", "LDRI32(LABEL)", size=4)
+@sdataisa.pattern("reg", "LDRU32(LABEL)", size=4)
+def pattern_ldr_label(context, tree):
+    base = context.new_reg(RiscvRegister)
+    d = context.new_reg(RiscvRegister)
+    label = tree.children[0].value
+    context.emit(AdrHi(base, label))
+    context.emit(loads[tree.name](d, label, base))
+    return d
+
+
+@sdataisa.pattern("stm", "STRI8(LABEL, reg)", size=4)
+@sdataisa.pattern("stm", "STRU8(LABEL, reg)", size=4)
+@sdataisa.pattern("stm", "STRI16(LABEL, reg)", size=4)
+@sdataisa.pattern("stm", "STRU16(LABEL, reg)", size=4)
+@sdataisa.pattern("stm", "STRI32(LABEL, reg)", size=4)
+@sdataisa.pattern("stm", "STRU32(LABEL, reg)", size=4)
+def pattern_str_label(context, tree, c0):
+    base = context.new_reg(RiscvRegister)
+    label = tree.children[0].value
+    context.emit(AdrHi(base, label))
+    context.emit(stores[tree.name](c0, label, base))
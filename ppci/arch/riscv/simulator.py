@@ -0,0 +1,1324 @@
+"""Instruction set simulator for RV32IMFDCV, RV64IM and Xpulp code.
+
+The simulator decodes machine code into the instruction classes of the
+riscv isa modules. Each basic block is decoded only once, translated into
+a python function and kept in a cache, so that loops run at the speed of
+plain python code.
+
+A single memory mapped uart data register is available at 0x20000000,
+which is what the board support code of the samples writes to.
+
+Hardware loops are simulated by ending a block at every known loop end
+address. The end addresses are registered when a loop setup instruction
+is translated, so blocks which were translated before are flushed.
+
+The vector registers are VLEN bits wide, and are kept in a bytearray in
+which the registers of a group are adjacent. Vector instructions are
+executed by methods of the simulator, which operate on all elements
+below the vector length.
+
+The register width follows the rv64 option of the architecture. The
+generated code refers to the register mask and the helper functions for
+signed arithmetic by name, these are defined per register width.
+"""
+
+import logging
+import math
+import struct
+from ctypes import c_float
+from ...utils.bitfun import sign_extend
+from . import instructions as rv
+from . import rvc_instructions as rvc
+from . import rvf_instructions as rvf
+from . import rvd_instructions as rvd
+from . import rvb_instructions as rvb
+from . import rv64_instructions as rv64
+from . import zicond_instructions as zc
+from . import xpulp_instructions as xp
+from . import rvv_instructions as rvv
+from .decoder import RiscvDecoder, DecodeError
+
+UART_ADDRESS = 0x20000000
+MASK = 0xFFFFFFFF
+MASK64 = 0xFFFFFFFFFFFFFFFF
+MAX_BLOCK_SIZE = 64
+EMPTY_RANGE = (1 << 32, 0)
+VLEN = 128
+VLENB = VLEN // 8
+
+# Control and status register numbers:
+FRM = 0x2
+FCSR = 0x3
+MEPC = 0x341
+
+
+class SimulatorError(Exception):
+    """ Raised when the simulated program does something invalid """
+
+    pass
+
+
+def make_integer_functions(xlen):
+    """Create the register mask and the integer arithmetic helpers of the
+    generated code for registers of xlen bits.
+    """
+    mask = (1 << xlen) - 1
+    sign = 1 << (xlen - 1)
+
+    def signed(value):
+        """ Interprete a register value as signed integer """
+        return (value ^ sign) - sign
+
+    def div(a, b):
+        """ Signed division, rounding towards zero """
+        if b == 0:
+            return mask
+        a, b = signed(a), signed(b)
+        q = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            q = -q
+        return q & mask
+
+    def divu(a, b):
+        if b == 0:
+            return mask
+        return a // b
+
+    def rem(a, b):
+        """ Signed remainder, the sign follows the dividend """
+        if b == 0:
+            return a
+        a, b = signed(a), signed(b)
+        r = abs(a) % abs(b)
+        if a < 0:
+            r = -r
+        return r & mask
+
+    def remu(a, b):
+        if b == 0:
+            return a
+        return a % b
+
+    return {
+        "XLEN": xlen,
+        "MASK": mask,
+        "SHIFT_MASK": xlen - 1,
+        "signed": signed,
+        "div": div,
+        "divu": divu,
+        "rem": rem,
+        "remu": remu,
+    }
+
+
+def sext32(value):
+    """ Sign extend the lower 32 bits of a value into a 64 bit register """
+    return (((value & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000) & MASK64
+
+
+def rol(value, amount):
+    """ Rotate a 32 bit value to the left """
+    amount &= 31
+    return ((value << amount) | (value >> (32 - amount))) & MASK
+
+
+def ctz(value):
+    """ Count the trailing zero bits of a 32 bit value """
+    if value == 0:
+        return 32
+    return (value & -value).bit_length() - 1
+
+
+def orc_b(value):
+    """ Set every byte which is not zero to all ones """
+    result = 0
+    for shift in range(0, 32, 8):
+        if value & (0xFF << shift):
+            result |= 0xFF << shift
+    return result
+
+
+def vsigned(value, sew):
+    """ Interprete a vector element as signed integer """
+    return sign_extend(value, sew)
+
+
+# The vector operations on two elements of sew bits:
+vector_ops = {
+    "add": lambda a, b, sew: a + b,
+    "sub": lambda a, b, sew: a - b,
+    "rsub": lambda a, b, sew: b - a,
+    "minu": lambda a, b, sew: min(a, b),
+    "min": lambda a, b, sew: min(a, b, key=lambda v: vsigned(v, sew)),
+    "maxu": lambda a, b, sew: max(a, b),
+    "max": lambda a, b, sew: max(a, b, key=lambda v: vsigned(v, sew)),
+    "and": lambda a, b, sew: a & b,
+    "or": lambda a, b, sew: a | b,
+    "xor": lambda a, b, sew: a ^ b,
+    "sll": lambda a, b, sew: a << (b & (sew - 1)),
+    "srl": lambda a, b, sew: a >> (b & (sew - 1)),
+    "sra": lambda a, b, sew: vsigned(a, sew) >> (b & (sew - 1)),
+    "mul": lambda a, b, sew: a * b,
+}
+
+# The struct formats of the vector elements per element width:
+element_formats = {8: "B", 16: "H", 32: "I", 64: "Q"}
+
+
+def f32(value):
+    """ Round a python float to single precision """
+    return c_float(value).value
+
+
+def ddiv(a, b):
+    """ Divide two floats, giving infinity or nan for a zero divisor """
+    if b == 0.0:
+        if a == 0.0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+def fdiv(a, b):
+    return f32(ddiv(a, b))
+
+
+def fsqrt(value):
+    return math.sqrt(value) if value >= 0.0 else math.nan
+
+
+def fsgnjx(a, b):
+    return math.copysign(a, math.copysign(1.0, a) * math.copysign(1.0, b))
+
+
+def f2bits(value):
+    return struct.unpack("<I", struct.pack("<f", value))[0]
+
+
+def bits2f(value):
+    return struct.unpack("<f", struct.pack("<I", value))[0]
+
+
+_rounders = {
+    0: round,
+    1: math.trunc,
+    2: math.floor,
+    3: math.ceil,
+    4: lambda v: math.floor(v + 0.5) if v >= 0 else math.ceil(v - 0.5),
+}
+
+
+def fcvt(value, rounding, low, high):
+    """ Convert a float to a saturated integer value """
+    if math.isnan(value):
+        return high & MASK
+    if math.isinf(value):
+        v = low if value < 0 else high
+    else:
+        v = min(max(_rounders[rounding](value), low), high)
+    return v & MASK
+
+
+class RiscvSimulator:
+    """Simulator for RISC-V programs.
+
+    Usage:
+
+        >>> sim = RiscvSimulator(arch)
+        >>> sim.load(obj)
+        >>> sim.run()
+        >>> sim.output
+
+    The program runs until an ebreak instruction is executed.
+    """
+
+    logger = logging.getLogger("riscvsim")
+
+    def __init__(self, arch, memory_size=0x20000, memory_base=0):
+        self.arch = arch
+        self.xlen = 64 if arch.has_option("rv64") else 32
+        self.mask = (1 << self.xlen) - 1
+        self._integer_functions = make_integer_functions(self.xlen)
+        if self.xlen == 64:
+            # The word instructions operate on the lower 32 bits:
+            words = make_integer_functions(32)
+            for name in ("signed", "div", "divu", "rem", "remu"):
+                self._integer_functions[name + "w"] = words[name]
+        self.decoder = RiscvDecoder(arch)
+        self.memory_base = memory_base
+        self.memory_size = memory_size
+        self.memory = bytearray(memory_size)
+        self.x = [0] * 32
+        self.f = [0.0] * 32
+        self.csrs = {}
+        self.pc = memory_base
+        self.instret = 0
+        self.halted = False
+        self.output = bytearray()
+        self.blocks = {}
+        self.loop_start = [0, 0]
+        self.loop_end = [0, 0]
+        self.loop_count = [0, 0]
+        self.loop_ends = set()
+        self.v = bytearray(32 * VLENB)
+        self.vl = 0
+        self.sew = 8
+        self.lmul = 1
+        self._code_range = EMPTY_RANGE
+        self._make_memory_accessors()
+        self._emitters = self._make_emitters()
+
+    def load(self, obj):
+        """Load all images of an object file, and set pc to its entry.
+
+        When the object was linked without a memory layout, the sections
+        are loaded instead.
+        """
+        parts = obj.images if obj.images else obj.sections
+        for part in parts:
+            self.write_memory(part.address, part.data)
+        if obj.entry_symbol_id is not None:
+            self.pc = obj.get_symbol_id_value(obj.entry_symbol_id)
+        elif parts:
+            self.pc = min(part.address for part in parts)
+
+    def load_image(self, image):
+        """ Copy the data of a single image into memory """
+        self.write_memory(image.address, image.data)
+
+    def write_memory(self, address, data):
+        offset = address - self.memory_base
+        if offset < 0 or offset + len(data) > self.memory_size:
+            raise SimulatorError(
+                "Data at {:#x} does not fit in memory".format(address)
+            )
+        self.memory[offset : offset + len(data)] = data
+        self.flush()
+
+    def flush(self):
+        """ Forget all translated blocks """
+        self.blocks.clear()
+        self._code_range = EMPTY_RANGE
+
+    def read_memory(self, address, size):
+        offset = address - self.memory_base
+        return bytes(self.memory[offset : offset + size])
+
+    def run(self, max_instructions=None):
+        """Run the program until ebreak, or until the instruction count
+        reaches max_instructions.
+
+        Returns the number of retired instructions.
+        """
+        blocks = self.blocks
+        x, f = self.x, self.f
+        pc = self.pc
+        self.halted = False
+        while not self.halted:
+            if max_instructions is not None:
+                if self.instret >= max_instructions:
+                    break
+            block = blocks.get(pc)
+            if block is None:
+                block = self.translate(pc)
+            func, count = block
+            pc = func(x, f, self)
+            self.instret += count
+        self.pc = pc
+        self.logger.info("Retired %s instructions", self.instret)
+        return self.instret
+
+    def translate(self, address):
+        """ Decode a basic block and compile it into a python function """
+        pc = address
+        instructions = []
+        while len(instructions) < MAX_BLOCK_SIZE:
+            data = self.read_memory(pc, 4)
+            try:
+                ins, size = self.decoder.decode(data, pc)
+            except DecodeError:
+                if not instructions:
+                    raise SimulatorError(
+                        "Invalid instruction at {:#x}".format(pc)
+                    )
+                break
+            instructions.append((pc, ins, size))
+            pc += size
+            if isinstance(ins, _control_classes) or pc in self.loop_ends:
+                break
+
+        lines = ["def block(x, f, s):"]
+        returned = False
+        for index, (pc, ins, size) in enumerate(instructions):
+            emitter = self._emitters[type(ins)]
+            code = emitter(ins, pc, size, index)
+            lines.extend("    " + line for line in code)
+            returned = code and code[-1].startswith("return")
+        if not returned:
+            if pc + size in self.loop_ends:
+                lines.append("    return s.end_of_loop({})".format(pc + size))
+            else:
+                lines.append("    return {}".format(pc + size))
+
+        namespace = dict(_namespace)
+        namespace.update(self._integer_functions)
+        namespace.update(self._accessors)
+        exec("\n".join(lines), namespace)
+        block = (namespace["block"], len(instructions))
+        self.blocks[address] = block
+        lo, hi = self._code_range
+        self._code_range = (min(lo, address), max(hi, pc + size))
+        return block
+
+    def add_loop_end(self, address):
+        """ Make sure that blocks end at the end of a hardware loop """
+        if address not in self.loop_ends:
+            self.loop_ends.add(address)
+            self.flush()
+
+    def end_of_loop(self, address):
+        """Continue after the last instruction of a hardware loop body.
+
+        Returns the start of the loop body while the loop count is not
+        exhausted, and the address after the loop otherwise.
+        """
+        for level in (0, 1):
+            if self.loop_end[level] == address and self.loop_count[level]:
+                self.loop_count[level] -= 1
+                if self.loop_count[level]:
+                    return self.loop_start[level]
+        return address
+
+    def set_vector_type(self, avl, vtype):
+        """Configure the element width and register grouping.
+
+        Returns the new vector length, which is the application vector
+        length limited to the number of elements of a register group.
+        """
+        vsew, vlmul = (vtype >> 3) & 0x7, vtype & 0x7
+        if vsew > 3 or vlmul > 3:
+            raise SimulatorError("Unsupported vector type {:#x}".format(vtype))
+        self.sew = 8 << vsew
+        self.lmul = 1 << vlmul
+        self.vl = min(avl, VLEN * self.lmul // self.sew)
+        return self.vl
+
+    def _vector_offset(self, address, size):
+        offset = address - self.memory_base
+        if offset < 0 or offset + size > self.memory_size:
+            raise SimulatorError(
+                "Invalid vector access at {:#x}".format(address)
+            )
+        return offset
+
+    def vector_load(self, vd, address, width):
+        """ Load vl elements of width bytes into register group vd """
+        size = self.vl * width
+        offset = self._vector_offset(address, size)
+        start = vd * VLENB
+        self.v[start : start + size] = self.memory[offset : offset + size]
+
+    def vector_store(self, vs3, address, width):
+        size = self.vl * width
+        offset = self._vector_offset(address, size)
+        start = vs3 * VLENB
+        self.memory[offset : offset + size] = self.v[start : start + size]
+        lo, hi = self._code_range
+        if address < hi and lo < address + size:
+            self.flush()
+
+    def read_elements(self, vs, count=None):
+        """ Read the elements of register group vs as unsigned values """
+        if count is None:
+            count = self.vl
+        fmt = "<{}{}".format(count, element_formats[self.sew])
+        return struct.unpack_from(fmt, self.v, vs * VLENB)
+
+    def write_elements(self, vd, values):
+        mask = (1 << self.sew) - 1
+        fmt = "<{}{}".format(len(values), element_formats[self.sew])
+        values = [value & mask for value in values]
+        struct.pack_into(fmt, self.v, vd * VLENB, *values)
+
+    def vector_op(self, name, vd, vs2, values):
+        """Combine the elements of vs2 with the given values.
+
+        The values are the elements of another register group, or a
+        scalar repeated for every element.
+        """
+        op, sew = vector_ops[name], self.sew
+        elements = self.read_elements(vs2)
+        self.write_elements(
+            vd, [op(a, b, sew) for a, b in zip(elements, values)]
+        )
+
+    def vector_scalar(self, value):
+        """ Repeat a scalar value, truncated to the element width """
+        return (value & ((1 << self.sew) - 1),) * self.vl
+
+    def vector_macc(self, vd, values, vs2):
+        products = zip(self.read_elements(vd), values, self.read_elements(vs2))
+        self.write_elements(vd, [c + a * b for c, a, b in products])
+
+    def vector_reduce(self, name, vd, vs2, vs1):
+        """ Combine all elements of vs2 into the first element of vs1 """
+        if self.vl:
+            op, sew = vector_ops[name], self.sew
+            mask = (1 << sew) - 1
+            result = self.read_elements(vs1, 1)[0]
+            for element in self.read_elements(vs2):
+                result = op(result, element, sew) & mask
+            self.write_elements(vd, [result])
+
+    def vector_move(self, vd, values):
+        self.write_elements(vd, list(values))
+
+    def move_to_scalar(self, vs2):
+        """ Sign extend the first element of vs2, regardless of vl """
+        value = self.read_elements(vs2, 1)[0]
+        return vsigned(value, self.sew) & self.mask
+
+    def move_to_vector(self, vd, value):
+        if self.vl:
+            self.write_elements(vd, [value])
+
+    def read_io(self, address, size):
+        if address == UART_ADDRESS:
+            return 0
+        raise SimulatorError("Invalid read at {:#x}".format(address))
+
+    def write_io(self, address, value, size):
+        if address == UART_ADDRESS:
+            self.output.append(value & 0xFF)
+        else:
+            raise SimulatorError("Invalid write at {:#x}".format(address))
+
+    def _make_memory_accessors(self):
+        """ Create load and store functions for the generated code """
+        memory = self.memory
+        base = self.memory_base
+        size = self.memory_size
+
+        def make_load(fmt):
+            unpack = struct.Struct(fmt).unpack_from
+            width = struct.calcsize(fmt)
+            limit = size - width
+
+            def load(address):
+                offset = address - base
+                if 0 <= offset <= limit:
+                    return unpack(memory, offset)[0]
+                return self.read_io(address, width)
+
+            return load
+
+        def make_store(fmt):
+            pack = struct.Struct(fmt).pack_into
+            width = struct.calcsize(fmt)
+            limit = size - width
+
+            def store(address, value):
+                offset = address - base
+                if 0 <= offset <= limit:
+                    pack(memory, offset, value)
+                    lo, hi = self._code_range
+                    if lo <= address < hi:
+                        self.flush()
+                else:
+                    self.write_io(address, value, width)
+
+            return store
+
+        self._accessors = {
+            "ld_b": make_load("<b"),
+            "ld_bu": make_load("<B"),
+            "ld_h": make_load("<h"),
+            "ld_hu": make_load("<H"),
+            "ld_w": make_load("<I"),
+            "ld_ws": make_load("<i"),
+            "ld_d": make_load("<Q"),
+            "st_b": make_store("<B"),
+            "st_h": make_store("<H"),
+            "st_w": make_store("<I"),
+            "st_d": make_store("<Q"),
+            "ld_fd": make_load("<d"),
+            "st_fd": make_store("<d"),
+        }
+
+    def _make_emitters(self):
+        """ Create the table of python code generators per instruction """
+        emitters = {}
+        mask = self.mask
+        rv64_option = self.xlen == 64
+
+        def emitter(*classes):
+            def wrapper(function):
+                for cls in classes:
+                    emitters[cls] = function
+                return function
+
+            return wrapper
+
+        def xset(rd, expr):
+            if rd.num == 0:
+                return []
+            return ["x[{}] = {}".format(rd.num, expr)]
+
+        def target(ins):
+            return int(ins.target, 16)
+
+        binops = {
+            rv.Addr: "(x[{1}] + x[{2}]) & MASK",
+            rv.Subr: "(x[{1}] - x[{2}]) & MASK",
+            rv.Sll: "(x[{1}] << (x[{2}] & SHIFT_MASK)) & MASK",
+            rv.Slt: "int(signed(x[{1}]) < signed(x[{2}]))",
+            rv.Sltu: "int(x[{1}] < x[{2}])",
+            rv.Xorr: "x[{1}] ^ x[{2}]",
+            rv.Srl: "x[{1}] >> (x[{2}] & SHIFT_MASK)",
+            rv.Sra: "(signed(x[{1}]) >> (x[{2}] & SHIFT_MASK)) & MASK",
+            rv.Orr: "x[{1}] | x[{2}]",
+            rv.Andr: "x[{1}] & x[{2}]",
+        }
+
+        @emitter(*binops)
+        def emit_regregreg(ins, pc, size, index):
+            expr = binops[type(ins)].format(0, ins.rn.num, ins.rm.num)
+            return xset(ins.rd, expr)
+
+        mextops = {
+            rv.Mul: "(x[{1}] * x[{2}]) & MASK",
+            rv.Mulh: "((signed(x[{1}]) * signed(x[{2}])) >> XLEN) & MASK",
+            rv.Mulhsu: "((signed(x[{1}]) * x[{2}]) >> XLEN) & MASK",
+            rv.Mulhu: "(x[{1}] * x[{2}]) >> XLEN",
+            rv.Div: "div(x[{1}], x[{2}])",
+            rv.Divu: "divu(x[{1}], x[{2}])",
+            rv.Rem: "rem(x[{1}], x[{2}])",
+            rv.Remu: "remu(x[{1}], x[{2}])",
+        }
+
+        bitops = {
+            rvb.Sh1add: "((x[{1}] << 1) + x[{2}]) & 0xFFFFFFFF",
+            rvb.Sh2add: "((x[{1}] << 2) + x[{2}]) & 0xFFFFFFFF",
+            rvb.Sh3add: "((x[{1}] << 3) + x[{2}]) & 0xFFFFFFFF",
+            rvb.Andn: "x[{1}] & (x[{2}] ^ 0xFFFFFFFF)",
+            rvb.Orn: "x[{1}] | (x[{2}] ^ 0xFFFFFFFF)",
+            rvb.Xnor: "x[{1}] ^ x[{2}] ^ 0xFFFFFFFF",
+            rvb.Min: "min(x[{1}], x[{2}], key=signed)",
+            rvb.Minu: "min(x[{1}], x[{2}])",
+            rvb.Max: "max(x[{1}], x[{2}], key=signed)",
+            rvb.Maxu: "max(x[{1}], x[{2}])",
+            rvb.Rol: "rol(x[{1}], x[{2}])",
+            rvb.Ror: "rol(x[{1}], -x[{2}])",
+        }
+
+        @emitter(*bitops)
+        def emit_bitop(ins, pc, size, index):
+            expr = bitops[type(ins)].format(0, ins.rn.num, ins.rm.num)
+            return xset(ins.rd, expr)
+
+        unops = {
+            rvb.Clz: "32 - x[{0}].bit_length()",
+            rvb.Ctz: "ctz(x[{0}])",
+            rvb.Cpop: 'bin(x[{0}]).count("1")',
+            rvb.SextB: "(((x[{0}] & 0xFF) ^ 0x80) - 0x80) & 0xFFFFFFFF",
+            rvb.SextH: "(((x[{0}] & 0xFFFF) ^ 0x8000) - 0x8000) & 0xFFFFFFFF",
+            rvb.ZextH: "x[{0}] & 0xFFFF",
+            rvb.OrcB: "orc_b(x[{0}])",
+            rvb.Rev8: 'int.from_bytes(x[{0}].to_bytes(4, "little"), "big")',
+        }
+
+        @emitter(*unops)
+        def emit_unop(ins, pc, size, index):
+            return xset(ins.rd, unops[type(ins)].format(ins.rs1.num))
+
+        @emitter(rvb.Rori)
+        def emit_rori(ins, pc, size, index):
+            expr = "rol(x[{}], {})".format(ins.rs1.num, -ins.imm)
+            return xset(ins.rd, expr)
+
+        @emitter(*mextops)
+        def emit_mext(ins, pc, size, index):
+            expr = mextops[type(ins)].format(0, ins.rs1.num, ins.rs2.num)
+            return xset(ins.rd, expr)
+
+        wordops = {
+            rv64.Addw: "sext32(x[{1}] + x[{2}])",
+            rv64.Subw: "sext32(x[{1}] - x[{2}])",
+            rv64.Sllw: "sext32(x[{1}] << (x[{2}] & 31))",
+            rv64.Srlw: "sext32((x[{1}] & 0xFFFFFFFF) >> (x[{2}] & 31))",
+            rv64.Sraw: "sext32(signedw(x[{1}] & 0xFFFFFFFF) >> (x[{2}] & 31))",
+            rv64.Mulw: "sext32(x[{1}] * x[{2}])",
+            rv64.Divw: (
+                "sext32(divw(x[{1}] & 0xFFFFFFFF, x[{2}] & 0xFFFFFFFF))"
+            ),
+            rv64.Divuw: (
+                "sext32(divuw(x[{1}] & 0xFFFFFFFF, x[{2}] & 0xFFFFFFFF))"
+            ),
+            rv64.Remw: (
+                "sext32(remw(x[{1}] & 0xFFFFFFFF, x[{2}] & 0xFFFFFFFF))"
+            ),
+            rv64.Remuw: (
+                "sext32(remuw(x[{1}] & 0xFFFFFFFF, x[{2}] & 0xFFFFFFFF))"
+            ),
+        }
+
+        @emitter(*wordops)
+        def emit_wordop(ins, pc, size, index):
+            expr = wordops[type(ins)].format(0, ins.rn.num, ins.rm.num)
+            return xset(ins.rd, expr)
+
+        @emitter(rv64.Addiw)
+        def emit_addiw(ins, pc, size, index):
+            imm = sign_extend(ins.offset, 12)
+            return xset(ins.rd, "sext32(x[{}] + {})".format(ins.rs1.num, imm))
+
+        immops = {
+            rv.Addi: "(x[{0}] + {1}) & MASK",
+            rv.Slti: "int(signed(x[{0}]) < {1})",
+            rv.Sltiu: "int(x[{0}] < {2})",
+            rv.Xori: "x[{0}] ^ {2}",
+            rv.Ori: "x[{0}] | {2}",
+            rv.Andi: "x[{0}] & {2}",
+        }
+
+        @emitter(*immops)
+        def emit_regimm(ins, pc, size, index):
+            imm = sign_extend(ins.offset, 12)
+            expr = immops[type(ins)].format(ins.rs1.num, imm, imm & mask)
+            return xset(ins.rd, expr)
+
+        shiftops = {
+            rv.Slli: "(x[{0}] << {1}) & MASK",
+            rv.Srli: "x[{0}] >> {1}",
+            rv.Srai: "(signed(x[{0}]) >> {1}) & MASK",
+            rv64.Slli64: "(x[{0}] << {1}) & MASK",
+            rv64.Srli64: "x[{0}] >> {1}",
+            rv64.Srai64: "(signed(x[{0}]) >> {1}) & MASK",
+            rv64.Slliw: "sext32(x[{0}] << {1})",
+            rv64.Srliw: "sext32((x[{0}] & 0xFFFFFFFF) >> {1})",
+            rv64.Sraiw: "sext32(signedw(x[{0}] & 0xFFFFFFFF) >> {1})",
+            rvc.CSlli: "(x[{0}] << {1}) & 0xFFFFFFFF",
+            rvc.CSrli: "x[{0}] >> {1}",
+            rvc.CSrai: "(signed(x[{0}]) >> {1}) & 0xFFFFFFFF",
+        }
+
+        @emitter(*shiftops)
+        def emit_shift(ins, pc, size, index):
+            rs = ins.rs1 if hasattr(ins, "rs1") else ins.rs
+            expr = shiftops[type(ins)].format(
+                rs.num, ins.imm & (self.xlen - 1)
+            )
+            return xset(ins.rd, expr)
+
+        @emitter(rv.Movr, rvc.CMovr)
+        def emit_mov(ins, pc, size, index):
+            return xset(ins.rd, "x[{}]".format(ins.rm.num))
+
+        @emitter(rvc.CAdd)
+        def emit_cadd(ins, pc, size, index):
+            expr = "(x[{0}] + x[{1}]) & 0xFFFFFFFF".format(
+                ins.rd.num, ins.rm.num
+            )
+            return xset(ins.rd, expr)
+
+        @emitter(rv.Nop, rvc.CNop)
+        def emit_nop(ins, pc, size, index):
+            return []
+
+        @emitter(rv.Lui)
+        def emit_lui(ins, pc, size, index):
+            return xset(ins.rd, sign_extend(ins.imm << 12, 32) & mask)
+
+        @emitter(rv.Auipc)
+        def emit_auipc(ins, pc, size, index):
+            offset = sign_extend(ins.imm << 12, 32)
+            return xset(ins.rd, (pc + offset) & mask)
+
+        loads = {
+            rv.Lb: "ld_b({}) & MASK",
+            rv.Lh: "ld_h({}) & MASK",
+            rv.Lw: "ld_w({})",
+            rv.Lbu: "ld_bu({})",
+            rv.Lhu: "ld_hu({})",
+            rvc.CLw: "ld_w({})",
+            rv64.Lwu: "ld_w({})",
+            rv64.Ld: "ld_d({})",
+        }
+        if rv64_option:
+            # Words are sign extended into the register:
+            loads[rv.Lw] = "ld_ws({}) & MASK"
+
+        @emitter(*loads)
+        def emit_load(ins, pc, size, index):
+            address = "(x[{}] + {}) & MASK".format(ins.rs1.num, ins.offset)
+            return xset(ins.rd, loads[type(ins)].format(address))
+
+        @emitter(rvc.CLwsp)
+        def emit_lwsp(ins, pc, size, index):
+            address = "(x[2] + {}) & 0xFFFFFFFF".format(ins.offset)
+            return xset(ins.rd, "ld_w({})".format(address))
+
+        stores = {
+            rv.Sb: "st_b",
+            rv.Sh: "st_h",
+            rv.Sw: "st_w",
+            rvc.CSw: "st_w",
+            rv64.Sd: "st_d",
+        }
+        store_masks = {"st_b": 0xFF, "st_h": 0xFFFF, "st_w": MASK}
+
+        @emitter(*stores)
+        def emit_store(ins, pc, size, index):
+            return [
+                "{}((x[{}] + {}) & MASK, x[{}] & {})".format(
+                    stores[type(ins)],
+                    ins.rs1.num,
+                    ins.offset,
+                    ins.rs2.num,
+                    store_masks.get(stores[type(ins)], mask),
+                )
+            ]
+
+        @emitter(rvc.CSwsp)
+        def emit_swsp(ins, pc, size, index):
+            return [
+                "st_w((x[2] + {}) & 0xFFFFFFFF, x[{}])".format(
+                    ins.offset, ins.rs2.num
+                )
+            ]
+
+        @emitter(rvc.CAddi)
+        def emit_caddi(ins, pc, size, index):
+            expr = "(x[{0}] + {1}) & 0xFFFFFFFF".format(ins.rd.num, ins.imm)
+            return xset(ins.rd, expr)
+
+        @emitter(rvc.CAddi16sp)
+        def emit_caddi16sp(ins, pc, size, index):
+            return ["x[2] = (x[2] + {}) & 0xFFFFFFFF".format(ins.imm)]
+
+        @emitter(rvc.CAddi4spn)
+        def emit_caddi4spn(ins, pc, size, index):
+            expr = "(x[2] + {}) & 0xFFFFFFFF".format(ins.imm)
+            return xset(ins.rd, expr)
+
+        @emitter(rvc.CLi)
+        def emit_cli(ins, pc, size, index):
+            return xset(ins.rd, ins.imm & MASK)
+
+        @emitter(rvc.CLui)
+        def emit_clui(ins, pc, size, index):
+            return xset(ins.rd, (sign_extend(ins.imm, 6) << 12) & MASK)
+
+        @emitter(rvc.CAndi)
+        def emit_candi(ins, pc, size, index):
+            imm = sign_extend(ins.imm, 6) & MASK
+            return xset(ins.rd, "x[{}] & {}".format(ins.rs.num, imm))
+
+        cregops = {
+            rvc.CSub: "(x[{0}] - x[{1}]) & 0xFFFFFFFF",
+            rvc.CXor: "x[{0}] ^ x[{1}]",
+            rvc.COr: "x[{0}] | x[{1}]",
+            rvc.CAnd: "x[{0}] & x[{1}]",
+        }
+
+        @emitter(*cregops)
+        def emit_cregreg(ins, pc, size, index):
+            expr = cregops[type(ins)].format(ins.rd.num, ins.rn.num)
+            return xset(ins.rd, expr)
+
+        branches = {
+            rv.Beq: "x[{0}] == x[{1}]",
+            rv.Bne: "x[{0}] != x[{1}]",
+            rv.Blt: "signed(x[{0}]) < signed(x[{1}])",
+            rv.Bge: "signed(x[{0}]) >= signed(x[{1}])",
+            rv.Bltu: "x[{0}] < x[{1}]",
+            rv.Bgeu: "x[{0}] >= x[{1}]",
+            rv.Bgt: "signed(x[{0}]) > signed(x[{1}])",
+            rv.Ble: "signed(x[{0}]) <= signed(x[{1}])",
+            rv.Bgtu: "x[{0}] > x[{1}]",
+            rv.Bleu: "x[{0}] <= x[{1}]",
+        }
+
+        @emitter(*branches)
+        def emit_branch(ins, pc, size, index):
+            condition = branches[type(ins)].format(ins.rn.num, ins.rm.num)
+            return [
+                "return {} if {} else {}".format(
+                    target(ins), condition, pc + size
+                )
+            ]
+
+        @emitter(rvc.CBeqz, rvc.CBnez)
+        def emit_cbranch(ins, pc, size, index):
+            op = "==" if isinstance(ins, rvc.CBeqz) else "!="
+            return [
+                "return {} if x[{}] {} 0 else {}".format(
+                    target(ins), ins.rn.num, op, pc + size
+                )
+            ]
+
+        @emitter(rv.B, rvc.CJ)
+        def emit_jump(ins, pc, size, index):
+            return ["return {}".format(target(ins))]
+
+        @emitter(rv.Bl, rvc.CJal)
+        def emit_call(ins, pc, size, index):
+            rd = ins.rd if isinstance(ins, rv.Bl) else rv.LR
+            return xset(rd, pc + size) + ["return {}".format(target(ins))]
+
+        @emitter(rv.Blr, rvc.CJr, rvc.CJalr)
+        def emit_jump_register(ins, pc, size, index):
+            if isinstance(ins, rv.Blr):
+                rd, offset = ins.rd, sign_extend(ins.offset, 12)
+            elif isinstance(ins, rvc.CJalr):
+                rd, offset = rv.LR, 0
+            else:
+                rd, offset = rv.R0, 0
+            code = [
+                "t = (x[{}] + {}) & {}".format(ins.rs1.num, offset, mask - 1)
+            ]
+            return code + xset(rd, pc + size) + ["return t"]
+
+        @emitter(rv.Ebreak, rvc.CEbreak)
+        def emit_ebreak(ins, pc, size, index):
+            return ["s.halted = True", "return {}".format(pc + size)]
+
+        @emitter(rv.Mret)
+        def emit_mret(ins, pc, size, index):
+            return ["return s.csrs.get({}, 0)".format(MEPC)]
+
+        counters = {
+            rv.Rdcyclei: "(s.instret + {}) & MASK",
+            rv.Rdtimei: "(s.instret + {}) & MASK",
+            rv.Rdinstreti: "(s.instret + {}) & MASK",
+            rv.Rdcyclehi: "(s.instret + {}) >> 32",
+            rv.Rdtimehi: "(s.instret + {}) >> 32",
+            rv.Rdinstrethi: "(s.instret + {}) >> 32",
+        }
+
+        @emitter(*counters)
+        def emit_counter(ins, pc, size, index):
+            return xset(ins.rd, counters[type(ins)].format(index))
+
+        @emitter(rv.Csrr)
+        def emit_csrr(ins, pc, size, index):
+            return xset(ins.rd, "s.csrs.get({}, 0)".format(ins.rm.num))
+
+        @emitter(rv.Csrw)
+        def emit_csrw(ins, pc, size, index):
+            return ["s.csrs[{}] = x[{}]".format(ins.rd.num, ins.rm.num)]
+
+        @emitter(rv.Csrs)
+        def emit_csrs(ins, pc, size, index):
+            return [
+                "s.csrs[{0}] = s.csrs.get({0}, 0) | x[{1}]".format(
+                    ins.rd.num, ins.rm.num
+                )
+            ]
+
+        csriops = {
+            rv.Csrwi: "s.csrs[{0}] = {1}",
+            rv.Csrsi: "s.csrs[{0}] = s.csrs.get({0}, 0) | {1}",
+            rv.Csrci: "s.csrs[{0}] = s.csrs.get({0}, 0) & ~{1}",
+        }
+
+        @emitter(*csriops)
+        def emit_csri(ins, pc, size, index):
+            return [csriops[type(ins)].format(ins.rd.num, ins.imm)]
+
+        fops = {
+            rvf.FAdd: "f32(f[{0}] + f[{1}])",
+            rvf.FSub: "f32(f[{0}] - f[{1}])",
+            rvf.FMul: "f32(f[{0}] * f[{1}])",
+            rvf.FDiv: "fdiv(f[{0}], f[{1}])",
+            rvf.FSgnj: "math.copysign(f[{0}], f[{1}])",
+            rvf.FSgnjn: "math.copysign(f[{0}], -math.copysign(1.0, f[{1}]))",
+            rvf.FSgnjx: "fsgnjx(f[{0}], f[{1}])",
+        }
+
+        dops = {
+            rvd.FAddD: "f[{0}] + f[{1}]",
+            rvd.FSubD: "f[{0}] - f[{1}]",
+            rvd.FMulD: "f[{0}] * f[{1}]",
+            rvd.FDivD: "ddiv(f[{0}], f[{1}])",
+            rvd.FSgnjD: "math.copysign(f[{0}], f[{1}])",
+            rvd.FSgnjnD: "math.copysign(f[{0}], -math.copysign(1.0, f[{1}]))",
+            rvd.FSgnjxD: "fsgnjx(f[{0}], f[{1}])",
+            rvd.FMinD: "min(f[{0}], f[{1}])",
+            rvd.FMaxD: "max(f[{0}], f[{1}])",
+        }
+        fops.update(dops)
+
+        @emitter(*fops)
+        def emit_fop(ins, pc, size, index):
+            expr = fops[type(ins)].format(ins.rn.num, ins.rm.num)
+            return ["f[{}] = {}".format(ins.rd.num, expr)]
+
+        # The product is rounded before the addition, python has no fused
+        # multiply add:
+        fusedops = {
+            rvd.FMaddD: "f[{0}] * f[{1}] + f[{2}]",
+            rvd.FMsubD: "f[{0}] * f[{1}] - f[{2}]",
+            rvd.FNmsubD: "f[{2}] - f[{0}] * f[{1}]",
+            rvd.FNmaddD: "-(f[{0}] * f[{1}]) - f[{2}]",
+        }
+
+        @emitter(*fusedops)
+        def emit_fused(ins, pc, size, index):
+            expr = fusedops[type(ins)].format(
+                ins.rn.num, ins.rm.num, ins.ra.num
+            )
+            return ["f[{}] = {}".format(ins.rd.num, expr)]
+
+        funops = {
+            rvd.FSqrtD: "fsqrt(f[{}])",
+            rvd.Fcvtsd: "f32(f[{}])",
+            rvd.Fcvtds: "f[{}]",
+            rvd.Fcvtdw: "float(signed(x[{}]))",
+            rvd.Fcvtdwu: "float(x[{}])",
+        }
+
+        @emitter(*funops)
+        def emit_funop(ins, pc, size, index):
+            expr = funops[type(ins)].format(ins.rm.num)
+            return ["f[{}] = {}".format(ins.rd.num, expr)]
+
+        fcmps = {
+            rvf.Feq: "f[{0}] == f[{1}]",
+            rvf.Flt: "f[{0}] < f[{1}]",
+            rvf.Fle: "f[{0}] <= f[{1}]",
+            rvd.FeqD: "f[{0}] == f[{1}]",
+            rvd.FltD: "f[{0}] < f[{1}]",
+            rvd.FleD: "f[{0}] <= f[{1}]",
+        }
+
+        @emitter(*fcmps)
+        def emit_fcmp(ins, pc, size, index):
+            expr = fcmps[type(ins)].format(ins.rn.num, ins.rm.num)
+            return xset(ins.rd, "int({})".format(expr))
+
+        @emitter(rvf.FLw)
+        def emit_flw(ins, pc, size, index):
+            return [
+                "f[{}] = bits2f(ld_w((x[{}] + {}) & 0xFFFFFFFF))".format(
+                    ins.rd.num, ins.rs1.num, ins.offset
+                )
+            ]
+
+        @emitter(rvf.FSw)
+        def emit_fsw(ins, pc, size, index):
+            return [
+                "st_w((x[{}] + {}) & 0xFFFFFFFF, f2bits(f[{}]))".format(
+                    ins.rs1.num, ins.offset, ins.rs2.num
+                )
+            ]
+
+        @emitter(rvd.FLd)
+        def emit_fld(ins, pc, size, index):
+            return [
+                "f[{}] = ld_fd((x[{}] + {}) & MASK)".format(
+                    ins.rd.num, ins.rs1.num, ins.offset
+                )
+            ]
+
+        @emitter(rvd.FSd)
+        def emit_fsd(ins, pc, size, index):
+            return [
+                "st_fd((x[{}] + {}) & MASK, f[{}])".format(
+                    ins.rs1.num, ins.offset, ins.rs2.num
+                )
+            ]
+
+        @emitter(rvf.Movxs)
+        def emit_movxs(ins, pc, size, index):
+            return xset(ins.rd, "f2bits(f[{}])".format(ins.rm.num))
+
+        @emitter(rvf.Movsx)
+        def emit_movsx(ins, pc, size, index):
+            return ["f[{}] = bits2f(x[{}])".format(ins.rd.num, ins.rm.num)]
+
+        @emitter(rvf.Fcvtsw, rvf.Fcvtswu)
+        def emit_fcvt_from_int(ins, pc, size, index):
+            if isinstance(ins, rvf.Fcvtsw):
+                value = "signed(x[{}])".format(ins.rm.num)
+            else:
+                value = "x[{}]".format(ins.rm.num)
+            return ["f[{}] = f32(float({}))".format(ins.rd.num, value)]
+
+        @emitter(rvf.Fcvtws, rvf.Fcvtwus, rvd.Fcvtwd, rvd.Fcvtwud)
+        def emit_fcvt_to_int(ins, pc, size, index):
+            if isinstance(ins, (rvf.Fcvtws, rvd.Fcvtwd)):
+                low, high = -(1 << 31), (1 << 31) - 1
+            else:
+                low, high = 0, MASK
+            rounding = getattr(ins, "rounding", 7)
+            if rounding == 7:
+                # Dynamic rounding mode:
+                rounding = "s.csrs.get({}, 0) & 7".format(FRM)
+            expr = "fcvt(f[{}], {}, {}, {})".format(
+                ins.rm.num, rounding, low, high
+            )
+            return xset(ins.rd, expr)
+
+        condops = {
+            zc.CzeroEqz: "0 if x[{2}] == 0 else x[{1}]",
+            zc.CzeroNez: "0 if x[{2}] else x[{1}]",
+        }
+
+        @emitter(*condops)
+        def emit_condop(ins, pc, size, index):
+            expr = condops[type(ins)].format(0, ins.rn.num, ins.rm.num)
+            return xset(ins.rd, expr)
+
+        pulpops = {
+            xp.PMin: "min(x[{1}], x[{2}], key=signed)",
+            xp.PMinu: "min(x[{1}], x[{2}])",
+            xp.PMax: "max(x[{1}], x[{2}], key=signed)",
+            xp.PMaxu: "max(x[{1}], x[{2}])",
+            xp.PRor: "rol(x[{1}], -x[{2}])",
+            xp.PMac: "(x[{0}] + x[{1}] * x[{2}]) & MASK",
+            xp.PMsu: "(x[{0}] - x[{1}] * x[{2}]) & MASK",
+        }
+
+        @emitter(*pulpops)
+        def emit_pulpop(ins, pc, size, index):
+            expr = pulpops[type(ins)].format(
+                ins.rd.num, ins.rn.num, ins.rm.num
+            )
+            return xset(ins.rd, expr)
+
+        pulpunops = {
+            xp.PAbs: "abs(signed(x[{0}])) & MASK",
+            xp.PExths: "(((x[{0}] & 0xFFFF) ^ 0x8000) - 0x8000) & MASK",
+            xp.PExthz: "x[{0}] & 0xFFFF",
+            xp.PExtbs: "(((x[{0}] & 0xFF) ^ 0x80) - 0x80) & MASK",
+            xp.PExtbz: "x[{0}] & 0xFF",
+            xp.PCnt: 'bin(x[{0}]).count("1")',
+        }
+
+        @emitter(*pulpunops)
+        def emit_pulpunop(ins, pc, size, index):
+            return xset(ins.rd, pulpunops[type(ins)].format(ins.rs1.num))
+
+        @emitter(xp.PClip, xp.PClipu)
+        def emit_clip(ins, pc, size, index):
+            bound = (1 << ins.imm) >> 1
+            low = -bound if isinstance(ins, xp.PClip) else 0
+            expr = "min(max(signed(x[{}]), {}), {}) & MASK".format(
+                ins.rs1.num, low, max(bound - 1, low)
+            )
+            return xset(ins.rd, expr)
+
+        post_loads = {
+            xp.PLb: "ld_b(x[{}]) & MASK",
+            xp.PLh: "ld_h(x[{}]) & MASK",
+            xp.PLw: "ld_w(x[{}])",
+            xp.PLbu: "ld_bu(x[{}])",
+            xp.PLhu: "ld_hu(x[{}])",
+        }
+
+        @emitter(*post_loads)
+        def emit_post_load(ins, pc, size, index):
+            rs1 = ins.rs1.num
+            # The base is updated before the loaded value is written, so
+            # that a load into the base register keeps the loaded value:
+            code = ["t = " + post_loads[type(ins)].format(rs1)]
+            code += xset(
+                ins.rs1, "(x[{}] + {}) & MASK".format(rs1, ins.offset)
+            )
+            return code + xset(ins.rd, "t")
+
+        post_stores = {xp.PSb: "st_b", xp.PSh: "st_h", xp.PSw: "st_w"}
+
+        @emitter(*post_stores)
+        def emit_post_store(ins, pc, size, index):
+            rs1 = ins.rs1.num
+            code = [
+                "{}(x[{}], x[{}] & {})".format(
+                    post_stores[type(ins)],
+                    rs1,
+                    ins.rs2.num,
+                    store_masks[post_stores[type(ins)]],
+                )
+            ]
+            return code + xset(
+                ins.rs1, "(x[{}] + {}) & MASK".format(rs1, ins.offset)
+            )
+
+        @emitter(xp.LpStarti)
+        def emit_lp_starti(ins, pc, size, index):
+            return [
+                "s.loop_start[{}] = {}".format(ins.loop, target(ins)),
+                "return {}".format(pc + size),
+            ]
+
+        @emitter(xp.LpEndi)
+        def emit_lp_endi(ins, pc, size, index):
+            self.add_loop_end(target(ins))
+            return [
+                "s.loop_end[{}] = {}".format(ins.loop, target(ins)),
+                "return {}".format(pc + size),
+            ]
+
+        @emitter(xp.LpCount, xp.LpCounti)
+        def emit_lp_count(ins, pc, size, index):
+            if isinstance(ins, xp.LpCount):
+                count = "x[{}]".format(ins.rs1.num)
+            else:
+                count = ins.count
+            return [
+                "s.loop_count[{}] = {}".format(ins.loop, count),
+                "return {}".format(pc + size),
+            ]
+
+        @emitter(xp.LpSetup, xp.LpSetupi)
+        def emit_lp_setup(ins, pc, size, index):
+            if isinstance(ins, xp.LpSetup):
+                count = "x[{}]".format(ins.rs1.num)
+            else:
+                count = ins.count
+            self.add_loop_end(target(ins))
+            return [
+                "s.loop_start[{}] = {}".format(ins.loop, pc + size),
+                "s.loop_end[{}] = {}".format(ins.loop, target(ins)),
+                "s.loop_count[{}] = {}".format(ins.loop, count),
+                "return {}".format(pc + size),
+            ]
+
+        @emitter(*rvv.vsetvli.values(), *rvv.vsetivli.values(), rvv.Vsetvl)
+        def emit_vsetvl(ins, pc, size, index):
+            if isinstance(ins, rvv.Vsetvl):
+                vtype = "x[{}]".format(ins.rs2.num)
+            else:
+                vtype = rvv.encode_vtype(ins.sew, ins.lmul)
+            if not hasattr(ins, "rs1"):
+                avl = ins.avl
+            elif ins.rs1.num:
+                avl = "x[{}]".format(ins.rs1.num)
+            elif ins.rd.num:
+                # The maximum vector length is requested:
+                avl = "MASK"
+            else:
+                avl = "s.vl"
+            expr = "s.set_vector_type({}, {})".format(avl, vtype)
+            return xset(ins.rd, expr) or [expr]
+
+        @emitter(rvv.Vle8, rvv.Vle16, rvv.Vle32, rvv.Vle64)
+        def emit_vector_load(ins, pc, size, index):
+            return [
+                "s.vector_load({}, x[{}], {})".format(
+                    ins.vd.num, ins.rs1.num, ins.sew // 8
+                )
+            ]
+
+        @emitter(rvv.Vse8, rvv.Vse16, rvv.Vse32, rvv.Vse64)
+        def emit_vector_store(ins, pc, size, index):
+            return [
+                "s.vector_store({}, x[{}], {})".format(
+                    ins.vs3.num, ins.rs1.num, ins.sew // 8
+                )
+            ]
+
+        def vector_operand(ins):
+            """ Python code for the second operand of a vector operation """
+            if hasattr(ins, "vs1"):
+                return "s.read_elements({})".format(ins.vs1.num)
+            elif hasattr(ins, "rs1"):
+                return "s.vector_scalar(x[{}])".format(ins.rs1.num)
+            else:
+                return "s.vector_scalar({})".format(ins.imm)
+
+        vector_classes = [
+            cls
+            for cls in rvv.rvvisa.instructions
+            if cls.__name__[-2:] in ("Vv", "Vx", "Vi")
+            and not cls.__name__.startswith(("Vmv", "Vmacc"))
+        ]
+
+        @emitter(*vector_classes)
+        def emit_vector_op(ins, pc, size, index):
+            name = type(ins).__name__[1:-2].lower()
+            return [
+                "s.vector_op({!r}, {}, {}, {})".format(
+                    name, ins.vd.num, ins.vs2.num, vector_operand(ins)
+                )
+            ]
+
+        @emitter(rvv.VmaccVv, rvv.VmaccVx)
+        def emit_vector_macc(ins, pc, size, index):
+            return [
+                "s.vector_macc({}, {}, {})".format(
+                    ins.vd.num, vector_operand(ins), ins.vs2.num
+                )
+            ]
+
+        reduction_classes = [
+            cls
+            for cls in rvv.rvvisa.instructions
+            if cls.__name__.startswith("Vred")
+        ]
+
+        @emitter(*reduction_classes)
+        def emit_vector_reduce(ins, pc, size, index):
+            name = type(ins).__name__[4:-2].lower()
+            name = "add" if name == "sum" else name
+            return [
+                "s.vector_reduce({!r}, {}, {}, {})".format(
+                    name, ins.vd.num, ins.vs2.num, ins.vs1.num
+                )
+            ]
+
+        @emitter(rvv.VmvVv, rvv.VmvVx, rvv.VmvVi)
+        def emit_vector_move(ins, pc, size, index):
+            return [
+                "s.vector_move({}, {})".format(
+                    ins.vd.num, vector_operand(ins)
+                )
+            ]
+
+        @emitter(rvv.VmvXs)
+        def emit_move_to_scalar(ins, pc, size, index):
+            return xset(ins.rd, "s.move_to_scalar({})".format(ins.vs2.num))
+
+        @emitter(rvv.VmvSx)
+        def emit_move_to_vector(ins, pc, size, index):
+            return [
+                "s.move_to_vector({}, x[{}])".format(ins.vd.num, ins.rs1.num)
+            ]
+
+        return emitters
+
+
+# Instructions which end a basic block:
+_control_classes = (
+    rv.BranchBase,
+    rv.B,
+    rv.Bl,
+    rv.Blr,
+    rv.Ebreak,
+    rv.Mret,
+    rvc.CJ,
+    rvc.CJal,
+    rvc.CJr,
+    rvc.CJalr,
+    rvc.CBeqz,
+    rvc.CBnez,
+    rvc.CEbreak,
+    xp.LoopInstruction,
+)
+
+_namespace = {
+    "math": math,
+    "sext32": sext32,
+    "f32": f32,
+    "fdiv": fdiv,
+    "ddiv": ddiv,
+    "fsqrt": fsqrt,
+    "fsgnjx": fsgnjx,
+    "f2bits": f2bits,
+    "bits2f": bits2f,
+    "fcvt": fcvt,
+    "rol": rol,
+    "ctz": ctz,
+    "orc_b": orc_b,
+}
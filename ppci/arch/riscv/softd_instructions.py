@@ -0,0 +1,326 @@
+"""Double precision floating point values without the D extension.
+
+Doubles are kept in aligned pairs of integer registers, with the low word
+in the first register. The operations on doubles call the double precision
+functions of the runtime. The pair instructions stand for instructions on
+the registers of the pairs, which are only known after register
+allocation.
+"""
+
+import struct
+from ..isa import Isa
+from ..encoding import Syntax, Operand
+from ..generic_instructions import ArtificialInstruction
+from ..generic_instructions import RegisterUseDef, Global
+from ...utils.bitfun import sign_extend
+from .registers import RiscvRegister, RiscvFRegister, RiscvPairRegister
+from .registers import LR, R0, R5, R10, R11, R12, R13, R14, R15
+from .registers import P10, P12, P14
+from .instructions import Movr, Li, Lui, Xorr, Lw, Sw
+from .instructions import B, Blt, Bgt, Beq, Bne, Bge, Ble
+from .rvf_instructions import Movsx
+
+softdisa = Isa()
+
+# The conversions between doubles and the floating point registers of the
+# F extension:
+softd_rvf_isa = Isa()
+
+
+class PairInstruction(ArtificialInstruction):
+    """An instruction on the registers of pairs.
+
+    These are not part of an isa, since the assembler has no syntax for
+    pairs of registers.
+    """
+
+    def render(self):  # pragma: no cover
+        raise NotImplementedError()
+
+
+class MovePair(PairInstruction):
+    rd = Operand("rd", RiscvPairRegister, write=True)
+    rm = Operand("rm", RiscvPairRegister, read=True)
+    syntax = Syntax(["mv", " ", rd, ",", " ", rm])
+
+    def render(self):
+        rd, rm = self.rd, self.rm
+        yield from move_words((rd.lo, rd.hi), (rm.lo, rm.hi))
+
+
+class SplitPair(PairInstruction):
+    """ Move the words of a pair into two registers """
+
+    rd = Operand("rd", RiscvRegister, write=True)
+    rd2 = Operand("rd2", RiscvRegister, write=True)
+    rm = Operand("rm", RiscvPairRegister, read=True)
+    syntax = Syntax(["split", " ", rd, ",", " ", rd2, ",", " ", rm])
+
+    def render(self):
+        yield from move_words((self.rd, self.rd2), (self.rm.lo, self.rm.hi))
+
+
+class JoinPair(PairInstruction):
+    """ Move two registers into the words of a pair """
+
+    rd = Operand("rd", RiscvPairRegister, write=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    rm2 = Operand("rm2", RiscvRegister, read=True)
+    syntax = Syntax(["join", " ", rd, ",", " ", rm, ",", " ", rm2])
+
+    def render(self):
+        yield from move_words((self.rd.lo, self.rd.hi), (self.rm, self.rm2))
+
+
+class LiPair(PairInstruction):
+    """ Load the 64 bits imm into a pair """
+
+    rd = Operand("rd", RiscvPairRegister, write=True)
+    imm = Operand("imm", int)
+    syntax = Syntax(["li", " ", rd, ",", " ", imm])
+
+    def render(self):
+        yield Li(self.rd.lo, sign_extend(self.imm & 0xFFFFFFFF, 32))
+        yield Li(self.rd.hi, sign_extend(self.imm >> 32, 32))
+
+
+class LoadPair(PairInstruction):
+    rd = Operand("rd", RiscvPairRegister, write=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["lw", " ", rd, ",", " ", offset, "(", rs1, ")"])
+    fprel = False
+
+    def render(self):
+        words = [(self.rd.lo, self.offset), (self.rd.hi, self.offset + 4)]
+        if self.rs1.num == self.rd.lo.num:
+            # Load the high word first, which keeps the address:
+            words.reverse()
+        for register, offset in words:
+            load = Lw(register, offset, self.rs1)
+            load.fprel = self.fprel
+            yield load
+
+
+class StorePair(PairInstruction):
+    rs2 = Operand("rs2", RiscvPairRegister, read=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["sw", " ", rs2, ",", " ", offset, "(", rs1, ")"])
+    fprel = False
+
+    def render(self):
+        for register, offset in ((self.rs2.lo, 0), (self.rs2.hi, 4)):
+            store = Sw(register, self.offset + offset, self.rs1)
+            store.fprel = self.fprel
+            yield store
+
+
+def move_words(destinations, sources):
+    """Move two registers into two other registers.
+
+    The moves are ordered such that no source is overwritten before it
+    is moved. Registers which swap places are swapped using x5.
+    """
+    (d1, d2), (s1, s2) = destinations, sources
+    if d1.num == s2.num and d2.num == s1.num:
+        yield Movr(R5, s1)
+        yield Movr(d2, s2)
+        yield Movr(d1, R5)
+        return
+    moves = [(d1, s1), (d2, s2)]
+    if d1.num == s2.num:
+        moves.reverse()
+    for dst, src in moves:
+        if dst.num != src.num:
+            yield Movr(dst, src)
+
+
+def split_pair_instructions(instructions):
+    """Replace the pair instructions by instructions on their registers.
+
+    This is done after register allocation, when the registers of the
+    pairs are known.
+    """
+    for instruction in instructions:
+        if isinstance(instruction, PairInstruction):
+            yield from instruction.render()
+        else:
+            yield instruction
+
+
+# The double precision functions of the runtime only write these
+# registers, next to temporaries which are not available to the register
+# allocator:
+runtime_clobbers = (R10, R11, R12, R13, R14, R15)
+
+
+def call_runtime(context, name, arguments, result):
+    """Call a double precision function of the runtime.
+
+    The arguments are pairs of a register and the value to pass in it.
+    Doubles are passed in x12:x13 and x14:x15, other values in x12. The
+    result is returned in x10, or x10:x11 for a double.
+    """
+    registers = []
+    for register, value in arguments:
+        context.move(register, value)
+        registers.append(register)
+    context.emit(RegisterUseDef(uses=registers))
+    context.emit(Global(name))
+    context.emit(context.arch.branch(LR, name, clobbers=runtime_clobbers))
+    context.emit(RegisterUseDef(defs=(result,)))
+    d = context.new_reg(type(result))
+    context.move(d, result)
+    return d
+
+
+# Instruction selection patterns:
+@softdisa.pattern("pair", "REGF64", size=0)
+def pattern_reg(context, tree):
+    return tree.value
+
+
+@softdisa.pattern("stm", "MOVF64(pair)", size=4)
+def pattern_mov(context, tree, c0):
+    context.move(tree.value, c0)
+    return tree.value
+
+
+@softdisa.pattern("pair", "CONSTF64", size=16)
+def pattern_const(context, tree):
+    (value,) = struct.unpack("<Q", struct.pack("<d", tree.value))
+    d = context.new_reg(RiscvPairRegister)
+    context.emit(LiPair(d, value))
+    return d
+
+
+@softdisa.pattern("pair", "LDRF64(mem)", size=4)
+def pattern_ldr_fprel(context, tree, c0):
+    d = context.new_reg(RiscvPairRegister)
+    base_reg, offset = c0
+    code = LoadPair(d, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+    return d
+
+
+@softdisa.pattern("pair", "LDRF64(reg)", size=4)
+def pattern_ldr(context, tree, c0):
+    d = context.new_reg(RiscvPairRegister)
+    context.emit(LoadPair(d, 0, c0))
+    return d
+
+
+@softdisa.pattern("stm", "STRF64(mem, pair)", size=4)
+def pattern_str_fprel(context, tree, c0, c1):
+    base_reg, offset = c0
+    code = StorePair(c1, offset, base_reg)
+    code.fprel = True
+    context.emit(code)
+
+
+@softdisa.pattern("stm", "STRF64(reg, pair)", size=4)
+def pattern_str(context, tree, c0, c1):
+    context.emit(StorePair(c1, 0, c0))
+
+
+@softdisa.pattern("pair", "ADDF64(pair, pair)", size=20)
+def pattern_add(context, tree, c0, c1):
+    return call_runtime(context, "__adddf3", ((P12, c0), (P14, c1)), P10)
+
+
+@softdisa.pattern("pair", "SUBF64(pair, pair)", size=20)
+def pattern_sub(context, tree, c0, c1):
+    return call_runtime(context, "__subdf3", ((P12, c0), (P14, c1)), P10)
+
+
+@softdisa.pattern("pair", "MULF64(pair, pair)", size=20)
+def pattern_mul(context, tree, c0, c1):
+    return call_runtime(context, "__muldf3", ((P12, c0), (P14, c1)), P10)
+
+
+@softdisa.pattern("pair", "DIVF64(pair, pair)", size=20)
+def pattern_div(context, tree, c0, c1):
+    return call_runtime(context, "__divdf3", ((P12, c0), (P14, c1)), P10)
+
+
+@softdisa.pattern("pair", "NEGF64(pair)", size=10)
+def pattern_neg(context, tree, c0):
+    # Flip the sign bit in the high word:
+    lo = context.new_reg(RiscvRegister)
+    hi = context.new_reg(RiscvRegister)
+    t = context.new_reg(RiscvRegister)
+    context.emit(SplitPair(lo, hi, c0))
+    context.emit(Lui(t, 0x80000))
+    context.emit(Xorr(t, hi, t))
+    d = context.new_reg(RiscvPairRegister)
+    context.emit(JoinPair(d, lo, t))
+    return d
+
+
+@softdisa.pattern("reg", "F64TOI32(pair)", size=20)
+@softdisa.pattern("reg", "F64TOI16(pair)", size=20)
+@softdisa.pattern("reg", "F64TOI8(pair)", size=20)
+def pattern_ftoi(context, tree, c0):
+    return call_runtime(context, "__fixdfsi", ((P12, c0),), R10)
+
+
+@softdisa.pattern("reg", "F64TOU32(pair)", size=20)
+@softdisa.pattern("reg", "F64TOU16(pair)", size=20)
+@softdisa.pattern("reg", "F64TOU8(pair)", size=20)
+def pattern_ftou(context, tree, c0):
+    return call_runtime(context, "__fixunsdfsi", ((P12, c0),), R10)
+
+
+@softdisa.pattern("pair", "I32TOF64(reg)", size=20)
+def pattern_itof(context, tree, c0):
+    return call_runtime(context, "__floatsidf", ((R12, c0),), P10)
+
+
+@softdisa.pattern("pair", "U32TOF64(reg)", size=20)
+def pattern_utof(context, tree, c0):
+    return call_runtime(context, "__floatunsidf", ((R12, c0),), P10)
+
+
+@softdisa.pattern("pair", "F32TOF64(reg)", size=20)
+def pattern_f32_to_f64(context, tree, c0):
+    return call_runtime(context, "__extendsfdf2", ((R12, c0),), P10)
+
+
+@softdisa.pattern("reg", "F64TOF32(pair)", size=20)
+def pattern_f64_to_f32(context, tree, c0):
+    return call_runtime(context, "__truncdfsf2", ((P12, c0),), R10)
+
+
+@softdisa.pattern("stm", "CJMPF64(pair, pair)", size=20)
+def pattern_cjmp(context, tree, c0, c1):
+    # The comparison functions return a value which compares to zero
+    # like the operands compare to each other:
+    op, yes_label, no_label = tree.value
+    opnames = {
+        "<": ("__ltdf2", Blt),
+        ">": ("__gtdf2", Bgt),
+        "==": ("__eqdf2", Beq),
+        "!=": ("__nedf2", Bne),
+        ">=": ("__gedf2", Bge),
+        "<=": ("__ledf2", Ble),
+    }
+    name, Bop = opnames[op]
+    jmp_ins = B(no_label.name, jumps=[no_label])
+    d = call_runtime(context, name, ((P12, c0), (P14, c1)), R10)
+    context.emit(Bop(d, R0, yes_label.name, jumps=[yes_label, jmp_ins]))
+    context.emit(jmp_ins)
+
+
+@softd_rvf_isa.pattern("pair", "F32TOF64(freg)", size=20)
+def pattern_freg_to_f64(context, tree, c0):
+    return call_runtime(context, "__extendsfdf2", ((R12, c0),), P10)
+
+
+@softd_rvf_isa.pattern("freg", "F64TOF32(pair)", size=20)
+def pattern_f64_to_freg(context, tree, c0):
+    d = context.new_reg(RiscvFRegister)
+    value = call_runtime(context, "__truncdfsf2", ((P12, c0),), R10)
+    context.emit(Movsx(d, value))
+    return d
@@ -35,6 +35,40 @@ class RiscvSToken(Token):
     imm = bit_concat(bit_range(25, 32), bit_range(7, 12))
 
 
+class RiscvShiftToken(Token):
+    class Info:
+        size = 32
+
+    opcode = bit_range(0, 7)
+    rd = bit_range(7, 12)
+    funct3 = bit_range(12, 15)
+    rs1 = bit_range(15, 20)
+    shamt = bit_range(20, 26)
+    funct6 = bit_range(26, 32)
+
+
+class RiscvR4Token(Token):
+    class Info:
+        size = 32
+
+    opcode = bit_range(0, 7)
+    rd = bit_range(7, 12)
+    funct3 = bit_range(12, 15)
+    rs1 = bit_range(15, 20)
+    rs2 = bit_range(20, 25)
+    fmt = bit_range(25, 27)
+    rs3 = bit_range(27, 32)
+
+
+class RiscvUToken(Token):
+    class Info:
+        size = 32
+
+    opcode = bit_range(0, 7)
+    rd = bit_range(7, 12)
+    imm = bit_range(12, 32)
+
+
 class RiscvSBToken(Token):
     class Info:
         size = 32
@@ -46,6 +80,21 @@ class RiscvSBToken(Token):
     imm = bit(31) + bit(7) + bit_range(25, 31) + bit_range(8, 12)
 
 
+class RiscvVToken(Token):
+    """ The format of the vector arithmetic, load and store instructions """
+
+    class Info:
+        size = 32
+
+    opcode = bit_range(0, 7)
+    rd = bit_range(7, 12)
+    funct3 = bit_range(12, 15)
+    rs1 = bit_range(15, 20)
+    rs2 = bit_range(20, 25)
+    vm = bit(25)
+    funct6 = bit_range(26, 32)
+
+
 class RiscvcToken(Token):
     class Info:
         size = 16
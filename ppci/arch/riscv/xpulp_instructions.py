@@ -0,0 +1,709 @@
+"""Definitions of the Xpulp extensions of the PULP RI5CY core.
+
+The extensions contain hardware loops, loads and stores which increment
+their base register after the access, a multiply accumulate instruction
+and a number of alu instructions, such as clip, abs, min and max.
+
+A hardware loop repeats the instructions in between the instruction
+after lp.setup and the end label a number of times, without a branch:
+
+    lp.setup 0, x12, end
+    p.lw x13, 4(x10!)
+    p.mac x14, x13, x13
+    end:
+
+The loop level, 0 or 1, is written as a number. There are two levels of
+hardware loops, the innermost loop uses level 0. The last instruction of
+a loop body cannot be a jump or a branch.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from ..generic_instructions import Label, RegisterUseDef, InlineAssembly
+from .registers import RiscvRegister
+from .tokens import RiscvToken, RiscvIToken, RiscvSToken
+from .relocations import LoopUImm12Relocation, LoopUImm5Relocation
+from .instructions import Addi, Subr, Nop, B, Lb, Lbu, Lh, Lhu, Lw
+from .instructions import Sb, Sh, Sw, Li, Blt, Bltu, Bgt, Bgtu
+from .rvc_instructions import Addiv, CB
+from .rvc_instructions import expand_instruction, instruction_size
+
+xpulpisa = Isa()
+xpulpisa.register_relocation(LoopUImm12Relocation)
+xpulpisa.register_relocation(LoopUImm5Relocation)
+
+# The hardware needs at least this number of instructions in a loop body:
+MIN_HARDWARE_LOOP_SIZE = 3
+
+
+class XpulpInstruction(Instruction):
+    tokens = [RiscvToken]
+    isa = xpulpisa
+
+
+def make_regregreg(mnemonic, funct7, funct3):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rn = Operand("rn", RiscvRegister, read=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(["p", ".", name, " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": funct7,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PMin = make_regregreg("p.min", 0b0000010, 0b100)
+PMinu = make_regregreg("p.minu", 0b0000010, 0b101)
+PMax = make_regregreg("p.max", 0b0000010, 0b110)
+PMaxu = make_regregreg("p.maxu", 0b0000010, 0b111)
+PRor = make_regregreg("p.ror", 0b0000100, 0b101)
+
+
+def make_unary(mnemonic, funct7, funct3):
+    """ Factory function for the instructions with one register operand """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(["p", ".", name, " ", rd, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rs1,
+        "rs2": 0,
+        "funct7": funct7,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rs1": rs1,
+        "patterns": patterns,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PAbs = make_unary("p.abs", 0b0000010, 0b000)
+PExths = make_unary("p.exths", 0b0001000, 0b100)
+PExthz = make_unary("p.exthz", 0b0001000, 0b101)
+PExtbs = make_unary("p.extbs", 0b0001000, 0b110)
+PExtbz = make_unary("p.extbz", 0b0001000, 0b111)
+PCnt = make_unary("p.cnt", 0b0001000, 0b011)
+
+
+def make_clip(mnemonic, funct3):
+    """Factory function for the clip instructions.
+
+    These clip a value to the range of a signed number with imm bits, or
+    to the positive part of this range.
+    """
+    rd = Operand("rd", RiscvRegister, write=True)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    imm = Operand("imm", int)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(["p", ".", name, " ", rd, ",", " ", rs1, ",", " ", imm])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rs1,
+        "rs2": imm,
+        "funct7": 0b0001010,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rs1": rs1,
+        "imm": imm,
+        "patterns": patterns,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PClip = make_clip("p.clip", 0b001)
+PClipu = make_clip("p.clipu", 0b010)
+
+
+def make_mac(mnemonic, funct3):
+    """ Factory function for multiply accumulate, which adds to rd """
+    rd = Operand("rd", RiscvRegister, read=True, write=True)
+    rn = Operand("rn", RiscvRegister, read=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(["p", ".", name, " ", rd, ",", " ", rn, ",", " ", rm])
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": 0b0100001,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PMac = make_mac("p.mac", 0b000)
+PMsu = make_mac("p.msu", 0b001)
+
+
+def make_ldr_post(mnemonic, func):
+    """Factory function for loads which increment the base register.
+
+    The value is loaded from the address in rs1, and after that the
+    offset is added to rs1.
+    """
+    rd = Operand("rd", RiscvRegister, write=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True, write=True)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(
+        ["p", ".", name, " ", rd, ",", " ", offset, "(", rs1, "!", ")"]
+    )
+    patterns = {
+        "opcode": 0b0001011,
+        "rd": rd,
+        "funct3": func,
+        "rs1": rs1,
+        "imm": offset,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvIToken],
+        "patterns": patterns,
+        "offset": offset,
+        "rd": rd,
+        "rs1": rs1,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PLb = make_ldr_post("p.lb", 0b000)
+PLh = make_ldr_post("p.lh", 0b001)
+PLw = make_ldr_post("p.lw", 0b010)
+PLbu = make_ldr_post("p.lbu", 0b100)
+PLhu = make_ldr_post("p.lhu", 0b101)
+
+
+def make_str_post(mnemonic, func):
+    """ Factory function for stores which increment the base register """
+    rs2 = Operand("rs2", RiscvRegister, read=True)
+    offset = Operand("offset", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True, write=True)
+    name = mnemonic.split(".")[1]
+    syntax = Syntax(
+        ["p", ".", name, " ", rs2, ",", " ", offset, "(", rs1, "!", ")"]
+    )
+    patterns = {
+        "opcode": 0b0101011,
+        "funct3": func,
+        "rs1": rs1,
+        "rs2": rs2,
+        "imm": offset,
+    }
+    members = {
+        "syntax": syntax,
+        "tokens": [RiscvSToken],
+        "patterns": patterns,
+        "offset": offset,
+        "rs1": rs1,
+        "rs2": rs2,
+    }
+    return type("P" + name.title(), (XpulpInstruction,), members)
+
+
+PSb = make_str_post("p.sb", 0b000)
+PSh = make_str_post("p.sh", 0b001)
+PSw = make_str_post("p.sw", 0b010)
+
+
+class LoopInstruction(XpulpInstruction):
+    """ Base class of the instructions which set up a hardware loop """
+
+    tokens = [RiscvIToken]
+
+
+class LpStarti(LoopInstruction):
+    loop = Operand("loop", int)
+    target = Operand("target", str)
+    syntax = Syntax(["lp", ".", "starti", " ", loop, ",", " ", target])
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b000,
+        "rs1": 0,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [LoopUImm12Relocation(self.target)]
+
+
+class LpEndi(LoopInstruction):
+    loop = Operand("loop", int)
+    target = Operand("target", str)
+    syntax = Syntax(["lp", ".", "endi", " ", loop, ",", " ", target])
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b001,
+        "rs1": 0,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [LoopUImm12Relocation(self.target)]
+
+
+class LpCount(LoopInstruction):
+    loop = Operand("loop", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    syntax = Syntax(["lp", ".", "count", " ", loop, ",", " ", rs1])
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b010,
+        "rs1": rs1,
+        "imm": 0,
+    }
+
+
+class LpCounti(LoopInstruction):
+    loop = Operand("loop", int)
+    count = Operand("count", int)
+    syntax = Syntax(["lp", ".", "counti", " ", loop, ",", " ", count])
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b011,
+        "rs1": 0,
+        "imm": count,
+    }
+
+
+class LpSetup(LoopInstruction):
+    """Start a hardware loop, which runs rs1 times.
+
+    The loop body starts after this instruction and ends at the target.
+    """
+
+    loop = Operand("loop", int)
+    rs1 = Operand("rs1", RiscvRegister, read=True)
+    target = Operand("target", str)
+    syntax = Syntax(
+        ["lp", ".", "setup", " ", loop, ",", " ", rs1, ",", " ", target]
+    )
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b100,
+        "rs1": rs1,
+        "imm": 0,
+    }
+
+    def relocations(self):
+        return [LoopUImm12Relocation(self.target)]
+
+
+class LpSetupi(LoopInstruction):
+    """ Start a hardware loop with a constant count and a short body """
+
+    loop = Operand("loop", int)
+    count = Operand("count", int)
+    target = Operand("target", str)
+    syntax = Syntax(
+        ["lp", ".", "setupi", " ", loop, ",", " ", count, ",", " ", target]
+    )
+    patterns = {
+        "opcode": 0b1111011,
+        "rd": loop,
+        "funct3": 0b101,
+        "rs1": 0,
+        "imm": count,
+    }
+
+    def relocations(self):
+        return [LoopUImm5Relocation(self.target)]
+
+
+class HardwareLoopEnd(RegisterUseDef):
+    """Marks the end of a hardware loop body.
+
+    The end has no instruction, but the register allocator must know
+    that the loop body is repeated, so the marker jumps to the start of
+    the body and to the label after the body.
+    """
+
+    def __init__(self, jumps):
+        super().__init__()
+        self.jumps = jumps
+
+    def __repr__(self):
+        return "VLoopEnd"
+
+
+# Instruction selection patterns:
+@xpulpisa.pattern("reg", "ADDI32(reg, MULI32(reg, reg))", size=10)
+@xpulpisa.pattern("reg", "ADDU32(reg, MULU32(reg, reg))", size=10)
+def pattern_mac(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvRegister)
+    context.move(d, c0)
+    context.emit(PMac(d, c1, c2))
+    return d
+
+
+@xpulpisa.pattern("reg", "ADDI32(MULI32(reg, reg), reg)", size=10)
+@xpulpisa.pattern("reg", "ADDU32(MULU32(reg, reg), reg)", size=10)
+def pattern_mac_swapped(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvRegister)
+    context.move(d, c2)
+    context.emit(PMac(d, c0, c1))
+    return d
+
+
+@xpulpisa.pattern("reg", "SUBI32(reg, MULI32(reg, reg))", size=10)
+@xpulpisa.pattern("reg", "SUBU32(reg, MULU32(reg, reg))", size=10)
+def pattern_msu(context, tree, c0, c1, c2):
+    d = context.new_reg(RiscvRegister)
+    context.move(d, c0)
+    context.emit(PMsu(d, c1, c2))
+    return d
+
+
+@xpulpisa.pattern("reg", "I8TOI16(reg)", size=2)
+@xpulpisa.pattern("reg", "I8TOI32(reg)", size=2)
+def pattern_extbs(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(PExtbs(d, c0))
+    return d
+
+
+@xpulpisa.pattern("reg", "I16TOI32(reg)", size=2)
+def pattern_exths(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(PExths(d, c0))
+    return d
+
+
+@xpulpisa.pattern("reg", "I16TOU32(reg)", size=2)
+@xpulpisa.pattern("reg", "U16TOU32(reg)", size=2)
+@xpulpisa.pattern("reg", "U16TOI32(reg)", size=2)
+def pattern_exthz(context, tree, c0):
+    d = context.new_reg(RiscvRegister)
+    context.emit(PExthz(d, c0))
+    return d
+
+
+post_increments = {
+    Lb: PLb,
+    Lbu: PLbu,
+    Lh: PLh,
+    Lhu: PLhu,
+    Lw: PLw,
+    Sb: PSb,
+    Sh: PSh,
+    Sw: PSw,
+}
+
+
+def is_self_move(ins):
+    """ Check for a move of a register to itself, as left by phi nodes """
+    return ins.ismove and ins.used_registers == ins.defined_registers
+
+
+def count_uses(instructions):
+    """Count the number of instructions which read each register.
+
+    Moves of a register to itself are not counted.
+    """
+    uses = {}
+    for ins in instructions:
+        if is_self_move(ins):
+            continue
+        for register in set(ins.used_registers):
+            uses[register] = uses.get(register, 0) + 1
+    return uses
+
+
+def is_block_end(ins):
+    return isinstance(ins, Label) or bool(ins.jumps)
+
+
+def get_increment(ins, register):
+    """ Get the constant which ins adds to register, if any """
+    if isinstance(ins, Addi) and ins.rs1 is register:
+        return ins.offset
+    elif isinstance(ins, Addiv) and ins.rs1 is register:
+        return ins.imm
+
+
+def fold_post_increments(instructions, move):
+    """Fold address increments into post increment loads and stores.
+
+    This is done before register allocation. A load or store at offset 0
+    from a pointer, which is incremented by an addi later on in the same
+    block, accesses memory with a post increment instruction instead.
+    The pointer may not be used otherwise, so the addi becomes a move,
+    which is removed by the register allocator.
+    """
+    uses = count_uses(instructions)
+    instructions = list(instructions)
+    for index, ins in enumerate(instructions):
+        cls = post_increments.get(type(ins))
+        if cls is None or ins.offset != 0 or ins.fprel:
+            continue
+        base = ins.rs1
+        if base.is_colored or uses[base] != 2:
+            continue
+
+        # Find the increment of the base register:
+        for position in range(index + 1, len(instructions)):
+            other = instructions[position]
+            if is_block_end(other) or base in other.defined_registers:
+                break
+            increment = get_increment(other, base)
+            if increment is not None and increment in range(-2048, 2048):
+                if isinstance(ins, (Sb, Sh, Sw)):
+                    instructions[index] = cls(ins.rs2, increment, base)
+                else:
+                    instructions[index] = cls(ins.rd, increment, base)
+                instructions[position] = move(other.rd, base)
+                break
+            if base in other.used_registers:
+                break
+    return instructions
+
+
+class CountedLoop:
+    """A loop which can be turned into a hardware loop.
+
+    The loop consists of a header, which compares a counter with a
+    bound, and a body which increments the counter by one and jumps
+    back to the header.
+    """
+
+    def __init__(self, header, branch, body, end, counter, bound):
+        self.header = header
+        self.branch = branch
+        self.body = body
+        self.end = end
+        self.counter = counter
+        self.bound = bound
+        self.exit_jump = None
+        self.increments = []
+
+
+def find_counted_loop(instructions, end, labels, references):
+    """Check if the jump at index end closes a counted loop.
+
+    Returns a CountedLoop, or None when the loop does not qualify.
+    """
+    jump = instructions[end]
+    if not isinstance(jump, (B, CB)) or len(jump.jumps) != 1:
+        return
+
+    # The body is a single block, without calls:
+    start = end - 1
+    while start > 0 and not isinstance(instructions[start], Label):
+        ins = instructions[start]
+        if ins.jumps or ins.clobbers or isinstance(ins, InlineAssembly):
+            return
+        start -= 1
+    body_label = instructions[start]
+    if not isinstance(body_label, Label) or references.get(body_label) != 1:
+        return
+
+    # The header only defines constants and compares the counter with
+    # the bound:
+    header = labels.get(jump.jumps[0])
+    if header is None:
+        return
+    position = header + 1
+    constants = set()
+    while True:
+        ins = instructions[position]
+        if isinstance(ins, Li):
+            constants.add(ins.rd)
+        elif not is_self_move(ins):
+            break
+        position += 1
+    branch = instructions[position]
+    if not isinstance(branch, (Blt, Bltu, Bgt, Bgtu)):
+        return
+    if branch.jumps[0] is not body_label:
+        return
+    exit_jump = instructions[position + 1]
+    if branch.jumps[1] is not exit_jump:
+        return
+
+    if isinstance(branch, (Blt, Bltu)):
+        counter, bound = branch.rn, branch.rm
+    else:
+        counter, bound = branch.rm, branch.rn
+    loop = CountedLoop(header, position, start, end, counter, bound)
+    loop.exit_jump = exit_jump
+    if loop.counter in constants or loop.counter.is_colored:
+        return
+
+    # The counter is incremented by one in the body, possibly followed
+    # by a number of moves, and the registers defined in the header are
+    # not changed:
+    body = instructions[start + 1 : end]
+    register = loop.counter
+    while True:
+        defs = [i for i in body if register in i.defined_registers]
+        if len(defs) != 1:
+            return
+        increment = defs[0]
+        if loop.increments and body.index(increment) > body.index(
+            loop.increments[0]
+        ):
+            return
+        loop.increments.insert(0, increment)
+        if not increment.ismove:
+            break
+        register = increment.used_registers[0]
+    if get_increment(increment, loop.counter) != 1:
+        return
+    for ins in body:
+        if constants.intersection(ins.defined_registers):
+            return
+        if loop.bound in ins.defined_registers:
+            return
+    return loop
+
+
+def insert_hardware_loops(frame, instructions):
+    """Turn counted loops into hardware loops.
+
+    This is done before register allocation. The loop:
+
+        header:
+          blt counter, bound, body
+          j exit
+        body:
+          ...
+          addi counter, counter, 1
+          j header
+
+    becomes a hardware loop, which runs the body bound - counter times:
+
+        header:
+          blt counter, bound, setup
+          j exit
+        setup:
+          sub count, bound, counter
+          lp.setup 0, count, end
+        body:
+          ...
+          addi counter, counter, 1
+        end:
+          j exit
+
+    The increment of the counter is left out when the counter is not
+    used otherwise.
+    """
+    labels = {}
+    references = {}
+    for index, ins in enumerate(instructions):
+        if isinstance(ins, Label):
+            labels[ins] = index
+        for target in ins.jumps:
+            references[target] = references.get(target, 0) + 1
+
+    loops = []
+    for index, ins in enumerate(instructions):
+        loop = find_counted_loop(instructions, index, labels, references)
+        if loop:
+            loops.append(loop)
+    if not loops:
+        return instructions
+
+    uses = count_uses(instructions)
+    replacements = {}
+    insertions = {}
+    removals = set()
+    for loop in loops:
+        branch = instructions[loop.branch]
+        body_label = instructions[loop.body]
+        setup_label = frame.new_label()
+        end_label = frame.new_label()
+        count = frame.new_reg(RiscvRegister)
+        replacements[loop.branch] = [
+            type(branch)(
+                branch.rn,
+                branch.rm,
+                setup_label.name,
+                jumps=[setup_label, loop.exit_jump],
+            )
+        ]
+        insertions[loop.body] = [
+            setup_label,
+            Subr(count, loop.bound, loop.counter),
+            LpSetup(0, count, end_label.name, jumps=[body_label]),
+        ]
+        exit_label = loop.exit_jump.jumps[0]
+        replacements[loop.end] = [
+            HardwareLoopEnd([body_label, end_label]),
+            end_label,
+            type(loop.exit_jump)(exit_label.name, jumps=[exit_label]),
+        ]
+
+        # The counter is only compared and incremented:
+        increments = loop.increments
+        if uses[loop.counter] == 2 and all(
+            uses[ins.defined_registers[0]] == 1 for ins in increments[:-1]
+        ):
+            removals.update(id(ins) for ins in increments)
+
+    result = []
+    for index, ins in enumerate(instructions):
+        result.extend(insertions.get(index, []))
+        if id(ins) in removals:
+            continue
+        result.extend(replacements.get(index, [ins]))
+    return result
+
+
+def pad_hardware_loops(instructions):
+    """Make sure that the hardware loops contain enough instructions.
+
+    This is done after register allocation, when the moves which were
+    coalesced are removed. The pseudo instructions in a loop body are
+    replaced by the instructions which they stand for, which are counted.
+    """
+    result = []
+    sizes = {}
+    for ins in instructions:
+        if isinstance(ins, LpSetup):
+            sizes[ins.target] = 0
+        elif isinstance(ins, Label) and ins.name in sizes:
+            for _ in range(MIN_HARDWARE_LOOP_SIZE - sizes.pop(ins.name)):
+                result.append(Nop())
+        elif sizes:
+            parts = list(expand_instruction(ins))
+            size = sum(1 for part in parts if instruction_size(part))
+            for target in sizes:
+                sizes[target] += size
+            result.extend(parts)
+            continue
+        result.append(ins)
+    return result
@@ -0,0 +1,109 @@
+"""Definitions of the Riscv integer conditional operations extension.
+
+The Zicond extension contains two instructions, which set a register to
+zero depending on the value of another register:
+
+    czero.eqz rd, rs1, rs2  # rd = 0 if rs2 == 0 else rs1
+    czero.nez rd, rs1, rs2  # rd = 0 if rs2 != 0 else rs1
+
+Selects are lowered to one or two of these instructions instead of the
+masks of the base instruction set.
+"""
+
+from ..isa import Isa
+from ..encoding import Instruction, Syntax, Operand
+from .registers import RiscvRegister, Riscv64Register
+from .tokens import RiscvToken
+from .instructions import Orr, emit_condition, select_trees
+from .instructions import make_select_pattern, no_constants
+
+zicondisa = Isa()
+
+
+class ZicondInstruction(Instruction):
+    tokens = [RiscvToken]
+    isa = zicondisa
+
+
+def make_czero(condition, funct3):
+    rd = Operand("rd", RiscvRegister, write=True)
+    rn = Operand("rn", RiscvRegister, read=True)
+    rm = Operand("rm", RiscvRegister, read=True)
+    syntax = Syntax(
+        ["czero", ".", condition, " ", rd, ",", " ", rn, ",", " ", rm]
+    )
+    patterns = {
+        "opcode": 0b0110011,
+        "rd": rd,
+        "funct3": funct3,
+        "rs1": rn,
+        "rs2": rm,
+        "funct7": 0b0000111,
+    }
+    members = {
+        "syntax": syntax,
+        "rd": rd,
+        "rn": rn,
+        "rm": rm,
+        "patterns": patterns,
+    }
+    name = "Czero" + condition.title()
+    return type(name, (ZicondInstruction,), members)
+
+
+CzeroEqz = make_czero("eqz", 0b101)
+CzeroNez = make_czero("nez", 0b111)
+
+
+def emit_czero_select(
+    context, op, signed, a, b, yes, no, reg_class=RiscvRegister
+):
+    """Select a value with the conditional zero instructions.
+
+    Each of the values is zeroed when it is not selected, so the result
+    is the or of both, or the remaining value if the other one is zero.
+    """
+    t, holds_if_set, _ = emit_condition(
+        context, op, signed, a, b, reg_class=reg_class
+    )
+    keep_if_set, keep_if_zero = (
+        (CzeroEqz, CzeroNez) if holds_if_set else (CzeroNez, CzeroEqz)
+    )
+    d = context.new_reg(reg_class)
+    if isinstance(no, int):
+        context.emit(keep_if_set(d, yes, t))
+    elif isinstance(yes, int):
+        context.emit(keep_if_zero(d, no, t))
+    else:
+        d1 = context.new_reg(reg_class)
+        d2 = context.new_reg(reg_class)
+        context.emit(keep_if_set(d1, yes, t))
+        context.emit(keep_if_zero(d2, no, t))
+        context.emit(Orr(d, d1, d2))
+    return d
+
+
+pattern_czero_select = make_select_pattern(emit_czero_select, no_constants)
+pattern_czero_select64 = make_select_pattern(
+    emit_czero_select, no_constants, reg_class=Riscv64Register
+)
+
+for _ty in ("I32", "U32", "I16", "U16", "I8", "U8"):
+    zicondisa.pattern(
+        "reg", "SELECT{}(reg, reg, reg, reg)".format(_ty), size=14
+    )(pattern_czero_select)
+
+for _ty in ("I64", "U64"):
+    zicondisa.pattern(
+        "reg", "SELECT{}(reg, reg, reg, reg)".format(_ty), size=14
+    )(pattern_czero_select64)
+
+for _ty in ("I32", "U32"):
+    for _tree, _constants, _condition in select_trees(_ty):
+        _yes_const, _no_const = _constants[2:]
+        if _yes_const and _no_const:
+            continue
+        _size = 6 if _yes_const or _no_const else 14
+        zicondisa.pattern("reg", _tree, size=_size, condition=_condition)(
+            make_select_pattern(emit_czero_select, _constants)
+        )
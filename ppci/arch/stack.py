@@ -110,7 +110,7 @@ class Frame:
         for lab_name, val in self.constants:
             if value == val:
                 return lab_name
-        assert isinstance(value, (str, int, bytes)), str(value)
+        assert isinstance(value, (str, int, bytes, tuple)), str(value)
         lab_name = self.new_name("literal")
         self.constants.append((lab_name, value))
         return lab_name
@@ -122,7 +122,7 @@ class Frame:
 
     def live_ranges(self, vreg):
         """ Determine the live range of some register """
-        return self.cfg._live_ranges[vreg]
+        return self.cfg.live_ranges(vreg)
 
     def new_reg(self, cls, twain=""):
         """ Retrieve a new virtual register """
@@ -31,12 +31,15 @@ def u8(x):
 
 
 class _p2(property):
-    def __init__(self, getter, setter, bitsize, signed):
+    def __init__(self, getter, setter, bitsize, signed, ranges=None):
         if bitsize < 1:
             raise TypeError("Cannot create field with less than 1 bit")
         self._bitsize = bitsize
         self._signed = signed
         self._mask = (1 << bitsize) - 1
+        # The (begin, end) bit positions of the parts of this field, most
+        # significant part first:
+        self._ranges = ranges
         super().__init__(getter, setter)
 
     def __add__(self, other):
@@ -52,7 +55,7 @@ def bit_range(b, e, signed=False):
     def setter(s, v):
         s[b:e] = v
 
-    return _p2(getter, setter, e - b, signed)
+    return _p2(getter, setter, e - b, signed, [(b, e)])
 
 
 def bit(b):
@@ -77,7 +80,11 @@ def bit_concat(*partials):
 
     bitsize = sum(at._bitsize for at in partials)
     signed = partials[0]._signed
-    return _p2(getter, setter, bitsize, signed)
+    if all(at._ranges for at in partials):
+        ranges = [r for at in partials for r in at._ranges]
+    else:
+        ranges = None
+    return _p2(getter, setter, bitsize, signed, ranges)
 
 
 class TokenMeta(type):
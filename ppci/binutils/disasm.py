@@ -4,37 +4,45 @@ from ..arch.data_instructions import DByte
 
 
 class Disassembler:
-    """ Base disassembler for some architecture """
+    """Base disassembler for some architecture.
+
+    The instructions are decoded with the decoder of the architecture.
+    Data which cannot be decoded, or the whole data when the architecture
+    has no decoder, is emitted as bytes.
+    """
 
     def __init__(self, arch):
         self.arch = arch
-        for instruction in arch.isa.instructions:
-            # print(instruction, instruction.patterns)
-            # for nl in instruction.non_leaves:
-            #    print('  ', nl.patterns)
-            pass
+        self.decoder = arch.get_decoder()
 
     def disasm(self, data, outs, address=0):
         """ Disassemble data into an instruction stream """
-        # TODO: implement this!
-
-        # The trial and error method, will be slow as a snail:
-        # for instruction in self.arch.isa.instructions:
-        #    for size in instruction.sizes():
-        #        part = data[:size]
-        #        try:
-        #            print(instruction, part, size)
-        #            i = instruction.decode(part)
-        #            print(i)
-        #        except ValueError:
-        #            pass
-
-        # For now, all is bytes!
+        data = bytes(data)
+        if self.decoder is None:
+            self.emit_bytes(data, outs, address)
+            return
+
+        offset = 0
+        while offset < len(data):
+            try:
+                ins, size = self.decoder.decode(
+                    data[offset : offset + 4], address + offset
+                )
+            except ValueError:
+                size = min(self.decoder.alignment, len(data) - offset)
+                self.emit_bytes(
+                    data[offset : offset + size], outs, address + offset
+                )
+            else:
+                ins.address = address + offset
+                outs.emit(ins)
+            offset += size
+
+    @staticmethod
+    def emit_bytes(data, outs, address):
+        """ Emit data as bytes """
         for byte in data:
             ins = DByte(byte)
             ins.address = address
             outs.emit(ins)
-            address += len(ins.encode())
-
-    def take_one(self):
-        pass
+            address += 1
@@ -1,5 +1,6 @@
 """ Linker utility. """
 
+import bisect
 import logging
 from collections import defaultdict
 from .objectfile import ObjectFile, Image, get_object, RelocationEntry
@@ -7,7 +8,7 @@ from ..common import CompilerError
 from .layout import Layout, Section, SectionData, SymbolDefinition, Align
 from .layout import get_layout
 from .debuginfo import SymbolIdAdjustingReplicator, DebugInfo
-from .archive import get_archive
+from .archive import Archive, get_archive
 
 
 def link(
@@ -61,11 +62,16 @@ def link(
 
     march = objects[0].arch
 
-    if use_runtime:
-        objects.append(march.runtime)
-
     libraries = list(map(get_archive, libraries)) if libraries else []
 
+    if use_runtime:
+        runtime = march.runtime
+        if isinstance(runtime, Archive):
+            # Only link the runtime functions which are used:
+            libraries.append(runtime)
+        else:
+            objects.append(runtime)
+
     linker = Linker(march, reporter)
     output_obj = linker.link(
         objects,
@@ -79,6 +85,53 @@ def link(
     return output_obj
 
 
+class RelaxationHoles:
+    """The holes punched into the data of a section by relaxation.
+
+    A hole is an offset and the number of bytes removed there. Padding
+    which is inserted before an offset is a hole with a negative size.
+    The holes are sorted and the running totals of their sizes are
+    kept, so the shift of an offset is found with a binary search.
+    """
+
+    def __init__(self, holes):
+        self.holes = sorted(holes, key=lambda x: x[0])
+
+        # Removed bytes shift the offsets after the hole, inserted
+        # bytes shift the offset of the hole as well:
+        keys = sorted(
+            (offset + 1 if size > 0 else offset, size)
+            for offset, size in self.holes
+        )
+        self.keys = [key for key, _ in keys]
+        self.totals = [0]
+        for _, size in keys:
+            self.totals.append(self.totals[-1] + size)
+
+    @property
+    def size(self):
+        """ The total number of bytes removed """
+        return self.totals[-1]
+
+    def shift(self, offset):
+        """ Get the number of bytes removed in front of the given offset """
+        return self.totals[bisect.bisect_right(self.keys, offset)]
+
+    def punch(self, data):
+        """ Create a copy of the data with the holes punched in it """
+        result = bytearray()
+        begin = 0
+        for offset, size in self.holes:
+            result += data[begin:offset]
+            if size < 0:
+                result += bytes(-size)
+                begin = offset
+            else:
+                begin = offset + size
+        result += data[begin:]
+        return result
+
+
 class Linker:
     """Merges the sections of several object files and
     performs relocation"""
@@ -89,6 +142,9 @@ class Linker:
         self.arch = arch
         self.extra_symbols = None
         self.reporter = reporter
+        self.alignment_points = defaultdict(list)
+        self.relaxation_iterations = 0
+        self.relaxation_savings = 0
 
     def link(
         self,
@@ -183,6 +239,11 @@ class Linker:
                 )
             )
 
+        self.reporter.message(
+            "Relaxation saved {} bytes in {} iterations".format(
+                self.relaxation_savings, self.relaxation_iterations
+            )
+        )
         self.reporter.message("Linking complete")
 
     def merge_objects(self, input_objects, debug):
@@ -207,12 +268,19 @@ class Linker:
                 output_section.alignment = input_section.alignment
 
             # Align section:
+            padding = 0
             while output_section.size % input_section.alignment != 0:
                 self.logger.debug("Padding output to ensure alignment")
                 output_section.add_data(bytes([0]))
+                padding += 1
 
             # Add new section:
             offset = output_section.size
+            if input_section.alignment > 1:
+                # Remember the alignment, so that relaxation keeps it:
+                self.alignment_points[input_section.name].append(
+                    [offset, input_section.alignment, padding]
+                )
             section_offsets[input_section.name] = offset
             output_section.add_data(input_section.data)
             self.logger.debug(
@@ -373,6 +441,27 @@ class Linker:
                 )
             self.dst.add_image(image)
 
+        # A section which is not in the layout would overlap other data.
+        # Without memories, the sections are not placed at all:
+        if not layout.memories:
+            return
+        placed = {
+            section.name
+            for image in self.dst.images
+            for section in image.sections
+        }
+        placed.update(
+            memory_input.section_name
+            for mem in layout.memories
+            for memory_input in mem.inputs
+            if isinstance(memory_input, SectionData)
+        )
+        for section in self.dst.sections:
+            if section.size and section.name not in placed:
+                raise CompilerError(
+                    'Section "{}" is not in the layout'.format(section.name)
+                )
+
     def get_symbol_value(self, symbol_id):
         """ Get value of a symbol from object or fallback """
         # Lookup symbol:
@@ -438,30 +527,43 @@ class Linker:
         Possible issues that might occur during this phase:
 
         - alignment of code. Code that was previously aligned might be
-          shifted.
+          shifted. The padding in front of aligned input sections is
+          adjusted to keep them aligned.
 
         - Linker relaxations might cause the opposite effect on jumps whose
           distance increases due to relaxation. This occurs when jumping over
           a memory whole between sections.
 
+        Shrinking one jump can bring other jumps in range, so the relaxation
+        is repeated until nothing changes anymore.
         """
 
         self.logger.debug("Doing linker relaxations")
+        while True:
+            saved = self._relax()
+            if saved is None:
+                break
+            self.relaxation_iterations += 1
+            self.relaxation_savings += saved
+
+        self.logger.debug(
+            "Relaxation saved %s bytes in %s iterations",
+            self.relaxation_savings,
+            self.relaxation_iterations,
+        )
 
-        # TODO: general note. Alignment must still be taken into account.
-        # A wrong situation occurs, when reducing the image by small amount
-        # of bytes. Locations that were aligned before, might become unaligned.
+    def _relax(self):
+        """Do a single relaxation pass.
 
+        Returns the number of bytes saved, or None when nothing was relaxed.
+        """
         # First, determine the list of possible optimizations!
         lst = []
         for relocation in self.dst.relocations:
             sym_value = self.get_symbol_value(relocation.symbol_id)
             reloc_section = self.dst.get_section(relocation.section)
             reloc_value = reloc_section.address + relocation.offset
-            rcls = self.dst.arch.isa.relocation_map[relocation.reloc_type]
-            reloc = rcls(
-                None, offset=relocation.offset, addend=relocation.addend
-            )
+            reloc = self.get_relocation(relocation)
             if reloc.can_shrink(sym_value, reloc_value):
                 # Apply code patching:
                 begin = relocation.offset
@@ -482,7 +584,7 @@ class Linker:
                 assert 0 <= diff <= size
                 # assert len(data) == size
                 new_end = begin + new_size
-                assert new_end + new_size == end
+                assert new_end + diff == end
                 # Do not shrink the data here, we will do this later on.
                 reloc_section.data[begin:new_end] = data
 
@@ -494,7 +596,7 @@ class Linker:
 
         if not lst:
             self.logger.debug("No linker relaxations found")
-            return
+            return None
 
         s = ", ".join(str(x) for x in lst)
         self.logger.debug("Relaxable relocations: %s", s)
@@ -502,12 +604,16 @@ class Linker:
         # Define a map with the byte holes:
         holes_map = defaultdict(list)  # section name to list of holes.
 
-        # Remove old relocations by new ones.
-        for hole, relocation, reloc, new_relocs in lst:
-            # Remove old relocation which is superceeded:
-            self.dst.relocations.remove(relocation)
+        # Remove old relocations which are superceeded:
+        relaxed = set(id(relocation) for _, relocation, _, _ in lst)
+        self.dst.relocations[:] = [
+            relocation
+            for relocation in self.dst.relocations
+            if id(relocation) not in relaxed
+        ]
 
-            # Inject new relocations:
+        # Inject new relocations:
+        for hole, relocation, reloc, new_relocs in lst:
             for new_reloc in new_relocs:
                 # TODO: maybe deal with somewhat shifted new relocations?
 
@@ -521,12 +627,10 @@ class Linker:
                 )
                 self.dst.add_relocation(new_relocation)
 
-            # Register hole:
+            # Register hole, if the patched code is smaller:
             assert relocation.section
-            holes_map[relocation.section].append(hole)
-
-        for holes in holes_map.values():
-            holes.sort(key=lambda x: x[0])
+            if hole[1]:
+                holes_map[relocation.section].append(hole)
 
         # TODO: at this point, there can be the situation that we have two
         # sections which become further apart (due to them being in different
@@ -535,32 +639,56 @@ class Linker:
 
         # Code has been patched here. Now update all relocations, symbols and
         # section addresses.
-        self._apply_relaxation_holes(holes_map)
+        return self._apply_relaxation_holes(holes_map)
 
     def _apply_relaxation_holes(self, hole_map):
         """Punch holes in the destination object file.
 
         Do adjustments to section addresses, symbol offsets
-        and relocation offsets.
+        and relocation offsets. Returns the number of bytes removed.
         """
 
-        def count_holes(offset, holes):
-            """ Count how much holes we have until the given offset. """
-            diff = 0
-            for hole_offset, hole_size in holes:
-                if hole_offset < offset:
-                    diff += hole_size
-                else:
-                    break
-            return diff
+        # Adjust the padding in front of aligned input sections:
+        for name, points in self.alignment_points.items():
+            if not hole_map.get(name):
+                continue
+
+            holes = RelaxationHoles(hole_map[name])
+            paddings = []
+            padding_delta = 0
+            for point in points:
+                offset, alignment, padding = point
+                shift = holes.shift(offset) + padding_delta
+                new_padding = (shift + padding) % alignment
+                change = padding - new_padding
+                if change > 0:
+                    paddings.append((offset - padding, change))
+                elif change < 0:
+                    paddings.append((offset, change))
+                padding_delta += change
+                point[2] = new_padding
+            hole_map[name].extend(paddings)
+
+        section_holes = {
+            name: RelaxationHoles(holes)
+            for name, holes in hole_map.items()
+            if holes
+        }
+        no_holes = RelaxationHoles([])
+
+        for name, points in self.alignment_points.items():
+            holes = section_holes.get(name, no_holes)
+            for point in points:
+                point[0] -= holes.shift(point[0])
 
         # Update symbols which are located in sections.
         for symbol in self.dst.symbols:
             # Ignore global section-less symbols.
             if symbol.section is None:
                 continue
-            holes = hole_map[symbol.section]
-            delta = count_holes(symbol.value, holes)
+            delta = section_holes.get(symbol.section, no_holes).shift(
+                symbol.value
+            )
             self.logger.debug(
                 "symbol changing %s (id=%s) at %08x with -%08x",
                 symbol.name,
@@ -573,8 +701,9 @@ class Linker:
         # Update relocations (which are always located in a section)
         for relocation in self.dst.relocations:
             assert relocation.section
-            holes = hole_map[relocation.section]
-            delta = count_holes(relocation.offset, holes)
+            delta = section_holes.get(relocation.section, no_holes).shift(
+                relocation.offset
+            )
             self.logger.debug(
                 "relocation changing %s at offset %08x with -%08x",
                 relocation.symbol_id,
@@ -584,34 +713,44 @@ class Linker:
             relocation.offset -= delta
 
         # Update section data:
-        for section in self.dst.sections:
-            # Loop over holes in reverse, since earlier holes influence later
-            # holes.
-            holes = hole_map[section.name]
-            for hole_offset, hole_size in reversed(holes):
-                for _ in range(hole_size):
-                    section.data.pop(hole_offset)
+        for name, holes in section_holes.items():
+            section = self.dst.get_section(name)
+            section.data = holes.punch(section.data)
 
         # Calculate total change per section
         section_changes = {
-            name: sum(h[1] for h in holes) for name, holes in hole_map.items()
+            name: holes.size for name, holes in section_holes.items()
         }
 
         # Update layout of section in images
         for image in self.dst.images:
             delta = 0
             for section in image.sections:
+                # Keep the section aligned:
+                address = section.address - delta
+                while address % section.alignment != 0:
+                    address += 1
+                delta = section.address - address
                 self.logger.debug(
-                    "sectororchanging %s at %08x with -%08x to %08x",
+                    "section changing %s at %08x with -%08x",
                     section.name,
                     section.address,
                     delta,
                 )
-                # TODO: tricky stuff might go wrong here with alignment
-                # requirements of sections.
-                # Idea: re-do the layout phase?
-                section.address -= delta
-                delta += section_changes[section.name]
+                section.address = address
+                delta += section_changes.get(section.name, 0)
+
+        return sum(section_changes.values())
+
+    def get_relocation(self, relocation):
+        """ Construct the architecture specific relocation of an entry """
+        rcls = self.dst.arch.isa.relocation_map[relocation.reloc_type]
+        reloc = rcls(None, offset=relocation.offset, addend=relocation.addend)
+        if reloc.base_symbol and self.dst.has_symbol(reloc.base_symbol):
+            symbol = self.dst.get_symbol(reloc.base_symbol)
+            if symbol.defined:
+                reloc.base_value = self.get_symbol_value(symbol.id)
+        return reloc
 
     def do_relocations(self):
         """ Perform the correct relocation as listed """
@@ -637,8 +776,7 @@ class Linker:
 
         # reloc_function = self.arch.get_reloc(reloc.typ)
         # Construct architecture specific relocation:
-        rcls = self.dst.arch.isa.relocation_map[relocation.reloc_type]
-        reloc = rcls(None, offset=relocation.offset, addend=relocation.addend)
+        reloc = self.get_relocation(relocation)
 
         begin = relocation.offset
         size = reloc.size()
@@ -62,6 +62,7 @@ import argparse
 from ppci.lang.common import Token, SourceLocation
 from ppci.lang.tools import baselex, yacc
 from ppci.utils.tree import Tree
+from ppci.codegen.treematcher import State
 
 # Generate parser on the fly:
 spec_file = path.join(path.dirname(path.abspath(__file__)), "burg.grammar")
@@ -413,6 +414,188 @@ class BurgGenerator:
         return tst + child_tests
 
 
+class BurgCompiler:
+    """Compile the labeling of trees for a burg system into python code.
+
+    A state function is generated for each terminal, which only tests the
+    rules with that terminal as root. The chain rules which follow a rule
+    are determined beforehand, instead of for every tree node. Acceptance
+    functions are called via a list, such that the generated code only
+    depends on the shape and the costs of the rules. The compiled code is
+    cached, so that code generators for the same target share it.
+    """
+
+    _cache = {}
+
+    def compile(self, system):
+        """Compile the system into a label function and kid functions.
+
+        The label function labels all nodes of a tree bottom up. The kid
+        functions are a map from rule number to a function which returns
+        the kid trees of a tree matched with that rule.
+        """
+        key = self.signature(system)
+        if key not in self._cache:
+            source = self.generate(system)
+            self._cache[key] = compile(source, "<burg matcher>", "exec")
+        namespace = {"State": State}
+        exec(self._cache[key], namespace)
+        acceptances = {rule.nr: rule.acceptance for rule in system.rules}
+        return namespace["make_matcher"](acceptances)
+
+    @staticmethod
+    def signature(system):
+        """ Get the properties of the system which determine the code """
+        rules = tuple(
+            (
+                rule.non_term,
+                str(rule.tree),
+                rule.cost,
+                rule.acceptance is not None,
+            )
+            for rule in system.rules
+        )
+        return frozenset(system.terminals), rules
+
+    def generate(self, system):
+        """ Generate the source of the matcher for the given system """
+        self.system = system
+        self.lines = []
+        self.print(0, "def make_matcher(acceptances):")
+        self.print(1, "kid_functions = {}")
+        for rule in system.rules:
+            kids, _ = self.compute_kids(rule.tree, "tree")
+            self.print(
+                1,
+                "kid_functions[{}] = lambda tree: ({})".format(
+                    rule.nr, "".join(kid + ", " for kid in kids)
+                ),
+            )
+
+        functions = {}
+        for terminal in sorted(system.terminals):
+            rules = system.get_rules_for_root(terminal)
+            if rules:
+                functions[terminal] = "state_{}".format(terminal)
+                self.emit_state(functions[terminal], rules)
+
+        self.print(1, "state_functions = {")
+        for terminal, function in functions.items():
+            self.print(2, '"{}": {},'.format(terminal, function))
+        self.print(1, "}")
+        self.print(0)
+        self.print(1, "def no_rules(tree):")
+        self.print(2, "return {}")
+        self.print(0)
+        self.print(1, "def label(tree):")
+        self.print(2, "for child in tree.children:")
+        self.print(3, "label(child)")
+        self.print(
+            2, "state_function = state_functions.get(tree.name, no_rules)"
+        )
+        self.print(2, "tree.state = State(state_function(tree))")
+        self.print(0)
+        self.print(1, "return label, kid_functions")
+        return "\n".join(self.lines)
+
+    def print(self, level, text=""):
+        self.lines.append("    " * level + text)
+
+    def emit_state(self, name, rules):
+        """ Emit a function which determines the labels of a tree """
+        self.print(0)
+        self.print(1, "def {}(tree):".format(name))
+        self.print(2, "labels = {}")
+        for rule in rules:
+            self.print(2, "# {}: {}".format(rule.nr, rule))
+            level = 2
+            tests = self.terminal_tests(rule.tree, "tree")
+            if tests:
+                self.print(level, "if {}:".format(" and ".join(tests)))
+                level += 1
+
+            kids, nts = self.compute_kids(rule.tree, "tree")
+            tests = []
+            costs = []
+            for index, (kid, nt) in enumerate(zip(kids, nts)):
+                self.print(level, "k{} = {}.state.labels".format(index, kid))
+                tests.append('"{}" in k{}'.format(nt, index))
+                costs.append('k{}["{}"][0]'.format(index, nt))
+            if rule.acceptance:
+                tests.append("acceptances[{}](tree)".format(rule.nr))
+            if tests:
+                self.print(level, "if {}:".format(" and ".join(tests)))
+                level += 1
+            costs.append(repr(rule.cost))
+            self.print(level, "c = {}".format(" + ".join(costs)))
+            self.emit_record(level, rule.non_term, "c", rule.nr)
+            for non_term, cost, nr in self.chain_closure(rule.non_term):
+                self.emit_record(level, non_term, "c + {}".format(cost), nr)
+        self.print(2, "return labels")
+
+    def emit_record(self, level, non_term, cost, nr):
+        """ Emit code to record a cheaper way to reach a non terminal """
+        self.print(level, "c2 = {}".format(cost))
+        self.print(
+            level,
+            'if "{0}" not in labels or labels["{0}"][0] > c2:'.format(
+                non_term
+            ),
+        )
+        self.print(level + 1, 'labels["{}"] = (c2, {})'.format(non_term, nr))
+
+    def chain_closure(self, non_term):
+        """Determine the chain rules which apply after a rule.
+
+        The chain rules are visited in the same order as when marking a
+        tree dynamically. For each non terminal, only the first cheapest
+        way to reach it is kept, since only that one can end up in the
+        labels.
+        """
+        closure = {}
+        marked_rules = set()
+
+        def visit(non_term, cost):
+            for rule in self.system.chain_rules_for_nt(non_term):
+                if rule not in marked_rules:
+                    marked_rules.add(rule)
+                    rule_cost = cost + rule.cost
+                    if (
+                        rule.non_term not in closure
+                        or closure[rule.non_term][0] > rule_cost
+                    ):
+                        closure[rule.non_term] = (rule_cost, rule.nr)
+                    visit(rule.non_term, rule_cost)
+
+        visit(non_term, 0)
+        return [(nt, cost, nr) for nt, (cost, nr) in closure.items()]
+
+    def terminal_tests(self, tree, prefix):
+        """ Get the tests on the names of the terminals below the root """
+        tests = []
+        for index, child in enumerate(tree.children):
+            if child.name in self.system.terminals:
+                child_prefix = "{}.children[{}]".format(prefix, index)
+                tests.append(
+                    '{}.name == "{}"'.format(child_prefix, child.name)
+                )
+                tests.extend(self.terminal_tests(child, child_prefix))
+        return tests
+
+    def compute_kids(self, tree, prefix):
+        """ Get the kid expressions and non terminals of a pattern """
+        if tree.name in self.system.non_terminals:
+            return [prefix], [tree.name]
+        kids = []
+        nts = []
+        for index, child in enumerate(tree.children):
+            child_prefix = "{}.children[{}]".format(prefix, index)
+            child_kids, child_nts = self.compute_kids(child, child_prefix)
+            kids.extend(child_kids)
+            nts.extend(child_nts)
+        return kids, nts
+
+
 def make_argument_parser():
     """ Constructs an argument parser """
     parser = argparse.ArgumentParser(
@@ -17,10 +17,12 @@ from ..arch import data_instructions
 from ..arch.arch_info import Endianness
 from ..binutils.debuginfo import DebugType, DebugLocation, DebugDb
 from ..binutils.outstream import MasterOutputStream, FunctionOutputStream
+from ..opt.select import SelectPass
 from .irdag import SelectionGraphBuilder
 from .instructionselector import InstructionSelector1
 from .instructionscheduler import InstructionScheduler
 from .registerallocator import GraphColoringRegisterAllocator
+from .registerallocator import LinearScanRegisterAllocator
 from .peephole import PeepHoleStream
 
 
@@ -29,7 +31,9 @@ class CodeGenerator:
 
     logger = logging.getLogger("codegen")
 
-    def __init__(self, arch, reporter, optimize_for="size"):
+    def __init__(
+        self, arch, reporter, optimize_for="size", allocator="coloring"
+    ):
         assert isinstance(arch, Architecture), arch
         self.arch = arch
         self.reporter = reporter
@@ -45,8 +49,21 @@ class CodeGenerator:
         self.instruction_selector = InstructionSelector1(
             arch, self.sgraph_builder, reporter, weights=selection_weights
         )
-        self.instruction_scheduler = InstructionScheduler()
-        self.register_allocator = GraphColoringRegisterAllocator(
+        if arch.info.latency_model:
+            self.instruction_scheduler = InstructionScheduler(
+                arch.info.latency_model, arch.info.alias
+            )
+        else:
+            self.instruction_scheduler = None
+        allocators = {
+            "coloring": GraphColoringRegisterAllocator,
+            "linearscan": LinearScanRegisterAllocator,
+        }
+        if allocator not in allocators:
+            raise ValueError(
+                "Unknown register allocator {}".format(allocator)
+            )
+        self.register_allocator = allocators[allocator](
             arch, self.instruction_selector, reporter
         )
 
@@ -72,6 +89,9 @@ class CodeGenerator:
         # Generate code for global variables:
         output_stream.select_section("data")
         for var in ircode.variables:
+            if hasattr(self.arch, "get_global_section"):
+                section = self.arch.get_global_section(var)
+                output_stream.select_section(section)
             self.generate_global(var, output_stream, debug)
 
         # Generate code for functions:
@@ -140,6 +160,11 @@ class CodeGenerator:
         )
 
         self.reporter.heading(3, "Log for {}".format(ir_function))
+
+        # Replace small diamonds by selects if the target can lower them:
+        if self.arch.info.selects:
+            SelectPass().on_function(ir_function)
+
         self.reporter.dump_ir(ir_function)
 
         # Split too large basic blocks in smaller chunks (for literal pools):
@@ -169,11 +194,36 @@ class CodeGenerator:
         # Select instructions and schedule them:
         self.select_and_schedule(ir_function, frame)
 
+        # Architecture specific optimizations of the selected code:
+        if hasattr(self.arch, "optimize_selection"):
+            frame.instructions = self.arch.optimize_selection(frame)
+
+        # Reorder the instructions to hide the latencies of the core:
+        if self.instruction_scheduler:
+            frame.instructions = self.instruction_scheduler.schedule(
+                frame.instructions
+            )
+
         self.reporter.dump_frame(frame)
 
         # Do register allocation:
         self.register_allocator.alloc_frame(frame)
 
+        # Schedule the spill code and the coalesced moves as well:
+        if self.instruction_scheduler:
+            if self.arch.info.reschedule:
+                frame.instructions = self.instruction_scheduler.schedule(
+                    frame.instructions
+                )
+            self.reporter.message(
+                "Estimated stalls on {}: {}".format(
+                    self.arch.info.latency_model.name,
+                    self.instruction_scheduler.count_stalls(
+                        frame.instructions
+                    ),
+                )
+            )
+
         # TODO: Peep-hole here?
         # frame.instructions = [i for i in frame.instructions]
         if hasattr(self.arch, "peephole"):
@@ -277,14 +327,6 @@ class CodeGenerator:
         for dd in debug_data:
             output_stream.emit(dd)
 
-        # Check if we know what variables are live
-        for tmp in frame.ig.temp_map:
-            if self.debug_db.contains(tmp):
-                self.debug_db.get(tmp)
-                # print(tmp, di)
-                # frame.live_ranges(tmp)
-                # print('live ranges:', lr)
-
     def _generate_inline_assembly(
         self, assembly_source, output_registers, input_registers, ostream
     ):
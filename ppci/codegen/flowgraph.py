@@ -1,6 +1,7 @@
+import heapq
 import logging
-from collections import defaultdict
-from ..graph.digraph import DiGraph, DiNode, dfs
+from collections.abc import Set
+from ..graph.digraph import DiGraph, DiNode
 
 
 class FlowGraphNode(DiNode):
@@ -9,8 +10,8 @@ class FlowGraphNode(DiNode):
 
     def __init__(self, g, ins):
         super().__init__(g)
-        self.gen = set()
-        self.kill = set()
+        self.gen_bits = 0
+        self.kill_bits = 0
         self.live_in = set()
         self.live_out = set()
         self.instructions = []
@@ -20,13 +21,27 @@ class FlowGraphNode(DiNode):
 
     def add_instruction(self, ins):
         """ Bundle the instruction into the current node. """
-        ins.gen = set(ins.used_registers)
-        ins.kill = set(ins.defined_registers)
+        # Number the registers in the order of the operands, and not in
+        # the order of a set, so that the numbering is the same each run:
+        ins.gen_bits = self.graph.to_bits(ins.used_registers)
+        ins.kill_bits = self.graph.to_bits(ins.defined_registers)
+        ins.gen = RegisterSet(self.graph, ins.gen_bits)
+        ins.kill = RegisterSet(self.graph, ins.kill_bits)
         self.instructions.append(ins)
 
         # Combine gen and kill effects of the node and the new instruction:
-        self.gen = self.gen | (ins.gen - self.kill)
-        self.kill = self.kill | ins.kill
+        self.gen_bits |= ins.gen_bits & ~self.kill_bits
+        self.kill_bits |= ins.kill_bits
+
+    @property
+    def gen(self):
+        """ The registers used in this node before they are defined """
+        return RegisterSet(self.graph, self.gen_bits)
+
+    @property
+    def kill(self):
+        """ The registers defined in this node """
+        return RegisterSet(self.graph, self.kill_bits)
 
     def __repr__(self):
         r = "CFG-node({})".format(len(self.instructions))
@@ -52,7 +67,10 @@ class FlowGraph(DiGraph):
         super().__init__()
         self.logger = logging.getLogger("flowgraph")
         self._map = {}
-        self._live_ranges = defaultdict(list)
+
+        # Registers are numbered densely, to store sets of them as bits:
+        self._numbers = {}
+        self.registers = []
 
         # TODO: make this very tricky part of code better readable!!!
 
@@ -102,62 +120,197 @@ class FlowGraph(DiGraph):
             self.add_node(node)
         return self._map[ins]
 
-    # def live_range(
+    def number(self, reg):
+        """Get the dense number of a register in this flowgraph.
+
+        The numbers are the bit positions in the register bitsets.
+        """
+        if reg not in self._numbers:
+            self._numbers[reg] = len(self.registers)
+            self.registers.append(reg)
+        return self._numbers[reg]
+
+    def to_bits(self, registers):
+        """ Create the bitset of the given registers """
+        numbers = self._numbers
+        bits = 0
+        for reg in registers:
+            if reg in numbers:
+                bits |= 1 << numbers[reg]
+            else:
+                bits |= 1 << self.number(reg)
+        return bits
+
     def calculate_liveness(self):
         """ Calculate liveness in CFG: """
+        self.calculate_block_liveness()
+
+        # In one pass fix all instructions:
+        for node in self:
+            assert len(node.instructions) > 0
+            live = node.live_out_bits
+            for ins in reversed(node.instructions):
+                ins.live_out = RegisterSet(self, live)
+                live = ins.gen_bits | (live & ~ins.kill_bits)
+                ins.live_in = RegisterSet(self, live)
+
+    def live_ranges(self, vreg):
+        """Get the pairs of instructions between which a register is live.
+
+        The liveness must be calculated before.
+        """
+        number = self._numbers.get(vreg)
+        if number is None:
+            return []
+        mask = 1 << number
+        ranges = []
+        for node in self:
+            instructions = node.instructions
+            for ins1, ins2 in zip(instructions, instructions[1:]):
+                if ins2.live_in.bits & mask:
+                    ranges.append((ins1, ins2))
+        return ranges
+
+    def calculate_block_liveness(self):
+        """Calculate the registers live at the start and end of the nodes.
+
+        The liveness of the single instructions is not determined.
+        """
         ###
         # Liveness:
         #  in[n] = use[n] UNION (out[n] - def[n])
         #  out[n] = for s in n.succ in union in[s]
+        #
+        # The sets are bitsets in python integers, using the dense numbers
+        # of the registers.
         ###
         for node in self:
-            node.live_in = set()
-            node.live_out = set()
+            node.live_in_bits = node.gen_bits
+            node.live_out_bits = 0
 
-        # Sort flowgraph nodes by backward depth first search:
-        # TODO: cfg_nodes = [x[1] for x in dfs(self.nodes[0], reverse=True)]
-        cfg_nodes = list(self.nodes)
+        # Liveness flows backwards, so visit the nodes in reverse
+        # postorder of the reversed flowgraph, which is approximated by
+        # the postorder of a depth first search from the entry node.
+        # Only the predecessors of changed nodes are visited again.
+        cfg_nodes = self.postorder()
+        order = {node: index for index, node in enumerate(cfg_nodes)}
+        worklist = list(range(len(cfg_nodes)))
+        pending = set(cfg_nodes)
 
-        # Dataflow fixed point iteration over the nodes in the CFG:
         n_iterations = 0
-        change = True
-        while change:
-            change = False
-            for node in cfg_nodes:
-                _in = node.live_in
-                _out = node.live_out
-                node.live_in = node.gen | (node.live_out - node.kill)
-                if node.successors:
-                    node.live_out = set.union(
-                        *(s.live_in for s in node.successors)
-                    )
-                else:
-                    node.live_out = set()
-
-                # Record for change:
-                change = (
-                    change or (_in != node.live_in) or (_out != node.live_out)
-                )
+        while worklist:
+            node = cfg_nodes[heapq.heappop(worklist)]
+            pending.remove(node)
             n_iterations += 1
 
-        # In one pass fix all instructions:
+            live_out = 0
+            for successor in node.successors:
+                live_out |= successor.live_in_bits
+            node.live_out_bits = live_out
+            live_in = node.gen_bits | (live_out & ~node.kill_bits)
+            if live_in != node.live_in_bits:
+                node.live_in_bits = live_in
+                for predecessor in node.predecessors:
+                    if predecessor not in pending:
+                        pending.add(predecessor)
+                        heapq.heappush(worklist, order[predecessor])
+
         for node in self:
-            assert len(node.instructions) > 0
-            ins2 = node.instructions[-1]
-            ins2.live_out = node.live_out  # Propagate into last instruction
-            ins2.live_in = ins2.gen | (ins2.live_out - ins2.kill)
-            if len(node.instructions) > 1:
-                for ins in reversed(node.instructions[:-1]):
-                    ins1 = ins
+            node.live_in = RegisterSet(self, node.live_in_bits)
+            node.live_out = RegisterSet(self, node.live_out_bits)
 
-                    ins1.live_out = ins2.live_in
-                    ins1.live_in = ins1.gen | (ins1.live_out - ins1.kill)
+        self.logger.debug(
+            "Iterations: %s,  nodes: %s", n_iterations, len(self)
+        )
 
-                    for vreg in ins2.live_in & ins1.live_out:
-                        self._live_ranges[vreg].append((ins1, ins2))
+    def postorder(self):
+        """Get the nodes in postorder of a depth first search.
 
-                    ins2 = ins1
+        Nodes which cannot be reached from the entry are put at the end.
+        """
+        nodes = []
+        if self.nodes:
+            visited = set()
+            entry = next(iter(self.nodes))
+            visited.add(entry)
+            stack = [(entry, iter(entry.successors))]
+            while stack:
+                node, successors = stack[-1]
+                for successor in successors:
+                    if successor not in visited:
+                        visited.add(successor)
+                        stack.append((successor, iter(successor.successors)))
+                        break
+                else:
+                    stack.pop()
+                    nodes.append(node)
+            nodes.extend(node for node in self.nodes if node not in visited)
+        return nodes
 
-        self.logger.debug(
-            "Iterations: %s,  nodes: %s", n_iterations, len(self)
+
+class RegisterSet(Set):
+    """A set of registers stored as a bitset.
+
+    The bits are the dense numbers of the registers in a flowgraph.
+    Operations on two register sets of the same flowgraph work on the
+    bits, all other set operations give a plain set.
+    """
+
+    __slots__ = ("_flowgraph", "bits")
+
+    def __init__(self, flowgraph, bits):
+        self._flowgraph = flowgraph
+        self.bits = bits
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __repr__(self):
+        return "{{{}}}".format(", ".join(str(reg) for reg in self))
+
+    def __contains__(self, reg):
+        number = self._flowgraph._numbers.get(reg)
+        return number is not None and bool((self.bits >> number) & 1)
+
+    def __iter__(self):
+        registers = self._flowgraph.registers
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield registers[lowest.bit_length() - 1]
+            bits ^= lowest
+
+    def __len__(self):
+        return bin(self.bits).count("1")
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def _same_graph(self, other):
+        return (
+            isinstance(other, RegisterSet)
+            and other._flowgraph is self._flowgraph
         )
+
+    def __eq__(self, other):
+        if self._same_graph(other):
+            return self.bits == other.bits
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __or__(self, other):
+        if self._same_graph(other):
+            return RegisterSet(self._flowgraph, self.bits | other.bits)
+        return super().__or__(other)
+
+    def __and__(self, other):
+        if self._same_graph(other):
+            return RegisterSet(self._flowgraph, self.bits & other.bits)
+        return super().__and__(other)
+
+    def __sub__(self, other):
+        if self._same_graph(other):
+            return RegisterSet(self._flowgraph, self.bits & ~other.bits)
+        return super().__sub__(other)
@@ -1,11 +1,208 @@
 """
     This algorithm takes the selected instructions and schedules them in
     a linear form.
+
+    The instructions are reordered by a list scheduler, per region of
+    instructions which can be moved. A region ends at labels, jumps,
+    calls and all other instructions for which the latency model has no
+    kind. Within a region, a dependency graph is built from the registers
+    which are used and defined, and from the memory accesses. The memory
+    accesses keep their order, since the volatile accesses can no longer
+    be told apart after instruction selection.
+
+    The instructions which are ready are issued in order of the longest
+    latency path to the end of the region. The scheduled order is only
+    used when it is estimated to stall less than the original order.
 """
 
+import logging
+
 
 class InstructionScheduler:
-    def schedule(self, graph, frame):
-        # TODO: schedule traces in better order.
-        # This is optional!
-        pass
+    """ List scheduler for a single issue, in order pipeline """
+
+    logger = logging.getLogger("scheduler")
+
+    def __init__(self, latency_model, aliases=None):
+        self.latency_model = latency_model
+        self.aliases = aliases if aliases else {}
+
+    def schedule(self, instructions):
+        """ Return the instructions in scheduled order """
+        scheduled = []
+        for region, barrier in self.split_regions(instructions):
+            stalls = self.count_region_stalls(region)
+            if stalls:
+                new_region = self.schedule_region(region)
+                new_stalls = self.count_region_stalls(new_region)
+                self.logger.debug(
+                    "Region of %s instructions stalls %s instead of %s",
+                    len(region),
+                    new_stalls,
+                    stalls,
+                )
+                if new_stalls < stalls:
+                    region = new_region
+            scheduled.extend(node.instruction for node in region)
+            if barrier is not None:
+                scheduled.append(barrier)
+        return scheduled
+
+    def count_stalls(self, instructions):
+        """Estimate the number of cycles the pipeline is stalled.
+
+        Each instruction is issued as soon as its operands are ready. The
+        estimate starts again after each instruction which ends a region.
+        """
+        return sum(
+            self.count_region_stalls(region)
+            for region, _ in self.split_regions(instructions)
+        )
+
+    def split_regions(self, instructions):
+        """Split the instructions into regions of movable instructions.
+
+        Yields the regions with the instruction which ends them.
+        """
+        region = []
+        for instruction in instructions:
+            kind = self.latency_model.get_kind(instruction)
+            if kind is None:
+                yield region, instruction
+                region = []
+            else:
+                region.append(self.make_node(instruction, kind))
+        yield region, None
+
+    def make_node(self, instruction, kind):
+        """ Gather the properties of an instruction used for scheduling """
+        latency_model = self.latency_model
+        return ScheduleNode(
+            instruction,
+            latency_model.latencies.get(kind, 1),
+            self.expand_aliases(instruction.used_registers),
+            self.expand_aliases(instruction.defined_registers),
+            kind in latency_model.memory_kinds,
+        )
+
+    def expand_aliases(self, registers):
+        """Get the hardware registers of the registers with their aliases.
+
+        After register allocation, different virtual registers can be
+        colored with the same hardware register. Registers which consist
+        of other registers are expanded into these, so that two registers
+        which share a larger register do not depend on each other.
+        """
+        aliases = self.aliases
+        expanded = []
+        for register in registers:
+            if register.is_colored:
+                register = register.get_real()
+            if register in aliases:
+                expanded.extend(r for r in aliases[register] if not r.aliases)
+            else:
+                expanded.append(register)
+        return expanded
+
+    @staticmethod
+    def count_region_stalls(region):
+        """ Estimate the stalls of a region in the given order """
+        stalls = 0
+        cycle = 0
+        ready = {}
+        for node in region:
+            issue = cycle
+            for register in node.used:
+                if register in ready:
+                    issue = max(issue, ready[register])
+            stalls += issue - cycle
+            cycle = issue + 1
+            for register in node.defined:
+                ready[register] = issue + node.latency
+        return stalls
+
+    @staticmethod
+    def build_dependencies(region):
+        """Determine the dependencies between the instructions.
+
+        Returns per instruction a list of the instructions which must be
+        issued before it, with the number of cycles between the issues.
+        """
+        predecessors = [[] for _ in region]
+        definitions = {}
+        uses = {}
+        last_memory_access = None
+        for index, node in enumerate(region):
+            edges = predecessors[index]
+            for register in node.used:
+                if register in definitions:
+                    producer = definitions[register]
+                    edges.append((producer, region[producer].latency))
+                uses.setdefault(register, []).append(index)
+            for register in node.defined:
+                if register in definitions:
+                    edges.append((definitions[register], 1))
+                for user in uses.pop(register, ()):
+                    if user != index:
+                        edges.append((user, 1))
+                definitions[register] = index
+            if node.memory:
+                if last_memory_access is not None:
+                    edges.append((last_memory_access, 1))
+                last_memory_access = index
+        return predecessors
+
+    def schedule_region(self, region):
+        """ Schedule a region of instructions without barriers """
+        predecessors = self.build_dependencies(region)
+        successors = [[] for _ in region]
+        for index, edges in enumerate(predecessors):
+            for predecessor, latency in edges:
+                successors[predecessor].append((index, latency))
+
+        # The priority is the longest latency path to the end:
+        heights = [1] * len(region)
+        for index in reversed(range(len(region))):
+            for successor, latency in successors[index]:
+                heights[index] = max(
+                    heights[index], latency + heights[successor]
+                )
+
+        waiting = [len(edges) for edges in predecessors]
+        earliest = [0] * len(region)
+        ready = [index for index, count in enumerate(waiting) if not count]
+        scheduled = []
+        cycle = 0
+        while ready:
+            # Prefer instructions which do not stall, then the highest:
+            index = min(
+                ready,
+                key=lambda i: (max(earliest[i], cycle), -heights[i], i),
+            )
+            ready.remove(index)
+            issue = max(earliest[index], cycle)
+            scheduled.append(region[index])
+            cycle = issue + 1
+            for successor, latency in successors[index]:
+                earliest[successor] = max(
+                    earliest[successor], issue + latency
+                )
+                waiting[successor] -= 1
+                if not waiting[successor]:
+                    ready.append(successor)
+        assert len(scheduled) == len(region)
+        return scheduled
+
+
+class ScheduleNode:
+    """ An instruction with the properties which determine its schedule """
+
+    __slots__ = ("instruction", "latency", "used", "defined", "memory")
+
+    def __init__(self, instruction, latency, used, defined, memory):
+        self.instruction = instruction
+        self.latency = latency
+        self.used = used
+        self.defined = defined
+        # Whether the instruction loads from or stores to memory:
+        self.memory = memory
@@ -43,6 +43,10 @@ operations are listed in the below table:
 +---------------+---------+-----------------------------------------+
 | CJMP          | I,U     | Conditional jump to a label             |
 +---------------+---------+-----------------------------------------+
+| JMPTABLE      | I,U     | Jump to a label in a table              |
++---------------+---------+-----------------------------------------+
+| SELECT(c0..3) | I,U     | c2 if c0 compares to c1, c3 otherwise   |
++---------------+---------+-----------------------------------------+
 
 ...
 
@@ -50,6 +54,7 @@ Memory move operations:
 
 - STRI64(REGI32[rax], CONSTI32[1])
 - MOVB()
+- CLRB()
 
 
 """
@@ -57,10 +62,9 @@ Memory move operations:
 import abc
 import logging
 from ..utils.tree import Tree
-from .treematcher import State
 from .. import ir
 from ..arch.encoding import Instruction
-from .burg import BurgSystem
+from .burg import BurgCompiler, BurgSystem
 from .irdag import FunctionInfo, prepare_function_info
 from .dagsplit import DagSplitter
 from ..arch.generic_instructions import RegisterUseDef, InlineAssembly
@@ -88,6 +92,8 @@ ops = [
     "STR",
     "CONST",  # Data
     "CJMP",  # Compare and jump
+    "JMPTABLE",  # Jump via a table of labels
+    "SELECT",  # Compare and select a value
     "I8TO",
     "I16TO",
     "I32TO",
@@ -108,6 +114,7 @@ terminals = tuple(x + y for x in ops for y in data_types) + (
     "CALL",
     "LABEL",
     "MOVB",  # Attempts at blob data copies
+    "CLRB",  # Fill blob data with zeros
     "JMP",
     "EXIT",
     "ENTRY",
@@ -153,10 +160,19 @@ class InstructionContext(ContextInterface):
 
 
 class TreeSelector:
-    """ Tree matcher that can match a tree and generate instructions """
+    """Tree matcher that can match a tree and generate instructions.
+
+    The labeling of the trees is compiled into python code for the rules
+    of the burg system.
+    """
 
     def __init__(self, sys):
         self.sys = sys
+        self.burm_label, self.kid_functions = BurgCompiler().compile(sys)
+        self.nts_map = {
+            rule.nr: self.sys.get_nts(rule.tree) for rule in sys.rules
+        }
+        self.templates = {rule.nr: rule.template for rule in sys.rules}
 
     def gen(self, context, tree):
         """Generate code for a given tree. The tree will be tiled with
@@ -168,45 +184,6 @@ class TreeSelector:
             raise RuntimeError("Tree {} not covered".format(tree))
         return self.apply_rules(context, tree, "stm")
 
-    def burm_label(self, tree):
-        """ Label all nodes in the tree bottom up """
-        for child_tree in tree.children:
-            self.burm_label(child_tree)
-
-        # Now the child nodes have been labeled, assign a state to the tree:
-        tree.state = State()
-
-        # Check all rules for matching with this subtree and
-        # check if a state can be determined
-        for rule in self.sys.get_rules_for_root(tree.name):
-            if self.sys.tree_terminal_equal(tree, rule.tree):
-                nts = self.nts(rule.nr)
-                kids = self.kids(tree, rule.nr)
-
-                # Check for acceptance:
-                if rule.acceptance:
-                    accept = rule.acceptance(tree)
-                else:
-                    accept = True
-
-                if (
-                    all(x.state.has_goal(y) for x, y in zip(kids, nts))
-                    and accept
-                ):
-                    cost = sum(x.state.get_cost(y) for x, y in zip(kids, nts))
-                    marked_rules = set()
-                    self.mark_tree(tree, rule, cost, marked_rules)
-
-    def mark_tree(self, tree, rule, cost, marked_rules):
-        cost = cost + rule.cost
-        tree.state.set_cost(rule.non_term, cost, rule.nr)
-        marked_rules.add(rule)
-
-        # Also set cost for chain rules here:
-        for cr in self.sys.chain_rules_for_nt(rule.non_term):
-            if cr not in marked_rules:
-                self.mark_tree(tree, cr, cost, marked_rules)
-
     def apply_rules(self, context, tree, goal):
         """ Apply all selected instructions to the tree """
         rule = tree.state.get_rule(goal)
@@ -217,7 +194,7 @@ class TreeSelector:
             )
         ]
         # Get the function to call:
-        rule_f = self.sys.get_rule(rule).template
+        rule_f = self.templates[rule]
         context.tree = tree
         res = rule_f(context, tree, *results)
         context.tree = None
@@ -225,13 +202,11 @@ class TreeSelector:
 
     def kids(self, tree, rule):
         """ Determine the kid trees for a rule """
-        template_tree = self.sys.get_rule(rule).tree
-        return self.sys.get_kids(tree, template_tree)
+        return self.kid_functions[rule](tree)
 
     def nts(self, rule):
         """ Get the open ends of this rules pattern """
-        template_tree = self.sys.get_rule(rule).tree
-        return self.sys.get_nts(template_tree)
+        return self.nts_map[rule]
 
 
 class InstructionSelector1:
@@ -366,7 +341,7 @@ class InstructionSelector1:
         context = InstructionContext(frame, self.arch)
 
         args = list(zip(function_info.arg_types, function_info.arg_vregs))
-        for instruction in self.arch.gen_function_enter(args):
+        for instruction in self.arch.gen_function_enter(frame, args):
             context.emit(instruction)
 
         # Generate proper instructions:
@@ -1,5 +1,16 @@
 """
 
+The interference graph is stored as proposed by George and Appel. The
+nodes are numbered, and the edges are stored twice: as a bit matrix for
+fast testing of an edge, and as lists of neighbour numbers for iterating
+over the neighbours of a node. The rows of the bit matrix are python
+integers.
+
+Nodes which are temporarily removed from the graph, or which are merged
+into another node, are marked as inactive. The neighbour lists are not
+updated for this, instead the inactive nodes are skipped when iterating
+over the neighbours.
+
 .. autoclass:: ppci.codegen.interferencegraph.InterferenceGraph
     :members: get_node, combine, interfere
 
@@ -7,9 +18,9 @@
 
 import logging
 from collections import defaultdict
-from ..graph.graph import Node
-from ..graph.maskable_graph import MaskableGraph
+from ..graph.graph import BaseGraph, Node
 from ..arch.registers import Register
+from ..utils.collections import OrderedSet
 
 
 class InterferenceGraphNode(Node):
@@ -17,8 +28,8 @@ class InterferenceGraphNode(Node):
 
     def __init__(self, graph, vreg):
         super().__init__(graph)
-        self.temps = {vreg}
-        self.moves = set()
+        self.temps = OrderedSet([vreg])
+        self.moves = OrderedSet()
         self.reg = vreg if vreg.is_colored else None
         self.reg_class = type(vreg)
 
@@ -32,7 +43,7 @@ class InterferenceGraphNode(Node):
         )
 
 
-class InterferenceGraph(MaskableGraph):
+class InterferenceGraph(BaseGraph):
     """ Interference graph. """
 
     def __init__(self):
@@ -43,6 +54,14 @@ class InterferenceGraph(MaskableGraph):
         self._def_map = defaultdict(list)
         self._use_map = defaultdict(list)
 
+        # Numbered nodes with their edges:
+        self._node_list = []
+        self._rows = []
+        self._adjacency = []
+        self._active = bytearray()
+        self._merged = bytearray()
+        self._masked_nodes = set()
+
     def defs(self, tmp):
         return self._def_map[tmp]
 
@@ -50,27 +69,74 @@ class InterferenceGraph(MaskableGraph):
         return self._use_map[tmp]
 
     def calculate_interference(self, flowgraph):
-        """ Construct interference graph """
+        """Construct interference graph.
+
+        The nodes are numbered like the registers in the flowgraph, and the
+        registers live at the same time are or-ed into the rows of each
+        other. Only the new neighbours of a node are appended to its list.
+
+        The nodes and the neighbour lists are built in the order in which
+        the edges would be added one by one: per instruction, the live
+        registers first and then the clobbered registers, each in a fixed
+        order. The allocator iterates over them in this order.
+        """
+        for number, tmp in enumerate(flowgraph.registers):
+            node = self.get_node(tmp)
+            assert node.id == number
+
+        rows = self._rows
+        adjacency = self._adjacency
+        order = []
+        seen = 0
         for n in flowgraph:
             for ins in n.instructions:
-                # ins.live_out |= ins.
-                for tmp in ins.live_in:
-                    self.get_node(tmp)
+                new = ins.live_in.bits & ~seen
+                if new:
+                    order.extend(bits_to_numbers(new))
+                    seen |= new
 
                 # Live out and zero length defined variables:
-                live_and_def = ins.live_out | ins.kill
+                live_and_def = ins.live_out.bits | ins.kill_bits
 
-                # Add interfering edges:
-                for tmp in live_and_def:
-                    n1 = self.get_node(tmp)
-                    for tmp2 in live_and_def - {tmp}:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
+                if live_and_def:
+                    new = live_and_def & ~seen
+                    if new:
+                        order.extend(bits_to_numbers(new))
+                        seen |= new
 
-                    # Add clobbered interfering edges:
+                    # Clobbered registers which are not live themselves:
+                    clobbers = []
+                    clobber_bits = 0
                     for tmp2 in ins.clobbers:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
+                        number = self.get_node(tmp2).id
+                        mask = 1 << number
+                        if not (live_and_def | clobber_bits) & mask:
+                            clobbers.append(number)
+                            clobber_bits |= mask
+                        if not seen & mask:
+                            order.append(number)
+                            seen |= mask
+
+                    # Add interfering edges:
+                    interfering = live_and_def | clobber_bits
+                    for number in bits_to_numbers(live_and_def):
+                        new = interfering & ~rows[number] & ~(1 << number)
+                        if new:
+                            rows[number] |= new
+                            adjacency[number].extend(
+                                bits_to_numbers(new & live_and_def)
+                            )
+                            if new & clobber_bits:
+                                adjacency[number].extend(
+                                    c for c in clobbers if (new >> c) & 1
+                                )
+
+                    # Add clobbered interfering edges:
+                    for number in clobbers:
+                        new = live_and_def & ~rows[number]
+                        if new:
+                            rows[number] |= new
+                            adjacency[number].extend(bits_to_numbers(new))
 
                 # Generate usage info:
                 for reg in ins.defined_registers:
@@ -78,6 +144,80 @@ class InterferenceGraph(MaskableGraph):
                 for reg in ins.used_registers:
                     self._use_map[reg].append(ins)
 
+        assert len(order) == len(self._node_list)
+        self.nodes = OrderedSet(self._node_list[number] for number in order)
+
+    def add_node(self, node):
+        """ Number a new node and add it to the graph """
+        node.id = len(self._node_list)
+        self._node_list.append(node)
+        self._rows.append(0)
+        self._adjacency.append([])
+        self._active.append(1)
+        self._merged.append(0)
+        super().add_node(node)
+
+    def del_node(self, node):
+        """ Remove a node from the graph """
+        for neighbour in self.adjecent(node):
+            self.del_edge(node, neighbour)
+        self._active[node.id] = 0
+        self.nodes.remove(node)
+
+    def add_edge(self, n, m):
+        """ Add an edge between n and m """
+        if n is m or self.has_edge(n, m):
+            return
+        self._rows[n.id] |= 1 << m.id
+        self._rows[m.id] |= 1 << n.id
+        self._adjacency[n.id].append(m.id)
+        self._adjacency[m.id].append(n.id)
+
+    def del_edge(self, n, m):
+        """ Delete edge between n and m """
+        if self.has_edge(n, m):
+            self._rows[n.id] &= ~(1 << m.id)
+            self._rows[m.id] &= ~(1 << n.id)
+            self._adjacency[n.id].remove(m.id)
+            self._adjacency[m.id].remove(n.id)
+
+    def has_edge(self, n, m):
+        """ Test if there exist and edge between n and m """
+        return bool((self._rows[n.id] >> m.id) & 1)
+
+    def get_number_of_edges(self):
+        """ Get the number of edges in this graph """
+        return sum(self.get_degree(n) for n in self.nodes) // 2
+
+    def adjecent(self, n):
+        """ Return all unmasked nodes with edges to n """
+        active = self._active
+        node_list = self._node_list
+        return [node_list[m] for m in self._adjacency[n.id] if active[m]]
+
+    def get_degree(self, node):
+        """ Get the number of unmasked neighbours of a node """
+        active = self._active
+        return sum(active[m] for m in self._adjacency[node.id])
+
+    def mask_node(self, node):
+        """ Temporarily remove a node from the graph """
+        assert not self.is_masked(node)
+        self._masked_nodes.add(node)
+        self._active[node.id] = 0
+        self.nodes.remove(node)
+
+    def unmask_node(self, node):
+        """ Put a masked node back into the graph """
+        assert self.is_masked(node)
+        self._masked_nodes.remove(node)
+        self._active[node.id] = 1
+        self.nodes.add(node)
+
+    def is_masked(self, node):
+        """ Test if a node is masked """
+        return node in self._masked_nodes
+
     def has_node(self, tmp):
         """ Check if there exists a node for this temp register """
         assert isinstance(tmp, Register)
@@ -92,7 +232,6 @@ class InterferenceGraph(MaskableGraph):
         else:
             assert create
             node = InterferenceGraphNode(self, tmp)
-            self.add_node(node)
             self.temp_map[tmp] = node
         return node
 
@@ -106,13 +245,42 @@ class InterferenceGraph(MaskableGraph):
 
     def combine(self, n, m):
         """ Combine n and m into n and return n """
+        assert n is not m
+        assert not self.is_masked(n), "Combining only allowed for non-masked"
+
         # Copy associated moves and temporaries into n:
         n.temps |= m.temps
-        n.moves.update(m.moves)
+        n.moves |= m.moves
 
         # Update local temp map:
         for tmp in m.temps:
             self.temp_map[tmp] = n
 
-        super().combine(n, m)
+        # Move the edges of m, including those to masked nodes, to n:
+        rows = self._rows
+        for t in self._adjacency[m.id]:
+            if self._merged[t]:
+                continue
+            if t != n.id and not (rows[n.id] >> t) & 1:
+                rows[n.id] |= 1 << t
+                rows[t] |= 1 << n.id
+                self._adjacency[n.id].append(t)
+                self._adjacency[t].append(n.id)
+            rows[t] &= ~(1 << m.id)
+        rows[n.id] &= ~(1 << m.id)
+        rows[m.id] = 0
+
+        # Node m is gone:
+        self._active[m.id] = 0
+        self._merged[m.id] = 1
+        self._masked_nodes.discard(m)
+        self.nodes.discard(m)
         return n
+
+
+def bits_to_numbers(bits):
+    """ Get the numbers of the bits which are set in ascending order """
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
@@ -50,11 +50,13 @@ def prepare_function_info(arch, function_info, ir_function):
             vreg = function_info.frame.new_reg(
                 arch.info.value_classes[arg.ty], twain=arg.name
             )
-        else:
-            # Allocate space on stack for this argument:
-            # vreg = function_info.frame.alloc(arg.ty.size, 1)
-            # print(phys_loc)
+        elif isinstance(phys_loc, StackLocation):
+            # The argument is passed on the stack:
             vreg = phys_loc
+        else:
+            # The argument is passed in registers, allocate space on
+            # stack for this argument:
+            vreg = function_info.frame.alloc(arg.ty.size, arg.ty.alignment)
         function_info.arg_vregs.append(vreg)
 
     if isinstance(ir_function, ir.Function):
@@ -286,6 +288,17 @@ class SelectionGraphBuilder:
         self.chain(sgnode)
         self.debug_db.map(node, sgnode)
 
+    def do_jump_table(self, node):
+        """ Process jump table into dag """
+        v = self.get_value(node.v)
+        sgnode = self.new_node("JMPTABLE", node.v.ty, v)
+        sgnode.value = (
+            [self.function_info.label_map[block] for block in node.table],
+            self.function_info.label_map[node.lab_default],
+        )
+        self.chain(sgnode)
+        self.debug_db.map(node, sgnode)
+
     def do_exit(self, node):
         # Jump to epilog:
         sgnode = self.new_node("JMP", None)
@@ -322,7 +335,17 @@ class SelectionGraphBuilder:
         """ Create a memcpy node. """
         dst = self.get_address(node.dst)
         src = self.get_address(node.src)
-        sgnode = self.new_node("MOVB", None, dst, src, value=node.amount)
+        sgnode = self.new_node(
+            "MOVB", None, dst, src, value=(node.amount, node.alignment)
+        )
+        self.chain(sgnode)
+
+    def do_clear_blob(self, node):
+        """ Create a node which fills memory with zeros. """
+        dst = self.get_address(node.dst)
+        sgnode = self.new_node(
+            "CLRB", None, dst, value=(node.amount, node.alignment)
+        )
         self.chain(sgnode)
 
     def get_address(self, ir_address):
@@ -351,8 +374,8 @@ class SelectionGraphBuilder:
         address = self.get_address(node.address)
         value = self.get_value(node.value)
         if node.value.ty.is_blob:
-            size = node.value.ty.size
-            sgnode = self.new_node("MOVB", None, address, value, value=size)
+            blob = (node.value.ty.size, node.value.ty.alignment)
+            sgnode = self.new_node("MOVB", None, address, value, value=blob)
         else:
             sgnode = self.new_node("STR", node.value.ty, address, value)
         self.chain(sgnode)
@@ -458,6 +481,18 @@ class SelectionGraphBuilder:
         self.debug_db.map(node, sgnode)
         self.add_map(node, sgnode.new_output(node.name))
 
+    def do_select(self, node):
+        """ Create a select node, which compares without jumping """
+        a = self.get_value(node.a)
+        b = self.get_value(node.b)
+        yes = self.get_value(node.yes)
+        no = self.get_value(node.no)
+        sgnode = self.new_node("SELECT", node.ty, a, b, yes, no)
+        # Pointers are compared unsigned:
+        sgnode.value = (node.cond, node.a.ty.is_signed)
+        self.debug_db.map(node, sgnode)
+        self.add_map(node, sgnode.new_output(node.name))
+
     def do_cast(self, node):
         """ Create a cast of type """
         from_ty = node.src.ty
@@ -106,6 +106,19 @@ classes that possibly interfere.
 [Runeson2003]_
 [Smith2004]_
 
+**Linear scan**
+
+Building the interference graph takes a lot of time for large functions.
+Linear scan allocation numbers the instructions, and approximates the
+live range of each virtual register by a single interval from its first
+to its last position. The intervals are visited in order of their start,
+and each interval gets a register which is not taken by the intervals
+which are still active. When no register is left, the interval which
+ends last is spilled. This is fast, but gives more spills and moves than
+graph coloring, so it is intended for builds without optimizations.
+
+[Poletto1999]_
+
 
 **Implementations**
 
@@ -114,7 +127,10 @@ The following class can be used to perform register allocation.
 """
 
 import logging
+from bisect import bisect_left
+from collections import defaultdict
 from functools import lru_cache
+from itertools import chain
 from .flowgraph import FlowGraph
 from .interferencegraph import InterferenceGraph
 from ..arch.arch import Architecture, Frame
@@ -127,12 +143,12 @@ from .instructionselector import ContextInterface
 class MiniCtx(ContextInterface):
     def __init__(self, frame, arch):
         self._frame = frame
-        self._arch = arch
+        self.arch = arch
         self.instructions = []
 
     def move(self, dst, src):
         """ Generate move """
-        self.emit(self._arch.move(dst, src))
+        self.emit(self.arch.move(dst, src))
 
     def emit(self, instruction):
         self.instructions.append(instruction)
@@ -190,9 +206,6 @@ class MiniGen:
         return offset_tree
 
 
-# TODO: implement linear scan allocator and other allocators!
-
-
 class GraphColoringRegisterAllocator:
     """Target independent register allocator.
 
@@ -320,6 +333,13 @@ class GraphColoringRegisterAllocator:
         for mv in self.moves:
             self.link_move(mv)
 
+        # Collect the registers which the instructions prefer:
+        self.preferences = defaultdict(list)
+        for instruction in self.frame.instructions:
+            hints = self.arch.get_register_preferences(instruction)
+            for reg, preferred in hints:
+                self.preferences[reg].append(preferred)
+
         self.select_stack = []
 
         # Move related sets:
@@ -470,7 +490,7 @@ class GraphColoringRegisterAllocator:
         """
         # This check was m.degree == self.K - 1
         if m in self.spill_worklist and self.is_colorable(m):
-            self.enable_moves({m} | m.adjecent)
+            self.enable_moves([m] + m.adjecent)
             self.spill_worklist.remove(m)
             if self.is_move_related(m):
                 self.freeze_worklist.add(m)
@@ -558,7 +578,7 @@ class GraphColoringRegisterAllocator:
         many registers can be blocked by the remaining nodes. If this is
         less than the number of available registers, the coalesc is safe!
         """
-        nodes = u.adjecent | v.adjecent
+        nodes = set(u.adjecent).union(v.adjecent)
         B = self.common_reg_class(u.reg_class, v.reg_class)
         num_blocked = sum(
             self.q(B, j.reg_class) for j in nodes if not self.is_colorable(j)
@@ -770,11 +790,15 @@ class GraphColoringRegisterAllocator:
                         takenregs.add(r)
                 else:
                     takenregs.add(m.reg)
-            ok_regs = self.cls_regs[node.reg_class] - takenregs
+            ok_regs = [
+                reg
+                for reg in self.cls_regs[node.reg_class]
+                if reg not in takenregs
+            ]
 
             if ok_regs:
                 assert ok_regs
-                reg = ok_regs[0]
+                reg = self.choose_register(node, ok_regs)
 
                 if self.verbose:
                     self.logger.debug("Assign %s to node %s", reg, node)
@@ -785,6 +809,24 @@ class GraphColoringRegisterAllocator:
 
         return spilled_nodes
 
+    def choose_register(self, node, ok_regs):
+        """Choose one of the available registers for a node.
+
+        Instructions can prefer a set of registers, or the register of
+        another node, for example when this gives a shorter encoding.
+        Take the register which is preferred most often, and the first
+        available register otherwise.
+        """
+        scores = defaultdict(int)
+        for temp in node.temps:
+            for preferred in self.preferences.get(temp, ()):
+                for reg in preferred:
+                    if not reg.is_colored:
+                        reg = self.node(reg).reg
+                    if reg is not None:
+                        scores[reg] += 1
+        return max(ok_regs, key=lambda reg: scores[reg])
+
     def remove_redundant_moves(self):
         """ Remove coalesced moves """
         for move in self.coalescedMoves:
@@ -826,3 +868,334 @@ class GraphColoringRegisterAllocator:
             & self.frozenMoves
             == set()
         )
+
+
+class LiveInterval:
+    """The range of instruction positions in which a register is live.
+
+    Instruction number i uses its registers at position 2*i and defines
+    registers at position 2*i + 1, so that a register whose last use is
+    in an instruction can share the physical register with a register
+    defined by the same instruction.
+    """
+
+    __slots__ = ("vreg", "start", "end", "reg")
+
+    def __init__(self, vreg, position):
+        self.vreg = vreg
+        self.start = position
+        self.end = position
+        self.reg = None
+
+    def __repr__(self):
+        return "Interval({}, {}-{})".format(self.vreg, self.start, self.end)
+
+    def add(self, position):
+        """ Extend the interval to include the given position """
+        if position < self.start:
+            self.start = position
+        elif position > self.end:
+            self.end = position
+
+
+class LinearScanRegisterAllocator:
+    """Target independent linear scan register allocator.
+
+    This allocator is much faster than the graph coloring allocator, at
+    the cost of some more moves and spills, and is intended for builds
+    without optimizations. Spilled registers are rewritten into short
+    lived registers and the allocation is repeated, like in the graph
+    coloring allocator.
+    """
+
+    logger = logging.getLogger("regalloc")
+    verbose = False  # Set verbose to True to get more logging info
+
+    def __init__(self, arch: Architecture, instruction_selector, reporter):
+        assert isinstance(arch, Architecture), arch
+        self.arch = arch
+        self.spill_gen = MiniGen(arch, instruction_selector)
+        self.reporter = reporter
+
+        # A map with register alias info:
+        self.alias = arch.info.alias
+
+        # Mapping from class to the registers of that class:
+        self.cls_regs = {}
+        for reg_class in self.arch.info.register_classes:
+            self.cls_regs[reg_class.typ] = OrderedSet(reg_class.registers)
+
+    def alloc_frame(self, frame: Frame):
+        """Do linear scan register allocation for a single frame.
+
+        Args:
+            frame: The frame to perform register allocation on.
+        """
+        self.frame = frame
+        self.spill_temps = set()
+        spill_rounds = 0
+
+        self.logger.debug("Starting linear scan")
+        while True:
+            self.init_data(frame)
+            spilled = self.scan()
+            if spilled:
+                spill_rounds += 1
+
+                self.logger.debug("Spilling round %s", spill_rounds)
+                max_spill_rounds = 30
+                if spill_rounds > max_spill_rounds:
+                    raise RuntimeError(
+                        "Give up: more than {} spill rounds done!".format(
+                            max_spill_rounds
+                        )
+                    )
+
+                self.rewrite_program(spilled)
+
+                if self.verbose:
+                    self.reporter.message("Rewrote program with spilling")
+                    self.reporter.dump_frame(self.frame)
+            else:
+                break
+
+        self.apply_colors()
+        self.remove_redundant_moves()
+
+    def init_data(self, frame: Frame):
+        """Determine the live intervals of the virtual registers.
+
+        The positions at which the physical registers are occupied are
+        recorded as well, since these can have holes between for example
+        the passing of arguments to calls.
+        """
+        cfg = FlowGraph(frame.instructions)
+        self.logger.debug(
+            "Constructed flowgraph with %s nodes", len(cfg.nodes)
+        )
+        cfg.calculate_block_liveness()
+
+        self.intervals = OrderedDict()
+        self.occupied = defaultdict(list)
+        self.preferences = defaultdict(list)
+        self.moves = []
+
+        for index, instruction in enumerate(frame.instructions):
+            if cfg.has_node(instruction):
+                node = cfg.get_node(instruction)
+                self.add_node_positions(node, index)
+
+            # Collect the registers which are preferred:
+            if instruction.ismove:
+                dst = instruction.defined_registers[0]
+                src = instruction.used_registers[0]
+                self.moves.append((instruction, dst, src))
+                self.preferences[dst].append((src,))
+                self.preferences[src].append((dst,))
+            hints = self.arch.get_register_preferences(instruction)
+            for reg, preferred in hints:
+                self.preferences[reg].append(preferred)
+
+        for positions in self.occupied.values():
+            positions.sort()
+
+        self.logger.debug("Determined %s live intervals", len(self.intervals))
+
+    def add_node_positions(self, node, first):
+        """Add the positions of the registers used in a flowgraph node.
+
+        The intervals of the virtual registers only need the start and
+        the end of the node for the registers live there. The physical
+        registers are followed backwards through the instructions.
+        """
+        last = first + len(node.instructions) - 1
+        live = set()
+        for reg in node.live_out:
+            if reg.is_colored:
+                live.add(reg.get_real())
+            else:
+                self.add_position(reg, 2 * last + 1)
+        for reg in node.live_in:
+            if not reg.is_colored:
+                self.add_position(reg, 2 * first)
+
+        index = last
+        for instruction in reversed(node.instructions):
+            use_position = 2 * index
+            def_position = use_position + 1
+            for reg in live:
+                self.occupied[reg].append(def_position)
+            for reg in instruction.kill:
+                self.add_position(reg, def_position)
+                if reg.is_colored:
+                    live.discard(reg.get_real())
+            for reg in instruction.clobbers:
+                self.occupied[reg.get_real()].append(def_position)
+            for reg in instruction.gen:
+                if reg.is_colored:
+                    live.add(reg.get_real())
+                else:
+                    self.add_position(reg, use_position)
+            for reg in live:
+                self.occupied[reg].append(use_position)
+            index -= 1
+
+    def add_position(self, reg, position):
+        """ Mark a register as live at the given position """
+        if reg.is_colored:
+            self.occupied[reg.get_real()].append(position)
+        elif reg in self.intervals:
+            self.intervals[reg].add(position)
+        else:
+            self.intervals[reg] = LiveInterval(reg, position)
+
+    def scan(self):
+        """Assign registers to the intervals in order of their start.
+
+        Returns the registers which must be spilled, if any.
+        """
+        intervals = sorted(
+            self.intervals.values(), key=lambda interval: interval.start
+        )
+        active = []
+        spilled = []
+        for interval in intervals:
+            # Expire intervals which ended before this one:
+            active = [i for i in active if i.end >= interval.start]
+
+            taken = set()
+            for other in active:
+                taken.update(self.alias.get(other.reg, (other.reg,)))
+
+            reg = self.choose_register(interval, taken)
+            if reg is not None:
+                interval.reg = reg
+                active.append(interval)
+            else:
+                victim = self.select_spill(interval, active)
+                spilled.append(victim.vreg)
+                if victim is not interval:
+                    interval.reg = victim.reg
+                    victim.reg = None
+                    active.remove(victim)
+                    active.append(interval)
+
+            if self.verbose:
+                self.logger.debug("Assign %s to %s", interval.reg, interval)
+
+        return spilled
+
+    def is_free(self, reg, interval):
+        """ Test if no alias of reg is occupied during the interval """
+        for reg2 in self.alias.get(reg, (reg,)):
+            positions = self.occupied.get(reg2)
+            if positions:
+                index = bisect_left(positions, interval.start)
+                if index < len(positions) and positions[index] <= interval.end:
+                    return False
+        return True
+
+    def select_spill(self, interval, active):
+        """Select the interval to spill, which is the one ending last.
+
+        Only the active intervals whose register can be used by the given
+        interval are considered. Registers which were introduced by
+        spilling are never spilled again.
+        """
+        candidates = [
+            other
+            for other in active
+            if other.vreg not in self.spill_temps
+            and other.reg in self.cls_regs[type(interval.vreg)]
+            and self.is_free(other.reg, interval)
+        ]
+        if interval.vreg not in self.spill_temps:
+            candidates.append(interval)
+        if not candidates:
+            raise RuntimeError(
+                "Cannot find a register for {}".format(interval.vreg)
+            )
+        return max(candidates, key=lambda other: other.end)
+
+    def choose_register(self, interval, taken):
+        """Choose one of the available registers for an interval.
+
+        Registers of move partners and registers preferred by the
+        instructions are taken when possible, so that moves can be
+        removed afterwards. Otherwise take the first available register
+        of the class, or None if there is no register available.
+        """
+        regs = self.cls_regs[type(interval.vreg)]
+        scores = defaultdict(int)
+        for preferred in self.preferences.get(interval.vreg, ()):
+            for reg in preferred:
+                if reg.is_colored:
+                    scores[reg.get_real()] += 2
+                elif reg in self.intervals and self.intervals[reg].reg:
+                    scores[self.intervals[reg].reg] += 2
+                else:
+                    # Look ahead at the registers preferred by registers
+                    # which get a register later on:
+                    for preferred2 in self.preferences.get(reg, ()):
+                        for reg2 in preferred2:
+                            if reg2.is_colored:
+                                scores[reg2.get_real()] += 1
+        preferred = sorted(scores, key=lambda reg: -scores[reg])
+        for reg in chain(preferred, regs):
+            if (
+                reg in regs
+                and reg not in taken
+                and self.is_free(reg, interval)
+            ):
+                return reg
+
+    def rewrite_program(self, spilled):
+        """ Rewrite program by creating a load and a store for each use """
+        slots = {}
+        for vreg in spilled:
+            self.logger.debug("Placing {} on stack".format(vreg))
+            size = vreg.bitsize // 8
+            slots[vreg] = self.frame.alloc(size, size)
+
+        for instruction in list(self.frame.instructions):
+            registers = OrderedSet(
+                instruction.used_registers + instruction.defined_registers
+            )
+            for vreg in registers:
+                if vreg not in slots:
+                    continue
+
+                slot = slots[vreg]
+                vreg2 = self.frame.new_reg(type(vreg))
+                self.spill_temps.add(vreg2)
+                instruction.replace_register(vreg, vreg2)
+
+                if instruction.reads_register(vreg2):
+                    code = self.spill_gen.gen_load(self.frame, vreg2, slot)
+                    self.frame.insert_code_before(instruction, code)
+
+                if instruction.writes_register(vreg2):
+                    code = self.spill_gen.gen_store(self.frame, vreg2, slot)
+                    self.frame.insert_code_after(instruction, code)
+
+    def apply_colors(self):
+        """ Assign colors to registers """
+        for interval in self.intervals.values():
+            interval.vreg.set_color(interval.reg.color)
+            self.frame.used_regs.add(interval.reg.get_real())
+
+        # Mark the pre-colored registers as used in this frame:
+        for reg in self.occupied:
+            self.frame.used_regs.add(reg)
+
+    def remove_redundant_moves(self):
+        """ Remove moves between registers which were assigned the same """
+        redundant = {
+            move for move, dst, src in self.moves if dst.color == src.color
+        }
+        if redundant:
+            self.frame.instructions[:] = [
+                instruction
+                for instruction in self.frame.instructions
+                if instruction not in redundant
+            ]
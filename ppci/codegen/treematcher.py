@@ -3,8 +3,8 @@ class State:
 
     __slots__ = ("labels",)
 
-    def __init__(self):
-        self.labels = {}
+    def __init__(self, labels=None):
+        self.labels = {} if labels is None else labels
 
     def has_goal(self, goal):
         return goal in self.labels
@@ -990,6 +990,50 @@ class Binop(LocalValue):
         )
 
 
+class Select(LocalValue):
+    """Select one of two values, depending on a comparison.
+
+    The value is yes when the comparison of a and b holds, and no
+    otherwise. Unlike a conditional jump, both values are evaluated, so
+    a select can be lowered without branches.
+    """
+
+    conditions = ["==", "<", ">", ">=", "<=", "!="]
+    a = value_use("a")
+    b = value_use("b")
+    yes = value_use("yes")
+    no = value_use("no")
+
+    def __init__(self, a, cond, b, yes, no, name, ty):
+        super().__init__(name, ty)
+        if cond not in Select.conditions:
+            raise ValueError("Invalid condition {}".format(cond))
+
+        if yes.ty is not ty or no.ty is not ty:
+            raise TypeError(
+                "Select type mismatch {}, {} != {}".format(
+                    yes.ty, no.ty, ty
+                )
+            )
+
+        self.a = a
+        self.cond = cond
+        self.b = b
+        self.yes = yes
+        self.no = no
+
+    def __str__(self):
+        return "{} {} = select {} {} {} ? {} : {}".format(
+            self.ty,
+            self.name,
+            self.a.name,
+            self.cond,
+            self.b.name,
+            self.yes.name,
+            self.no.name,
+        )
+
+
 def add(a, b, name, ty):
     """ Substract b from a """
     return Binop(a, "+", b, name, ty)
@@ -1099,13 +1143,15 @@ class CopyBlob(Instruction):
     dst = value_use("dst")
     src = value_use("src")
 
-    def __init__(self, dst, src, amount: int):
+    def __init__(self, dst, src, amount: int, alignment: int = 1):
         super().__init__()
         self.dst = dst
         self.src = src
         if not isinstance(amount, int):
             raise TypeError("amount must be int, not {}".format(type(amount)))
         self.amount = amount
+        # The alignment which both dst and src are known to have:
+        self.alignment = alignment
 
     def __str__(self):
         return "memcpy({}, {}, {})".format(
@@ -1113,6 +1159,23 @@ class CopyBlob(Instruction):
         )
 
 
+class ClearBlob(Instruction):
+    """ Sort of memset operation, which fills a blob with zeros. """
+
+    dst = value_use("dst")
+
+    def __init__(self, dst, amount: int, alignment: int = 1):
+        super().__init__()
+        self.dst = dst
+        if not isinstance(amount, int):
+            raise TypeError("amount must be int, not {}".format(type(amount)))
+        self.amount = amount
+        self.alignment = alignment
+
+    def __str__(self):
+        return "memset({}, 0, {})".format(self.dst.name, self.amount)
+
+
 class Variable(GlobalValue):
     """ Global variable, reserves room in the data area. Has name and size """
 
@@ -1385,7 +1448,11 @@ class CJump(JumpBase):
 
 
 class JumpTable(JumpBase):
-    """ Jump table.
+    """Jump table.
+
+    Jump to the block at index v in the table. When v is outside of the
+    table, jump to the default block. The index is compared unsigned, so a
+    negative index jumps to the default block as well.
 
     In the worst case, this is expanded to a whole bunch of CJump statements.
     """
@@ -1396,9 +1463,31 @@ class JumpTable(JumpBase):
     def __init__(self, v, table, default):
         super().__init__()
         self.v = v
-        self.table = table
+        self.size = len(table)
+        for index, block in enumerate(table):
+            self.set_target_block("table_{}".format(index), block)
         self.lab_default = default
-        raise NotImplementedError("TODO")
+
+    @property
+    def table(self):
+        """ Get the list of blocks in the table """
+        return [
+            self._block_map["table_{}".format(index)]
+            for index in range(self.size)
+        ]
+
+    @property
+    def targets(self):
+        """ Gets the unique blocks that this instruction jumps to """
+        targets = []
+        for block in self._block_map.values():
+            if block not in targets:
+                targets.append(block)
+        return targets
 
     def __str__(self):
-        return "jmp_table {}".format(self.v.name)
+        return "jmp_table {} ? [{}] : {}".format(
+            self.v.name,
+            ", ".join(block.name for block in self.table),
+            self.lab_default.name,
+        )
@@ -214,6 +214,17 @@ class DictWriter:
                 "operation": instruction.operation,
                 "b": self.write_value_ref(instruction.b),
             }
+        elif isinstance(instruction, ir.Select):
+            json_instruction = {
+                "kind": "select",
+                "name": instruction.name,
+                "type": self.write_type(instruction.ty),
+                "a": self.write_value_ref(instruction.a),
+                "condition": instruction.cond,
+                "b": self.write_value_ref(instruction.b),
+                "yes": self.write_value_ref(instruction.yes),
+                "no": self.write_value_ref(instruction.no),
+            }
         elif isinstance(instruction, ir.Unop):
             json_instruction = {
                 "kind": "unop",
@@ -252,6 +263,17 @@ class DictWriter:
                 "yes_block": self.write_block_ref(instruction.lab_yes),
                 "no_block": self.write_block_ref(instruction.lab_no),
             }
+        elif isinstance(instruction, ir.JumpTable):
+            json_instruction = {
+                "kind": "jumptable",
+                "v": self.write_value_ref(instruction.v),
+                "table": [
+                    self.write_block_ref(block) for block in instruction.table
+                ],
+                "default_block": self.write_block_ref(
+                    instruction.lab_default
+                ),
+            }
         elif isinstance(instruction, ir.Cast):
             json_instruction = {
                 "kind": "cast",
@@ -492,6 +514,16 @@ class DictReader:
             b = self.get_value_ref(json_instruction["b"])
             instruction = ir.Binop(a, operation, b, name, ty)
             self.register_value(instruction)
+        elif itype == "select":
+            name = json_instruction["name"]
+            ty = self.get_type(json_instruction["type"])
+            a = self.get_value_ref(json_instruction["a"])
+            cond = json_instruction["condition"]
+            b = self.get_value_ref(json_instruction["b"])
+            yes = self.get_value_ref(json_instruction["yes"])
+            no = self.get_value_ref(json_instruction["no"])
+            instruction = ir.Select(a, cond, b, yes, no, name, ty)
+            self.register_value(instruction)
         elif itype == "unop":
             name = json_instruction["name"]
             ty = self.get_type(json_instruction["type"])
@@ -536,6 +568,13 @@ class DictReader:
             lab_yes = self.get_block_ref(json_instruction["yes_block"])
             lab_no = self.get_block_ref(json_instruction["no_block"])
             instruction = ir.CJump(a, cond, b, lab_yes, lab_no)
+        elif itype == "jumptable":
+            v = self.get_value_ref(json_instruction["v"])
+            table = [
+                self.get_block_ref(name) for name in json_instruction["table"]
+            ]
+            default = self.get_block_ref(json_instruction["default_block"])
+            instruction = ir.JumpTable(v, table, default)
         elif itype == "procedurecall":
             callee = self.get_value_ref(json_instruction["callee"])
             arguments = []
@@ -354,6 +354,15 @@ class Reader:
                     self.consume(":")
                     v1 = self.parse_value_ref(ty=ty)
                     ins.set_incoming(b1, v1)
+            elif a == "select":
+                a = self.parse_value_ref()
+                cond = self.consume(self.peek)[0]
+                b = self.parse_value_ref()
+                self.consume("?")
+                yes = self.parse_value_ref(ty=ty)
+                self.consume(":")
+                no = self.parse_value_ref(ty=ty)
+                ins = ir.Select(a, cond, b, yes, no, name, ty)
             elif a == "alloc":
                 size = self.parse_integer()
                 self.consume_keyword("bytes")
@@ -421,6 +430,8 @@ class Reader:
             ins = self.parse_jmp()
         elif self.at_keyword("cjmp"):
             ins = self.parse_cjmp()
+        elif self.at_keyword("jmp_table"):
+            ins = self.parse_jmp_table()
         elif self.at_keyword("return"):
             ins = self.parse_return()
         elif self.at_keyword("store"):
@@ -455,6 +466,21 @@ class Reader:
         ins = ir.CJump(a, op, b, L1, L2)
         return ins
 
+    def parse_jmp_table(self):
+        self.consume_keyword("jmp_table")
+        v = self.parse_value_ref()
+        self.consume("?")
+        self.consume("[")
+        table = [self.parse_block_ref()]
+        while self.peek == ",":
+            self.consume(",")
+            table.append(self.parse_block_ref())
+        self.consume("]")
+        self.consume(":")
+        default = self.parse_block_ref()
+        ins = ir.JumpTable(v, table, default)
+        return ins
+
     def parse_jmp(self):
         self.consume_keyword("jmp")
         L1 = self.parse_block_ref()
@@ -160,13 +160,19 @@ class Verifier:
         elif isinstance(instruction, ir.Phi):
             for inp_val in instruction.inputs.values():
                 assert instruction.ty is inp_val.ty
-        elif isinstance(instruction, ir.CJump):
+        elif isinstance(instruction, (ir.CJump, ir.Select)):
             if instruction.a.ty is not instruction.b.ty:
                 raise IrFormError(
                     "Type {} is not {} in {}".format(
                         instruction.a.ty, instruction.b.ty, instruction
                     )
                 )
+        elif isinstance(instruction, ir.JumpTable):
+            ty = instruction.v.ty
+            if not (ty is ir.ptr or ty.is_integer):
+                raise IrFormError(
+                    "Jump table index must be an integer, not {}".format(ty)
+                )
         elif isinstance(instruction, (ir.FunctionCall, ir.ProcedureCall)):
             if isinstance(
                 instruction.callee, (ir.SubRoutine, ir.ExternalSubRoutine)
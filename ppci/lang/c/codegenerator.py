@@ -17,6 +17,11 @@ from .scope import RootScope
 from ...utils.bitfun import value_to_bits, bits_to_bytes
 from .eval import ConstantExpressionEvaluator
 
+# Switch statements with at least this many cases use a jump table, when
+# the case values are dense enough:
+JUMP_TABLE_MIN_CASES = 4
+JUMP_TABLE_MIN_DENSITY = 0.4
+
 
 class CCodeGenerator:
     """ Converts parsed C code to ir-code """
@@ -575,7 +580,8 @@ class CCodeGenerator:
             https://www.codeproject.com/Articles/100473/
             Something-You-May-Not-Know-About-the-Switch-Statem
 
-        For now, implemented as a gigantic if-then forest.
+        Dense switches are implemented with a jump table, others as
+        a gigantic if-then forest.
         """
         backup = self.switch_options
         self.switch_options = {}
@@ -594,24 +600,34 @@ class CCodeGenerator:
         self.break_block_stack.pop()
 
         # Implement switching logic, now that we have the branches:
-        # TODO: implement jump tables and other performance related stuff.
         self.builder.set_block(test_block)
         test_value = self.gen_expr(stmt.expression, rvalue=True)
         switch_ir_typ = self.get_ir_type(stmt.expression.typ)
-        for option, target_block in self.switch_options.items():
-            if option != "default":
-                option = self.builder.emit_const(option, switch_ir_typ)
+        default_block = self.switch_options.get("default", final_block)
+        values = [
+            option for option in self.switch_options if option != "default"
+        ]
+        if self.use_jump_table(values, switch_ir_typ):
+            self.gen_jump_table(
+                test_value, switch_ir_typ, values, default_block
+            )
+        else:
+            for value in values:
+                option = self.builder.emit_const(value, switch_ir_typ)
                 next_test_block = self.builder.new_block()
                 self.emit(
                     ir.CJump(
-                        test_value, "==", option, target_block, next_test_block
+                        test_value,
+                        "==",
+                        option,
+                        self.switch_options[value],
+                        next_test_block,
                     )
                 )
                 self.builder.set_block(next_test_block)
 
-        # If all else fails, jump to the default case if we have it.
-        target_block = self.switch_options.get("default", final_block)
-        self.builder.emit_jump(target_block)
+            # If all else fails, jump to the default case if we have it.
+            self.builder.emit_jump(default_block)
 
         # Set continuation point:
         self.builder.set_block(final_block)
@@ -619,6 +635,31 @@ class CCodeGenerator:
         # Restore state:
         self.switch_options = backup
 
+    def use_jump_table(self, values, ir_typ):
+        """ Test if a switch with the given case values uses a jump table """
+        if not self.context.arch_info.jump_tables:
+            return False
+        if len(values) < JUMP_TABLE_MIN_CASES or ir_typ.size > self.ptr_size:
+            return False
+        span = max(values) - min(values) + 1
+        return len(values) >= span * JUMP_TABLE_MIN_DENSITY
+
+    def gen_jump_table(self, test_value, ir_typ, values, default_block):
+        """Jump to the case blocks via a table indexed by the switch value.
+
+        The gaps in between the case values go to the default block.
+        """
+        lowest, highest = min(values), max(values)
+        if lowest != 0:
+            offset = self.builder.emit_const(lowest, ir_typ)
+            test_value = self.builder.emit_sub(test_value, offset, ir_typ)
+        index = self.builder.emit_cast(test_value, ir.ptr)
+        table = [
+            self.switch_options.get(value, default_block)
+            for value in range(lowest, highest + 1)
+        ]
+        self.emit(ir.JumpTable(index, table, default_block))
+
     def gen_while(self, stmt: statements.While) -> None:
         """ Generate while statement code """
         condition_block = self.builder.new_block()
@@ -877,6 +918,11 @@ class CCodeGenerator:
         field = expr.field
         ivalue = expr.value
         ptr, inc = self.gen_local_init(ptr, field.typ, ivalue)
+
+        # Clear the remainder of the union:
+        size = self.sizeof(typ)
+        ptr = self.gen_local_clear(ptr, size - inc, 1)
+        inc = size
         # Update pointer with size of union:
         # inc = self.context.sizeof(typ)
         # size = self.emit(ir.Const(inc, 'size', ir.ptr))
@@ -887,17 +933,25 @@ class CCodeGenerator:
         self, ptr, typ, expr: expressions.ArrayInitializer
     ):
         assert isinstance(expr, expressions.ArrayInitializer)
+        element_size, alignment = self.data_layout(typ.element_type)
         inc = 0
+        holes = 0
         for value in expr.values:
             # TODO: do array elements need to be aligned?
             if value is None:
                 # Implicit value (a hole between other valid values.)
-                pad_inc = self.sizeof(typ.element_type)
-                ptr = self.builder.emit_add(ptr, pad_inc, ir.ptr)
-                inc2 = pad_inc
+                holes += element_size
             else:
+                ptr = self.gen_local_clear(ptr, holes, alignment)
+                inc += holes
+                holes = 0
                 ptr, inc2 = self.gen_local_init(ptr, typ.element_type, value)
-            inc += inc2
+                inc += inc2
+
+        # Elements without a value are zero, up to the end of the array:
+        size = self.sizeof(typ)
+        ptr = self.gen_local_clear(ptr, size - inc, alignment)
+        inc = size
         return ptr, inc
 
     def gen_local_init_struct(self, ptr, typ, expr):
@@ -932,9 +986,8 @@ class CCodeGenerator:
                         value = expr.values[field]
                         ptr, inc2 = self.gen_local_init(ptr, field.typ, value)
                     else:
-                        pad_inc = self.sizeof(field.typ)
-                        ptr = self.builder.emit_add(ptr, pad_inc, ir.ptr)
-                        inc2 = pad_inc
+                        inc2, alignment = self.data_layout(field.typ)
+                        ptr = self.gen_local_clear(ptr, inc2, alignment)
                 offset += inc2
 
             # Fill last padding space:
@@ -951,6 +1004,13 @@ class CCodeGenerator:
             inc = value.ty.size
         return ptr, inc
 
+    def gen_local_clear(self, ptr, amount, alignment):
+        """ Fill a part of a local variable with zeros """
+        if amount > 0:
+            self.emit(ir.ClearBlob(ptr, amount, alignment))
+            ptr = self.builder.emit_add(ptr, amount, ir.ptr)
+        return ptr
+
     def gen_condition_to_integer(self, expr):
         """ Generate code that takes a boolean and convert it to integer """
         yes_block = self.builder.new_block()
@@ -1049,7 +1109,9 @@ class CCodeGenerator:
                         ir.Alloc("load_blob", ir_typ.size, ir_typ.alignment)
                     )
                     value_ptr = self.emit(ir.AddressOf(value, "value_ptr"))
-                    self.gen_copy_struct(value_ptr, lvalue, ir_typ.size)
+                    self.gen_copy_struct(
+                        value_ptr, lvalue, ir_typ.size, ir_typ.alignment
+                    )
             elif isinstance(lvalue, BitFieldAccess):
                 value = self._load_bitfield(lvalue, ir_typ)
             else:
@@ -1286,8 +1348,8 @@ class CCodeGenerator:
             if expr.op == "=" and expr.a.typ.is_struct:
                 lhs = self.gen_expr(expr.a, rvalue=False)
                 rhs = self.gen_expr(expr.b, rvalue=False)
-                amount = self.sizeof(expr.a.typ)
-                self.gen_copy_struct(lhs, rhs, amount)
+                amount, alignment = self.data_layout(expr.a.typ)
+                self.gen_copy_struct(lhs, rhs, amount, alignment)
                 value = None
             else:
                 lhs = self.gen_expr(expr.a, rvalue=False)
@@ -1315,9 +1377,9 @@ class CCodeGenerator:
             raise NotImplementedError(str(expr.op))
         return value
 
-    def gen_copy_struct(self, dst, src, amount):
+    def gen_copy_struct(self, dst, src, amount, alignment):
         """ Generate a copy struct action. """
-        self.emit(ir.CopyBlob(dst, src, amount))
+        self.emit(ir.CopyBlob(dst, src, amount, alignment))
 
     def gen_ternop(self, expr: expressions.TernaryOperator):
         """ Generate code for ternary operator a ? b : c """
@@ -154,6 +154,11 @@ class IrToPythonCompiler:
         self.print(2, "return value")
         self.emit("")
 
+        # Round to single precision:
+        self.emit("def _irpy_f32(value):")
+        self.print(1, 'return struct.unpack("f", struct.pack("f", value))[0]')
+        self.emit("")
+
         # More C like integer divide
         self.emit("def _irpy_idiv(x, y):")
         with self.indented():
@@ -344,6 +349,8 @@ class IrToPythonCompiler:
             self.gen_cjump(ins)
         elif isinstance(ins, ir.Jump):
             self.gen_jump(ins)
+        elif isinstance(ins, ir.JumpTable):
+            self.gen_jump_table(ins)
         elif isinstance(ins, ir.Alloc):
             self.emit("{} = _irpy_alloca({})".format(ins.name, ins.amount))
             self.stack_size += ins.amount
@@ -372,16 +379,28 @@ class IrToPythonCompiler:
                 )
         elif isinstance(ins, ir.Binop):
             self.gen_binop(ins)
+        elif isinstance(ins, ir.Select):
+            a = self.fetch_value(ins.a)
+            b = self.fetch_value(ins.b)
+            yes = self.fetch_value(ins.yes)
+            no = self.fetch_value(ins.no)
+            self.emit(
+                "{} = {} if {} {} {} else {}".format(
+                    ins.name, yes, a, ins.cond, b, no
+                )
+            )
         elif isinstance(ins, ir.Cast):
             if ins.ty.is_integer:
                 self.emit(
-                    "{} = _irpy_correct(int(round({})), {}, {})".format(
+                    "{} = _irpy_correct(int({}), {}, {})".format(
                         ins.name, ins.src.name, ins.ty.bits, ins.ty.signed
                     )
                 )
             elif ins.ty is ir.ptr:
                 self.emit("{} = int(round({}))".format(ins.name, ins.src.name))
-            elif ins.ty in [ir.f32, ir.f64]:
+            elif ins.ty is ir.f32:
+                self.emit("{} = _irpy_f32({})".format(ins.name, ins.src.name))
+            elif ins.ty is ir.f64:
                 self.emit("{} = float({})".format(ins.name, ins.src.name))
             else:  # pragma: no cover
                 raise NotImplementedError(str(ins))
@@ -432,6 +451,19 @@ class IrToPythonCompiler:
         else:
             self.emit_jump(ins.target)
 
+    def gen_jump_table(self, ins):
+        if self._shape_style:  # pragma: no cover
+            raise NotImplementedError(str(ins))
+        v = self.fetch_value(ins.v)
+        targets = ", ".join('"{}"'.format(b.name) for b in ins.table)
+        self.emit("if 0 <= {} < {}:".format(v, len(ins.table)))
+        with self.indented():
+            self.emit("_irpy_prev_block = _irpy_current_block")
+            self.emit("_irpy_current_block = [{}][{}]".format(targets, v))
+        self.emit("else:")
+        with self.indented():
+            self.emit_jump(ins.lab_default)
+
     def gen_binop(self, ins):
         a = self.fetch_value(ins.a)
         b = self.fetch_value(ins.b)
@@ -460,6 +492,8 @@ class IrToPythonCompiler:
                     ins.name, ins.ty.bits, ins.ty.signed
                 )
             )
+        elif ins.ty is ir.f32:
+            self.emit("{0} = _irpy_f32({0})".format(ins.name))
 
     def gen_load(self, ins):
         address = self.fetch_value(ins.address)
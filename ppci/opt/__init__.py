@@ -2,7 +2,9 @@ from .clean import CleanPass
 from .mem2reg import Mem2RegPromotor
 from .cse import CommonSubexpressionEliminationPass
 from .constantfolding import ConstantFolder
+from .division import DivisionByPowerOfTwoPass
 from .load_after_store import LoadAfterStorePass
+from .select import SelectPass
 from .transform import RemoveAddZeroPass
 from .transform import DeleteUnusedInstructionsPass
 from .transform import ModulePass, FunctionPass, BlockPass, InstructionPass
@@ -17,7 +19,9 @@ __all__ = [
     "CommonSubexpressionEliminationPass",
     "ConstantFolder",
     "DeleteUnusedInstructionsPass",
+    "DivisionByPowerOfTwoPass",
     "LoadAfterStorePass",
     "Mem2RegPromotor",
     "RemoveAddZeroPass",
+    "SelectPass",
 ]
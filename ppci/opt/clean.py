@@ -49,6 +49,15 @@ class CleanPass(FunctionPass):
             if block in predecessors:
                 continue
 
+            # Do not remove if a predecessor already jumps to a successor
+            # with phi nodes, the phis can only have one value per block:
+            if any(
+                successor.phis
+                and set(predecessors) & set(successor.predecessors)
+                for successor in successors
+            ):
+                continue
+
             # Update successor incoming blocks:
             for successor in successors:
                 successor.replace_incoming(block, predecessors)
@@ -48,6 +48,12 @@ class ConstantFolder(BlockPass):
             return True
         elif isinstance(value, ir.Cast):
             return self.is_const(value.src)
+        elif isinstance(value, ir.Unop):
+            return (
+                value.operation == "-"
+                and value.ty.is_integer
+                and self.is_const(value.a)
+            )
         elif isinstance(value, ir.Binop):
             return (
                 value.operation in self.ops
@@ -69,6 +75,9 @@ class ConstantFolder(BlockPass):
             assert a.ty is value.ty
             res = self.ops[value.operation](value.ty, a.value, b.value)
             return ir.Const(res, "new_fold", a.ty)
+        elif isinstance(value, ir.Unop):
+            a = self.eval_const(value.a)
+            return ir.Const(correct(-a.value, a.ty), "new_fold", a.ty)
         elif isinstance(value, ir.Cast):
             c_val = self.eval_const(value.src)
             numeric_value = cast(c_val.value, value.ty)
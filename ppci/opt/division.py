@@ -0,0 +1,77 @@
+""" Strength reduction of integer division by constants. """
+
+from .transform import BlockPass
+from .. import ir
+from ..utils.bitfun import is_power_of_two, to_signed, to_unsigned
+
+UNSIGNED_TYPES = {ir.i8: ir.u8, ir.i16: ir.u16, ir.i32: ir.u32, ir.i64: ir.u64}
+
+
+class DivisionByPowerOfTwoPass(BlockPass):
+    """Replace division and remainder by a power of two with shifts and
+    masks.
+
+    Signed values are rounded towards zero by adding 2**k - 1 to negative
+    dividends before shifting. Division by other constants requires the
+    upper half of a product, which the IR cannot express, so backends
+    handle those during instruction selection.
+    """
+
+    def on_block(self, block):
+        count = 0
+        for instruction in list(block):
+            if (
+                isinstance(instruction, ir.Binop)
+                and instruction.operation in ("/", "%")
+                and instruction.ty.is_integer
+                and isinstance(instruction.b, ir.Const)
+            ):
+                ty = instruction.ty
+                if ty.signed:
+                    divisor = to_signed(instruction.b.value, ty.bits)
+                else:
+                    divisor = to_unsigned(instruction.b.value, ty.bits)
+                if is_power_of_two(abs(divisor)):
+                    self.rewrite(instruction, divisor)
+                    count += 1
+        if count > 0:
+            self.logger.debug("Replaced %i divisions", count)
+
+    def rewrite(self, instruction, divisor):
+        """ Insert the shifts and masks before the division """
+        ty = instruction.ty
+        shift = abs(divisor).bit_length() - 1
+
+        def emit(value):
+            instruction.block.insert_instruction(
+                value, before_instruction=instruction
+            )
+            return value
+
+        def binop(a, operation, b, ty=ty):
+            return emit(ir.Binop(a, operation, b, "div_strength", ty))
+
+        def const(value, ty=ty):
+            return emit(ir.Const(value, "div_strength", ty))
+
+        x = instruction.a
+        bias = None
+        if ty.signed and shift > 0:
+            # Round towards zero by adding 2**shift - 1 to negative values,
+            # which is the sign shifted right logically:
+            uty = UNSIGNED_TYPES[ty]
+            sign = binop(x, ">>", const(ty.bits - 1))
+            sign = emit(ir.Cast(sign, "div_strength", uty))
+            bias = binop(sign, ">>", const(ty.bits - shift, uty), uty)
+            bias = emit(ir.Cast(bias, "div_strength", ty))
+            x = binop(x, "+", bias)
+
+        if instruction.operation == "/":
+            value = binop(x, ">>", const(shift))
+            if divisor < 0:
+                value = emit(ir.Unop("-", value, "div_strength", ty))
+        else:
+            value = binop(x, "&", const((1 << shift) - 1))
+            if bias:
+                value = binop(value, "-", bias)
+        instruction.replace_by(value)
@@ -0,0 +1,178 @@
+from .transform import FunctionPass
+from .clean import CleanPass
+from .. import ir
+
+
+class SelectPass(FunctionPass):
+    """Turn small diamonds in the control flow graph into selects.
+
+    A conditional jump to one or two short blocks, which only compute
+    the values of the phi nodes in the block where they join, is
+    replaced by select instructions:
+
+    .. code::
+
+        cjmp a < b ? A : B
+        A:
+        jmp C
+        B:
+        jmp C
+        C:
+        i32 c = phi A: x, B: y
+
+    Transforms into:
+
+    .. code::
+
+        i32 c = select a < b ? x : y
+        jmp C
+        C:
+
+    The instructions of the short blocks are executed speculatively, so
+    only instructions without side effects are moved. This pass is run
+    just before instruction selection for targets which can lower
+    selects without branches.
+    """
+
+    max_arm_size = 2
+    max_phis = 2
+
+    def on_function(self, function):
+        count = 0
+        change = True
+        while change:
+            change = False
+            for block in function:
+                if self.convert_block(block):
+                    count += 1
+                    change = True
+                    break
+        if count > 0:
+            self.logger.debug("Created selects for %s diamonds", count)
+
+    def convert_block(self, block):
+        """ Try to replace the conditional jump of block by selects """
+        cjump = block.last_instruction
+        if not isinstance(cjump, ir.CJump):
+            return False
+
+        if cjump.lab_yes is cjump.lab_no:
+            return False
+
+        if not (self.is_int(cjump.a.ty) and self.is_int(cjump.b.ty)):
+            return False
+
+        # Determine the join block and the arms in between:
+        yes_arm = self.get_arm(block, cjump.lab_yes)
+        no_arm = self.get_arm(block, cjump.lab_no)
+        if yes_arm:
+            join = yes_arm.last_instruction.target
+        elif no_arm:
+            join = no_arm.last_instruction.target
+        else:
+            return False
+
+        if join is block:
+            return False
+
+        if yes_arm is None and cjump.lab_yes is not join:
+            return False
+
+        if no_arm is None and cjump.lab_no is not join:
+            return False
+
+        if no_arm and no_arm.last_instruction.target is not join:
+            return False
+
+        phis = join.phis
+        if not phis or len(phis) > self.max_phis:
+            return False
+
+        if not all(self.is_int(phi.ty) for phi in phis):
+            return False
+
+        # Move the instructions of the arms in front of the jump:
+        arms = [arm for arm in (yes_arm, no_arm) if arm]
+        for arm in arms:
+            for instruction in arm.instructions[:-1]:
+                arm.remove_instruction(instruction)
+                block.insert_instruction(instruction, cjump)
+
+        # Create a select for each phi:
+        yes_block = yes_arm or block
+        no_block = no_arm or block
+        for phi in phis:
+            yes = phi.get_value(yes_block)
+            no = phi.get_value(no_block)
+            if yes is no:
+                value = yes
+            else:
+                value = ir.Select(
+                    cjump.a, cjump.cond, cjump.b, yes, no, "select", phi.ty
+                )
+                block.insert_instruction(value, cjump)
+            for arm in arms:
+                phi.del_incoming(arm)
+            phi.set_incoming(block, value)
+
+        # Replace the conditional jump and remove the arms:
+        block.remove_instruction(cjump)
+        cjump.delete()
+        block.add_instruction(ir.Jump(join))
+        for arm in arms:
+            arm.delete()
+            block.function.remove_block(arm)
+
+        # Merge the join block if it has no other predecessors:
+        if join.predecessors == [block] and not join.is_entry:
+            for phi in join.phis:
+                phi.replace_by(phi.get_value(block))
+                join.remove_instruction(phi)
+                phi.delete()
+            CleanPass().glue_blocks(block, join)
+        return True
+
+    def get_arm(self, block, target):
+        """ Check if target is a short block in between block and a join """
+        if target is block or target.is_entry:
+            return None
+
+        if target.predecessors != [block]:
+            return None
+
+        if not isinstance(target.last_instruction, ir.Jump):
+            return None
+
+        if target.last_instruction.target is target:
+            return None
+
+        instructions = target.instructions[:-1]
+        if len(instructions) > self.max_arm_size:
+            return None
+
+        if not all(self.is_speculatable(i) for i in instructions):
+            return None
+
+        return target
+
+    @staticmethod
+    def is_int(ty):
+        return ty.is_integer or ty is ir.ptr
+
+    def is_speculatable(self, instruction):
+        """ Test if instruction can be executed without side effects """
+        if isinstance(instruction, ir.Const):
+            return self.is_int(instruction.ty)
+        elif isinstance(instruction, ir.Binop):
+            return (
+                self.is_int(instruction.ty)
+                and instruction.operation not in ["/", "%"]
+            )
+        elif isinstance(instruction, ir.Unop):
+            return self.is_int(instruction.ty)
+        elif isinstance(instruction, ir.Cast):
+            return self.is_int(instruction.ty) and self.is_int(
+                instruction.src.ty
+            )
+        else:
+            return False
@@ -96,6 +96,47 @@ def sign_extend(value: int, bits: int) -> int:
     return (value & mask) - (value & sign_bit)
 
 
+def is_power_of_two(value: int) -> bool:
+    """ Test if value is a positive power of two """
+    return value > 0 and (value & (value - 1)) == 0
+
+
+def unsigned_division_magic(divisor: int, bits: int):
+    """Find a multiplier and shift to divide by a constant.
+
+    Returns a tuple (multiplier, shift) such that n // divisor equals
+    (n * multiplier) >> (bits + shift) for all unsigned n of the given
+    amount of bits. The multiplier can be one bit wider than bits.
+    See "Division by invariant integers using multiplication" by
+    Granlund and Montgomery.
+    """
+    assert divisor > 1
+    for shift in range(bits + 1):
+        total = bits + shift
+        multiplier = -(-(1 << total) // divisor)
+        if multiplier * divisor - (1 << total) <= (1 << shift):
+            return multiplier, shift
+    raise ValueError("No magic number for {}".format(divisor))
+
+
+def signed_division_magic(divisor: int, bits: int):
+    """Find a multiplier and shift to divide signed values by a constant.
+
+    Returns a tuple (multiplier, shift) for a positive divisor which is
+    not a power of two, such that the quotient rounded towards zero equals
+    ((n * multiplier) >> (bits + shift)) + (1 if n < 0 else 0) for all
+    signed n of the given amount of bits. The multiplier is below
+    2 ** bits.
+    """
+    assert divisor > 1 and not is_power_of_two(divisor)
+    for shift in range(bits):
+        total = bits + shift
+        multiplier = -(-(1 << total) // divisor)
+        if multiplier * divisor - (1 << total) <= (2 << shift):
+            return multiplier, shift
+    raise ValueError("No magic number for {}".format(divisor))
+
+
 def value_to_bytes_big_endian(value: int, size: int):
     """ Pack integer value into bytes """
     byte_numbers = reversed(range(size))
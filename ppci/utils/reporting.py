@@ -523,7 +523,7 @@ class HtmlReportGenerator(TextWritingReporter):
                 self.print("</td>")
                 for ur in used_regs:
                     self.print("<td>")
-                    for r2 in ins.live_out:
+                    for r2 in getattr(ins, "live_out", ()):
                         if r2.color == ur.color:
                             self.print(r2.name)
                     self.print("</td>")
@@ -0,0 +1,124 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+class Riscv64AssemblerTestCase(AsmTestCaseBase):
+    """ Rv64 instruction assembly test case """
+    march = 'riscv:rv64'
+
+    def setUp(self):
+        super().setUp()
+        self.as_args = ['-march=rv64im']
+
+    def test_addw(self):
+        self.feed('addw x5, x6, x7')
+        self.check('BB 02 73 00')
+
+    def test_addiw(self):
+        self.feed('addiw x5, x6, -1')
+        self.check('9B 02 F3 FF')
+
+    def test_divuw(self):
+        self.feed('divuw x5, x6, x7')
+        self.check('BB 52 73 02')
+
+    def test_ld(self):
+        self.feed('ld x10, 8(x2)')
+        self.check('03 35 81 00')
+
+    def test_sd(self):
+        self.feed('sd x5, 16(x2)')
+        self.check('23 38 51 00')
+
+    def test_slli(self):
+        """ Shift amounts have six bits on rv64 """
+        self.feed('slli x5, x6, 40')
+        self.check('93 12 83 02')
+
+    def test_srai(self):
+        self.feed('srai x5, x6, 63')
+        self.check('93 52 F3 43')
+
+    def test_sraiw(self):
+        self.feed('sraiw x5, x6, 3')
+        self.check('9B 52 33 40')
+
+
+class Riscv64SelectionTestCase(unittest.TestCase):
+    def compile(self, source):
+        arch = get_arch('riscv:rv64')
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_type_sizes(self):
+        arch = get_arch('riscv:rv64')
+        self.assertEqual(8, arch.info.get_size('ptr'))
+        self.assertEqual(8, arch.info.get_size('long'))
+        self.assertEqual(4, arch.info.get_size('int'))
+
+    def test_word_operations(self):
+        """ Int arithmetic keeps the values sign extended """
+        code = self.compile('int f(int a, int b) { return (a + b) << 3; }')
+        self.assertIn('addw', code)
+        self.assertIn('slliw', code)
+
+    def test_long_operations(self):
+        code = self.compile('long f(long *p, long b) { return *p + b; }')
+        self.assertIn('ld', code)
+        self.assertIn('add x', code)
+        self.assertNotIn('addw', code)
+
+    def test_frame(self):
+        """ The return address and frame pointer are saved as doublewords """
+        code = self.compile('int g(int); int f(int a) { return g(a); }')
+        self.assertIn('sd x1, 0(x2)', code)
+        self.assertIn('ld x1, 0(x2)', code)
+        self.assertIn('sd x8, 8(x2)', code)
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            get_arch('riscv:rv64:rvc')
+
+
+class Riscv64SimulatorTestCase(unittest.TestCase):
+    def test_arithmetic(self):
+        source = """
+        section code
+        addi x5, x0, -1
+        srli x6, x5, 32
+        addiw x7, x6, 1
+        addi x8, x0, 1
+        slli x8, x8, 40
+        addw x9, x8, x5
+        sd x5, 0(x10)
+        lw x11, 0(x10)
+        lwu x12, 0(x10)
+        ld x13, 0(x10)
+        sraiw x14, x6, 4
+        srai x15, x5, 63
+        divw x16, x5, x0
+        ebreak
+        """
+        arch = get_arch('riscv:rv64')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.x[10] = 0x1000
+        simulator.run(max_instructions=100)
+        mask = 0xFFFFFFFFFFFFFFFF
+        self.assertEqual(0xFFFFFFFF, simulator.x[6])
+        self.assertEqual(0, simulator.x[7])
+        self.assertEqual(mask, simulator.x[9])
+        self.assertEqual(mask, simulator.x[11])
+        self.assertEqual(0xFFFFFFFF, simulator.x[12])
+        self.assertEqual(mask, simulator.x[13])
+        self.assertEqual(mask, simulator.x[14])
+        self.assertEqual(mask, simulator.x[15])
+        self.assertEqual(mask, simulator.x[16])
+
+
+if __name__ == '__main__':
+    unittest.main()
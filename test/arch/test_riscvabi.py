@@ -0,0 +1,200 @@
+import io
+import unittest
+from ppci import ir
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.arch import BlobReference
+from ppci.arch.riscv.registers import R10, R11, R12, R13, R17, F10, F11
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.arch.stack import StackLocation
+
+
+class RiscvAbiLocationTestCase(unittest.TestCase):
+    """ Argument locations of the standard calling convention """
+    def test_integer_arguments(self):
+        arch = get_arch('riscv:ilp32')
+        locations = arch.determine_arg_locations([ir.i32] * 10)
+        self.assertEqual([R10, R11, R12], locations[:3])
+        self.assertEqual(R17, locations[7])
+        self.assertEqual(0, locations[8].offset)
+        self.assertEqual(4, locations[9].offset)
+        self.assertEqual(R10, arch.determine_rv_location(ir.i32))
+
+    def test_float_arguments(self):
+        arch = get_arch('riscv:rvf:ilp32f')
+        locations = arch.determine_arg_locations([ir.f32, ir.i32, ir.f32])
+        self.assertEqual([F10, R10, F11], locations)
+        self.assertEqual(F10, arch.determine_rv_location(ir.f32))
+        locations = arch.determine_arg_locations([ir.f32] * 9)
+        self.assertEqual(R10, locations[8])
+        arch = get_arch('riscv:rvf:ilp32')
+        self.assertEqual(
+            [R10, R11], arch.determine_arg_locations([ir.f32, ir.i32]))
+        self.assertEqual(R10, arch.determine_rv_location(ir.f32))
+
+    def test_blob_arguments(self):
+        arch = get_arch('riscv:ilp32')
+        small, large = ir.BlobDataTyp(6, 4), ir.BlobDataTyp(12, 4)
+        locations = arch.determine_arg_locations(
+            [ir.i32, small, large, ir.i32])
+        self.assertEqual(R10, locations[0])
+        self.assertEqual((R11, R12), locations[1])
+        self.assertIsInstance(locations[2], BlobReference)
+        self.assertEqual(R13, locations[2].location)
+        locations = arch.determine_arg_locations([ir.i32] * 7 + [small])
+        self.assertEqual(R17, locations[7][0])
+        self.assertIsInstance(locations[7][1], StackLocation)
+        locations = arch.determine_arg_locations([ir.i32] * 8 + [small])
+        self.assertIsInstance(locations[8], StackLocation)
+        self.assertEqual(8, arch.get_stack_arguments_size(locations))
+
+    def test_invalid_options(self):
+        for march in ('riscv:ilp32f', 'riscv:ilp32:ilp32f',
+                      'riscv:rv64:ilp32', 'riscv:rvd:ilp32f'):
+            with self.assertRaises(ValueError):
+                get_arch(march)
+
+    def test_saved_float_registers(self):
+        arch = get_arch('riscv:rvf:ilp32f')
+        ir_module = c_to_ir(io.StringIO(
+            'float g(float); float f(float a) { return g(a) + a; }'), arch)
+        optimize(ir_module, level=2)
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('fsw f8, ', code)
+        self.assertIn('flw f8, ', code)
+
+
+class RiscvAbiExecutionTestCase(unittest.TestCase):
+    """ Call assembly functions which follow the standard convention """
+    source = """
+    struct pair { int a; short b; };
+    struct big { int v[5]; };
+    int add2(int a, int b);
+    int pair_sum(struct pair p, int x);
+    int ninth(int a, int b, int c, int d, int e, int f, int g, int h, int i);
+
+    int combine(int a, struct pair p, struct big b, int c, int d, int e,
+                int f, int g, int h) {
+      return a + p.a * 2 + p.b * 3 + b.v[0] + b.v[4] * 5 + c + d + e +
+        f + g + h * 7;
+    }
+
+    int run(int x) {
+      struct pair p = {x, -3};
+      struct big b = {{1, 2, 3, 4, x}};
+      return combine(1, p, b, 2, 3, 4, 5, 6, 7) + add2(x, 100) +
+        pair_sum(p, 1000) + ninth(1, 2, 3, 4, 5, 6, 7, 8, 9 * x);
+    }
+    """
+    callees = """
+    section code
+    global add2
+    global pair_sum
+    global ninth
+    add2:
+    add x10, x10, x11
+    jalr x0, x1, 0
+    pair_sum:
+    slli x11, x11, 16
+    srai x11, x11, 16
+    add x10, x10, x11
+    add x10, x10, x12
+    jalr x0, x1, 0
+    ninth:
+    lw x10, 0(x2)
+    jalr x0, x1, 0
+    """
+
+    def test_options(self):
+        x = 10
+        expected = (
+            (1 + 2 * x - 9 + 1 + 5 * x + 2 + 3 + 4 + 5 + 6 + 49) +
+            (x + 100) + (x - 3 + 1000) + 9 * x)
+        for march in ('riscv:ilp32', 'riscv:rvc:ilp32', 'riscv:rvf:ilp32f',
+                      'riscv:omitfp:ilp32'):
+            arch = get_arch(march)
+            ir_module = c_to_ir(io.StringIO(self.source), arch)
+            optimize(ir_module, level=2)
+            start = asm(io.StringIO("""
+            section code
+            global run
+            lui x2, 0x10
+            jal x1, run
+            ebreak
+            """), arch)
+            callees = asm(io.StringIO(self.callees), arch)
+            image = link(
+                [start, callees, ir_to_object([ir_module], arch)],
+                use_runtime=True)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.x[10] = x
+            simulator.run(max_instructions=100000)
+            self.assertEqual(expected, simulator.x[10], march)
+
+    def test_float_arguments(self):
+        source = """
+        float scale(float x, int n);
+        float run(int n, float x) {
+          return scale(x, n) + x;
+        }
+        """
+        arch = get_arch('riscv:rvf:ilp32f')
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        start = asm(io.StringIO("""
+        section code
+        global run
+        global scale
+        lui x2, 0x10
+        jal x1, run
+        ebreak
+        scale:
+        fcvt.s.w f0, x10
+        fmul.s f10, f10, f0
+        jalr x0, x1, 0
+        """), arch)
+        image = link([start, ir_to_object([ir_module], arch)])
+        simulator = RiscvSimulator(arch)
+        simulator.load(image)
+        simulator.x[10] = 3
+        simulator.f[10] = 1.5
+        simulator.run(max_instructions=1000)
+        self.assertEqual(6.0, simulator.f[10])
+
+    def test_clobbered_float_registers(self):
+        # Without the standard calling convention, calls clobber all
+        # floating point registers:
+        source = """
+        float g(float x);
+        float run(float x) {
+          return g(x) + x;
+        }
+        """
+        arch = get_arch('riscv:rvf')
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        clobbers = ''.join(
+            'fsgnj.s f{0}, f10, f10\n'.format(n) for n in range(32))
+        start = asm(io.StringIO("""
+        section code
+        global run
+        global g
+        lui x2, 0x10
+        jal x1, run
+        ebreak
+        g:
+        fadd.s f10, f12, f12
+        {}
+        jalr x0, x1, 0
+        """.format(clobbers)), arch)
+        image = link([start, ir_to_object([ir_module], arch)])
+        simulator = RiscvSimulator(arch)
+        simulator.load(image)
+        simulator.f[12] = 1.5
+        simulator.run(max_instructions=1000)
+        self.assertEqual(4.5, simulator.f[10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
 from test_asm import AsmTestCaseBase
+from ppci.api import get_arch
+from ppci.arch.riscv.instructions import Addi
+from ppci.arch.riscv.registers import R0
 
 
 class RiscvAssemblerTestCase(AsmTestCaseBase):
@@ -188,6 +191,14 @@ class RiscvAssemblerTestCase(AsmTestCaseBase):
         self.feed('and x4, x7, x5')
         self.check('33 F2 53 00')
 
+    def test_mulh(self):
+        self.feed('mulh x5, x6, x7')
+        self.check('B3 12 73 02')
+
+    def test_mulhu(self):
+        self.feed('mulhu x5, x6, x7')
+        self.check('B3 32 73 02')
+
     def test_readcycle(self):
         self.feed('rdcycle x4')
         self.check('73 22 00 c0')
@@ -217,5 +228,37 @@ class RiscvAssemblerTestCase(AsmTestCaseBase):
         self.check('13 00 00 00')
 
 
+class RiscvEncodingTestCase(unittest.TestCase):
+    """ Check the compiled encoders against the token based encoding """
+    def test_packers(self):
+        for march in ('riscv:rvf', 'riscv:rvd', 'riscv:rv64'):
+            with self.subTest(march=march):
+                self.check_packers(get_arch(march))
+
+    def check_packers(self, arch):
+        for instruction_class in arch.isa.instructions:
+            packer = instruction_class.get_packer()
+            if not packer:
+                continue
+            for value in (0, 1, 31, -7):
+                args = []
+                for operand in instruction_class.syntax.formal_arguments:
+                    if operand._cls is int:
+                        args.append(value)
+                    elif operand._cls is str:
+                        args.append('label')
+                    else:
+                        args.append(operand._cls('r', num=abs(value)))
+                instruction = instruction_class(*args)
+                tokens = instruction.get_tokens()
+                instruction.set_all_patterns(tokens)
+                self.assertEqual(tokens.encode(), packer(instruction))
+
+    def test_immediate_out_of_range(self):
+        instruction = Addi(R0, R0, 5000)
+        with self.assertRaises(ValueError):
+            instruction.encode()
+
+
 if __name__ == '__main__':
     unittest.main()
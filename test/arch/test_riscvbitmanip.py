@@ -0,0 +1,134 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.wasm import Module, wasm_to_ir
+
+
+class RiscvBitmanipAssemblerTestCase(AsmTestCaseBase):
+    """ Zba and zbb instruction assembly test case """
+    march = 'riscv:zba:zbb'
+
+    def setUp(self):
+        super().setUp()
+        self.as_args = ['-march=rv32i_zba_zbb']
+
+    def test_sh2add(self):
+        self.feed('sh2add x5, x6, x7')
+        self.check('B3 42 73 20')
+
+    def test_andn(self):
+        self.feed('andn x5, x6, x7')
+        self.check('B3 72 73 40')
+
+    def test_max(self):
+        self.feed('max x5, x6, x7')
+        self.check('B3 62 73 0A')
+
+    def test_rori(self):
+        self.feed('rori x5, x6, 7')
+        self.check('93 52 73 60')
+
+    def test_clz(self):
+        self.feed('clz x5, x6')
+        self.check('93 12 03 60')
+
+    def test_sext_b(self):
+        self.feed('sext.b x5, x6')
+        self.check('93 12 43 60')
+
+    def test_zext_h(self):
+        self.feed('zext.h x5, x6')
+        self.check('B3 42 03 08')
+
+    def test_rev8(self):
+        self.feed('rev8 x5, x6')
+        self.check('93 52 83 69')
+
+
+class RiscvBitmanipSelectionTestCase(unittest.TestCase):
+    """ Check that the instruction selector uses the bitmanip instructions """
+    def compile(self, source, march='riscv:zba:zbb'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_sign_extend(self):
+        code = self.compile('int f(int x) { char c = x; return c; }')
+        self.assertIn('sext.b', code)
+        self.assertNotIn('slli', code)
+
+    def test_andn(self):
+        code = self.compile('int f(int a, int b) { return a & ~b; }')
+        self.assertIn('andn', code)
+
+    def test_rotate(self):
+        code = self.compile(
+            'unsigned f(unsigned x) { return (x << 3) | (x >> 29); }')
+        self.assertIn('rori', code)
+
+    def test_array_index(self):
+        code = self.compile('int f(int *a, int i) { return a[i]; }')
+        self.assertIn('sh2add', code)
+        self.assertNotIn('mul', code)
+
+    def test_wasm_runtime_functions(self):
+        """ The wasm bit counting functions become single instructions """
+        module = Module(
+            '(module (func $f (param i32 i32) (result i32) '
+            'local.get 0 i32.popcnt local.get 1 i32.rotl))')
+        arch = get_arch('riscv:zbb')
+        ir_module = wasm_to_ir(module, arch.info.get_type_info('ptr'))
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('cpop', code)
+        self.assertIn('rol', code)
+        self.assertNotIn('jal x1', code)
+
+    def test_without_option(self):
+        code = self.compile(
+            'int f(int *a, int i) { return a[i]; }', march='riscv')
+        self.assertNotIn('sh2add', code)
+
+
+class RiscvBitmanipSimulatorTestCase(unittest.TestCase):
+    def test_bit_counting(self):
+        source = """
+        section code
+        li x5, 0x00F0
+        clz x6, x5
+        ctz x7, x5
+        cpop x8, x5
+        clz x9, x0
+        li x10, 0x80
+        sext.b x11, x10
+        li x12, -1
+        zext.h x13, x12
+        andn x14, x12, x5
+        li x15, 3
+        ror x16, x5, x15
+        min x17, x12, x5
+        minu x18, x12, x5
+        sh3add x19, x15, x5
+        ebreak
+        """
+        arch = get_arch('riscv:zba:zbb')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.run(max_instructions=100)
+        self.assertEqual(24, simulator.x[6])
+        self.assertEqual(4, simulator.x[7])
+        self.assertEqual(4, simulator.x[8])
+        self.assertEqual(32, simulator.x[9])
+        self.assertEqual(0xFFFFFF80, simulator.x[11])
+        self.assertEqual(0xFFFF, simulator.x[13])
+        self.assertEqual(0xFFFFFF0F, simulator.x[14])
+        self.assertEqual(0x1E, simulator.x[16])
+        self.assertEqual(0xFFFFFFFF, simulator.x[17])
+        self.assertEqual(0xF0, simulator.x[18])
+        self.assertEqual(0x108, simulator.x[19])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import io
+import struct
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+class RiscvBlockCopyTestCase(unittest.TestCase):
+    """ Copy and clear blocks of memory, such as structs """
+    def compile(self, source, march='riscv'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_split_block(self):
+        arch = get_arch('riscv')
+        self.assertEqual(
+            [(0, 4), (4, 4), (8, 2), (10, 1)], arch.split_block(11, 4))
+        self.assertEqual([(0, 2), (2, 2), (4, 1)], arch.split_block(5, 2))
+        self.assertEqual([(0, 1), (1, 1)], arch.split_block(2, 1))
+        arch = get_arch('riscv:rv64')
+        self.assertEqual([(0, 8), (8, 4)], arch.split_block(12, 8))
+
+    def test_word_copy(self):
+        code = self.compile(
+            'struct s { int a; short b; short c; }; '
+            'void f(struct s *p, struct s *q) { *p = *q; }')
+        self.assertEqual(2, code.count('(x13)'))
+        self.assertEqual(2, code.count('(x12)'))
+        self.assertNotIn('lh ', code)
+
+    def test_byte_copy(self):
+        code = self.compile(
+            'struct s { char a[3]; }; '
+            'void f(struct s *p, struct s *q) { *p = *q; }')
+        self.assertEqual(3, code.count('lb '))
+
+    def test_large_copy(self):
+        code = self.compile(
+            'struct s { int a[40]; }; '
+            'void f(struct s *p, struct s *q) { *p = *q; }')
+        self.assertIn('addi x14, x0, 160', code)
+        self.assertIn('jal x1, __memcpy', code)
+
+    def test_zero_initialization(self):
+        code = self.compile(
+            'int g(int *); int f(void) { int a[16] = {1}; return g(a); }')
+        self.assertEqual(15, code.count('sw x0, '))
+        code = self.compile(
+            'int g(int *); int f(void) { int a[64] = {1}; return g(a); }')
+        self.assertIn('jal x1, __memclr', code)
+
+
+class RiscvBlockExecutionTestCase(unittest.TestCase):
+    """ Run code with struct copies and partial initializers """
+    source = """
+    struct small { char a; short b; };
+    struct medium { int a; char b; short c; int d[5]; };
+    struct large { int values[50]; char tail[3]; };
+    union number { char c; int i; };
+
+    int sum_medium(struct medium m, int x) {
+      return m.a + m.b + m.c + m.d[0] + m.d[4] + x;
+    }
+
+    int run(struct large *large, char *bytes) {
+      struct small s1 = {1, 2};
+      struct small s2;
+      struct medium m1 = {3, 4};
+      struct medium m2;
+      struct large l1;
+      struct large l2 = {{5}};
+      int matrix[3][2] = {{6}, {7}};
+      int sparse[40] = {[2] = 8, [30] = 9};
+      union number numbers[2] = {{10}, {11}};
+      char text[9] = "ab";
+      int sum = 0;
+      s2 = s1;
+      m1.d[4] = 12;
+      m2 = m1;
+      l1 = *large;
+      *large = l2;
+      for (int i = 0; i < 50; i++) {
+        sum += l1.values[i] + sparse[i % 40] + large->values[i];
+      }
+      for (int i = 0; i < 9; i++) {
+        bytes[i] = text[i];
+      }
+      return sum + s2.a + s2.b + m2.a + m2.b + m2.c + m2.d[4] +
+        matrix[0][0] + matrix[0][1] + matrix[1][0] + matrix[2][1] +
+        numbers[1].i + l1.tail[2] + sum_medium(m2, 1000);
+    }
+    """
+
+    def test_options(self):
+        values = list(range(100, 150))
+        expected = (
+            sum(values) + 8 * 2 + 9 + 5 + 1 + 2 + 3 + 4 + 0 + 12 + 6 + 0 + 7 +
+            0 + 11 + 13 + (3 + 4 + 12 + 1000))
+        for march in ('riscv', 'riscv:rvc', 'riscv:omitfp', 'riscv:rv64'):
+            arch = get_arch(march)
+            ir_module = c_to_ir(io.StringIO(self.source), arch)
+            optimize(ir_module, level=2)
+            start = asm(io.StringIO("""
+            section code
+            global run
+            lui x2, 0x10
+            jal x1, run
+            ebreak
+            """), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)], use_runtime=True)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            data = struct.pack('<50i', *values) + bytes([0, 0, 13])
+            simulator.write_memory(0x8000, data)
+            simulator.write_memory(0x9000, bytes(range(1, 10)))
+            simulator.x[12] = 0x8000
+            simulator.x[13] = 0x9000
+            simulator.run(max_instructions=100000)
+            self.assertEqual(expected, simulator.x[10], march)
+            large = simulator.read_memory(0x8000, len(data))
+            self.assertEqual(
+                struct.pack('<50i', 5, *[0] * 49) + bytes(3), large, march)
+            self.assertEqual(
+                b'ab' + bytes(7), simulator.read_memory(0x9000, 9), march)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import io
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.binutils.layout import Layout
+from ppci.binutils.linker import Linker
+from ppci.utils.reporting import TextReportGenerator
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+FAR_LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY far LOCATION=0x180000 SIZE=0x100 {
+    SECTION(far)
+}
+"""
+
+
+class RiscvCallTestCase(unittest.TestCase):
+    """ Calls with an auipc and jalr pair, relaxed by the linker """
+    source = """
+    int twice(int x) {
+      return x + x;
+    }
+
+    int run(int x) {
+      return twice(x) + twice(x + 1) + twice(x + 2) + x / 3;
+    }
+    """
+    helper = """
+    int twice(int x);
+    int triple(int x) {
+      return twice(x) + x;
+    }
+    """
+
+    def compile(self, source, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def test_assembler(self):
+        arch = get_arch('riscv')
+        obj = asm(io.StringIO("""
+        section code
+        call x1, f
+        f:
+        """), arch)
+        self.assertEqual(['call'], [r.reloc_type for r in obj.relocations])
+        self.assertEqual(
+            bytes.fromhex('97000000e7800000'), obj.get_section('code').data)
+
+    def test_code(self):
+        arch, ir_module = self.compile(self.source, 'riscv:farcall')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('call x1, twice', code)
+        self.assertNotIn('jal x1, ', code)
+
+    def test_relaxation(self):
+        arch = get_arch('riscv')
+        obj = asm(io.StringIO("""
+        section code
+        call x1, f
+        call x0, f
+        f:
+        addi x10, x10, 1
+        """), arch)
+        linker = Linker(arch)
+        image = linker.link([obj])
+        self.assertEqual(
+            bytes.fromhex('ef0080006f00400013051500'),
+            image.get_section('code').data)
+        self.assertEqual(8, linker.relaxation_savings)
+        self.assertEqual(1, linker.relaxation_iterations)
+
+    def test_far_call(self):
+        arch = get_arch('riscv')
+        obj = asm(io.StringIO("""
+        section code
+        global far_function
+        call x1, far_function
+        ebreak
+        section far
+        far_function:
+        addi x10, x10, 1
+        jalr x0, x1, 0
+        """), arch)
+        linker = Linker(arch)
+        image = linker.link(
+            [obj], layout=Layout.load(io.StringIO(FAR_LAYOUT)))
+        self.assertEqual(12, image.get_section('code').size)
+        self.assertEqual(0, linker.relaxation_savings)
+        simulator = RiscvSimulator(arch, memory_size=0x200000)
+        simulator.load(image)
+        simulator.x[10] = 41
+        simulator.run(max_instructions=100)
+        self.assertEqual(42, simulator.x[10])
+
+    def test_compressed_relaxation(self):
+        """ Calls are relaxed to jal first, and to c.jal next """
+        arch, ir_module = self.compile(self.source, 'riscv:rvc:farcall')
+        _, helper = self.compile(self.helper, 'riscv:rvc:farcall')
+        objs = [
+            ir_to_object([ir_module], arch), ir_to_object([helper], arch)]
+        linker = Linker(arch)
+        image = linker.link(objs)
+        self.assertEqual(2, linker.relaxation_iterations)
+        self.assertEqual(
+            sum(o.get_section('code').size for o in objs),
+            image.get_section('code').size + linker.relaxation_savings)
+        # The padding in front of the second object keeps it aligned:
+        self.assertEqual(2, linker.alignment_points['code'][1][2])
+        self.assertEqual(0, image.get_symbol_value('triple') % 4)
+
+    def test_report(self):
+        arch = get_arch('riscv')
+        obj = asm(io.StringIO("""
+        section code
+        call x1, f
+        f:
+        """), arch)
+        f = io.StringIO()
+        with TextReportGenerator(f) as reporter:
+            link([obj], reporter=reporter)
+        self.assertIn('Relaxation saved 4 bytes in 1 iterations', f.getvalue())
+
+    def test_execution(self):
+        x = 20
+        expected = 2 * x + 2 * (x + 1) + 2 * (x + 2) + x // 3
+        for march in ('riscv:farcall', 'riscv:rvc:farcall',
+                      'riscv:nom:farcall'):
+            arch, ir_module = self.compile(self.source, march)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)], use_runtime=True)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.x[12] = x
+            simulator.run(max_instructions=10000)
+            self.assertEqual(expected, simulator.x[10], march)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import io
+import struct
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv import instructions as rv
+from ppci.arch.riscv import rvc_instructions as rvc
+from ppci.arch.riscv.registers import R0, SP, FP, R5, R9, R10, R12, R16
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.utils.bitfun import to_unsigned
+
+
+class RiscvCompressTestCase(unittest.TestCase):
+    """ Rewrite of 32 bits instructions into their compressed form """
+    def check(self, instruction, compressed):
+        result = rvc.compress(instruction)
+        if compressed is None:
+            self.assertIsNone(result)
+        else:
+            self.assertEqual(compressed, str(result))
+            self.assertEqual(2, len(result.encode()))
+
+    def test_addi(self):
+        self.check(rv.Addi(R10, R10, 5), 'c.addi x10, x10, 5')
+        self.check(rv.Addi(R10, R0, -7), 'c.li x10, -7')
+        self.check(rv.Addi(R10, R12, 0), 'c.mv x10, x12')
+        self.check(rv.Addi(SP, SP, -64), 'c.addi16sp -64')
+        self.check(rv.Addi(R9, SP, 24), 'c.addi4spn x9 24')
+        self.check(rv.Addi(R10, R10, 32), None)
+        self.check(rv.Addi(R10, R12, 1), None)
+
+    def test_register_operations(self):
+        self.check(rv.Addr(R10, R10, R16), 'c.add x10, x16')
+        self.check(rv.Addr(R10, R16, R10), 'c.add x10, x16')
+        self.check(rv.Addr(R10, R0, R16), 'c.mv x10, x16')
+        self.check(rv.Subr(FP, FP, R9), 'c.sub x8, x9')
+        self.check(rv.Xorr(R9, FP, R9), 'c.xor x9, x8')
+        self.check(rv.Subr(R9, FP, R9), None)
+        self.check(rv.Andr(R5, R5, R9), None)
+
+    def test_shifts(self):
+        self.check(rv.Slli(R16, R16, 3), 'c.slli x16, x16, 3')
+        self.check(rv.Srai(R9, R9, 31), 'c.srai x9, x9, 31')
+        self.check(rv.Srli(R5, R5, 2), None)
+
+    def test_lui(self):
+        self.check(rv.Lui(R10, 0xFFFFF), 'c.lui x10, -1')
+        self.check(rv.Lui(R10, 0x20), None)
+        self.check(rv.Lui(SP, 1), None)
+
+    def test_memory(self):
+        self.check(rv.Lw(R16, 8, SP), 'c.lwsp x16,8(x2)')
+        self.check(rv.Sw(R16, 252, SP), 'c.swsp x16,252(x2)')
+        self.check(rv.Lw(R10, 124, R9), 'c.lw x10, 124(x9)')
+        self.check(rv.Sw(R10, 6, R9), None)
+        self.check(rv.Lw(R10, 128, R9), None)
+        self.check(rv.Lw(R16, 0, R9), None)
+
+
+class RiscvCompressionAwareAllocationTestCase(unittest.TestCase):
+    """ Compile C code with the rvc option """
+    source = """
+    int run(int *p, int n) {
+      int sum = 0, mask = 0;
+      for (int i = 0; i < n; i++) {
+        sum = sum + (p[i] << 2) - (p[i] >> 1);
+        mask = (mask ^ p[i]) & 0x7ff;
+      }
+      return sum | mask;
+    }
+    """
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_object([ir_module], arch)
+
+    def test_register_preferences(self):
+        arch = get_arch('riscv:rvc')
+        preferences = list(
+            arch.get_register_preferences(rvc.Xorv(R5, R9, R16)))
+        self.assertIn((R5, rvc.compressible_registers), preferences)
+        self.assertIn((R5, (R9, R16)), preferences)
+        self.assertIn((R9, (R5,)), preferences)
+        arch = get_arch('riscv')
+        self.assertFalse(
+            list(arch.get_register_preferences(rvc.Xorv(R5, R9, R16))))
+
+    def test_code_size(self):
+        size = self.compile('riscv').get_section('code').size
+        with self.assertLogs('arch', level='INFO') as logs:
+            rvc_size = self.compile('riscv:rvc').get_section('code').size
+        self.assertLess(rvc_size, size * 0.75)
+        self.assertTrue(
+            any('Compressed run from' in line for line in logs.output))
+
+    def test_assembly(self):
+        arch = get_arch('riscv:rvc')
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        code = ir_to_assembly([ir_module], arch)
+        for mnemonic in ('c.lw', 'c.slli', 'c.srai', 'c.xor', 'c.add'):
+            self.assertIn(mnemonic + ' ', code)
+
+    def test_execution(self):
+        values = [7, -300, 12345, 0, -1, 99, 2000000, -42]
+        expected_sum, mask = 0, 0
+        for value in values:
+            expected_sum += (value << 2) - (value >> 1)
+            mask = (mask ^ value) & 0x7ff
+        expected = to_unsigned(expected_sum | mask, 32)
+        for march in ('riscv', 'riscv:rvc'):
+            arch = get_arch(march)
+            start = asm(io.StringIO("""
+            section code
+            global run
+            lui x2, 0x10
+            jal x1, run
+            ebreak
+            """), arch)
+            image = link([start, self.compile(march)])
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.write_memory(0x8000, struct.pack('<8i', *values))
+            simulator.x[12] = 0x8000
+            simulator.x[13] = len(values)
+            simulator.run(max_instructions=10000)
+            self.assertEqual(expected, simulator.x[10], march)
+
+
+if __name__ == '__main__':
+    unittest.main()
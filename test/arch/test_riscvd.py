@@ -0,0 +1,117 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci import ir
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+class RiscvDoubleAssemblerTestCase(AsmTestCaseBase):
+    """ Double precision instruction assembly test case """
+    march = 'riscv:rvd'
+
+    def setUp(self):
+        super().setUp()
+        self.as_args = ['-march=rv32imfd']
+
+    def test_fadd_d(self):
+        self.feed('fadd.d f1, f2, f3')
+        self.check('D3 70 31 02')
+
+    def test_fmadd_d(self):
+        self.feed('fmadd.d f1, f2, f3, f4')
+        self.check('C3 70 31 22')
+
+    def test_fld(self):
+        self.feed('fld f1, -8(x2)')
+        self.check('87 30 81 FF')
+
+    def test_fsd(self):
+        self.feed('fsd f9, 16(x10)')
+        self.check('27 38 95 00')
+
+    def test_fcvt_w_d(self):
+        self.feed('fcvt.w.d x5, f6, rtz')
+        self.check('D3 12 03 C2')
+
+    def test_fsqrt_d(self):
+        self.feed('fsqrt.d f1, f2')
+        self.check('D3 70 01 5A')
+
+
+class RiscvDoubleSelectionTestCase(unittest.TestCase):
+    def compile(self, source, march='riscv:rvd'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_double_size(self):
+        self.assertEqual(8, get_arch('riscv:rvd').info.get_size(ir.f64))
+        # Without the D extension, doubles are kept in integer registers:
+        self.assertEqual(8, get_arch('riscv:rvf').info.get_size(ir.f64))
+        self.assertEqual(8, get_arch('riscv').info.get_size(ir.f64))
+
+    def test_options(self):
+        for march in ('riscv:rvc:rvd', 'riscv:rvc:rvf'):
+            with self.assertRaises(ValueError):
+                get_arch(march)
+
+    def test_arithmetic(self):
+        code = self.compile(
+            'double f(double a, double b) { return a / b - b; }')
+        self.assertIn('fdiv.d', code)
+        self.assertIn('fsub.d', code)
+        self.assertNotIn('.s ', code)
+
+    def test_fused_multiply_add(self):
+        code = self.compile(
+            'double f(double a, double b, double c) { return a * b + c; }')
+        self.assertIn('fmadd.d', code)
+        self.assertNotIn('fmul.d', code)
+
+    def test_memory(self):
+        code = self.compile('void f(double *a) { a[1] = a[0]; }')
+        self.assertIn('fld', code)
+        self.assertIn('fsd', code)
+
+    def test_conversions(self):
+        code = self.compile('int f(double a, float b) { return a + b; }')
+        self.assertIn('fcvt.d.s', code)
+        self.assertIn('fcvt.w.d', code)
+
+
+class RiscvDoubleSimulatorTestCase(unittest.TestCase):
+    def test_double_arithmetic(self):
+        source = """
+        section code
+        li x5, 7
+        fcvt.d.w f1, x5
+        li x5, 2
+        fcvt.d.w f2, x5
+        fdiv.d f3, f1, f2
+        fmadd.d f4, f3, f2, f1
+        fsqrt.d f5, f2
+        fsd f5, 0(x10)
+        fld f6, 0(x10)
+        fcvt.w.d x6, f3, rtz
+        flt.d x7, f2, f1
+        fcvt.s.d f7, f5
+        ebreak
+        """
+        arch = get_arch('riscv:rvd')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.x[10] = 0x1000
+        simulator.run(max_instructions=100)
+        self.assertEqual(3.5, simulator.f[3])
+        self.assertEqual(14.0, simulator.f[4])
+        self.assertEqual(2 ** 0.5, simulator.f[6])
+        self.assertEqual(3, simulator.x[6])
+        self.assertEqual(1, simulator.x[7])
+        self.assertNotEqual(2 ** 0.5, simulator.f[7])
+        self.assertAlmostEqual(2 ** 0.5, simulator.f[7], places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import io
+import struct
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.utils.bitfun import to_signed, to_unsigned
+
+
+def truncating_division(a, b):
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+class RiscvDivisionSelectionTestCase(unittest.TestCase):
+    """ Division by a constant is done without the div instructions """
+    def compile(self, source, march='riscv', level=2):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=level)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_signed(self):
+        code = self.compile('int f(int a) { return a / 10 + a % 7; }')
+        self.assertIn('mulh ', code)
+        self.assertNotIn('div', code)
+        self.assertNotIn('rem', code)
+
+    def test_unsigned(self):
+        code = self.compile(
+            'unsigned f(unsigned a) { return a / 7 + a % 1000; }')
+        self.assertIn('mulhu', code)
+        self.assertNotIn('div', code)
+        self.assertNotIn('rem', code)
+
+    def test_power_of_two(self):
+        for level in (0, 2):
+            code = self.compile(
+                'int f(int a) { return a / 8 + a % -16; }', level=level)
+            self.assertIn('srai', code)
+            self.assertNotIn('mul', code)
+            self.assertNotIn('div', code)
+
+    def test_variable_divisor(self):
+        code = self.compile('int f(int a, int b) { return a / b; }')
+        self.assertIn('div', code)
+
+    def test_rv64(self):
+        code = self.compile(
+            'int f(int a) { return a / 10; } '
+            'long g(long a) { return a % 1000; }', march='riscv:rv64')
+        self.assertNotIn('div', code)
+        self.assertNotIn('rem', code)
+
+
+class RiscvDivisionSimulatorTestCase(unittest.TestCase):
+    """ Compare the division sequences with the expected results """
+    signed_divisors = [-1, 3, -7, 10, 16, -4096, 641, 0x7FFFFFFF]
+    unsigned_divisors = [3, 7, 10, 1000, 65536, 0x80000001, 0xFFFFFFFF]
+    values = [
+        0, 1, 7, -1, -7, 123456789, -123456789, 0x7FFFFFFF, -0x80000000]
+
+    def run_divisions(self, march, c_type, fmt, divisors, suffix=''):
+        statements = []
+        for index, divisor in enumerate(divisors):
+            statements.append(
+                'out[{0}] = a / {2}{3}; out[{1}] = a % {2}{3};'.format(
+                    2 * index, 2 * index + 1, divisor, suffix))
+        source = 'void run({0} *in, {0} *out) {{ {0} a = *in; {1} }}'.format(
+            c_type, ' '.join(statements))
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        start = asm(io.StringIO("""
+        section code
+        global run
+        lui x2, 0x10
+        jal x1, run
+        ebreak
+        """), arch)
+        image = link([start, ir_to_object([ir_module], arch)])
+        size = struct.calcsize(fmt)
+        signed = fmt[-1].islower()
+        for value in self.values:
+            if signed:
+                value = to_signed(value, 8 * size)
+            else:
+                value = to_unsigned(value, 8 * size)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.write_memory(0x8000, struct.pack(fmt, value))
+            simulator.x[12] = 0x8000
+            simulator.x[13] = 0x9000
+            simulator.run(max_instructions=10000)
+            data = simulator.read_memory(0x9000, 2 * size * len(divisors))
+            for index, divisor in enumerate(divisors):
+                quotient, remainder = struct.unpack_from(
+                    fmt + fmt[-1], data, 2 * size * index)
+                if signed:
+                    expected = truncating_division(value, divisor)
+                    self.assertEqual(
+                        to_signed(expected, 8 * size), quotient,
+                        (value, divisor))
+                else:
+                    expected = value // divisor
+                    self.assertEqual(expected, quotient, (value, divisor))
+                self.assertEqual(
+                    value - expected * divisor, remainder, (value, divisor))
+
+    def test_signed(self):
+        self.run_divisions('riscv', 'int', '<i', self.signed_divisors)
+
+    def test_unsigned(self):
+        self.run_divisions(
+            'riscv', 'unsigned', '<I', self.unsigned_divisors, suffix='u')
+
+    def test_rv64(self):
+        self.run_divisions('riscv:rv64', 'int', '<i', self.signed_divisors)
+        self.run_divisions(
+            'riscv:rv64', 'unsigned', '<I', self.unsigned_divisors,
+            suffix='u')
+        self.run_divisions(
+            'riscv:rv64', 'long', '<q', self.signed_divisors + [10 ** 12],
+            suffix='L')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+def instructions(code, name):
+    """ Get the instructions of a function from the assembly listing """
+    lines = code.splitlines()
+    start = lines.index(' {}:'.format(name))
+    result = []
+    for line in lines[start + 1:]:
+        if line.strip().startswith('.'):
+            break
+        if not line.startswith(' {}'.format(name)):
+            result.append(line.strip())
+    return result
+
+
+class RiscvFrameTestCase(unittest.TestCase):
+    """ Prologue and epilogue of several kinds of functions """
+    def compile(self, source, march='riscv'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_leaf_function(self):
+        """ Accessor functions do not need a frame at all """
+        code = self.compile(
+            'struct dev { int status; }; '
+            'int get_status(struct dev *d) { return d->status; }')
+        self.assertEqual(
+            ['lw x10, 0(x12)', 'jalr x0,x1, 0'],
+            instructions(code, 'get_status'))
+        code = self.compile(
+            'struct dev { int status; }; '
+            'int get_status(struct dev *d) { return d->status; }',
+            march='riscv:rvc')
+        self.assertEqual(['c.lw x10, 0(x12)', 'c.jr x1'],
+                         instructions(code, 'get_status'))
+
+    def test_runtime_call(self):
+        """ Calls to the runtime functions overwrite the return address """
+        code = self.compile(
+            'int f(int a, int b) { return a * b; }', march='riscv:nom')
+        self.assertIn('sw x1, 0(x2)', instructions(code, 'f'))
+
+    def test_single_adjustment(self):
+        code = self.compile(
+            'int g(int); int f(int a) { int b[3]; b[a] = a; '
+            'return g(b[1]) + a; }')
+        f = instructions(code, 'f')
+        adjustments = [i for i in f if i.startswith('addi x2, x2, ')]
+        self.assertEqual(['addi x2, x2, -32', 'addi x2, x2, 32'], adjustments)
+        self.assertIn('sw x1, 0(x2)', f)
+        self.assertIn('sw x8, 4(x2)', f)
+        self.assertIn('addi x8, x2, 32', f)
+
+    def test_omit_frame_pointer(self):
+        source = (
+            'int g(int); int f(int a) { int b[3]; b[a] = a; '
+            'return g(b[1]) + a; }')
+        f = instructions(self.compile(source, march='riscv:omitfp'), 'f')
+        self.assertIn('addi x2, x2, -32', f)
+        self.assertFalse([i for i in f if 'x8' in i])
+
+    def test_compressed_prologue(self):
+        code = self.compile(
+            'int g(int); int f(int a) { return g(a) + a; }',
+            march='riscv:rvc')
+        f = instructions(code, 'f')
+        self.assertEqual('c.addi16sp -16', f[0])
+        self.assertIn('c.swsp x1,0(x2)', f)
+        self.assertIn('c.lwsp x1,0(x2)', f)
+
+
+class RiscvFrameExecutionTestCase(unittest.TestCase):
+    """ Run code with stack arguments, locals and a large frame """
+    source = """
+    int sum8(int a, int b, int c, int d, int e, int f, int g, int h) {
+      return a + b + c + d + e + f + g + h;
+    }
+    int fill(char *buffer, int n) {
+      for (int i = 0; i < n; i++) {
+        buffer[i] = i;
+      }
+      return n;
+    }
+    int run(int x) {
+      int values[4];
+      char buffer[2032];
+      for (int i = 0; i < 4; i++) {
+        values[i] = x * i;
+      }
+      fill(buffer, 2032);
+      return buffer[2031] + buffer[1000] + values[3] +
+        sum8(values[0], values[1], values[2], values[3], 1, 2, 3, x);
+    }
+    """
+
+    def test_options(self):
+        # The frame is larger than the range of an immediate offset:
+        expected = (2031 % 256 - 256) + (1000 % 256 - 256) + 30 + 60 + 16
+        for march in ('riscv', 'riscv:omitfp', 'riscv:rvc',
+                      'riscv:rvc:omitfp', 'riscv:rv64'):
+            arch = get_arch(march)
+            ir_module = c_to_ir(io.StringIO(self.source), arch)
+            optimize(ir_module, level=2)
+            start = asm(io.StringIO("""
+            section code
+            global run
+            lui x2, 0x10
+            jal x1, run
+            ebreak
+            """), arch)
+            image = link([start, ir_to_object([ir_module], arch)])
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.x[12] = 10
+            simulator.run(max_instructions=100000)
+            self.assertEqual(expected, simulator.x[10], march)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import io
+import random
+import struct
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.build.tasks import TaskError
+from ppci.utils.bitfun import to_signed, to_unsigned
+
+
+def truncating_division(a, b):
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def expected_result(name, a, b):
+    """ The result of the M extension instruction for a runtime function """
+    sa, sb = to_signed(a, 32), to_signed(b, 32)
+    if name == '__mulsi3':
+        result = a * b
+    elif name == '__udivsi3':
+        result = a // b if b else -1
+    elif name == '__umodsi3':
+        result = a % b if b else a
+    elif name == '__divsi3':
+        result = truncating_division(sa, sb) if sb else -1
+    else:
+        result = sa - truncating_division(sa, sb) * sb if sb else a
+    return to_unsigned(result, 32)
+
+
+class RiscvNomSelectionTestCase(unittest.TestCase):
+    """ Without the M extension, the runtime functions are called """
+    def compile(self, source, march='riscv:nom', level=2):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=level)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_runtime_calls(self):
+        code = self.compile(
+            'int f(int a, int b) { return a * b + a / b + a % b; } '
+            'unsigned g(unsigned a, unsigned b) { return a / b + a % b; }')
+        for name in ('__mulsi3', '__divsi3', '__modsi3', '__udivsi3',
+                     '__umodsi3'):
+            self.assertIn('jal x1, {}'.format(name), code)
+        for mnemonic in ('mul', 'div', 'rem'):
+            self.assertNotIn(mnemonic + ' ', code)
+
+    def test_constants(self):
+        """ Multiply by a few shift adds and divide by powers of two """
+        code = self.compile(
+            'int f(int a) { return a * 10 + a / 8 + a % -16; } '
+            'unsigned g(unsigned a) { return a / 64u + a % 4u; }')
+        self.assertIn('slli', code)
+        self.assertNotIn('jal x1', code)
+
+    def test_array_index(self):
+        code = self.compile(
+            'struct s { int a, b, c; }; int f(struct s *p, int i) '
+            '{ return p[i].b; }')
+        self.assertNotIn('__mulsi3', code)
+
+    def test_assembler(self):
+        arch = get_arch('riscv:nom')
+        with self.assertRaises(TaskError):
+            asm(io.StringIO('mul x5, x6, x7'), arch)
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            get_arch('riscv:rv64:nom')
+
+
+class RiscvNomRuntimeTestCase(unittest.TestCase):
+    """Run the runtime functions in the simulator.
+
+    Next to the results, check the number of executed instructions for
+    several operand distributions.
+    """
+    names = ('__mulsi3', '__udivsi3', '__umodsi3', '__divsi3', '__modsi3')
+
+    def setUp(self):
+        self.arch = get_arch('riscv:nom')
+
+    def link_call(self, name):
+        source = """
+        section code
+        global {0}
+        jal x1, {0}
+        ebreak
+        """.format(name)
+        return link(
+            [asm(io.StringIO(source), self.arch)], use_runtime=True)
+
+    def run_function(self, image, name, a, b):
+        simulator = RiscvSimulator(self.arch)
+        simulator.load(image)
+        simulator.x[12] = a
+        simulator.x[13] = b
+        retired = simulator.run(max_instructions=10000)
+        self.assertEqual(
+            expected_result(name, a, b), simulator.x[10], (name, a, b))
+        return retired
+
+    def check(self, name, operands, average, maximum):
+        image = self.link_call(name)
+        counts = [self.run_function(image, name, a, b) for a, b in operands]
+        self.assertLessEqual(sum(counts) / len(counts), average, name)
+        self.assertLessEqual(max(counts), maximum, name)
+
+    def test_edge_cases(self):
+        values = [
+            0, 1, 2, 3, 10, 255, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFE,
+            0xFFFFFFFF]
+        operands = [(a, b) for a in values for b in values]
+        for name in self.names:
+            self.check(name, operands, 60, 280)
+
+    def test_small_operands(self):
+        """ Loop counters, array sizes and digits, such as 10 * i """
+        rng = random.Random(2)
+        operands = [
+            (rng.randrange(1000), rng.randrange(1, 16)) for _ in range(50)]
+        self.check('__mulsi3', operands, 30, 32)
+        self.check('__udivsi3', operands, 65, 90)
+        self.check('__umodsi3', operands, 65, 90)
+
+    def test_negative_operands(self):
+        """ Small negative values only take the steps of their magnitude """
+        rng = random.Random(3)
+        operands = [
+            (to_unsigned(rng.randrange(-1000, 1000), 32),
+             to_unsigned(rng.choice([-10, -3, 7, 100]), 32))
+            for _ in range(50)]
+        self.check('__mulsi3', operands, 40, 60)
+        self.check('__divsi3', operands, 70, 95)
+        self.check('__modsi3', operands, 70, 95)
+
+    def test_large_operands(self):
+        rng = random.Random(4)
+        operands = [
+            (rng.getrandbits(32), rng.getrandbits(32)) for _ in range(50)]
+        self.check('__mulsi3', operands, 130, 140)
+        self.check('__udivsi3', operands, 25, 60)
+        operands = [
+            (rng.getrandbits(32), rng.getrandbits(8) + 1) for _ in range(50)]
+        self.check('__udivsi3', operands, 180, 215)
+        self.check('__divsi3', operands, 185, 225)
+
+    def test_linked_on_demand(self):
+        """ Only the runtime functions which are called are linked in """
+        image = self.link_call('__mulsi3')
+        self.assertTrue(image.has_symbol('__mulsi3'))
+        self.assertFalse(image.has_symbol('__divsi3'))
+        image = self.link_call('__umodsi3')
+        self.assertFalse(image.has_symbol('__mulsi3'))
+
+    def test_compiled_code(self):
+        """ Compile C code and link it with the runtime functions """
+        source = """
+        int run(int *p) {
+          int sum = 0;
+          for (int i = 0; i < 8; i++) {
+            sum += p[i] * p[i + 1] + p[i] / (i - 9) + p[i] % (i + 3);
+          }
+          return sum;
+        }
+        """
+        values = [7, -300, 12345, 0, -1, 99, 2000000, -42, 5]
+        expected = 0
+        for i in range(8):
+            expected += values[i] * values[i + 1]
+            expected += truncating_division(values[i], i - 9)
+            expected += values[i] - truncating_division(
+                values[i], i + 3) * (i + 3)
+        for level in (0, 2):
+            ir_module = c_to_ir(io.StringIO(source), self.arch)
+            optimize(ir_module, level=level)
+            start = asm(io.StringIO("""
+            section code
+            global run
+            lui x2, 0x10
+            jal x1, run
+            ebreak
+            """), self.arch)
+            image = link(
+                [start, ir_to_object([ir_module], self.arch)],
+                use_runtime=True)
+            simulator = RiscvSimulator(self.arch)
+            simulator.load(image)
+            simulator.write_memory(
+                0x8000, struct.pack('<9i', *values))
+            simulator.x[12] = 0x8000
+            simulator.run(max_instructions=100000)
+            self.assertEqual(
+                to_unsigned(expected, 32), simulator.x[10], level)
+
+
+if __name__ == '__main__':
+    unittest.main()
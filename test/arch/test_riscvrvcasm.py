@@ -14,6 +14,10 @@ class RiscvrvcAssemblerTestCase(AsmTestCaseBase):
         self.feed('c.sub x4, x7')
         self.check('1D 8E')
 
+    def test_cadd(self):
+        self.feed('c.add x8, x9')
+        self.check('26 94')
+
     def test_cxor(self):
         self.feed('c.xor x4, x7')
         self.check('3D 8E')
@@ -38,6 +42,10 @@ class RiscvrvcAssemblerTestCase(AsmTestCaseBase):
         self.feed('c.addi x4, x4, 5')
         self.check('15 02')
 
+    def test_caddi_negative(self):
+        self.feed('c.addi x8, x8, -3')
+        self.check('75 14')
+
     def test_cnop(self):
         self.feed('c.nop')
         self.check('01 00')
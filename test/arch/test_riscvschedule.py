@@ -0,0 +1,175 @@
+import io
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_object, link, optimize
+from ppci.arch.generic_instructions import Label
+from ppci.arch.riscv.instructions import Addi, Lw, Mul, Sw
+from ppci.arch.riscv.registers import R10, R11, R12, R13, R14, R15
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.codegen.instructionscheduler import InstructionScheduler
+from ppci.utils.reporting import DummyReportGenerator
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+
+class MessageReporter(DummyReportGenerator):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def message(self, msg):
+        self.messages.append(msg)
+
+
+class RiscvScheduleTestCase(unittest.TestCase):
+    """ Scheduling of instructions for the latencies of a core """
+
+    def make_scheduler(self, march):
+        arch = get_arch(march)
+        return InstructionScheduler(arch.info.latency_model, arch.info.alias)
+
+    def test_load_use(self):
+        """ Test that an independent instruction fills the load delay """
+        scheduler = self.make_scheduler('riscv:vexriscv')
+        load = Lw(R10, 0, R11)
+        use = Addi(R12, R10, 1)
+        other = Addi(R13, R14, 1)
+        instructions = [load, use, other]
+        self.assertEqual(1, scheduler.count_stalls(instructions))
+        scheduled = scheduler.schedule(instructions)
+        self.assertEqual([load, other, use], scheduled)
+        self.assertEqual(0, scheduler.count_stalls(scheduled))
+
+    def test_multiply_latency(self):
+        """ Test that a multiplication is started early """
+        scheduler = self.make_scheduler('riscv:rocket')
+        other1 = Addi(R13, R14, 1)
+        other2 = Addi(R15, R14, 2)
+        mul = Mul(R10, R11, R12)
+        use = Addi(R12, R10, 1)
+        scheduled = scheduler.schedule([other1, other2, mul, use])
+        self.assertEqual([mul, other1, other2, use], scheduled)
+
+    def test_memory_order(self):
+        """ Test that a load is not moved before a store """
+        scheduler = self.make_scheduler('riscv:vexriscv')
+        store = Sw(R10, 0, R11)
+        load = Lw(R12, 0, R13)
+        use = Addi(R14, R12, 1)
+        other = Addi(R15, R15, 1)
+        scheduled = scheduler.schedule([other, store, load, use])
+        self.assertLess(scheduled.index(store), scheduled.index(load))
+        self.assertEqual([store, load, other, use], scheduled)
+
+    def test_anti_dependency(self):
+        """ Test that a register is not overwritten before it is used """
+        scheduler = self.make_scheduler('riscv:vexriscv')
+        load = Lw(R10, 0, R11)
+        use = Addi(R12, R10, 1)
+        read = Addi(R15, R13, 1)
+        write = Addi(R13, R14, 1)
+        scheduled = scheduler.schedule([load, use, read, write])
+        self.assertLess(scheduled.index(read), scheduled.index(write))
+
+    def test_barrier(self):
+        """ Test that instructions are not moved past a label """
+        scheduler = self.make_scheduler('riscv:vexriscv')
+        load = Lw(R10, 0, R11)
+        label = Label('here')
+        use = Addi(R12, R10, 1)
+        other = Addi(R13, R14, 1)
+        instructions = [load, label, use, other]
+        self.assertEqual(instructions, scheduler.schedule(instructions))
+
+    def test_picorv32(self):
+        """ Test that the code is kept as is for picorv32 """
+        scheduler = self.make_scheduler('riscv:picorv32')
+        instructions = [Lw(R10, 0, R11), Addi(R12, R10, 1), Addi(R13, R14, 1)]
+        self.assertEqual(0, scheduler.count_stalls(instructions))
+        self.assertEqual(instructions, scheduler.schedule(instructions))
+
+    def test_options(self):
+        for march in ('riscv:vexriscv:rocket', 'riscv:postsched'):
+            with self.assertRaises(ValueError):
+                get_arch(march)
+        self.assertIsNone(get_arch('riscv').info.latency_model)
+
+
+class RiscvScheduleExecutionTestCase(unittest.TestCase):
+    """ Execute scheduled code on the simulator """
+    source = """
+    int values[16];
+
+    int run(int n) {
+      int i, s = 0;
+      for (i = 0; i < 16; i++) {
+        values[i] = i * n + 3;
+      }
+      for (i = 1; i < 15; i++) {
+        s += values[i - 1] * values[i + 1] + (values[i] >> 1) * 5;
+      }
+      return s;
+    }
+    """
+
+    def expected(self, n):
+        values = [i * n + 3 for i in range(16)]
+        s = 0
+        for i in range(1, 15):
+            s += values[i - 1] * values[i + 1] + (values[i] >> 1) * 5
+        return s
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        reporter = MessageReporter()
+        obj = ir_to_object([ir_module], arch, reporter=reporter)
+        stalls = [
+            int(message.split(':')[-1])
+            for message in reporter.messages
+            if message.startswith('Estimated stalls')
+        ]
+        return arch, obj, sum(stalls)
+
+    def test_stall_estimate(self):
+        _, _, stalls = self.compile('riscv:vexriscv')
+        _, _, more_stalls = self.compile('riscv:rocket')
+        self.assertLess(stalls, more_stalls)
+
+    def test_execution(self):
+        for march in (
+            'riscv:vexriscv',
+            'riscv:vexriscv:postsched',
+            'riscv:rvc:rocket:postsched',
+        ):
+            arch, obj, _ = self.compile(march)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, obj], layout=io.StringIO(LAYOUT), use_runtime=True)
+            for n in (0, 7):
+                simulator = RiscvSimulator(arch)
+                simulator.load(image)
+                simulator.x[12] = n
+                simulator.run(max_instructions=100000)
+                self.assertTrue(simulator.halted, march)
+                self.assertEqual(self.expected(n), simulator.x[10], march)
+
+
+if __name__ == '__main__':
+    unittest.main()
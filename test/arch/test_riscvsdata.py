@@ -0,0 +1,150 @@
+import io
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.binutils.outstream import TextOutputStream
+from ppci.binutils.disasm import Disassembler
+from ppci.common import CompilerError
+
+
+START = """
+section code
+global run
+global __global_pointer
+lui x2, 0x10
+lui x3, __global_pointer
+addi x3, x3, __global_pointer
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+    SECTION(sdata)
+    DEFINESYMBOL(__global_pointer)
+    SECTION(sbss)
+}
+"""
+
+
+class RiscvSmallDataTestCase(unittest.TestCase):
+    """ Address global variables relative to the global pointer """
+    source = """
+    int counter = 5;
+    static char flag;
+    short half = -2;
+    int far[1000];
+    int table[8];
+
+    int run(int n) {
+      for (int i = 0; i < n; i++) {
+        counter += i;
+        table[i & 7] += half;
+        far[i] = flag;
+        flag = i & 1;
+      }
+      return counter + table[3] + far[5];
+    }
+    """
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def disassemble(self, arch, section):
+        f = io.StringIO()
+        disassembler = Disassembler(arch)
+        disassembler.disasm(section.data, TextOutputStream(f=f))
+        return f.getvalue()
+
+    def test_sections(self):
+        arch, ir_module = self.compile('riscv:sdata')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('section sdata', code)
+        self.assertIn('section sbss', code)
+        self.assertIn('lui x9, %hi(counter)', code)
+        self.assertIn('%lo(counter)(x', code)
+        self.assertNotIn('_literal_', code)
+
+    def test_assembler(self):
+        arch = get_arch('riscv:sdata')
+        obj = asm(io.StringIO("""
+        section code
+        lui x5, %hi(value)
+        lw x6, %lo(value)(x5)
+        sh x6, %lo(value)(x5)
+        addi x5, x5, %lo(value)
+        """), arch)
+        self.assertEqual(
+            ['hi20', 'lo12_i', 'lo12_s', 'lo12_i'],
+            [r.reloc_type for r in obj.relocations])
+
+    def test_relaxation(self):
+        arch, ir_module = self.compile('riscv:sdata')
+        obj = ir_to_object([ir_module], arch)
+        image = link(
+            [asm(io.StringIO(START), arch), obj], layout=io.StringIO(LAYOUT))
+        code = self.disassemble(arch, image.get_section('code'))
+        self.assertIn('(x3)', code)
+        # Only the accesses to the large array still need a lui:
+        self.assertEqual(4, code.count('lui '))
+        self.assertLess(
+            image.get_section('code').size,
+            obj.get_section('code').size + 20)
+
+    def test_without_global_pointer(self):
+        arch, ir_module = self.compile('riscv:sdata')
+        obj = ir_to_object([ir_module], arch)
+        layout = LAYOUT.replace('DEFINESYMBOL(__global_pointer)', '')
+        start = START.replace('global __global_pointer', '')
+        start = '\n'.join(
+            line for line in start.splitlines() if 'x3' not in line)
+        image = link(
+            [asm(io.StringIO(start), arch), obj], layout=io.StringIO(layout))
+        code = self.disassemble(arch, image.get_section('code'))
+        self.assertNotIn('(x3)', code)
+
+    def test_layout_without_small_data(self):
+        """ Test that the small data sections must be in the layout """
+        arch, ir_module = self.compile('riscv:sdata')
+        obj = ir_to_object([ir_module], arch)
+        layout = '\n'.join(
+            line for line in LAYOUT.splitlines()
+            if 'sdata' not in line and 'sbss' not in line)
+        with self.assertRaisesRegex(CompilerError, 'sdata'):
+            link(
+                [asm(io.StringIO(START), arch), obj],
+                layout=io.StringIO(layout))
+
+    def test_execution(self):
+        n = 30
+        counter = 5 + sum(range(n))
+        table3 = -2 * 4
+        expected = counter + table3 + 0
+        for march in ('riscv:sdata', 'riscv:rvc:sdata', 'riscv'):
+            arch, ir_module = self.compile(march)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)],
+                layout=io.StringIO(LAYOUT))
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.pc = 0
+            simulator.x[12] = n
+            simulator.run(max_instructions=10000)
+            self.assertEqual(expected, simulator.x[10], march)
+
+    def test_rv64(self):
+        with self.assertRaises(ValueError):
+            get_arch('riscv:rv64:sdata')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.binutils.outstream import TextOutputStream
+from ppci.binutils.disasm import Disassembler
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+
+class RiscvZicondAssemblerTestCase(AsmTestCaseBase):
+    """ Conditional zero instruction assembly test case """
+    march = 'riscv:zicond'
+
+    def test_czero_eqz(self):
+        self.feed('czero.eqz x10, x11, x12')
+        self.check('33 D5 C5 0E')
+
+    def test_czero_nez(self):
+        self.feed('czero.nez x5, x6, x7')
+        self.check('B3 72 73 0E')
+
+
+class RiscvSelectTestCase(unittest.TestCase):
+    """ Comparisons and small diamonds without branches """
+    source = """
+    int lt(int a, int b) { return a < b; }
+    int geu(unsigned a, unsigned b) { return a >= b; }
+    int eq(int a, int b) { return a == b; }
+    int nez(int a) { return a != 0; }
+    int gt7(int a) { return a > 7; }
+    int maxi(int a, int b) { return a > b ? a : b; }
+    int sel(int c, int a, int b) { return c ? a : b; }
+    unsigned clear(unsigned a, unsigned b) { return a <= b ? 0 : a; }
+    int absi(int a) { int r = a; if (a < 0) r = -a; return r; }
+    int konst(int a) { return (1 == 1) ? a : (2 == 2) ? 2 : 3; }
+
+    int run(int n) {
+      int s = 0;
+      for (int i = -n; i <= n; i++) {
+        int j = 3 - i;
+        s = s * 3 + lt(i, j) + 2 * geu(i, j) + 4 * eq(i, 1) + 8 * nez(i)
+          + 16 * gt7(i * 3) + maxi(i, j) + sel(i & 1, i, 5 * j)
+          + clear(i, j) + absi(i * j) + konst(i);
+      }
+      return s;
+    }
+    """
+
+    def expected(self, n):
+        def clear(a, b):
+            return 0 if (a & 0xFFFFFFFF) <= (b & 0xFFFFFFFF) else a
+
+        s = 0
+        for i in range(-n, n + 1):
+            j = 3 - i
+            s = (
+                s * 3
+                + (i < j)
+                + 2 * ((i & 0xFFFFFFFF) >= (j & 0xFFFFFFFF))
+                + 4 * (i == 1)
+                + 8 * (i != 0)
+                + 16 * (i * 3 > 7)
+                + max(i, j)
+                + (i if i & 1 else 5 * j)
+                + clear(i, j)
+                + abs(i * j)
+                + i
+            )
+        return s & 0xFFFFFFFF
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def get_function(self, code, name):
+        start = code.index(' {}:'.format(name))
+        end = code.index(' {}_epilog:'.format(name))
+        return code[start:end]
+
+    def test_code(self):
+        arch, ir_module = self.compile('riscv')
+        code = ir_to_assembly([ir_module], arch)
+        for name in ('lt', 'geu', 'eq', 'nez', 'gt7', 'maxi', 'sel', 'absi'):
+            function = self.get_function(code, name)
+            for branch in ('beq', 'bne', 'blt', 'bge', 'bgt', 'ble'):
+                self.assertNotIn(branch, function, name)
+        self.assertIn('slt x', self.get_function(code, 'lt'))
+        self.assertIn('sltiu x', self.get_function(code, 'eq'))
+        self.assertIn('sltu x10, x0, x12', self.get_function(code, 'nez'))
+        self.assertIn('slti x', self.get_function(code, 'gt7'))
+
+    def test_zicond_code(self):
+        for march in ('riscv:zicond', 'riscv:rv64:zicond'):
+            arch, ir_module = self.compile(march)
+            code = ir_to_assembly([ir_module], arch)
+            self.assertIn('czero.eqz x', self.get_function(code, 'maxi'))
+            self.assertIn('czero.nez x', self.get_function(code, 'maxi'))
+            self.assertIn('czero.', self.get_function(code, 'clear'))
+
+    def test_disassembly(self):
+        arch, ir_module = self.compile('riscv:rvc:zicond')
+        obj = ir_to_object([ir_module], arch)
+        f = io.StringIO()
+        disassembler = Disassembler(arch)
+        disassembler.disasm(
+            obj.get_section('code').data, TextOutputStream(f=f))
+        code = f.getvalue()
+        self.assertIn('czero.eqz x', code)
+        self.assertIn('czero.nez x', code)
+
+    def test_execution(self):
+        for n in (0, 1, 6):
+            expected = self.expected(n)
+            for march in ('riscv', 'riscv:rvc', 'riscv:zicond'):
+                arch, ir_module = self.compile(march)
+                start = asm(io.StringIO(START), arch)
+                image = link(
+                    [start, ir_to_object([ir_module], arch)],
+                    layout=io.StringIO(LAYOUT), use_runtime=True)
+                simulator = RiscvSimulator(arch)
+                simulator.load(image)
+                simulator.x[12] = n
+                simulator.run(max_instructions=100000)
+                self.assertTrue(simulator.halted, march)
+                self.assertEqual(expected, simulator.x[10], march)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import io
+import unittest
+from ppci.api import asm, link, get_arch
+from ppci.arch.riscv.decoder import RiscvDecoder
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+class RiscvSimulatorTestCase(unittest.TestCase):
+    """ Run small assembly snippets on the riscv simulator """
+    march = 'riscv'
+
+    def run_snippet(self, source, march=None):
+        arch = get_arch(march or self.march)
+        source = 'section code\n' + source
+        obj = link([asm(io.StringIO(source), arch)])
+        simulator = RiscvSimulator(arch)
+        simulator.load(obj)
+        simulator.run(max_instructions=100000)
+        self.assertTrue(simulator.halted)
+        return simulator
+
+    def test_arithmetic(self):
+        sim = self.run_snippet("""
+        li x5, 100
+        li x6, -7
+        add x7, x5, x6
+        sub x8, x6, x5
+        slt x9, x6, x5
+        sltu x10, x6, x5
+        srai x11, x6, 1
+        srli x12, x6, 28
+        lui x13, 0x12345
+        ebreak
+        """)
+        self.assertEqual(93, sim.x[7])
+        self.assertEqual(0xFFFFFF95, sim.x[8])
+        self.assertEqual(1, sim.x[9])
+        self.assertEqual(0, sim.x[10])
+        self.assertEqual(0xFFFFFFFC, sim.x[11])
+        self.assertEqual(0xF, sim.x[12])
+        self.assertEqual(0x12345000, sim.x[13])
+
+    def test_division_corner_cases(self):
+        sim = self.run_snippet("""
+        li x5, -7
+        li x6, 2
+        div x7, x5, x6
+        rem x8, x5, x6
+        div x9, x5, x0
+        remu x10, x5, x0
+        lui x11, 0x80000
+        li x12, -1
+        div x13, x11, x12
+        rem x14, x11, x12
+        ebreak
+        """)
+        self.assertEqual(0xFFFFFFFD, sim.x[7])
+        self.assertEqual(0xFFFFFFFF, sim.x[8])
+        self.assertEqual(0xFFFFFFFF, sim.x[9])
+        self.assertEqual(0xFFFFFFF9, sim.x[10])
+        self.assertEqual(0x80000000, sim.x[13])
+        self.assertEqual(0, sim.x[14])
+
+    def test_multiply_high(self):
+        sim = self.run_snippet("""
+        li x5, -2
+        li x6, 3
+        mulh x7, x5, x6
+        mulhu x8, x5, x6
+        mulhsu x9, x5, x6
+        mulhsu x10, x6, x5
+        ebreak
+        """)
+        self.assertEqual(0xFFFFFFFF, sim.x[7])
+        self.assertEqual(2, sim.x[8])
+        self.assertEqual(0xFFFFFFFF, sim.x[9])
+        self.assertEqual(2, sim.x[10])
+
+    def test_loop_and_uart(self):
+        sim = self.run_snippet("""
+        lui x5, 0x20000
+        li x6, 65
+        li x7, 5
+        loop:
+        sw x6, 0(x5)
+        addi x6, x6, 1
+        addi x7, x7, -1
+        bne x7, x0, loop
+        ebreak
+        """)
+        self.assertEqual(b'ABCDE', sim.output)
+        self.assertEqual(3 + 5 * 4 + 1, sim.instret)
+
+    def test_memory(self):
+        sim = self.run_snippet("""
+        lui x5, 0x4
+        li x6, -2
+        sw x6, 0(x5)
+        lb x7, 0(x5)
+        lbu x8, 0(x5)
+        lh x9, 2(x5)
+        lhu x10, 2(x5)
+        ebreak
+        """)
+        self.assertEqual(0xFFFFFFFE, sim.x[7])
+        self.assertEqual(0xFE, sim.x[8])
+        self.assertEqual(0xFFFFFFFF, sim.x[9])
+        self.assertEqual(0xFFFF, sim.x[10])
+
+    def test_call(self):
+        sim = self.run_snippet("""
+        li x10, 3
+        jal x1, double
+        jal x1, double
+        ebreak
+        double:
+        add x10, x10, x10
+        jalr x0,x1, 0
+        """)
+        self.assertEqual(12, sim.x[10])
+
+    def test_compressed(self):
+        sim = self.run_snippet("""
+        c.li x8, -3
+        c.addi x8, x8, -5
+        c.li x9, 12
+        c.sub x9, x8
+        c.lui x10, 3
+        lui x2, 1
+        c.addi16sp -64
+        c.swsp x9,4(x2)
+        c.lwsp x11,4(x2)
+        l1: c.bneqz x9, l2
+        c.j l1
+        l2:
+        c.ebreak
+        """, march='riscv:rvc')
+        self.assertEqual(0xFFFFFFF8, sim.x[8])
+        self.assertEqual(20, sim.x[9])
+        self.assertEqual(0x3000, sim.x[10])
+        self.assertEqual(0xFC0, sim.x[2])
+        self.assertEqual(20, sim.x[11])
+
+    def test_float(self):
+        sim = self.run_snippet("""
+        li x5, 7
+        fcvt.s.w f1, x5
+        li x6, 2
+        fcvt.s.w f2, x6
+        fdiv.s f3, f1, f2
+        fmv.x.s x7, f3
+        fmul.s f4, f3, f3
+        fcvt.w.s x8, f4, rtz
+        f.flt.s x9, f2, f1
+        fcvt.w.s x10, f3, rtz
+        ebreak
+        """, march='riscv:rvf')
+        self.assertEqual(3.5, sim.f[3])
+        self.assertEqual(0x40600000, sim.x[7])
+        self.assertEqual(12, sim.x[8])
+        self.assertEqual(1, sim.x[9])
+        # Conversions round towards zero:
+        self.assertEqual(3, sim.x[10])
+
+
+class RiscvDecoderTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        source = """
+        section code
+        addi x7, x5, -12
+        sw x5, -2048(x6)
+        mul x5, x6, x7
+        csrr x5, mstatus
+        c.andi x10, x10, -5
+        c.lw x8, 124(x15)
+        """
+        arch = get_arch('riscv:rvc')
+        data = asm(io.StringIO(source), arch).get_section('code').data
+        decoder = RiscvDecoder(arch)
+        address = 0
+        while address < len(data):
+            ins, size = decoder.decode(data[address:address + 4], address)
+            self.assertEqual(data[address:address + size], ins.encode())
+            address += size
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+import ctypes
+import io
+import math
+import operator
+import random
+import struct
+import unittest
+from ppci import ir
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.utils.bitfun import to_signed
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x8000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x8000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+NAN = 0x7FF8000000000000
+
+
+def as_double(value):
+    return struct.unpack('<d', struct.pack('<Q', value))[0]
+
+
+def as_bits(value):
+    return struct.unpack('<Q', struct.pack('<d', value))[0]
+
+
+def as_single(value):
+    return struct.unpack('<f', struct.pack('<I', value))[0]
+
+
+def expected_result(name, a, b):
+    """ The IEEE-754 result of a runtime function """
+    x, y = as_double(a), as_double(b)
+    if name == '__adddf3':
+        result = x + y
+    elif name == '__subdf3':
+        result = x - y
+    elif name == '__muldf3':
+        result = x * y
+    elif y:
+        result = x / y
+    elif x == 0 or math.isnan(x):
+        result = math.nan
+    else:
+        result = math.copysign(math.inf, x) * math.copysign(1, y)
+    if math.isnan(result):
+        return NAN
+    return as_bits(result)
+
+
+def expected_conversion(name, a):
+    """ The result of a conversion function of the runtime """
+    if name == '__floatsidf':
+        return as_bits(float(to_signed(a, 32)))
+    elif name == '__floatunsidf':
+        return as_bits(float(a))
+    elif name == '__extendsfdf2':
+        x = as_single(a)
+        return NAN if math.isnan(x) else as_bits(x)
+    x = as_double(a)
+    if name == '__truncdfsf2':
+        if math.isnan(x):
+            return 0x7FC00000
+        x = ctypes.c_float(x).value
+        return struct.unpack('<I', struct.pack('<f', x))[0]
+    elif name == '__fixdfsi':
+        low, high = -2**31, 2**31 - 1
+    else:
+        low, high = 0, 2**32 - 1
+    if math.isnan(x):
+        return high & 0xFFFFFFFF
+    if math.isinf(x):
+        return (high if x > 0 else low) & 0xFFFFFFFF
+    return max(low, min(high, int(x))) & 0xFFFFFFFF
+
+
+comparisons = {
+    '__eqdf2': (operator.eq, lambda r: r == 0),
+    '__nedf2': (operator.ne, lambda r: r != 0),
+    '__ltdf2': (operator.lt, lambda r: r < 0),
+    '__ledf2': (operator.le, lambda r: r <= 0),
+    '__gtdf2': (operator.gt, lambda r: r > 0),
+    '__gedf2': (operator.ge, lambda r: r >= 0),
+}
+
+special_values = [
+    0, 1 << 63, 1, (1 << 63) | 1, (1 << 52) - 1, 1 << 52, 1 << 51,
+    0x7FEFFFFFFFFFFFFF, 0xFFEFFFFFFFFFFFFF, 0x7FE0000000000000,
+    0x7FF0000000000000, 0xFFF0000000000000, NAN, 0x7FF0000000000001,
+    as_bits(1.0), as_bits(-1.0), as_bits(1.0) + 1, as_bits(0.5),
+    as_bits(3.0), as_bits(1 / 3), as_bits(2.0 ** -53), as_bits(2.0 ** 31),
+    as_bits(-2.0 ** 31), as_bits(2.0 ** 32)]
+
+
+class RiscvSoftDoubleSelectionTestCase(unittest.TestCase):
+    """ Without the D extension, doubles are kept in pairs of registers """
+    def compile(self, source, march='riscv'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_double_size(self):
+        for march in ('riscv', 'riscv:rvc', 'riscv:rvf', 'riscv:rvfx'):
+            self.assertEqual(8, get_arch(march).info.get_size(ir.f64))
+
+    def test_runtime_calls(self):
+        code = self.compile(
+            'double f(double a, double b, int c) '
+            '{ return (a + b) * (a - b) / c; } '
+            'int g(double a) { return a; }')
+        for name in ('__adddf3', '__subdf3', '__muldf3', '__divdf3',
+                     '__floatsidf', '__fixdfsi'):
+            self.assertIn('jal x1, {}'.format(name), code)
+        self.assertNotIn('sf3', code)
+
+    def test_compare(self):
+        code = self.compile(
+            'int f(double a, double b) { if (a < b) return 1; return 2; }')
+        self.assertIn('jal x1, __ltdf2', code)
+        self.assertIn('blt x10, x0', code)
+
+    def test_negate(self):
+        code = self.compile('double f(double a) { return -a; }')
+        self.assertNotIn('jal x1', code)
+
+    def test_single_precision_unit(self):
+        """ Floats use the F extension, doubles the runtime """
+        code = self.compile(
+            'double f(float a, double b) { return (a * a) * b; }',
+            march='riscv:rvf')
+        self.assertIn('fmul.s', code)
+        self.assertIn('jal x1, __extendsfdf2', code)
+        self.assertIn('jal x1, __muldf3', code)
+
+
+class RiscvSoftDoubleRuntimeTestCase(unittest.TestCase):
+    """Run the double precision functions in the simulator.
+
+    The results are compared with the python floating point operations,
+    which are double precision.
+    """
+    march = 'riscv'
+    names = ('__adddf3', '__subdf3', '__muldf3', '__divdf3')
+
+    def setUp(self):
+        self.arch = get_arch(self.march)
+        self.images = {}
+
+    def run_function(self, name, a, b=0):
+        if name not in self.images:
+            source = """
+            section code
+            global {0}
+            jal x1, {0}
+            ebreak
+            """.format(name)
+            self.images[name] = link(
+                [asm(io.StringIO(source), self.arch)], use_runtime=True)
+        simulator = RiscvSimulator(self.arch)
+        simulator.load(self.images[name])
+        simulator.x[12] = a & 0xFFFFFFFF
+        simulator.x[13] = a >> 32
+        simulator.x[14] = b & 0xFFFFFFFF
+        simulator.x[15] = b >> 32
+        retired = simulator.run(max_instructions=10000)
+        return simulator.x[10] | (simulator.x[11] << 32), retired
+
+    def check(self, name, operands, average):
+        counts = []
+        for a, b in operands:
+            result, retired = self.run_function(name, a, b)
+            counts.append(retired)
+            self.assertEqual(
+                expected_result(name, a, b), result,
+                (name, hex(a), hex(b)))
+        self.assertLessEqual(sum(counts) / len(counts), average, name)
+
+    def test_special_values(self):
+        operands = [(a, b) for a in special_values for b in special_values]
+        for name in self.names:
+            self.check(name, operands, 700)
+
+    def test_random_values(self):
+        rng = random.Random(15)
+        values = [rng.getrandbits(64) for _ in range(60)]
+        values += [as_bits(rng.uniform(-10, 10)) for _ in range(30)]
+        operands = list(zip(values, values[1:]))
+        # Nearby values cancel out in subtraction:
+        operands += [(a, a ^ rng.getrandbits(8)) for a in values]
+        averages = {
+            '__adddf3': 80, '__subdf3': 120, '__muldf3': 120,
+            '__divdf3': 1000}
+        for name in self.names:
+            self.check(name, operands, averages[name])
+
+    def test_conversions(self):
+        rng = random.Random(16)
+        values = [rng.getrandbits(64) for _ in range(40)]
+        values += [as_bits(value) for value in (
+            2.75, -2.7, 0.5, -0.5, 1e9, -1e9, 2.0 ** 32 - 0.5,
+            -2.0 ** 31 - 1, 4294967295.0)]
+        for name in ('__fixdfsi', '__fixunsdfsi', '__truncdfsf2'):
+            for a in special_values + values:
+                result, retired = self.run_function(name, a)
+                self.assertEqual(
+                    expected_conversion(name, a), result & 0xFFFFFFFF,
+                    (name, hex(a)))
+                self.assertLessEqual(retired, 50)
+        values = [rng.getrandbits(32) for _ in range(40)]
+        values += [0, 1, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFF, 0x7F800000,
+                   0xFF800000, 0x7FC00000, 0x7F800001, 0x400000]
+        for name in ('__floatsidf', '__floatunsidf', '__extendsfdf2'):
+            for a in values:
+                result, retired = self.run_function(name, a)
+                self.assertEqual(
+                    expected_conversion(name, a), result, (name, hex(a)))
+                self.assertLessEqual(retired, 100)
+
+    def test_comparisons(self):
+        rng = random.Random(17)
+        values = [rng.getrandbits(64) for _ in range(30)]
+        operands = [(a, b) for a in special_values for b in special_values]
+        operands += list(zip(values, values[1:])) + [(a, a) for a in values]
+        # Values which only differ in the low word:
+        operands += [(a, a ^ 1) for a in values]
+        for name, (compare, test) in comparisons.items():
+            for a, b in operands:
+                result, retired = self.run_function(name, a, b)
+                self.assertEqual(
+                    compare(as_double(a), as_double(b)),
+                    test(to_signed(result, 32)), (name, hex(a), hex(b)))
+                self.assertLessEqual(retired, 35)
+
+
+class RiscvSoftDoubleNomRuntimeTestCase(RiscvSoftDoubleRuntimeTestCase):
+    """ Multiply without the M extension """
+    march = 'riscv:nom'
+    names = ('__muldf3',)
+
+    def test_random_values(self):
+        rng = random.Random(18)
+        values = [rng.getrandbits(64) for _ in range(60)]
+        self.check('__muldf3', list(zip(values, values[1:])), 1000)
+
+
+class RiscvSoftDoubleExecutionTestCase(unittest.TestCase):
+    """ Run compiled code with doubles on the simulator """
+    source = """
+    struct point { double x; int tag; double y; };
+    struct point points[3];
+    double table[4] = {1.5, -2.25, 0.1, 3e100};
+
+    double scale(double k) { return k * 0.5; }
+
+    double many(double a, double b, double c, double d, double e, int i,
+                double f, float g) {
+      return a + b * 2 + c * 3 + d * 4 + e * 5 + i + f * 7 + g;
+    }
+
+    int run(int n) {
+      double a = n, b = a + 1, c = b * b, d = c - a, e = d / 3;
+      double f = e + c, g = f * a, h = g - b, i = h + e, j = i * 0.125;
+      double k = j + a;
+      double m = scale(k);
+      double sum = a + b + c + d + e + f + g + h + i + j + k + m;
+      for (int q = 0; q < 3; q++) {
+        points[q].x = sum + table[q];
+        points[q].tag = q;
+        points[q].y = -points[q].x;
+      }
+      sum = sum + points[1].y + many(a, b, c, d, e, n, f, (float)j);
+      if (table[3] > sum && sum != 0) {
+        sum = sum / 4;
+      }
+      return (int)(sum * 16) + (int)(unsigned)(c * 3);
+    }
+    """
+
+    def expected(self, n):
+        def single(value):
+            return struct.unpack('<f', struct.pack('<f', value))[0]
+
+        a = float(n)
+        b = a + 1
+        c = b * b
+        d = c - a
+        e = d / 3
+        f = e + c
+        g = f * a
+        h = g - b
+        i = h + e
+        j = i * 0.125
+        k = j + a
+        m = k * 0.5
+        total = a + b + c + d + e + f + g + h + i + j + k + m
+        y = -(total + -2.25)
+        total = total + y + (
+            a + b * 2 + c * 3 + d * 4 + e * 5 + n + f * 7 + single(j))
+        if 3e100 > total and total != 0:
+            total = total / 4
+        return (int(total * 16) + int(c * 3)) & 0xFFFFFFFF
+
+    def test_execution(self):
+        for march in (
+            'riscv',
+            'riscv:rvc',
+            'riscv:nom',
+            'riscv:rvf',
+            'riscv:rvf:ilp32f',
+            'riscv:ilp32',
+            'riscv:omitfp',
+        ):
+            arch = get_arch(march)
+            for level in (0, 2):
+                ir_module = c_to_ir(io.StringIO(self.source), arch)
+                optimize(ir_module, level=level)
+                start = asm(io.StringIO(START), arch)
+                image = link(
+                    [start, ir_to_object([ir_module], arch)],
+                    layout=io.StringIO(LAYOUT), use_runtime=True)
+                for n in (3, -5):
+                    simulator = RiscvSimulator(arch)
+                    simulator.load(image)
+                    # The argument register depends on the convention:
+                    simulator.x[10] = simulator.x[12] = n & 0xFFFFFFFF
+                    simulator.run(max_instructions=200000)
+                    self.assertTrue(simulator.halted, march)
+                    self.assertEqual(
+                        self.expected(n), simulator.x[10], (march, level))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+import ctypes
+import io
+import math
+import operator
+import random
+import struct
+import unittest
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.utils.bitfun import to_signed, to_unsigned
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+
+def as_float(value):
+    return struct.unpack('<f', struct.pack('<I', value))[0]
+
+
+def as_bits(value):
+    """ Round a python float to single precision """
+    value = ctypes.c_float(value).value
+    return struct.unpack('<I', struct.pack('<f', value))[0]
+
+
+def expected_result(name, a, b):
+    """ The IEEE-754 result of a runtime function """
+    x, y = as_float(a), as_float(b)
+    if name == '__fixsfsi':
+        if math.isnan(x):
+            return 0x7FFFFFFF
+        if math.isinf(x):
+            return 0x7FFFFFFF if x > 0 else 0x80000000
+        return to_unsigned(max(-2**31, min(2**31 - 1, int(x))), 32)
+    elif name == '__floatsisf':
+        return as_bits(float(to_signed(a, 32)))
+    elif name == '__addsf3':
+        result = x + y
+    elif name == '__subsf3':
+        result = x - y
+    elif name == '__mulsf3':
+        result = x * y
+    elif y:
+        result = x / y
+    elif x == 0 or math.isnan(x):
+        result = math.nan
+    else:
+        result = math.copysign(math.inf, x) * math.copysign(1, y)
+    if math.isnan(result):
+        return 0x7FC00000
+    return as_bits(result)
+
+
+comparisons = {
+    '__eqsf2': (operator.eq, lambda r: r == 0),
+    '__nesf2': (operator.ne, lambda r: r != 0),
+    '__ltsf2': (operator.lt, lambda r: r < 0),
+    '__lesf2': (operator.le, lambda r: r <= 0),
+    '__gtsf2': (operator.gt, lambda r: r > 0),
+    '__gesf2': (operator.ge, lambda r: r >= 0),
+}
+
+special_values = [
+    0, 0x80000000, 1, 0x80000001, 0x7FFFFF, 0x800000, 0x7F7FFFFF,
+    0xFF7FFFFF, 0x7F800000, 0xFF800000, 0x7FC00000, 0x3F800000,
+    0xBF800000, 0x3F800001, 0x3F000000, 0x33800000, 0x34000000,
+    0x4F000000, 0xCF000000, 0x00400000, 0x7F000000]
+
+
+class RiscvSoftFloatSelectionTestCase(unittest.TestCase):
+    """ Without a floating point unit, the runtime functions are called """
+    def compile(self, source, march='riscv'):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return ir_to_assembly([ir_module], arch)
+
+    def test_runtime_calls(self):
+        code = self.compile(
+            'float f(float a, float b, int c) '
+            '{ return (a + b) * (a - b) / c; } '
+            'int g(float a) { return a; }')
+        for name in ('__addsf3', '__subsf3', '__mulsf3', '__divsf3',
+                     '__floatsisf', '__fixsfsi'):
+            self.assertIn('jal x1, {}'.format(name), code)
+
+    def test_compare(self):
+        code = self.compile(
+            'int f(float a, float b) { if (a < b) return 1; return 2; }')
+        self.assertIn('jal x1, __ltsf2', code)
+        self.assertIn('blt x10, x0', code)
+
+    def test_negate(self):
+        code = self.compile('float f(float a) { return -a; }')
+        self.assertNotIn('jal x1', code)
+
+    def test_floating_point_unit(self):
+        code = self.compile(
+            'float f(float a, float b) { return a * b; }', march='riscv:rvf')
+        self.assertNotIn('__mulsf3', code)
+
+
+class RiscvSoftFloatRuntimeTestCase(unittest.TestCase):
+    """Run the floating point functions in the simulator.
+
+    The results are compared with the single precision rounding of the
+    python floating point operations.
+    """
+    march = 'riscv'
+    names = ('__addsf3', '__subsf3', '__mulsf3', '__divsf3')
+
+    def setUp(self):
+        self.arch = get_arch(self.march)
+        self.images = {}
+
+    def run_function(self, name, a, b=0):
+        if name not in self.images:
+            source = """
+            section code
+            global {0}
+            jal x1, {0}
+            ebreak
+            """.format(name)
+            self.images[name] = link(
+                [asm(io.StringIO(source), self.arch)], use_runtime=True)
+        simulator = RiscvSimulator(self.arch)
+        simulator.load(self.images[name])
+        simulator.x[12] = a
+        simulator.x[13] = b
+        retired = simulator.run(max_instructions=10000)
+        return simulator.x[10], retired
+
+    def check(self, name, operands, average):
+        counts = []
+        for a, b in operands:
+            result, retired = self.run_function(name, a, b)
+            counts.append(retired)
+            self.assertEqual(
+                expected_result(name, a, b), result,
+                (name, hex(a), hex(b)))
+        self.assertLessEqual(sum(counts) / len(counts), average, name)
+
+    def test_special_values(self):
+        operands = [(a, b) for a in special_values for b in special_values]
+        for name in self.names:
+            self.check(name, operands, 400)
+
+    def test_random_values(self):
+        rng = random.Random(5)
+        values = [rng.getrandbits(32) for _ in range(60)]
+        operands = list(zip(values, values[1:]))
+        # Nearby values cancel out in subtraction:
+        operands += [(a, a ^ rng.getrandbits(4)) for a in values]
+        averages = {
+            '__addsf3': 60, '__subsf3': 80, '__mulsf3': 70, '__divsf3': 240}
+        for name in self.names:
+            self.check(name, operands, averages[name])
+
+    def test_conversions(self):
+        rng = random.Random(6)
+        values = [rng.getrandbits(32) for _ in range(40)]
+        # Fractions are truncated towards zero:
+        values += [0x3F000000, 0x3FC00000, 0x40300000, 0xC02CCCCD]
+        self.check(
+            '__fixsfsi', [(a, 0) for a in special_values + values], 30)
+        values += [0, 1, 0xFFFFFFFF, 0x7FFFFFFF, 0x80000000, 16777217]
+        self.check('__floatsisf', [(a, 0) for a in values], 45)
+
+    def test_cast_to_int(self):
+        """ Test that a cast in C truncates like python int() """
+        ir_module = c_to_ir(
+            io.StringIO('int run(float a) { return a; }'), self.arch)
+        start = asm(io.StringIO(START), self.arch)
+        image = link(
+            [start, ir_to_object([ir_module], self.arch)], use_runtime=True)
+        for value in (2.75, -2.7, 0.5, -0.5, 1e9):
+            simulator = RiscvSimulator(self.arch)
+            simulator.load(image)
+            simulator.x[12] = as_bits(value)
+            simulator.run(max_instructions=10000)
+            self.assertEqual(int(value), to_signed(simulator.x[10], 32))
+
+    def test_comparisons(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(32) for _ in range(30)]
+        operands = [(a, b) for a in special_values for b in special_values]
+        operands += list(zip(values, values[1:])) + [(a, a) for a in values]
+        for name, (compare, test) in comparisons.items():
+            for a, b in operands:
+                result, retired = self.run_function(name, a, b)
+                self.assertEqual(
+                    compare(as_float(a), as_float(b)),
+                    test(to_signed(result, 32)), (name, hex(a), hex(b)))
+                self.assertLessEqual(retired, 25)
+
+    def test_compiled_code(self):
+        """ Compile C code and link it with the runtime functions """
+        source = """
+        float run(float *p, int n) {
+          float sum = 0;
+          for (int i = 0; i < n; i++) {
+            if (p[i] > 0.5) {
+              sum = sum + p[i] * p[i];
+            } else {
+              sum = sum - p[i] / 3;
+            }
+          }
+          return sum + n;
+        }
+        """
+        values = [1.5, -2.25, 0.125, 1e10, -3e-20, 7.0, 0.5, 100.75]
+        expected = 0.0
+        for value in struct.unpack('<8f', struct.pack('<8f', *values)):
+            if value > 0.5:
+                expected = as_float(as_bits(
+                    expected + as_float(as_bits(value * value))))
+            else:
+                expected = as_float(as_bits(
+                    expected - as_float(as_bits(value / 3))))
+        expected = as_bits(expected + 8)
+        ir_module = c_to_ir(io.StringIO(source), self.arch)
+        optimize(ir_module, level=2)
+        start = asm(io.StringIO(START), self.arch)
+        image = link(
+            [start, ir_to_object([ir_module], self.arch)], use_runtime=True)
+        simulator = RiscvSimulator(self.arch)
+        simulator.load(image)
+        simulator.write_memory(0x8000, struct.pack('<8f', *values))
+        simulator.x[12] = 0x8000
+        simulator.x[13] = len(values)
+        simulator.run(max_instructions=100000)
+        self.assertEqual(expected, simulator.x[10])
+
+
+class RiscvSoftFloatNomRuntimeTestCase(RiscvSoftFloatRuntimeTestCase):
+    """ Multiply without the M extension """
+    march = 'riscv:nom'
+    names = ('__mulsf3',)
+
+    def test_random_values(self):
+        rng = random.Random(8)
+        values = [rng.getrandbits(32) for _ in range(60)]
+        self.check('__mulsf3', list(zip(values, values[1:])), 250)
+
+
+if __name__ == '__main__':
+    unittest.main()
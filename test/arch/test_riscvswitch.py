@@ -0,0 +1,144 @@
+import io
+import unittest
+from ppci import ir, irutils
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+IR_SOURCE = """module main;
+global function i32 select(ptr index) {
+  select_entry: {
+    jmp_table index ? [one, two, one] : other;
+  }
+
+  one: {
+    i32 a = 1;
+    return a;
+  }
+
+  two: {
+    i32 b = 2;
+    return b;
+  }
+
+  other: {
+    i32 c = 3;
+    return c;
+  }
+
+}
+"""
+
+
+class RiscvSwitchTestCase(unittest.TestCase):
+    """ Dense switch statements are lowered to jump tables """
+    source = """
+    int pick(int x) {
+      switch (x) {
+        case -2: return 7;
+        case -1: return 11;
+        case 0: return 13;
+        case 2: return 17;
+        case 3: return 19;
+        case 5: return 23;
+        default: return 29;
+      }
+    }
+
+    int run(int n) {
+      int total = 0;
+      for (int i = -4; i < n; i++) {
+        total = total * 3 + pick(i);
+      }
+      return total;
+    }
+    """
+    sparse = """
+    int pick(int x) {
+      switch (x) {
+        case 1: return 7;
+        case 100: return 11;
+        case 1000: return 13;
+        case 10000: return 17;
+        default: return 29;
+      }
+    }
+    """
+
+    def compile(self, source, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def test_ir_roundtrip(self):
+        module = irutils.read_module(io.StringIO(IR_SOURCE))
+        irutils.verify_module(module)
+        jump_table = module.functions[0].entry.last_instruction
+        self.assertIsInstance(jump_table, ir.JumpTable)
+        self.assertEqual(
+            ['one', 'two', 'one'], [b.name for b in jump_table.table])
+        self.assertEqual(
+            {'one', 'two', 'other'}, {b.name for b in jump_table.targets})
+        f = io.StringIO()
+        irutils.print_module(module, file=f)
+        self.assertIn(
+            'jmp_table index ? [one, two, one] : other', f.getvalue())
+        module2 = irutils.from_json(irutils.to_json(module))
+        self.assertEqual(
+            str(jump_table),
+            str(module2.functions[0].entry.last_instruction))
+
+    def test_code(self):
+        arch, ir_module = self.compile(self.source, 'riscv')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('bgeu ', code)
+        self.assertIn('jalr x0,x', code)
+        self.assertLess(code.count('beq '), 2)
+
+    def test_sparse(self):
+        arch, ir_module = self.compile(self.sparse, 'riscv')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertEqual(4, code.count('beq ') + code.count('bne '))
+        self.assertNotIn('bgeu ', code)
+
+    def test_execution(self):
+        cases = {-2: 7, -1: 11, 0: 13, 2: 17, 3: 19, 5: 23}
+        n = 8
+        expected = 0
+        for i in range(-4, n):
+            expected = (expected * 3 + cases.get(i, 29)) & 0xFFFFFFFF
+        for march in ('riscv', 'riscv:rvc', 'riscv:farcall', 'riscv:rv64'):
+            arch, ir_module = self.compile(self.source, march)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)],
+                layout=io.StringIO(LAYOUT), use_runtime=True)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.x[12] = n
+            simulator.run(max_instructions=10000)
+            self.assertEqual(
+                expected, simulator.x[10] & 0xFFFFFFFF, march)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.binutils.outstream import TextOutputStream
+from ppci.binutils.disasm import Disassembler
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+
+class RiscvVectorAssemblerTestCase(AsmTestCaseBase):
+    """ Vector instruction assembly test case """
+    march = 'riscv:rvv'
+
+    def test_vsetvli(self):
+        self.feed('vsetvli x10, x11, e32, m1, ta, ma')
+        self.check('57 F5 05 0D')
+
+    def test_vsetivli(self):
+        self.feed('vsetivli x0, 1, e32, m1, ta, ma')
+        self.check('57 F0 00 CD')
+
+    def test_load(self):
+        self.feed('vle32.v v8, (x10)')
+        self.check('07 64 05 02')
+
+    def test_store(self):
+        self.feed('vse8.v v8, (x11)')
+        self.check('27 84 05 02')
+
+    def test_vadd(self):
+        self.feed('vadd.vv v8, v8, v12')
+        self.feed('vadd.vi v8, v8, -1')
+        self.check('57 04 86 02 57 B4 8F 02')
+
+    def test_vmacc(self):
+        self.feed('vmacc.vv v8, v12, v16')
+        self.check('57 24 06 B7')
+
+    def test_reduction(self):
+        self.feed('vredsum.vs v16, v8, v16')
+        self.check('57 28 88 02')
+
+    def test_moves(self):
+        self.feed('vmv.x.s x10, v16')
+        self.feed('vmv.v.i v8, 0')
+        self.check('57 25 00 43 57 34 00 5E')
+
+
+class RiscvVectorTestCase(unittest.TestCase):
+    """ Vector kernels and the vector block copy of the runtime """
+    source = """
+    int rvv_dot_i32(int *a, int *b, int n);
+    int rvv_sum_i32(int *a, int n);
+    void rvv_add_i32(int *d, int *a, int *b, int n);
+    void rvv_memcpy(void *d, void *s, int n);
+    void rvv_memset(void *d, int v, int n);
+    int rvv_setvl_e32(int n);
+
+    struct big { int v[30]; char tail[3]; };
+    struct big x, y;
+    int a[20];
+    int b[20];
+    int c[20];
+
+    int run(int n) {
+      for (int i = 0; i < n; i++) { a[i] = i; b[i] = 2 * i + 1; }
+      rvv_add_i32(c, a, b, n);
+      rvv_memcpy(b, c, n * 4);
+      rvv_memset(a, 0, 8);
+      x.v[29] = n;
+      y = x;
+      return rvv_dot_i32(a, b, n) + rvv_sum_i32(c, n) * 1000
+        + rvv_setvl_e32(n) * 1000000 + y.v[29] * 100000000;
+    }
+    """
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def test_code(self):
+        arch, ir_module = self.compile('riscv:rvv')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('vsetvli x', code)
+        self.assertIn('vle32.v v8, (x', code)
+        self.assertIn('vredsum.vs v16, v8, v16', code)
+        self.assertIn('vmv.x.s x', code)
+        self.assertNotIn('jal x1, rvv_', code)
+
+    def test_disassembly(self):
+        arch, ir_module = self.compile('riscv:rvc:rvv')
+        obj = ir_to_object([ir_module], arch)
+        f = io.StringIO()
+        disassembler = Disassembler(arch)
+        disassembler.disasm(
+            obj.get_section('code').data, TextOutputStream(f=f))
+        code = f.getvalue()
+        self.assertIn('vsetvli x', code)
+        self.assertIn('vmul.vv v8, v8, v12', code)
+        self.assertIn('vse8.v v8, (x', code)
+
+    def test_execution(self):
+        for n in (0, 1, 5, 20):
+            a = list(range(n))
+            c = [3 * i + 1 for i in range(n)]
+            a[:2] = [0] * min(n, 2)
+            expected = (
+                sum(x * y for x, y in zip(a, c))
+                + sum(c) * 1000
+                + min(n, 4) * 1000000
+                + n * 100000000
+            )
+            for march in ('riscv:rvv', 'riscv:rvc:rvv'):
+                arch, ir_module = self.compile(march)
+                start = asm(io.StringIO(START), arch)
+                image = link(
+                    [start, ir_to_object([ir_module], arch)],
+                    layout=io.StringIO(LAYOUT), use_runtime=True)
+                simulator = RiscvSimulator(arch)
+                simulator.load(image)
+                simulator.x[12] = n
+                simulator.run(max_instructions=10000)
+                self.assertTrue(simulator.halted, march)
+                self.assertEqual(expected, simulator.x[10], march)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            get_arch('riscv:rv64:rvv')
+
+
+class RiscvVectorSimulatorTestCase(unittest.TestCase):
+    def run_source(self, source):
+        arch = get_arch('riscv:rvv')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.run(max_instructions=100)
+        self.assertTrue(simulator.halted)
+        return simulator
+
+    def test_vector_length(self):
+        source = """
+        section code
+        li x5, 100
+        vsetvli x10, x5, e32, m1, ta, ma
+        vsetvli x11, x5, e8, m8, ta, ma
+        li x5, 3
+        vsetvli x12, x5, e16, m2, ta, ma
+        vsetvli x13, x0, e16, m1, ta, ma
+        vsetivli x14, 7, e64, m4, ta, ma
+        vsetvli x0, x0, e16, m2, ta, ma
+        ebreak
+        """
+        simulator = self.run_source(source)
+        self.assertEqual(4, simulator.x[10])
+        self.assertEqual(100, simulator.x[11])
+        self.assertEqual(3, simulator.x[12])
+        self.assertEqual(8, simulator.x[13])
+        self.assertEqual(7, simulator.x[14])
+        self.assertEqual(7, simulator.vl)
+
+    def test_arithmetic(self):
+        source = """
+        section code
+        li x5, 0x1000
+        li x6, -2
+        sw x6, 0(x5)
+        li x6, 5
+        sw x6, 4(x5)
+        li x6, 0x80000000
+        sw x6, 8(x5)
+        li x6, 3
+        sw x6, 12(x5)
+        vsetivli x0, 4, e32, m1, ta, ma
+        vle32.v v1, (x5)
+        vmv.v.i v2, 3
+        vmin.vv v3, v1, v2
+        vminu.vv v4, v1, v2
+        vsra.vi v5, v1, 1
+        vrsub.vi v6, v1, 0
+        li x6, 10
+        vmacc.vx v2, x6, v1
+        addi x7, x5, 16
+        vse32.v v2, (x7)
+        lw x10, 16(x5)
+        lw x11, 20(x5)
+        vmv.s.x v7, x0
+        vredmax.vs v7, v1, v7
+        vmv.x.s x12, v7
+        vredsum.vs v7, v3, v7
+        vmv.x.s x13, v7
+        vredmaxu.vs v7, v4, v7
+        vmv.x.s x14, v7
+        vredmin.vs v7, v5, v5
+        vmv.x.s x15, v7
+        vredsum.vs v7, v6, v7
+        vmv.x.s x16, v7
+        ebreak
+        """
+        simulator = self.run_source(source)
+        self.assertEqual(-17 & 0xFFFFFFFF, simulator.x[10])
+        self.assertEqual(53, simulator.x[11])
+        self.assertEqual(5, simulator.x[12])
+        # The sum of -2, 3, 0x80000000, 3 and the initial 5:
+        self.assertEqual(0x80000009, simulator.x[13])
+        self.assertEqual(0x80000009, simulator.x[14])
+        self.assertEqual(0xC0000000, simulator.x[15])
+        self.assertEqual(0x40000000 - 6, simulator.x[16])
+
+    def test_narrow_elements(self):
+        source = """
+        section code
+        li x5, 0x1000
+        li x6, 0x80ff7f01
+        sw x6, 0(x5)
+        vsetivli x0, 4, e8, m1, ta, ma
+        vle8.v v1, (x5)
+        li x6, 0x101
+        vadd.vx v2, v1, x6
+        vse8.v v2, (x5)
+        lw x10, 0(x5)
+        vmv.x.s x11, v1
+        vredminu.vs v3, v1, v1
+        vmv.x.s x12, v3
+        vsll.vi v4, v1, 9
+        vmv.x.s x13, v4
+        ebreak
+        """
+        simulator = self.run_source(source)
+        self.assertEqual(0x81008002, simulator.x[10])
+        self.assertEqual(1, simulator.x[11])
+        self.assertEqual(1, simulator.x[12])
+        self.assertEqual(2, simulator.x[13])
+
+
+if __name__ == '__main__':
+    unittest.main()
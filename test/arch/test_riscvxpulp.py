@@ -0,0 +1,263 @@
+import io
+import unittest
+from test_asm import AsmTestCaseBase
+from ppci.api import asm, c_to_ir, get_arch, ir_to_assembly, ir_to_object
+from ppci.api import link, optimize
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.binutils.outstream import TextOutputStream
+from ppci.binutils.disasm import Disassembler
+
+
+START = """
+section code
+global run
+lui x2, 0x10
+jal x1, run
+ebreak
+"""
+
+LAYOUT = """
+MEMORY flash LOCATION=0x0000 SIZE=0x4000 {
+    SECTION(code)
+}
+MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
+    SECTION(data)
+}
+"""
+
+
+class RiscvXpulpAssemblerTestCase(AsmTestCaseBase):
+    """ Xpulp instruction assembly test case """
+    march = 'riscv:xpulp'
+
+    def test_post_increment_load(self):
+        self.feed('p.lw x5, 4(x6!)')
+        self.check('8B 22 43 00')
+
+    def test_post_increment_store(self):
+        self.feed('p.sh x5, -2(x6!)')
+        self.check('2B 1F 53 FE')
+
+    def test_mac(self):
+        self.feed('p.mac x5, x6, x7')
+        self.check('B3 02 73 42')
+
+    def test_clip(self):
+        self.feed('p.clip x5, x6, 8')
+        self.check('B3 12 83 14')
+
+    def test_extbs(self):
+        self.feed('p.extbs x5, x6')
+        self.check('B3 62 03 10')
+
+    def test_hardware_loop(self):
+        self.feed('lp.setup 0, x12, end')
+        self.feed('addi x10, x10, 1')
+        self.feed('end:')
+        self.check('7B 40 46 00 13 05 15 00')
+
+    def test_hardware_loop_immediate(self):
+        self.feed('lp.setupi 1, 100, end')
+        self.feed('addi x10, x10, 1')
+        self.feed('end:')
+        self.check('FB 50 42 06 13 05 15 00')
+
+
+class RiscvXpulpTestCase(unittest.TestCase):
+    """ Hardware loops, post increment addressing and mac """
+    source = """
+    int a[8] = {1, 2, 3, 4, 5, 6, 7, 8};
+    int b[8] = {3, 1, 4, 1, 5, 9, 2, 6};
+    int c[8];
+
+    int dot(int *a, int *b, int n) {
+      int s = 0;
+      for (int i = 0; i < n; i++) s += a[i] * b[i];
+      return s;
+    }
+
+    int dotp(int *a, int *b, int n) {
+      int s = 0;
+      while (n--) s += *a++ * *b++;
+      return s;
+    }
+
+    void scale(int *a, int *b, int n, int k) {
+      for (int i = 0; i < n; i++) { *b = *a * k; a++; b++; }
+    }
+
+    int sum(int n) {
+      int s = 0;
+      for (int i = 0; i < n; i++) s += i;
+      return s;
+    }
+
+    int twice(int n) {
+      int s = 0;
+      for (int i = 0; i < n; i++) s += 2;
+      return s;
+    }
+
+    int run(int n) {
+      scale(a, c, n, 3);
+      return dot(a, b, n) * 1000000 + dotp(a, c, n) * 1000 + sum(n)
+        + dot(a, b, 0) + twice(n) * 100;
+    }
+    """
+
+    def compile(self, march):
+        arch = get_arch(march)
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        optimize(ir_module, level=2)
+        return arch, ir_module
+
+    def test_code(self):
+        arch, ir_module = self.compile('riscv:xpulp')
+        code = ir_to_assembly([ir_module], arch)
+        self.assertIn('p.mac x', code)
+        self.assertIn('p.lw x', code)
+        self.assertIn('p.sw x', code)
+        self.assertEqual(4, code.count('lp.setup 0, x'))
+
+    def test_disassembly(self):
+        arch, ir_module = self.compile('riscv:rvc:xpulp')
+        obj = ir_to_object([ir_module], arch)
+        f = io.StringIO()
+        disassembler = Disassembler(arch)
+        disassembler.disasm(
+            obj.get_section('code').data, TextOutputStream(f=f))
+        code = f.getvalue()
+        self.assertIn('p.mac x', code)
+        self.assertIn('p.lw x', code)
+        self.assertIn('lp.setup 0, x', code)
+        # Short loop bodies are padded:
+        self.assertIn('nop', code)
+
+    def test_execution(self):
+        a = [1, 2, 3, 4, 5, 6, 7, 8]
+        b = [3, 1, 4, 1, 5, 9, 2, 6]
+        n = 8
+        expected = (
+            sum(x * y for x, y in zip(a, b)) * 1000000
+            + sum(3 * x * x for x in a) * 1000
+            + sum(range(n))
+            + 2 * n * 100
+        )
+        instructions = {}
+        for march in ('riscv', 'riscv:xpulp', 'riscv:rvc:xpulp'):
+            arch, ir_module = self.compile(march)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)],
+                layout=io.StringIO(LAYOUT), use_runtime=True)
+            simulator = RiscvSimulator(arch)
+            simulator.load(image)
+            simulator.x[12] = n
+            instructions[march] = simulator.run(max_instructions=10000)
+            self.assertTrue(simulator.halted, march)
+            self.assertEqual(expected, simulator.x[10], march)
+        self.assertLess(instructions['riscv:xpulp'], instructions['riscv'])
+
+    def test_large_constants(self):
+        """ Test constants which are loaded with lui and a negative addi """
+        source = """
+        int run(int n) {
+          unsigned u = n;
+          int i, s = 0;
+          for (i = 0; i < 4; i++) {
+            s += u / 3 + u / 7 + u % 10 + n % 641 + (u + i) / 3;
+          }
+          return s;
+        }
+        """
+        for march in ('riscv:xpulp', 'riscv:rvc:xpulp'):
+            arch = get_arch(march)
+            ir_module = c_to_ir(io.StringIO(source), arch)
+            optimize(ir_module, level=2)
+            start = asm(io.StringIO(START), arch)
+            image = link(
+                [start, ir_to_object([ir_module], arch)],
+                layout=io.StringIO(LAYOUT), use_runtime=True)
+            for n in (1000, 123457, 400000011):
+                expected = sum(
+                    n // 3 + n // 7 + n % 10 + n % 641 + (n + i) // 3
+                    for i in range(4)
+                )
+                simulator = RiscvSimulator(arch)
+                simulator.load(image)
+                simulator.x[12] = n
+                simulator.run(max_instructions=10000)
+                self.assertTrue(simulator.halted, march)
+                self.assertEqual(expected, simulator.x[10], march)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            get_arch('riscv:rv64:xpulp')
+        with self.assertRaises(ValueError):
+            get_arch('riscv:nom:xpulp')
+
+
+class RiscvXpulpSimulatorTestCase(unittest.TestCase):
+    def test_instructions(self):
+        source = """
+        section code
+        li x5, -300
+        p.abs x6, x5
+        p.clip x7, x5, 8
+        li x8, 300
+        p.clipu x9, x8, 8
+        p.extbs x11, x8
+        p.exthz x12, x5
+        li x13, 7
+        p.mac x13, x8, x5
+        p.min x14, x5, x8
+        p.maxu x15, x5, x8
+        lp.setupi 0, 5, end
+        addi x10, x10, 3
+        nop
+        addi x10, x10, -1
+        end:
+        ebreak
+        """
+        arch = get_arch('riscv:xpulp')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.run(max_instructions=100)
+        self.assertTrue(simulator.halted)
+        self.assertEqual(300, simulator.x[6])
+        self.assertEqual(0xFFFFFF80, simulator.x[7])
+        self.assertEqual(127, simulator.x[9])
+        self.assertEqual(44, simulator.x[11])
+        self.assertEqual(0xFED4, simulator.x[12])
+        self.assertEqual((7 - 90000) & 0xFFFFFFFF, simulator.x[13])
+        self.assertEqual(0xFFFFFED4, simulator.x[14])
+        self.assertEqual(0xFFFFFED4, simulator.x[15])
+        self.assertEqual(10, simulator.x[10])
+
+    def test_post_increment(self):
+        source = """
+        section code
+        li x5, 0x1000
+        li x6, 0x12345678
+        p.sw x6, 4(x5!)
+        p.sh x6, 2(x5!)
+        li x5, 0x1000
+        p.lw x7, 4(x5!)
+        p.lhu x8, 2(x5!)
+        li x9, 0x1000
+        p.lb x9, 0(x9!)
+        ebreak
+        """
+        arch = get_arch('riscv:xpulp')
+        simulator = RiscvSimulator(arch)
+        simulator.load(link([asm(io.StringIO(source), arch)]))
+        simulator.run(max_instructions=100)
+        self.assertEqual(0x1006, simulator.x[5])
+        self.assertEqual(0x12345678, simulator.x[7])
+        self.assertEqual(0x5678, simulator.x[8])
+        # The loaded value wins over the increment of the base:
+        self.assertEqual(0x78, simulator.x[9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import io
+
+from ppci.api import asm, get_arch, link
+from ppci.binutils.disasm import Disassembler
+from ppci.binutils.outstream import TextOutputStream
+
+
+class RiscvDisassemblerTestCase(unittest.TestCase):
+    def disasm(self, data, march, address=0):
+        f = io.StringIO()
+        disassembler = Disassembler(get_arch(march))
+        disassembler.disasm(data, TextOutputStream(f=f), address=address)
+        return [line.strip() for line in f.getvalue().splitlines()]
+
+    def assemble(self, source, march):
+        source = 'section code\n' + source
+        obj = link([asm(io.StringIO(source), get_arch(march))])
+        return obj.get_section('code').data
+
+    def test_instructions(self):
+        data = self.assemble("""
+        addi x7, x5, -12
+        lw x10, 8(x2)
+        sw x5, -2048(x6)
+        lui x13, 0x12345
+        mul x5, x6, x7
+        csrr x5, mstatus
+        ebreak
+        """, 'riscv')
+        expected = [
+            'addi x7, x5, -12',
+            'lw x10, 8(x2)',
+            'sw x5, -2048(x6)',
+            'lui x13, 74565',
+            'mul x5, x6, x7',
+            'csrr x5, mstatus',
+            'ebreak',
+        ]
+        self.assertEqual(expected, self.disasm(data, 'riscv'))
+
+    def test_branch_targets(self):
+        """ Jump targets are shown as absolute addresses """
+        data = self.assemble("""
+        loop:
+        addi x5, x5, 1
+        bne x5, x6, loop
+        jal x1, loop
+        """, 'riscv')
+        expected = [
+            'addi x5, x5, 1',
+            'bne x5, x6, 0x00001000',
+            'jal x1, 0x00001000',
+        ]
+        self.assertEqual(expected, self.disasm(data, 'riscv', 0x1000))
+
+    def test_compressed(self):
+        data = self.assemble("""
+        c.li x8, -3
+        c.lw x8, 124(x15)
+        addi x7, x5, -12
+        """, 'riscv:rvc')
+        expected = [
+            'c.li x8, -3',
+            'c.lw x8, 124(x15)',
+            'addi x7, x5, -12',
+            '.byte 0',
+            '.byte 0',
+        ]
+        self.assertEqual(expected, self.disasm(data + bytes(2), 'riscv:rvc'))
+
+    def test_float(self):
+        data = self.assemble('fadd.s f1, f2, f3', 'riscv:rvf')
+        self.assertEqual(['fadd.s f1, f2, f3'], self.disasm(data, 'riscv:rvf'))
+
+    def test_invalid_data(self):
+        """ Data which is no instruction is shown as bytes """
+        self.assertEqual(
+            ['.byte 255', '.byte 255', '.byte 255', '.byte 255', '.byte 1'],
+            self.disasm(bytes([255, 255, 255, 255, 1]), 'riscv'),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
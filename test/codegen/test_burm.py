@@ -180,6 +180,64 @@ class TreeMatchingTestCase(unittest.TestCase):
         v = selector.gen(context, tree)
         self.assertEqual((1, '+', 2), v)
 
+    def make_load_system(self):
+        """ Create a system with a cheaper rule for a nested pattern """
+        system = BurgSystem()
+        for terminal in ['LDR', 'ADD', 'VAL']:
+            system.add_terminal(terminal)
+        system.add_rule(
+            'stm', Tree('reg'), 0, None, lambda ctx, tree, c0: c0)
+        system.add_rule(
+            'reg',
+            Tree('LDR', Tree('reg')),
+            1,
+            None,
+            lambda ctx, tree, c0: ('ldr', c0))
+        system.add_rule(
+            'reg',
+            Tree('LDR', Tree('ADD', Tree('reg'), Tree('VAL'))),
+            1,
+            lambda tree: tree.children[0].children[1].value < 8,
+            lambda ctx, tree, c0: (
+                'ldr', c0, tree.children[0].children[1].value))
+        system.add_rule(
+            'reg',
+            Tree('ADD', Tree('reg'), Tree('reg')),
+            1,
+            None,
+            lambda ctx, tree, c0, c1: ('add', c0, c1))
+        system.add_rule(
+            'reg', Tree('VAL'), 1, None, lambda ctx, tree: tree.value)
+        system.check()
+        return system
+
+    class Ctx:
+        pass
+
+    def test_nested_pattern(self):
+        """ Test that the cheapest match of a nested pattern is selected """
+        tree = Tree(
+            'LDR', Tree('ADD', Tree('VAL', value=1), Tree('VAL', value=4)))
+        selector = TreeSelector(self.make_load_system())
+        v = selector.gen(self.Ctx(), tree)
+        self.assertEqual(('ldr', 1, 4), v)
+
+    def test_acceptance(self):
+        """ Test that a rule is not selected when it is not accepted """
+        tree = Tree(
+            'LDR', Tree('ADD', Tree('VAL', value=1), Tree('VAL', value=9)))
+        selector = TreeSelector(self.make_load_system())
+        v = selector.gen(self.Ctx(), tree)
+        self.assertEqual(('ldr', ('add', 1, 9)), v)
+
+    def test_compiled_code_is_shared(self):
+        """ Test that systems with the same rules share compiled code """
+        selector1 = TreeSelector(self.make_load_system())
+        selector2 = TreeSelector(self.make_load_system())
+        self.assertIsNot(selector1.burm_label, selector2.burm_label)
+        self.assertIs(
+            selector1.burm_label.__code__, selector2.burm_label.__code__)
+
 
 if __name__ == '__main__':
     unittest.main()
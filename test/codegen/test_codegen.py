@@ -2,6 +2,10 @@
 
 import unittest
 import io
+import os
+import subprocess
+import sys
+import ppci
 from ppci import ir
 from ppci.irutils import Builder, Writer
 from ppci.codegen.dagsplit import DagSplitter
@@ -189,5 +193,49 @@ class IrDagTestCase(unittest.TestCase):
         # self.assertTrue(sg_value.vreg)
 
 
+class DeterminismTestCase(unittest.TestCase):
+    """ Check that the generated code does not depend on the hash seed """
+    source = """
+    struct item { int key; int value; struct item *next; };
+    int lookup(struct item *items, int key);
+    int update(struct item *items, int n, int a, int b) {
+      int s = 0, t = 1, u = 2, v = 3;
+      for (int i = 0; i < n; i++) {
+        s += lookup(items, i) * a + t;
+        t = t * b + s - u;
+        u = u ^ (v + i);
+        switch (s & 3) {
+          case 0: v = lookup(items->next, s) + t - u; break;
+          case 1: v -= items->value; break;
+          default: items->key = v + u; break;
+        }
+      }
+      return s + t + u + v;
+    }
+    """
+    script = (
+        'import io, sys\n'
+        'from ppci.api import cc\n'
+        'obj = cc(io.StringIO(sys.stdin.read()), sys.argv[1])\n'
+        'print(obj.get_section("code").data.hex())\n'
+    )
+
+    def compile(self, march, seed):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(
+            ppci.__file__)))
+        env = dict(os.environ)
+        env['PYTHONHASHSEED'] = str(seed)
+        env['PYTHONPATH'] = os.pathsep.join(
+            filter(None, [root, env.get('PYTHONPATH')]))
+        return subprocess.check_output(
+            [sys.executable, '-c', self.script, march],
+            input=self.source, env=env, universal_newlines=True)
+
+    def test_hash_seed(self):
+        for march in ('riscv', 'riscv:rv64'):
+            self.assertEqual(
+                self.compile(march, 1), self.compile(march, 3), march)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,162 @@
+import io
+import unittest
+from ppci.codegen.registerallocator import LinearScanRegisterAllocator
+from ppci.api import asm, c_to_ir, get_arch, ir_to_object, link
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.arch.arch import Frame
+from ppci.arch.example import Def, Use, Add, Mov, R0, R1, R2, R3
+from ppci.arch.example import ExampleRegister, Use3, R10l, DefHalf, UseHalf
+
+
+class LinearScanRegisterAllocatorTestCase(unittest.TestCase):
+    """ Use the example target to test the linear scan allocator """
+    def setUp(self):
+        arch = get_arch('example')
+        self.register_allocator = LinearScanRegisterAllocator(
+            arch, None, None)
+
+    def conflict(self, ta, tb):
+        self.assertNotEqual(ta.color, tb.color)
+
+    def test_register_allocation(self):
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        t3 = ExampleRegister('t3')
+        t4 = ExampleRegister('t4')
+        t5 = ExampleRegister('t5')
+        f.instructions.append(Def(t1))
+        f.instructions.append(Def(t2))
+        f.instructions.append(Def(t3))
+        f.instructions.append(Add(t4, t1, t2))
+        f.instructions.append(Add(t5, t4, t3))
+        f.instructions.append(Use(t5))
+        self.register_allocator.alloc_frame(f)
+        self.conflict(t1, t2)
+        self.conflict(t2, t3)
+        self.conflict(t1, t3)
+        self.conflict(t3, t4)
+        self.assertTrue(all(t.is_colored for t in (t1, t2, t3, t4, t5)))
+
+    def test_register_reuse(self):
+        """ A register is used again after the end of an interval """
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        f.instructions.append(Def(t1))
+        f.instructions.append(Use(t1))
+        f.instructions.append(Def(t2))
+        f.instructions.append(Use(t2))
+        self.register_allocator.alloc_frame(f)
+        self.assertEqual(R0.color, t1.color)
+        self.assertEqual(R0.color, t2.color)
+
+    def test_move_removal(self):
+        """ Moves between registers which got the same register vanish """
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        f.instructions.append(Def(t1))
+        move = Mov(t2, t1, ismove=True)
+        f.instructions.append(move)
+        move2 = Mov(R1, t2, ismove=True)
+        f.instructions.append(move2)
+        f.instructions.append(Use(R1))
+        self.register_allocator.alloc_frame(f)
+        self.assertEqual(R1.color, t1.color)
+        self.assertEqual(R1.color, t2.color)
+        self.assertNotIn(move, f.instructions)
+        self.assertNotIn(move2, f.instructions)
+
+    def test_pre_colored(self):
+        """ Pre colored registers cannot be used while they are live """
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        f.instructions.append(Def(t1))
+        f.instructions.append(Def(R0))
+        f.instructions.append(Def(t2))
+        f.instructions.append(Use3(R0, t1, t2))
+        f.instructions.append(Def(R1))
+        f.instructions.append(Use(R1))
+        self.register_allocator.alloc_frame(f)
+        self.conflict(t1, R0)
+        self.conflict(t2, R0)
+        self.conflict(t1, t2)
+        self.assertEqual(R1.color, t1.color)
+
+    def test_alias(self):
+        """ Aliased registers are occupied by their alias """
+        f = Frame('tst')
+        t1 = ExampleRegister('t1')
+        f.instructions.append(Def(R0))
+        f.instructions.append(Def(R1))
+        f.instructions.append(Def(R2))
+        f.instructions.append(Def(t1))
+        f.instructions.append(DefHalf(R10l))
+        f.instructions.append(UseHalf(R10l))
+        f.instructions.append(Use3(R0, R1, R2))
+        f.instructions.append(Use(t1))
+        self.register_allocator.alloc_frame(f)
+        self.assertEqual(R3.color, t1.color)
+
+
+class LinearScanOnRiscvTestCase(unittest.TestCase):
+    """ Compile code with many live values and run it on riscv """
+    source = """
+    int f(int a, int b);
+    int pressure(int n) {
+      int a = n + 1, b = n * 2, c = n - 3, d = n * n, e = n ^ 5;
+      int g = n + 6, h = n * 7, i = n - 8, j = n | 9, k = n + 10;
+      int l = n * 11, m = n - 12, o = n ^ 13, p = n + 14, q = n * 15;
+      int r = n - 16, s = n | 17, t = n + 18, u = n * 19, v = n - 20;
+      int w = f(a, b);
+      return a + b * c - d + e * g + h - i + j * k + l - m + o * p
+        + q - r + s * t + u - v + w;
+    }
+    int f(int a, int b) { return a * b; }
+    int run(int n) {
+      int s = 0;
+      for (int i = 0; i < n; i++) s = s * 3 + pressure(i);
+      return s;
+    }
+    """
+
+    start = """
+    section code
+    global run
+    lui x2, 0x10
+    jal x1, run
+    ebreak
+    """
+
+    layout = """
+    MEMORY flash LOCATION=0x0000 SIZE=0x4000 { SECTION(code) }
+    MEMORY ram LOCATION=0x4000 SIZE=0x4000 { SECTION(data) }
+    """
+
+    def run_code(self, allocator):
+        arch = get_arch('riscv')
+        ir_module = c_to_ir(io.StringIO(self.source), arch)
+        obj = ir_to_object([ir_module], arch, allocator=allocator)
+        image = link(
+            [asm(io.StringIO(self.start), arch), obj],
+            layout=io.StringIO(self.layout))
+        simulator = RiscvSimulator(arch)
+        simulator.load(image)
+        simulator.x[12] = 9
+        simulator.run(max_instructions=100000)
+        self.assertTrue(simulator.halted)
+        return simulator.x[10]
+
+    def test_same_result(self):
+        self.assertEqual(
+            self.run_code('coloring'), self.run_code('linearscan'))
+
+    def test_unknown_allocator(self):
+        with self.assertRaises(ValueError):
+            self.run_code('magic')
+
+
+if __name__ == '__main__':
+    unittest.main()
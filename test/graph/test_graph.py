@@ -1,9 +1,12 @@
 #!/usr/bin/python
 
+import io
 import unittest
+from unittest import mock
+from ppci.api import cc
 from ppci.graph import Graph, Node, DiGraph, DiNode, MaskableGraph
 from ppci.codegen.interferencegraph import InterferenceGraph
-from ppci.codegen.flowgraph import FlowGraph
+from ppci.codegen.flowgraph import FlowGraph, RegisterSet
 from ppci.arch.generic_instructions import Nop
 from ppci.arch.example import Def, Use, DefUse, Add, Cmp, Use3, ExampleRegister
 
@@ -328,6 +331,152 @@ class InterferenceGraphTestCase(unittest.TestCase):
         # For repr called:
         self.assertTrue(str(ig.get_node(t4)))
 
+    def test_mask_and_combine(self):
+        """ Edges to masked nodes move along when combining nodes """
+        t1 = ExampleRegister('t1')
+        t2 = ExampleRegister('t2')
+        t3 = ExampleRegister('t3')
+        t4 = ExampleRegister('t4')
+        instrs = []
+        instrs.append(Def(t1))
+        instrs.append(Def(t2))
+        instrs.append(Def(t3))
+        instrs.append(Use3(t1, t2, t3))
+        instrs.append(Def(t4))
+        instrs.append(Use(t4))
+        cfg = FlowGraph(instrs)
+        cfg.calculate_liveness()
+        ig = InterferenceGraph()
+        ig.calculate_interference(cfg)
+        n1, n2, n3, n4 = (ig.get_node(t) for t in (t1, t2, t3, t4))
+        self.assertEqual(3, ig.get_number_of_edges())
+        ig.mask_node(n1)
+        self.assertEqual([n3], n2.adjecent)
+        self.assertEqual(1, n2.degree)
+        ig.combine(n4, n2)
+        self.assertIs(n4, ig.get_node(t2))
+        self.assertEqual([n3], n4.adjecent)
+        self.assertNotIn(n2, ig.nodes)
+        ig.unmask_node(n1)
+        self.assertTrue(ig.interfere(t4, t1))
+        self.assertEqual({n3, n4}, set(n1.adjecent))
+
+
+def reference_graph(flowgraph):
+    """Build the interference graph by adding the edges one by one.
+
+    Return the registers of the nodes with the registers of their
+    neighbours, both in the order in which they were added.
+    """
+    graph = Graph()
+    nodes = {}
+
+    def get_node(reg):
+        if reg not in nodes:
+            nodes[reg] = Node(graph)
+        return nodes[reg]
+
+    for n in flowgraph:
+        for ins in n.instructions:
+            for tmp in ins.live_in:
+                get_node(tmp)
+            live_and_def = ins.live_out | ins.kill
+            for tmp in live_and_def:
+                n1 = get_node(tmp)
+                for tmp2 in live_and_def:
+                    graph.add_edge(n1, get_node(tmp2))
+                for tmp2 in ins.clobbers:
+                    graph.add_edge(n1, get_node(tmp2))
+    registers = {node: reg for reg, node in nodes.items()}
+    return [
+        (registers[node], [registers[m] for m in graph.adjecent(node)])
+        for node in graph.nodes
+    ]
+
+
+class InterferenceGraphOrderTestCase(unittest.TestCase):
+    """ Check the order of the nodes and of the neighbours of each node """
+    source = """
+    int g(int a, int b);
+    int f(int *p, int n, int a, int b) {
+      int s = 0, t = 1, u = 2;
+      for (int i = 0; i < n; i++) {
+        s += g(p[i], t) * a;
+        t = t * b + s - u;
+        u = g(u ^ i, s) + t;
+      }
+      return s + t + u;
+    }
+    """
+
+    def test_order(self):
+        calculate_interference = InterferenceGraph.calculate_interference
+
+        def check(graph, flowgraph):
+            calculate_interference(graph, flowgraph)
+            nodes = [
+                (
+                    list(node.temps)[0],
+                    [list(m.temps)[0] for m in node.adjecent],
+                )
+                for node in graph.nodes
+            ]
+            self.assertEqual(reference_graph(flowgraph), nodes, march)
+
+        for march in ('riscv', 'riscv:rvc', 'riscv:rv64'):
+            with mock.patch.object(
+                    InterferenceGraph, 'calculate_interference', check):
+                cc(io.StringIO(self.source), march)
+
+
+class FlowGraphTestCase(unittest.TestCase):
+    def test_instruction_liveness(self):
+        """ Test the liveness of the single instructions in a loop """
+        x = ExampleRegister('x')
+        y = ExampleRegister('y')
+        i2 = DefUse(y, x)
+        i1 = Def(x, jumps=[i2])
+        i3 = DefUse(x, y)
+        i4 = Nop(jumps=[i2])
+        cfg = FlowGraph([i1, i2, i3, i4])
+        cfg.calculate_liveness()
+        self.assertEqual(set(), i1.live_in)
+        self.assertEqual({x}, i1.live_out)
+        self.assertEqual({x}, i2.live_in)
+        self.assertEqual({y}, i2.live_out)
+        self.assertEqual({x}, i3.live_out)
+        self.assertEqual({x}, i4.live_in)
+        self.assertEqual({x}, i4.live_out)
+        self.assertEqual({x}, cfg.get_node(i2).live_in)
+
+    def test_postorder(self):
+        """ Successors come before their predecessors in postorder """
+        i3 = Nop()
+        i2 = Nop(jumps=[i3])
+        i1 = Nop(jumps=[i2])
+        cfg = FlowGraph([i1, i2, i3])
+        nodes = [cfg.get_node(i) for i in (i3, i2, i1)]
+        self.assertEqual(nodes, cfg.postorder())
+
+    def test_register_set(self):
+        """ Test the set operations on the bitset of registers """
+        a = ExampleRegister('a')
+        b = ExampleRegister('b')
+        c = ExampleRegister('c')
+        cfg = FlowGraph([Nop()])
+        s1 = RegisterSet(cfg, cfg.to_bits([a, b]))
+        s2 = RegisterSet(cfg, cfg.to_bits([b, c]))
+        self.assertEqual(2, len(s1))
+        self.assertIn(a, s1)
+        self.assertNotIn(c, s1)
+        self.assertNotIn(ExampleRegister('d'), s1)
+        self.assertEqual({a, b, c}, s1 | s2)
+        self.assertEqual({b}, s1 & s2)
+        self.assertEqual({a}, s1 - s2)
+        self.assertEqual({a, b, c}, s1 | {c})
+        self.assertEqual({a}, s1 - {b})
+        self.assertFalse(RegisterSet(cfg, 0))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,9 +5,23 @@ from sample_helpers import add_samples, build
 
 from helper_util import has_iverilog, run_picorv32
 from helper_util import do_long_tests, do_iverilog, make_filename
+from ppci import ir
+from ppci.api import get_arch
+from ppci.arch.riscv.simulator import RiscvSimulator
 from ppci.binutils.objectfile import merge_memories
 from helper_util import has_qemu, qemu
 
+# Samples which use 64 bit integers, which only rv64 supports:
+LONG_LONG_SAMPLES = ("test_control_flow",)
+
+
+def skip_unsupported(testcase):
+    """ Skip the samples which the march cannot run as expected """
+    arch = get_arch(testcase.march)
+    name = testcase._testMethodName
+    if name in LONG_LONG_SAMPLES and ir.i64 not in arch.info.type_infos:
+        testcase.skipTest("no 64 bit integers on " + testcase.march)
+
 
 @unittest.skipUnless(do_long_tests("riscv"), "skipping slow tests")
 @add_samples("simple", "medium", "8bit", "32bit")
@@ -18,7 +32,10 @@ class TestSamplesOnRiscv(unittest.TestCase):
     startercode = """
     global main_main 
     global bsp_exit 
+    global __global_pointer
     LUI sp, 0x1F        ; setup stack pointer
+    LUI gp, __global_pointer  ; setup global pointer for small data
+    ADDI gp, gp, __global_pointer
     JAL ra, main_main    ; Branch to sample start LR
     JAL ra, bsp_exit     ; do exit stuff LR
     EBREAK
@@ -29,6 +46,9 @@ class TestSamplesOnRiscv(unittest.TestCase):
     }
     MEMORY ram LOCATION=0x4000 SIZE=0x4000 {
         SECTION(data)
+        SECTION(sdata)
+        DEFINESYMBOL(__global_pointer)
+        SECTION(sbss)
     }
     """
 
@@ -53,6 +73,9 @@ class TestSamplesOnRiscv(unittest.TestCase):
     }
     """
 
+    def setUp(self):
+        skip_unsupported(self)
+
     def do(self, src, expected_output, lang="c3"):
         # Construct binary file from snippet:
         startercode = io.StringIO(self.startercode)
@@ -101,6 +124,115 @@ class TestSamplesOnRiscvC(TestSamplesOnRiscv):
     march = "riscv:rvc"
 
 
+@unittest.skipUnless(do_long_tests("riscv"), "skipping slow tests")
+@add_samples("simple", "medium", "8bit", "32bit")
+class TestSamplesOnRiscvSimulator(unittest.TestCase):
+    """ Run the samples on the python instruction set simulator """
+
+    opt_level = 2
+    maxDiff = None
+    march = "riscv"
+    startercode = """
+    global main_main
+    global bsp_exit
+    global __global_pointer
+    global _start
+    _start:
+    LUI sp, 0x1F        ; setup stack pointer
+    LUI gp, __global_pointer  ; setup global pointer for small data
+    ADDI gp, gp, __global_pointer
+    JAL ra, main_main    ; Branch to sample start LR
+    JAL ra, bsp_exit     ; do exit stuff LR
+    EBREAK
+    """
+    arch_mmap = "ENTRY(_start)\n" + TestSamplesOnRiscv.arch_mmap
+    bsp_c3_src = TestSamplesOnRiscv.bsp_c3_src
+
+    def setUp(self):
+        skip_unsupported(self)
+
+    def do(self, src, expected_output, lang="c3"):
+        startercode = io.StringIO(self.startercode)
+        base_filename = make_filename(self.id())
+        bsp_c3 = io.StringIO(self.bsp_c3_src)
+
+        obj = build(
+            base_filename,
+            src,
+            bsp_c3,
+            startercode,
+            self.march,
+            self.opt_level,
+            io.StringIO(self.arch_mmap),
+            lang=lang,
+        )
+
+        simulator = RiscvSimulator(get_arch(self.march))
+        simulator.load(obj)
+        simulator.run(max_instructions=10000000)
+        self.assertTrue(simulator.halted)
+        self.assertEqual(expected_output, simulator.output.decode("ascii"))
+
+
+class TestSamplesOnRiscvCSimulator(TestSamplesOnRiscvSimulator):
+    march = "riscv:rvc"
+
+
+class TestSamplesOnRiscvOmitfpSimulator(TestSamplesOnRiscvSimulator):
+    """ Address locals relative to the stack pointer """
+
+    march = "riscv:rvc:omitfp"
+
+
+class TestSamplesOnRiscvBitmanipSimulator(TestSamplesOnRiscvSimulator):
+    march = "riscv:zba:zbb"
+
+
+class TestSamplesOnRiscvXpulpSimulator(TestSamplesOnRiscvSimulator):
+    """ Hardware loops, post increment loads and stores and mac """
+
+    march = "riscv:rvc:xpulp"
+
+
+class TestSamplesOnRiscvVectorSimulator(TestSamplesOnRiscvSimulator):
+    """ Struct copies with vector loads and stores in the runtime """
+
+    march = "riscv:rvc:rvv"
+
+
+class TestSamplesOnRiscv64Simulator(TestSamplesOnRiscvSimulator):
+    march = "riscv:rv64"
+
+
+class TestSamplesOnRiscvSdataSimulator(TestSamplesOnRiscvSimulator):
+    """ Small global variables addressed relative to the global pointer """
+
+    march = "riscv:rvc:sdata"
+
+
+class TestSamplesOnRiscvScheduledSimulator(TestSamplesOnRiscvSimulator):
+    """ Instructions scheduled before and after register allocation """
+
+    march = "riscv:rvc:vexriscv:postsched"
+
+
+@add_samples("double", "fp")
+class TestSamplesOnRiscvNomSimulator(TestSamplesOnRiscvSimulator):
+    """ Run the samples with the multiply and floating point runtime """
+
+    march = "riscv:nom"
+
+
+@add_samples("double", "fp")
+class TestSamplesOnRiscvDSimulator(TestSamplesOnRiscvSimulator):
+    march = "riscv:rvd"
+
+
+@add_samples("double", "fp")
+class TestSamplesOnRiscvDScheduledSimulator(TestSamplesOnRiscvSimulator):
+    march = "riscv:rvd:rocket:postsched"
+
+
 @unittest.skipUnless(do_long_tests("riscv"), "skipping slow tests")
 @add_samples("simple")
 class TestSamplesOnRiscvSiFiveU(unittest.TestCase):
@@ -156,6 +288,9 @@ class TestSamplesOnRiscvSiFiveU(unittest.TestCase):
     }
     """
 
+    def setUp(self):
+        skip_unsupported(self)
+
     def do(self, src, expected_output, lang="c3"):
         # Construct binary file from snippet:
         startercode = io.StringIO(self.startercode)
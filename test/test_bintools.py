@@ -8,6 +8,7 @@ from ppci.binutils.outstream import binary_and_logging_stream
 from ppci.common import CompilerError
 from ppci.api import link, get_arch
 from ppci.binutils import layout
+from ppci.binutils.linker import RelaxationHoles
 from ppci.arch.example import Mov, R0, R1, ExampleArch
 
 
@@ -136,6 +137,38 @@ class LinkerTestCase(unittest.TestCase):
         with self.assertRaisesRegex(CompilerError, 'exceeds'):
             link([object1], layout2)
 
+    def test_section_not_in_layout(self):
+        """ Check the error that is given for a section without a place """
+        arch = ExampleArch()
+        layout2 = layout.Layout()
+        m = layout.Memory('flash')
+        m.location = 0x0
+        m.size = 0x100
+        m.add_input(layout.Section('code'))
+        layout2.add_memory(m)
+        object1 = ObjectFile(arch)
+        object1.get_section('code', create=True).add_data(bytes([0]*22))
+        object1.get_section('sdata', create=True).add_data(bytes([0]*4))
+        with self.assertRaisesRegex(CompilerError, 'sdata'):
+            link([object1], layout2)
+
+        # Without memories, the sections are not placed:
+        obj = link([object1], layout.Layout())
+        self.assertEqual(4, obj.get_section('sdata').size)
+
+    def test_relaxation_holes(self):
+        """ Check the shift of offsets around holes and padding """
+        holes = RelaxationHoles([(10, 2), (4, 2), (20, -2)])
+        self.assertEqual(
+            [0, 0, 2, 2, 4, 4, 2],
+            [holes.shift(offset) for offset in (0, 4, 5, 10, 11, 19, 20)])
+        self.assertEqual(2, holes.size)
+        data = bytearray(range(1, 23))
+        self.assertEqual(
+            bytes([1, 2, 3, 4, 7, 8, 9, 10, 13, 14, 15, 16, 17, 18, 19, 20,
+                   0, 0, 21, 22]),
+            holes.punch(data))
+
 
 class ObjectFileTestCase(unittest.TestCase):
     def make_twins(self):
@@ -1,6 +1,7 @@
 import unittest
 import sys
 from ppci.utils.bitfun import rotate_left, rotate_right, BitView, sign_extend
+from ppci.utils.bitfun import signed_division_magic, unsigned_division_magic
 
 
 class BitRotationTestCase(unittest.TestCase):
@@ -23,6 +24,33 @@ class SignExtendTestCase(unittest.TestCase):
         self.assertEqual(0x7fff, sign_extend(0xffff7fff, 16))
 
 
+class DivisionMagicTestCase(unittest.TestCase):
+    def test_unsigned(self):
+        self.assertEqual((0xCCCCCCCD, 3), unsigned_division_magic(10, 32))
+
+    def test_unsigned_wide_multiplier(self):
+        self.assertEqual((0x124924925, 3), unsigned_division_magic(7, 32))
+
+    def test_signed(self):
+        self.assertEqual((0x66666667, 2), signed_division_magic(10, 32))
+        self.assertEqual((0x92492493, 2), signed_division_magic(7, 32))
+
+    def test_all_8_bit_values(self):
+        for divisor in range(3, 256):
+            multiplier, shift = unsigned_division_magic(divisor, 8)
+            for value in range(256):
+                self.assertEqual(
+                    value // divisor, (value * multiplier) >> (8 + shift))
+
+        for divisor in (3, 5, 6, 7, 9, 10, 100, 127):
+            multiplier, shift = signed_division_magic(divisor, 8)
+            for value in range(-128, 128):
+                quotient = (value * multiplier) >> (8 + shift)
+                if value < 0:
+                    quotient += 1
+                self.assertEqual(int(value / divisor), quotient)
+
+
 class BitViewTestCase(unittest.TestCase):
     """ Checkout the functions of the bit fiddler """
     def test_simple_case(self):
@@ -119,6 +119,28 @@ class TestReader(unittest.TestCase):
             self.assertTrue(m)
 
 
+    def test_select(self):
+        src = """module selmod;
+
+global function i32 maxi(i32 a, i32 b) {
+  init: {
+    i32 c = select a > b ? a : b;
+    return c;
+  }
+}
+
+"""
+        module = irutils.read_module(io.StringIO(src))
+        irutils.verify_module(module)
+        f = io.StringIO()
+        irutils.Writer(file=f).write(module)
+        self.assertIn("i32 c = select a > b ? a : b;", f.getvalue())
+        module2 = irutils.from_json(irutils.to_json(module))
+        f2 = io.StringIO()
+        irutils.Writer(file=f2).write(module2)
+        self.assertEqual(f.getvalue(), f2.getvalue())
+
+
 class TestIrToPython(unittest.TestCase):
     def test_add_example(self):
         reader = irutils.Reader()
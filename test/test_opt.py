@@ -10,6 +10,9 @@ from ppci.binutils.debuginfo import DebugDb
 from ppci.irutils import verify_module
 from ppci.opt import Mem2RegPromotor
 from ppci.opt import CleanPass
+from ppci.opt import DivisionByPowerOfTwoPass
+from ppci.opt import LoadAfterStorePass
+from ppci.opt import SelectPass
 from ppci.opt.constantfolding import correct
 from ppci.opt.tailcall import TailCallOptimization
 
@@ -77,6 +80,28 @@ class CleanTestCase(OptTestCase):
         self.assertNotIn(block4, self.function)
 
 
+    def test_keep_empty_block_with_phi(self):
+        """ An empty block on an edge to a phi cannot always be removed """
+        addr = self.builder.emit(ir.Const(0x100, 'addr', ir.ptr))
+        a = self.builder.emit(ir.Load(addr, 'a', ir.i32))
+        b = self.builder.emit(ir.Const(2, 'b', ir.i32))
+        block1 = self.builder.new_block()
+        block2 = self.builder.new_block()
+        self.builder.emit(ir.CJump(a, '>', b, block1, block2))
+        self.builder.set_block(block1)
+        self.builder.emit(ir.Jump(block2))
+        self.builder.set_block(block2)
+        phi = self.builder.emit(ir.Phi('res', ir.i32))
+        phi.set_incoming(self.function.entry, b)
+        phi.set_incoming(block1, a)
+        self.builder.emit(ir.Store(phi, addr))
+        self.builder.emit(ir.Exit())
+
+        # Act:
+        self.clean_pass.run(self.module)
+        self.assertIn(block1, self.function)
+
+
 class Mem2RegTestCase(OptTestCase):
     """ Test the memory to register lifter """
     def setUp(self):
@@ -137,6 +162,167 @@ class Mem2RegTestCase(OptTestCase):
         self.assertIn(alloc, self.function.entry.instructions)
 
 
+class LoadAfterStoreTestCase(OptTestCase):
+    """ Test the replacement of loads after a store """
+    def setUp(self):
+        super().setUp()
+        self.load_after_store = LoadAfterStorePass()
+
+    def test_replace_load(self):
+        addr = self.builder.emit(ir.Const(0x100, 'addr', ir.ptr))
+        cnst = self.builder.emit(ir.Const(1, 'cnst', ir.i32))
+        self.builder.emit(ir.Store(cnst, addr))
+        load = self.builder.emit(ir.Load(addr, 'Ld', ir.i32))
+        store = self.builder.emit(ir.Store(load, addr))
+        self.builder.emit(ir.Exit())
+        self.load_after_store.run(self.module)
+        self.assertIs(cnst, store.value)
+
+    def test_copy_blob_in_between(self):
+        """ A copy of a blob can overwrite the stored value """
+        addr = self.builder.emit(ir.Const(0x100, 'addr', ir.ptr))
+        src = self.builder.emit(ir.Const(0x200, 'src', ir.ptr))
+        cnst = self.builder.emit(ir.Const(1, 'cnst', ir.i32))
+        self.builder.emit(ir.Store(cnst, addr))
+        self.builder.emit(ir.CopyBlob(addr, src, 8, 4))
+        self.builder.emit(ir.ClearBlob(src, 8, 4))
+        load = self.builder.emit(ir.Load(addr, 'Ld', ir.i32))
+        store = self.builder.emit(ir.Store(load, src))
+        self.builder.emit(ir.Exit())
+        self.load_after_store.run(self.module)
+        self.assertIs(load, store.value)
+
+
+class SelectTestCase(OptTestCase):
+    """ Test the replacement of small diamonds by selects """
+    def setUp(self):
+        super().setUp()
+        self.select_pass = SelectPass()
+        self.addr = self.builder.emit(ir.Const(0x100, 'addr', ir.ptr))
+        self.a = self.builder.emit(ir.Load(self.addr, 'a', ir.i32))
+        self.b = self.builder.emit(ir.Const(2, 'b', ir.i32))
+
+    def make_diamond(self, yes_value, no_value=None):
+        """ Create a diamond, or a triangle if there is no no value """
+        yes_block = self.builder.new_block()
+        join = self.builder.new_block()
+        no_block = self.builder.new_block() if no_value else join
+        entry = self.function.entry
+        self.builder.emit(ir.CJump(self.a, '<', self.b, yes_block, no_block))
+        self.builder.set_block(yes_block)
+        yes = self.builder.emit(yes_value)
+        self.builder.emit(ir.Jump(join))
+        if no_value:
+            self.builder.set_block(no_block)
+            no = self.builder.emit(no_value)
+            self.builder.emit(ir.Jump(join))
+        else:
+            no = self.b
+        self.builder.set_block(join)
+        phi = self.builder.emit(ir.Phi('res', ir.i32))
+        phi.set_incoming(yes_block, yes)
+        phi.set_incoming(no_block if no_value else entry, no)
+        self.builder.emit(ir.Store(phi, self.addr))
+        self.builder.emit(ir.Exit())
+        return phi
+
+    def test_diamond(self):
+        self.make_diamond(
+            ir.add(self.a, self.b, 'add', ir.i32),
+            ir.Const(5, 'five', ir.i32))
+        self.select_pass.run(self.module)
+        self.assertEqual(1, len(self.function.blocks))
+        select, = [
+            i for i in self.function.entry if isinstance(i, ir.Select)]
+        self.assertEqual('<', select.cond)
+        self.assertIsInstance(select.yes, ir.Binop)
+        self.assertEqual(5, select.no.value)
+
+    def test_triangle(self):
+        self.make_diamond(ir.Const(5, 'five', ir.i32))
+        self.select_pass.run(self.module)
+        self.assertEqual(1, len(self.function.blocks))
+        store = self.function.entry.instructions[-2]
+        self.assertIsInstance(store.value, ir.Select)
+        self.assertIs(self.b, store.value.no)
+
+    def test_load_not_speculated(self):
+        phi = self.make_diamond(ir.Load(self.addr, 'ld', ir.i32))
+        self.select_pass.run(self.module)
+        self.assertEqual(3, len(self.function.blocks))
+        self.assertIn(phi, phi.block)
+
+
+class DivisionByPowerOfTwoTestCase(OptTestCase):
+    """ Check the shifts and masks against division for all 8 bit values """
+    def evaluate(self, value, x):
+        if isinstance(value, ir.Parameter):
+            return x
+        elif isinstance(value, ir.Const):
+            return correct(value.value, value.ty)
+        elif isinstance(value, ir.Cast):
+            return correct(self.evaluate(value.src, x), value.ty)
+        elif isinstance(value, ir.Unop):
+            return correct(-self.evaluate(value.a, x), value.ty)
+        a = self.evaluate(value.a, x)
+        b = self.evaluate(value.b, x)
+        operations = {
+            '+': lambda: a + b,
+            '-': lambda: a - b,
+            '&': lambda: a & b,
+            '>>': lambda: a >> b,
+        }
+        return correct(operations[value.operation](), value.ty)
+
+    def divide(self, ty, operation, divisor):
+        x = ir.Parameter('x', ty)
+        self.function.add_parameter(x)
+        cnst = self.builder.emit(ir.Const(divisor, 'cnst', ty))
+        binop = self.builder.emit(ir.Binop(x, operation, cnst, 'div', ty))
+        alloc = self.builder.emit(ir.Alloc('A', 1, 1))
+        addr = self.builder.emit(ir.AddressOf(alloc, 'addr'))
+        store = self.builder.emit(ir.Store(binop, addr))
+        self.builder.emit(ir.Exit())
+        DivisionByPowerOfTwoPass().run(self.module)
+        return x, store.value
+
+    def check(self, ty, operation, divisor):
+        x, result = self.divide(ty, operation, divisor)
+        self.assertNotEqual(operation, getattr(result, 'operation', None))
+        for value in range(-128, 128) if ty.signed else range(256):
+            quotient = abs(value) // abs(divisor)
+            if (value < 0) != (divisor < 0):
+                quotient = -quotient
+            if operation == '/':
+                expected = quotient
+            else:
+                expected = value - quotient * divisor
+            self.assertEqual(
+                correct(expected, ty), self.evaluate(result, value))
+
+    def test_signed_division(self):
+        self.check(ir.i8, '/', 8)
+
+    def test_signed_negative_division(self):
+        self.check(ir.i8, '/', -4)
+
+    def test_signed_remainder(self):
+        self.check(ir.i8, '%', 16)
+
+    def test_minimum_divisor(self):
+        self.check(ir.i8, '/', -128)
+
+    def test_unsigned_division(self):
+        self.check(ir.u8, '/', 32)
+
+    def test_unsigned_remainder(self):
+        self.check(ir.u8, '%', 128)
+
+    def test_other_divisors(self):
+        _, result = self.divide(ir.i8, '/', 6)
+        self.assertEqual('/', result.operation)
+
+
 class TypedEvalTestCase(unittest.TestCase):
     """ Test various integer values wrapped at bitsizes and signedness """
     def test_char_overflow(self):
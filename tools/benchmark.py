@@ -10,12 +10,21 @@ python -m pytest benchmark.py
 
 """
 
+import io
 import time
 import os
+import functools
 import logging
 from glob import glob
 from ppci import api
+from ppci.codegen.codegen import CodeGenerator
+from ppci.binutils.outstream import BinaryOutputStream
+from ppci.binutils.debuginfo import DebugDb
+from ppci.arch.riscv.simulator import RiscvSimulator
+from ppci.arch.generic_instructions import VirtualInstruction
+from ppci.binutils.objectfile import ObjectFile, RelocationEntry
 from ppci.lang.c import COptions
+from ppci.utils.reporting import DummyReportGenerator
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 
@@ -28,6 +37,58 @@ def test_compile_8cc(benchmark):
     benchmark(compile_8cc)
 
 
+def test_compile_8cc_linearscan(benchmark):
+    benchmark(compile_8cc, allocator="linearscan")
+
+
+def test_register_allocators(benchmark):
+    """Compare the register allocators on the 8cc sources.
+
+    The time spent in register allocation and the code size per allocator
+    are stored in the extra info of the benchmark.
+    """
+    for allocator in ("coloring", "linearscan"):
+        benchmark.extra_info[allocator] = compare_register_allocator(
+            allocator
+        )
+    benchmark(compare_register_allocator, "linearscan")
+
+
+def test_encode_riscv_instructions(benchmark):
+    benchmark(encode_instructions, make_riscv_instructions())
+
+
+def test_instruction_selection(benchmark):
+    # Some samples use 64 bit integers, which need the rv64 option:
+    ir_modules = samples_to_ir("riscv:rv64")
+    arch = api.get_arch("riscv:rv64")
+    code_generator = CodeGenerator(arch, DummyReportGenerator())
+    benchmark(select_instructions, code_generator, ir_modules)
+
+
+def test_instruction_scheduling(benchmark):
+    """Compare the estimated stalls of the C samples per core.
+
+    The estimates are stored in the extra info of the benchmark.
+    """
+    ir_modules = samples_to_ir("riscv:rv64")
+    for core in ("vexriscv", "vexriscv:postsched", "rocket"):
+        march = "riscv:rv64:" + core
+        benchmark.extra_info[core] = estimate_stalls(march, ir_modules)
+    benchmark(estimate_stalls, "riscv:rv64:rocket:postsched", ir_modules)
+
+
+def test_link_relaxation(benchmark):
+    benchmark(api.link, [make_relaxation_object()])
+
+
+def test_division_by_constant(benchmark):
+    """Compare the instruction counts of division by constants"""
+    for divisors in ("constant", "variable"):
+        benchmark.extra_info[divisors] = count_division_instructions(divisors)
+    benchmark(count_division_instructions, "constant")
+
+
 def compile_nos_for_riscv():
     """ Compile nOS for riscv architecture. """
     logging.basicConfig(level=logging.INFO)
@@ -62,6 +123,198 @@ def compile_nos_for_riscv():
     )
 
 
+def samples_to_ir(march):
+    """ Translate the C samples of the test suite into ir-modules """
+    arch = api.get_arch(march)
+    samples_folder = os.path.join(this_dir, "..", "test", "samples")
+    libc_folder = os.path.join(this_dir, "..", "librt", "libc")
+    coptions = COptions()
+    coptions.add_include_path(os.path.join(libc_folder, "include"))
+    ir_modules = []
+    for source_path in sorted(glob(os.path.join(samples_folder, "*", "*.c"))):
+        with open(source_path, "r") as f:
+            ir_modules.append(api.c_to_ir(f, arch, coptions=coptions))
+    return ir_modules
+
+
+def select_instructions(code_generator, ir_modules):
+    """ Select instructions for all functions of the ir-modules """
+    arch = code_generator.arch
+    for ir_module in ir_modules:
+        for ir_function in ir_module.functions:
+            frame = arch.new_frame(ir_function.name, ir_function)
+            frame.debug_db = DebugDb()
+            code_generator.select_and_schedule(ir_function, frame)
+
+
+class StallReporter(DummyReportGenerator):
+    """ Report generator which adds up the estimated stalls """
+
+    def __init__(self):
+        super().__init__()
+        self.stalls = 0
+
+    def message(self, msg):
+        if msg.startswith("Estimated stalls"):
+            self.stalls += int(msg.split(":")[-1])
+
+
+def estimate_stalls(march, ir_modules):
+    """ Generate code for the ir-modules and get the estimated stalls """
+    arch = api.get_arch(march)
+    reporter = StallReporter()
+    for ir_module in ir_modules:
+        code_generator = CodeGenerator(arch, reporter)
+        obj = ObjectFile(arch)
+        code_generator.generate(ir_module, BinaryOutputStream(obj))
+    return reporter.stalls
+
+
+def make_relaxation_object(count=100000):
+    """Create an object file with many calls which can be relaxed.
+
+    The calls go to a nearby function, so the linker relaxes every call
+    into a c.jal instruction.
+    """
+    arch = api.get_arch("riscv:rvc")
+    obj = ObjectFile(arch)
+    section = obj.get_section("code", create=True)
+    for index in range(count):
+        symbol_id = index // 64
+        if index % 64 == 0:
+            name = "f{}".format(symbol_id)
+            obj.add_symbol(
+                symbol_id, name, "local", section.size, "code", "func", 0
+            )
+        obj.add_relocation(
+            RelocationEntry("cbl_imm11", symbol_id, "code", section.size, 0)
+        )
+        section.add_data(bytes([0xEF, 0, 0, 0]))  # jal x1, 0
+    return obj
+
+
+def make_riscv_instructions():
+    """ Create an instance of every riscv instruction class. """
+    instructions = []
+    for march in ["riscv", "riscv:rvc", "riscv:rvf"]:
+        isa = api.get_arch(march).isa
+        for instruction_class in isa.instructions:
+            if not instruction_class.syntax or issubclass(
+                instruction_class, VirtualInstruction
+            ):
+                continue
+            args = []
+            for operand in instruction_class.syntax.formal_arguments:
+                if operand._cls is int:
+                    args.append(4)
+                elif operand._cls is str:
+                    args.append("label")
+                else:
+                    args.append(operand._cls("x1", num=1))
+            instructions.append(instruction_class(*args))
+    return instructions
+
+
+def encode_instructions(instructions, rounds=100):
+    """ Encode the given instructions several times. """
+    for _ in range(rounds):
+        for instruction in instructions:
+            instruction.encode()
+
+
+DIVISION_SAMPLE = """
+%s
+int to_decimal(unsigned value, char *buffer)
+{
+    int count = 0;
+    do {
+        buffer[count++] = '0' + value %% TEN;
+        value /= TEN;
+    } while (value);
+    return count;
+}
+
+int fletcher16(unsigned char *data, int size)
+{
+    int i, sum1 = 0, sum2 = 0;
+    for (i = 0; i < size; i++) {
+        sum1 = (sum1 + data[i]) %% MODULUS;
+        sum2 = (sum2 + sum1) %% MODULUS;
+    }
+    return (sum2 << 8) | sum1;
+}
+
+int main(void)
+{
+    char buffer[16];
+    int i, total = 0;
+    for (i = 0; i < 100; i++) {
+        int seconds = i * 7919 - 300000;
+        total += seconds / HOUR + (seconds %% HOUR) / MINUTE;
+        total += seconds %% MINUTE + seconds / EIGHT;
+        total += to_decimal(i * 104729, buffer);
+        total += fletcher16((unsigned char *)buffer, 16);
+    }
+    return total;
+}
+"""
+
+
+def count_division_instructions(divisors="constant", march="riscv"):
+    """Run a division heavy sample in the riscv simulator.
+
+    The divisors are either constants or loaded from variables, the latter
+    gives the instruction counts of the div and rem instructions. Returns
+    the number of instructions in the code, the number of division
+    instructions among them, the number of retired instructions and the
+    result of the sample.
+    Note that div and rem take over 32 cycles on cores such as picorv32
+    and VexRiscv, the retired instruction count does not show this.
+    """
+    values = {"TEN": 10, "MODULUS": 255, "HOUR": 3600, "MINUTE": 60}
+    values["EIGHT"] = 8
+    if divisors == "constant":
+        definitions = "".join(
+            "#define {} {}\n".format(name, value)
+            for name, value in values.items()
+        )
+    else:
+        definitions = "".join(
+            "int {} = {};\n".format(name, value)
+            for name, value in values.items()
+        )
+    source = DIVISION_SAMPLE % definitions
+
+    arch = api.get_arch(march)
+    ir_module = api.c_to_ir(io.StringIO(source), arch)
+    api.optimize(ir_module, level=2)
+    code = api.ir_to_assembly([ir_module], arch)
+    lines = [line.split() for line in code.splitlines()]
+    instructions = [line[0] for line in lines if line and line[0].isalpha()]
+    start = io.StringIO(
+        "section code\nglobal main\nlui x2, 0x10\njal x1, main\nebreak\n"
+    )
+    layout = io.StringIO("""
+        MEMORY flash LOCATION=0x0 SIZE=0x4000 { SECTION(code) }
+        MEMORY ram LOCATION=0x4000 SIZE=0x4000 { SECTION(data) }
+        """)
+    obj = api.link(
+        [api.asm(start, arch), api.ir_to_object([ir_module], arch)],
+        layout=layout,
+    )
+    simulator = RiscvSimulator(arch)
+    simulator.load(obj)
+    retired = simulator.run(max_instructions=10000000)
+    return {
+        "instructions": len(instructions),
+        "divisions": sum(
+            name.startswith(("div", "rem")) for name in instructions
+        ),
+        "retired": retired,
+        "result": simulator.x[10],
+    }
+
+
 def get_sources(folder, extension):
     resfiles = []
     resdirs = []
@@ -73,18 +326,12 @@ def get_sources(folder, extension):
     return (resdirs, resfiles)
 
 
-def compile_8cc():
-    """ Compile the 8cc compiler.
-
-    8cc homepage:
-    https://github.com/rui314/8cc
-    """
-
+def get_8cc_sources():
+    """ Get the options for and the source files of 8cc """
     home = os.environ['HOME']
     _8cc_folder = os.path.join(home, 'GIT', '8cc')
     libc_includes = os.path.join(this_dir, '..', 'librt', 'libc', 'include')
     linux_include_dir = '/usr/include'
-    arch = api.get_arch('x86_64')
     coptions = COptions()
     include_paths = [
         libc_includes,
@@ -110,10 +357,66 @@ def compile_8cc():
         'set.c',
         'encoding.c',
     ]
+    return coptions, [os.path.join(_8cc_folder, name) for name in sources]
+
+
+def compare_register_allocator(allocator, march="riscv"):
+    """Generate code for the 8cc sources with the given register allocator.
+
+    The sources are translated into ir-code without optimizations, as in
+    a debug build, before the timing starts. Returns the seconds spent in
+    register allocation, the seconds spent in the whole code generation
+    and the size of the code.
+    """
+    arch = api.get_arch(march)
+    coptions, sources = get_8cc_sources()
+    ir_modules = []
+    for source_path in sources:
+        with open(source_path, "r") as f:
+            ir_module = api.c_to_ir(f, arch, coptions=coptions)
+        ir_modules.append(ir_module)
+
+    allocation_time = 0
+
+    def timed_alloc_frame(frame, alloc_frame):
+        nonlocal allocation_time
+        t1 = time.perf_counter()
+        alloc_frame(frame)
+        allocation_time += time.perf_counter() - t1
+
+    t1 = time.perf_counter()
+    size = 0
+    for ir_module in ir_modules:
+        code_generator = CodeGenerator(
+            arch, DummyReportGenerator(), allocator=allocator
+        )
+        register_allocator = code_generator.register_allocator
+        register_allocator.alloc_frame = functools.partial(
+            timed_alloc_frame, alloc_frame=register_allocator.alloc_frame
+        )
+        obj = ObjectFile(arch)
+        code_generator.generate(ir_module, BinaryOutputStream(obj))
+        size += obj.get_section("code").size
+    return {
+        "allocation_time": allocation_time,
+        "codegen_time": time.perf_counter() - t1,
+        "size": size,
+    }
+
+
+def compile_8cc(allocator="coloring"):
+    """ Compile the 8cc compiler.
+
+    8cc homepage:
+    https://github.com/rui314/8cc
+    """
+    arch = api.get_arch('x86_64')
+    coptions, sources = get_8cc_sources()
     objs = []
-    for filename in sources:
-        source_path = os.path.join(_8cc_folder, filename)
+    for source_path in sources:
         with open(source_path, 'r') as f:
-            objs.append(api.cc(f, arch, coptions=coptions))
+            objs.append(
+                api.cc(f, arch, coptions=coptions, allocator=allocator)
+            )
 
     # TODO: maybe link it?
\ No newline at end of file
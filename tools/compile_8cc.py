@@ -46,14 +46,16 @@ coptions.add_include_paths(include_paths)
 coptions.add_define('BUILD_DIR', '"{}"'.format(_8cc_folder))
 
 
-def do_compile(filename, reporter):
+def do_compile(filename, reporter, allocator):
     with open(filename, 'r') as f:
-        obj = api.cc(f, arch, coptions=coptions, reporter=reporter)
+        obj = api.cc(
+            f, arch, coptions=coptions, reporter=reporter,
+            allocator=allocator)
     print(filename, 'compiled into', obj)
     return obj
 
 
-def main():
+def main(allocator='coloring'):
     t1 = time.time()
     failed = 0
     passed = 0
@@ -79,7 +81,7 @@ def main():
             filename = os.path.join(_8cc_folder, filename)
             print('==> Compiling', filename)
             try:
-                obj = do_compile(filename, reporter)
+                obj = do_compile(filename, reporter, allocator)
             except CompilerError as ex:
                 print('Error:', ex.msg, ex.loc)
                 ex.print()
@@ -106,10 +108,13 @@ def main():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--verbose', '-v', action='count', default=0)
+    parser.add_argument(
+        '--allocator', choices=['coloring', 'linearscan'],
+        default='coloring', help='the register allocator to use')
     args = parser.parse_args()
     if args.verbose > 0:
         level = logging.DEBUG
     else:
         level = logging.INFO
     logging.basicConfig(level=level, format=logformat)
-    main()
+    main(allocator=args.allocator)